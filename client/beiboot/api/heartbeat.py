@@ -6,6 +6,7 @@ import kubernetes as k8s
 
 from beiboot.api import stopwatch
 from beiboot.types import Beiboot
+from beiboot.utils import heartbeat_lease_name
 
 logger = logging.getLogger(__name__)
 
@@ -18,41 +19,50 @@ def write_heartbeat(
     config: ClientConfiguration = default_configuration,
 ) -> datetime:
     """
-    Create a client contact entry to the heartbeat configmap for a Beiboot. Returns the timestamp written to the
-    configmap.
+    Renew the heartbeat Lease of a client for a Beiboot. Each client has its own Lease object in the namespace of the
+    Beiboot. Returns the timestamp written to the Lease.
 
     :param client_id: The client id to write the contact entry on behalf of
     :type client_id: str
     :param bbt: The Beiboot to write a heartbeat for
     :type bbt: Beiboot
-    :param timestamp: Optional timestamp to write to the configmap
+    :param timestamp: Optional timestamp to write to the Lease
     :type timestamp: datetime
     """
 
     if timestamp is None:
         timestamp = datetime.utcnow()
 
-    _timestamp = timestamp.isoformat()
-    configmap = k8s.client.V1ConfigMap(  # type: ignore
-        api_version="v1",
-        kind="ConfigMap",
-        data={client_id: _timestamp},
+    _timestamp = timestamp.isoformat(timespec="microseconds") + "Z"
+    name = heartbeat_lease_name(client_id, config)
+    lease = k8s.client.V1Lease(  # type: ignore
+        api_version="coordination.k8s.io/v1",
+        kind="Lease",
         metadata=k8s.client.V1ObjectMeta(  # type: ignore
-            name=config.CLIENT_HEARTBEAT_CONFIGMAP_NAME,
+            name=name,
             namespace=bbt.namespace,
+            labels={config.CLIENT_HEARTBEAT_LEASE_LABEL: "true"},
+        ),
+        spec=k8s.client.V1LeaseSpec(  # type: ignore
+            holder_identity=client_id, renew_time=_timestamp
         ),
     )
     try:
-        config.K8S_CORE_API.patch_namespaced_config_map(
-            name=config.CLIENT_HEARTBEAT_CONFIGMAP_NAME,
-            namespace=bbt.namespace,
-            body=configmap,
-        )
+        try:
+            config.K8S_COORDINATION_API.patch_namespaced_lease(
+                name=name, namespace=bbt.namespace, body=lease
+            )
+        except k8s.client.exceptions.ApiException as e:  # type: ignore
+            if e.status != 404:
+                raise e
+            config.K8S_COORDINATION_API.create_namespaced_lease(
+                namespace=bbt.namespace, body=lease
+            )
         logger.debug(f"Successfully heartbeat for client {client_id} to {_timestamp}")
     except k8s.client.exceptions.ApiException as e:  # type: ignore
         if e.status == 404:
             raise RuntimeError(
-                f"Cannot write heartbeat, the required configmap '{config.CLIENT_HEARTBEAT_CONFIGMAP_NAME}' does not exist"
+                f"Cannot write heartbeat, the namespace '{bbt.namespace}' does not exist"
             ) from None
         else:
             raise RuntimeError(f"Cannot write heartbeat: {e}") from None
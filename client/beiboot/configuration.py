@@ -26,6 +26,8 @@ class ClientConfiguration(object):
         self.NAMESPACE = namespace
         self.CONFIGMAP_NAME = "beiboot-config"
         self.CLIENT_HEARTBEAT_CONFIGMAP_NAME = "beiboot-clients"
+        self.CLIENT_HEARTBEAT_LEASE_PREFIX = "beiboot-client-"
+        self.CLIENT_HEARTBEAT_LEASE_LABEL = "beiboot.getdeck.dev/client-heartbeat"
         self.REGISTRY_URL = (
             registry_url.rstrip("/") if registry_url else "quay.io/getdeck"
         )
@@ -71,6 +73,7 @@ class ClientConfiguration(object):
             CustomObjectsApi,
             ApiextensionsV1Api,
             AdmissionregistrationV1Api,
+            CoordinationV1Api,
         )
 
         self.K8S_CORE_API = CoreV1Api()
@@ -79,6 +82,7 @@ class ClientConfiguration(object):
         self.K8S_CUSTOM_OBJECT_API = CustomObjectsApi()
         self.K8S_EXTENSIONS_API = ApiextensionsV1Api()
         self.K8S_ADMISSION_API = AdmissionregistrationV1Api()
+        self.K8S_COORDINATION_API = CoordinationV1Api()
 
     def __getattr__(self, item):
         if item in [
@@ -88,6 +92,7 @@ class ClientConfiguration(object):
             "K8S_CUSTOM_OBJECT_API",
             "K8S_ADMISSION_API",
             "K8S_EXTENSIONS_API",
+            "K8S_COORDINATION_API",
         ]:
             try:
                 return self.__getattribute__(item)
@@ -1,5 +1,7 @@
 import getpass
+import json
 import logging
+import shlex
 import socket
 from typing import Optional, List
 
@@ -9,7 +11,7 @@ from beiboot.configuration import ClientConfiguration
 from beiboot.connection.abstract import AbstractConnector
 from beiboot.connection.types import ConnectorType
 from beiboot.types import Beiboot
-from beiboot.utils import _list_containers_by_prefix
+from beiboot.utils import _list_containers_by_prefix, heartbeat_lease_name
 
 logger = logging.getLogger(__name__)
 
@@ -36,8 +38,21 @@ class GhostunnelDocker(AbstractConnector):
     HEARTBEAT_IMAGE = "quay.io/getdeck/tooler:latest"
     CONTAINER_PREFIX = "getdeck-beiboot-{name}"
     _DOCKER_NETWORK_NAME = None
-    HEARTBEAT_CMD = 'watch -n30 "VAR=\'{{\\"data\\":{{\\"{client}\\": \\"\'$(date +\\"%Y-%m-%dT%H:%M:%S\\")\'\\"}}}}\';  kubectl --kubeconfig /kubernetes/sa_kubeconfig.yaml patch configmap beiboot-clients -n {namespace} --type merge --patch=\\"$VAR\\""'  # noqa
+    # renew the heartbeat Lease of this client every 30s, RENEW_TIME is replaced with the current time
+    HEARTBEAT_CMD = (
+        "while true; do echo {lease} "
+        '| sed "s/RENEW_TIME/$(date -u +%Y-%m-%dT%H:%M:%S.000000Z)/" '
+        "| kubectl --kubeconfig /kubernetes/sa_kubeconfig.yaml apply -n {namespace} -f -; "
+        "sleep 30; done"
+    )
     CLIENT = f"{socket.gethostname()}-{getpass.getuser()}"
+    GHOSTUNNEL_BINARY = "/usr/bin/ghostunnel"
+    # runs the ghostunnel clients in the background, the container stops (and is restarted) if one of them exits
+    TUNNEL_CMD = (
+        "trap 'exit 0' TERM INT; trap 'trap - TERM INT; kill 0' EXIT; pids=; "
+        "{listeners}"
+        "while kill -0 $pids 2>/dev/null; do sleep 2; done; exit 1"
+    )
 
     def __init__(
         self,
@@ -46,6 +61,31 @@ class GhostunnelDocker(AbstractConnector):
         super(GhostunnelDocker, self).__init__(configuration)
         self.HEARTBEAT_IMAGE = configuration.TOOLER_IMAGE
 
+    def _heartbeat_command(self, namespace: str) -> List[str]:
+        lease = {
+            "apiVersion": "coordination.k8s.io/v1",
+            "kind": "Lease",
+            "metadata": {
+                "name": heartbeat_lease_name(self.CLIENT, self.configuration),
+                "labels": {self.configuration.CLIENT_HEARTBEAT_LEASE_LABEL: "true"},
+            },
+            "spec": {"holderIdentity": self.CLIENT, "renewTime": "RENEW_TIME"},
+        }
+        return [
+            "sh",
+            "-c",
+            self.HEARTBEAT_CMD.format(
+                lease=shlex.quote(json.dumps(lease)), namespace=namespace
+            ),
+        ]
+
+    def _tunnel_command(self, listeners: List[str]) -> str:
+        return self.TUNNEL_CMD.format(
+            listeners="".join(
+                f'{listener} & pids="$pids $!"; ' for listener in listeners
+            )
+        )
+
     def set_docker_network(self, network_name):
         self._DOCKER_NETWORK_NAME = network_name
 
@@ -85,25 +125,32 @@ class GhostunnelDocker(AbstractConnector):
         )  # {filename, path}
         container_prefixes = self.CONTAINER_PREFIX.format(name=beiboot.name)
 
+        # all ports are tunneled by one container, running one ghostunnel client per port
+        listeners = []
+        ports = {}
         for call_port in additional_ports:
             local_port, cluster_port = call_port.split(":")
             _endpoint = _nodeport_for_target(cluster_port)
             if not _endpoint:
                 logger.warning(f"No endpoint for cluster port {cluster_port}")
                 continue
-            _cmd = (
-                f"client --listen 0.0.0.0:{local_port} --unsafe-listen "
+            listeners.append(
+                f"{self.GHOSTUNNEL_BINARY} client --listen 0.0.0.0:{local_port} --unsafe-listen "
                 f"--target {_endpoint} --cert /crt/client.crt --key /crt/client.key --cacert /crt/ca.crt"
             )
+            ports[f"{local_port}"] = int(local_port)
+
+        if listeners:
             try:
                 container = self.configuration.DOCKER.containers.run(  # noqa
                     image=self.IMAGE,
-                    name=f"{container_prefixes}-{cluster_port}",
-                    command=_cmd,
+                    name=f"{container_prefixes}-tunnel",
+                    entrypoint=["sh", "-c"],
+                    command=[self._tunnel_command(listeners)],
                     restart_policy={"Name": "unless-stopped"},
                     remove=False,
                     detach=True,
-                    ports={f"{local_port}": int(local_port)},
+                    ports=ports,
                     volumes=[
                         f"{path}:/crt/{file}" for file, path in mtls_files.items()
                     ],
@@ -120,9 +167,7 @@ class GhostunnelDocker(AbstractConnector):
             container = self.configuration.DOCKER.containers.run(  # noqa
                 image=self.HEARTBEAT_IMAGE,
                 name=f"{container_prefixes}-heartbeat",
-                command=self.HEARTBEAT_CMD.format(
-                    client=self.CLIENT, namespace=beiboot.namespace
-                ),
+                command=self._heartbeat_command(beiboot.namespace),
                 restart_policy={"Name": "unless-stopped"},
                 remove=False,
                 detach=True,
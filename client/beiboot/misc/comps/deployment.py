@@ -24,7 +24,10 @@ def data(params: InstallOptions) -> list[dict]:
                                 "name": "beiboot",
                                 "image": f"quay.io/getdeck/beiboot:{params.version}",
                                 "imagePullPolicy": "Always",
-                                "ports": [{"containerPort": 9443}],
+                                "ports": [
+                                    {"containerPort": 9443},
+                                    {"containerPort": 9090, "name": "metrics"},
+                                ],
                             }
                         ],
                     },
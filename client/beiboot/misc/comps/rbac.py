@@ -61,6 +61,11 @@ def data(params: InstallOptions) -> list[dict]:
                     ],
                     "verbs": ["*"],
                 },
+                {
+                    "apiGroups": ["coordination.k8s.io"],
+                    "resources": ["leases"],
+                    "verbs": ["*"],
+                },
                 {
                     "apiGroups": ["getdeck.dev"],
                     "resources": ["beiboots"],
@@ -120,6 +120,8 @@ class BeibootParameters:
     maxLifetime: Optional[str] = field(default_factory=lambda: None)
     # the max time for this cluster before getting removed when no client is connected
     maxSessionTimeout: Optional[str] = field(default_factory=lambda: None)
+    # hibernate this cluster instead of removing it once the session timeout is reached
+    hibernateOnSessionTimeout: Optional[bool] = field(default_factory=lambda: None)
     # the max time waiting for this cluster to become 'READY'
     clusterReadyTimeout: Optional[int] = field(
         default_factory=lambda: default_configuration.CLUSTER_CREATION_TIMEOUT
@@ -146,6 +148,7 @@ class BeibootParameters:
         params.nodes = data.get("nodes")
         params.maxLifetime = data.get("maxLifetime")
         params.maxSessionTimeout = data.get("maxSessionTimeout")
+        params.hibernateOnSessionTimeout = data.get("hibernateOnSessionTimeout")
         params.clusterReadyTimeout = data.get("clusterReadyTimeout")
         params.serverStorageRequests = data.get("serverStorageRequests")
         params.nodeStorageRequests = data.get("nodeStorageRequests")
@@ -192,6 +195,7 @@ class BeibootState(Enum):
     PENDING = "PENDING"
     RUNNING = "RUNNING"
     READY = "READY"
+    HIBERNATED = "HIBERNATED"
     TERMINATING = "TERMINATING"
     ERROR = "ERROR"
 
@@ -1,5 +1,7 @@
 import base64
+import hashlib
 import logging
+import re
 import socket
 from pathlib import Path
 from typing import List, Optional, Container
@@ -51,6 +53,20 @@ def create_shelf_custom_ressource(
     return cr
 
 
+def heartbeat_lease_name(client_id: str, config: ClientConfiguration) -> str:
+    """
+    It returns the name of the heartbeat Lease of a client, a valid Kubernetes object name derived from the client id
+
+    :param client_id: The client id
+    :type client_id: str
+    :return: The name of the Lease
+    """
+    _name = re.sub(r"[^a-z0-9-]+", "-", client_id.lower()).strip("-")
+    _digest = hashlib.sha1(client_id.encode("utf-8")).hexdigest()[:8]
+    _name = _name[: 63 - len(config.CLIENT_HEARTBEAT_LEASE_PREFIX) - 9].strip("-")
+    return f"{config.CLIENT_HEARTBEAT_LEASE_PREFIX}{_name}-{_digest}"
+
+
 def decode_kubeconfig(kubeconfig_obj: dict):
     """
     It takes a dictionary with a key called `source` and returns the value of that key decoded from base64
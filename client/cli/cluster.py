@@ -42,6 +42,11 @@ from cli.__main__ import cluster
     help="The timeout for for this cluster if no client is connected (e.g. 2h or 2h30m); units are d(ays), h(ours), m(inutes).",
     type=str,
 )
+@click.option(
+    "--hibernate-on-session-timeout",
+    help="Hibernate this cluster once the session timeout is reached and resume it with the next client connection.",
+    is_flag=True,
+)
 @click.option(
     "--cluster-ready-timeout",
     help="The timeout for a cluster to enter READY state (in seconds)",
@@ -81,6 +86,7 @@ def create_cluster(
     nodes,
     max_lifetime,
     max_session_timeout,
+    hibernate_on_session_timeout,
     cluster_ready_timeout,
     server_requests_cpu,
     node_requests_cpu,
@@ -113,6 +119,7 @@ def create_cluster(
         nodes=nodes,
         maxLifetime=max_lifetime,
         maxSessionTimeout=max_session_timeout,
+        hibernateOnSessionTimeout=hibernate_on_session_timeout,
         clusterReadyTimeout=cluster_ready_timeout,
         serverResources={"requests": server_requests} if server_requests else None,
         nodeResources={"requests": node_requests} if node_requests else None,
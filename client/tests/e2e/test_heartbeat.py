@@ -8,6 +8,7 @@ from tests.e2e.base import TestClientBase
 
 from beiboot.types import BeibootState
 from beiboot.configuration import default_configuration
+from beiboot.utils import heartbeat_lease_name
 
 
 class TestBaseSetup(TestClientBase):
@@ -33,29 +34,33 @@ class TestBaseSetup(TestClientBase):
         timestamp = datetime.utcnow()
 
         api.write_heartbeat("test-client", bbt, timestamp)
-        configmap = minikube.kubectl(
+        lease = minikube.kubectl(
             [
                 "-n",
                 bbt.namespace,
                 "get",
-                "configmap",
-                default_configuration.CLIENT_HEARTBEAT_CONFIGMAP_NAME,
+                "lease",
+                heartbeat_lease_name("test-client", default_configuration),
             ]
         )
-        # cm = json.loads(configmap)
-        assert "test-client" in configmap["data"].keys()
-        assert configmap["data"]["test-client"] == str(timestamp.isoformat())
+        assert lease["spec"]["holderIdentity"] == "test-client"
+        assert (
+            lease["spec"]["renewTime"]
+            == timestamp.isoformat(timespec="microseconds") + "Z"
+        )
 
         api.write_heartbeat("test-client1", bbt)
-        configmap = minikube.kubectl(
+        leases = minikube.kubectl(
             [
                 "-n",
                 bbt.namespace,
                 "get",
-                "configmap",
-                default_configuration.CLIENT_HEARTBEAT_CONFIGMAP_NAME,
+                "lease",
+                "-l",
+                f"{default_configuration.CLIENT_HEARTBEAT_LEASE_LABEL}=true",
             ]
         )
-        # cm = json.loads(configmap)
-        assert "test-client1" in configmap["data"].keys()
-        assert datetime.fromisoformat(configmap["data"]["test-client1"])
+        assert {item["spec"]["holderIdentity"] for item in leases["items"]} == {
+            "test-client",
+            "test-client1",
+        }
@@ -5,6 +5,7 @@ from beiboot.utils import (
     decode_b64_dict,
     get_beiboot_config_location,
     get_kubeconfig_location,
+    heartbeat_lease_name,
 )
 
 
@@ -45,3 +46,13 @@ def test_config_paths():
     assert kubeconfig == str(
         Path.home().joinpath(".getdeck", "mycluster", "mycluster.yaml")
     )
+
+
+def test_heartbeat_lease_name():
+    from beiboot.configuration import default_configuration
+
+    name = heartbeat_lease_name("My-Host.local-Dev_User", default_configuration)
+    assert name.startswith("beiboot-client-my-host-local-dev-user-")
+    # client ids that only differ in invalid characters get distinct Leases
+    assert name != heartbeat_lease_name("my-host-local-dev-user", default_configuration)
+    assert len(heartbeat_lease_name("x" * 100, default_configuration)) <= 63
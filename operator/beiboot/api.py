@@ -0,0 +1,168 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, ContextManager, List, Optional
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    It returns the bounded thread pool that runs all blocking Kubernetes API calls of the operator. The number of
+    workers is configured with BEIBOOT_API_WORKERS.
+
+    :return: The ThreadPoolExecutor
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from beiboot.configuration import configuration
+
+            _executor = ThreadPoolExecutor(
+                max_workers=configuration.API_WORKERS,
+                thread_name_prefix="beiboot-api",
+            )
+        return _executor
+
+
+async def run_sync(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking function in the bounded API thread pool without blocking the event loop
+
+    :param func: The blocking function to run
+    :type func: Callable
+    :return: The return value of the function
+    """
+    loop = asyncio.get_running_loop()
+    # the function runs in the context of the caller, e.g. to record its requests in the caller's span
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(context.run, func, *args, **kwargs)
+    )
+
+
+class AsyncApi:
+    """
+    A wrapper around a (blocking) kubernetes client API instance, e.g. k8s.client.CoreV1Api(). Every API method is
+    returned as a coroutine function that runs the request in the bounded API thread pool:
+
+        core_api = AsyncApi(k8s.client.CoreV1Api())
+        pod = await core_api.read_namespaced_pod("server-0", "default")
+
+    All other attributes (e.g. api_client) are passed through. The wrapped instance is available as `sync`.
+    """
+
+    def __init__(self, api: Any):
+        self.sync = api
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def _call(*args, **kwargs):
+            return await run_sync(attr, *args, **kwargs)
+
+        return _call
+
+
+@dataclass
+class ApiRequest:
+    """
+    A request of the (blocking) kubernetes client as seen by the request hooks (see `add_request_hook`). The status
+    and the data of the response are set once the response (or an ApiException) is received; the data of a streamed
+    response (e.g. a watch) is not read, it remains None.
+    """
+
+    method: str
+    url: str
+    query_params: Optional[list] = None
+    headers: dict = field(default_factory=dict)
+    preload_content: bool = True
+    status: Optional[int] = None
+    data: Optional[bytes] = None
+
+
+RequestHook = Callable[[ApiRequest], ContextManager]
+
+_request_hooks: List[RequestHook] = []
+
+
+def add_request_hook(hook: RequestHook) -> None:
+    """
+    It registers a hook for all requests of the (blocking) kubernetes client, e.g. for the metrics, the tracing or
+    the recording. A hook is called with the ApiRequest and returns a context manager that is entered before the
+    request is sent and exited after its response is received:
+
+        @contextlib.contextmanager
+        def log_request(request: ApiRequest):
+            try:
+                yield
+            finally:
+                logger.debug(f"{request.method} {request.url}: {request.status}")
+
+        add_request_hook(log_request)
+
+    The request method of the REST client is wrapped only once, for all hooks. A hook is registered only once.
+
+    :param hook: The hook
+    :type hook: Callable[[ApiRequest], ContextManager]
+    """
+    _install_request_hooks()
+    if hook not in _request_hooks:
+        _request_hooks.append(hook)
+
+
+def _install_request_hooks() -> None:
+    from kubernetes.client.rest import ApiException, RESTClientObject
+
+    request = RESTClientObject.request
+    if getattr(request, "_beiboot_hooked", False):
+        return
+
+    @functools.wraps(request)
+    def _request(
+        self,
+        method,
+        url,
+        query_params=None,
+        headers=None,
+        body=None,
+        post_params=None,
+        _preload_content=True,
+        _request_timeout=None,
+    ):
+        kwargs = dict(
+            query_params=query_params,
+            headers=headers,
+            body=body,
+            post_params=post_params,
+            _preload_content=_preload_content,
+            _request_timeout=_request_timeout,
+        )
+        if not _request_hooks:
+            return request(self, method, url, **kwargs)
+        api_request = ApiRequest(
+            method, url, query_params, headers or {}, _preload_content
+        )
+        with contextlib.ExitStack() as stack:
+            for hook in list(_request_hooks):
+                stack.enter_context(hook(api_request))
+            try:
+                response = request(self, method, url, **kwargs)
+            except ApiException as e:
+                api_request.status, api_request.data = e.status, e.body
+                raise e
+            api_request.status = response.status
+            if _preload_content:
+                api_request.data = response.data
+            return response
+
+    _request._beiboot_hooked = True  # type: ignore
+    RESTClientObject.request = _request
@@ -0,0 +1,235 @@
+import copy
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+logger = logging.getLogger("beiboot")
+
+
+class AttrDict(dict):
+    """
+    A dict that exposes its keys as attributes, e.g. to access `model.metadata["uid"]` like on a kopf Body
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(AttrDict, self).__init__(*args, **kwargs)
+        self.__dict__ = self
+
+
+class BeibootIndex:
+    """
+    An in-memory index of all Beiboot objects, fed by the Beiboot watch stream of the operator.
+    The index is keyed by the name of the Beiboot object and additionally indexed by the Beiboot namespace and by
+    the current state of the Beiboot.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_name: Dict[str, dict] = {}
+        self._by_namespace: Dict[str, str] = {}
+        self._by_state: Dict[str, Set[str]] = {}
+        self.primed = False
+
+    @staticmethod
+    def _name(body: dict) -> str:
+        return body["metadata"]["name"]
+
+    def _drop(self, name: str) -> None:
+        old = self._by_name.pop(name, None)
+        if old is None:
+            return
+        if namespace := old.get("beibootNamespace"):
+            if self._by_namespace.get(namespace) == name:
+                del self._by_namespace[namespace]
+        if state := old.get("state"):
+            self._by_state.get(state, set()).discard(name)
+
+    def upsert(self, body: dict) -> None:
+        """
+        Add or replace a Beiboot object in the index
+
+        :param body: The raw body of the Beiboot object
+        :type body: dict
+        """
+        body = copy.deepcopy(dict(body))
+        name = self._name(body)
+        with self._lock:
+            self._drop(name)
+            self._by_name[name] = body
+            if namespace := body.get("beibootNamespace"):
+                self._by_namespace[namespace] = name
+            if state := body.get("state"):
+                self._by_state.setdefault(state, set()).add(name)
+
+    def remove(self, body: dict) -> None:
+        """
+        Remove a Beiboot object from the index
+
+        :param body: The raw body of the Beiboot object
+        :type body: dict
+        """
+        with self._lock:
+            self._drop(self._name(body))
+
+    def prime(self, items: List[dict]) -> None:
+        """
+        Replace the content of the index with the given list of Beiboot objects, e.g. from an initial list request
+
+        :param items: The raw Beiboot objects
+        :type items: List[dict]
+        """
+        with self._lock:
+            self._by_name.clear()
+            self._by_namespace.clear()
+            self._by_state.clear()
+            for item in items:
+                self.upsert(item)
+            self.primed = True
+        logger.debug(f"Beiboot index primed with {len(items)} object(s)")
+
+    def get_by_name(self, name: str) -> Optional[AttrDict]:
+        with self._lock:
+            if body := self._by_name.get(name):
+                return AttrDict(copy.deepcopy(body))
+        return None
+
+    def get_by_namespace(self, namespace: str) -> Optional[AttrDict]:
+        with self._lock:
+            if name := self._by_namespace.get(namespace):
+                return self.get_by_name(name)
+        return None
+
+    def get_by_state(self, state: str) -> List[AttrDict]:
+        with self._lock:
+            return [
+                self.get_by_name(name)  # type: ignore
+                for name in sorted(self._by_state.get(state, set()))
+            ]
+
+    def all(self) -> List[AttrDict]:
+        with self._lock:
+            return [self.get_by_name(name) for name in sorted(self._by_name)]  # type: ignore
+
+    def has_namespace(self, namespace: str) -> bool:
+        with self._lock:
+            return namespace in self._by_namespace
+
+    def namespaces(self) -> Set[str]:
+        with self._lock:
+            return set(self._by_namespace.keys())
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._by_name.keys())
+
+    def count_by_state(self) -> Dict[str, int]:
+        with self._lock:
+            return {state: len(names) for state, names in self._by_state.items()}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._by_name)
+
+
+beiboot_index = BeibootIndex()
+
+
+class NodeIndex:
+    """
+    An in-memory index of the external IP addresses of all nodes of the host cluster, fed by the node watch stream
+    of the operator
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ips: Dict[str, List[str]] = {}
+        self.primed = False
+
+    @staticmethod
+    def _external_ips(body: dict) -> List[str]:
+        addresses = (body.get("status") or {}).get("addresses") or []
+        return [
+            str(address["address"])
+            for address in addresses
+            if address.get("type") == "ExternalIP"
+        ]
+
+    def upsert(self, body: dict) -> None:
+        with self._lock:
+            self._ips[body["metadata"]["name"]] = self._external_ips(body)
+
+    def remove(self, body: dict) -> None:
+        with self._lock:
+            self._ips.pop(body["metadata"]["name"], None)
+
+    def prime(self, items: List[dict]) -> None:
+        with self._lock:
+            self._ips = {
+                item["metadata"]["name"]: self._external_ips(item) for item in items
+            }
+            self.primed = True
+
+    def external_ips(self) -> List[str]:
+        with self._lock:
+            return [ip for name in sorted(self._ips) for ip in self._ips[name]]
+
+
+node_index = NodeIndex()
+
+
+class NamespaceCache:
+    """
+    A thread-safe in-memory store for data of Beiboot clusters, keyed by the Beiboot namespace
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Any] = {}
+
+    def get(self, namespace: str) -> Optional[Any]:
+        with self._lock:
+            return self._data.get(namespace)
+
+    def set(self, namespace: str, value: Any) -> None:
+        with self._lock:
+            self._data[namespace] = value
+
+    def remove(self, namespace: str) -> None:
+        with self._lock:
+            self._data.pop(namespace, None)
+
+    def __contains__(self, namespace: str) -> bool:
+        with self._lock:
+            return namespace in self._data
+
+
+# the kubeconfig of each Beiboot cluster, as published by the cluster itself
+kubeconfigs = NamespaceCache()
+# the client TLS material of the tunnel of each Beiboot cluster, together with the uid of the tunnel Pod
+client_tls = NamespaceCache()
+# the service account token data of each Beiboot cluster
+serviceaccount_tokens = NamespaceCache()
+# the latest client heartbeat of each Beiboot cluster, from the clients ConfigMap
+client_heartbeats = NamespaceCache()
+# the latest heartbeat of each client of each Beiboot cluster, from the client Leases: {Lease name: renew time}
+client_leases = NamespaceCache()
+# the tunnel services of each Beiboot cluster: {service name: {"nodePort": ..., "targetPort": ...}}
+tunnel_services = NamespaceCache()
+
+
+def forget_namespace(namespace: str) -> None:
+    """
+    Drop all cached data of the Beiboot cluster in the given namespace
+
+    :param namespace: The namespace of the Beiboot cluster
+    :type namespace: str
+    """
+    for cache in [
+        kubeconfigs,
+        client_tls,
+        serviceaccount_tokens,
+        client_heartbeats,
+        client_leases,
+        tunnel_services,
+    ]:
+        cache.remove(namespace)
@@ -1,6 +1,6 @@
+import asyncio
 import base64
 import json
-import uuid
 from datetime import datetime, timedelta
 from json import JSONDecodeError
 from typing import Optional, Tuple
@@ -9,19 +9,25 @@ import kubernetes as k8s
 import kopf
 
 import beiboot.comps.ghostunnel as ghostunnel
+from beiboot.api import AsyncApi
+from beiboot.events import create_event, event_publisher
+from beiboot.cache import serviceaccount_tokens
 from beiboot.comps.client_timeout import (
     create_clients_heartbeat_configmap,
     get_latest_client_heartbeat,
 )
 from beiboot.configuration import BeibootConfiguration, ClusterConfiguration
+from beiboot.pool import UNBOUND_PARAMETERS, is_bound
 from beiboot.provider.abstract import AbstractClusterProvider
 from beiboot.provider.factory import cluster_factory, ProviderType
+from beiboot.resources.apply import apply_objects
 from beiboot.resources.services import ports_to_services
+from beiboot.signals import workload_signals
 from beiboot.resources.utils import (
     handle_create_namespace,
-    handle_create_service,
     handle_delete_namespace,
     handle_create_beiboot_serviceaccount,
+    handle_rebind_beiboot_serviceaccount,
     get_serviceaccount_data,
 )
 from beiboot.utils import StateMachine, AsyncState, parse_timedelta
@@ -33,6 +39,8 @@ class BeibootCluster(StateMachine):
     The body of the Beiboot CRD is available as self.model
     """
 
+    metrics_kind = "beiboot"
+
     requested = AsyncState("Cluster requested", initial=True, value="REQUESTED")
     preparing = AsyncState("Cluster preparing", value="PREPARING")
     restoring = AsyncState("Cluster restoring", value="RESTORING")
@@ -41,20 +49,40 @@ class BeibootCluster(StateMachine):
     running = AsyncState("Cluster running", value="RUNNING")
     ready = AsyncState("Cluster ready", value="READY")
     error = AsyncState("Cluster error", value="ERROR")
+    hibernated = AsyncState("Cluster hibernated", value="HIBERNATED")
     terminating = AsyncState("Cluster terminating", value="TERMINATING")
 
     prepare = requested.to(preparing) | error.to(preparing)
     restore = preparing.to(restoring) | error.to(restoring)
     create = preparing.to(creating) | restoring.to(creating) | error.to(creating)
     boot = creating.to(pending)
+    bind = requested.to(running)
     operate = pending.to(running)
     reconcile = running.to(ready) | ready.to.itself() | error.to(ready)
     recover = error.to(running)
+    hibernate = hibernated.from_(ready, running)
+    resume = hibernated.to(pending)
     impair = error.from_(
-        ready, running, pending, restoring, creating, preparing, requested, error
+        ready,
+        running,
+        pending,
+        restoring,
+        creating,
+        preparing,
+        requested,
+        hibernated,
+        error,
     )
     terminate = terminating.from_(
-        pending, preparing, restoring, creating, running, ready, error, terminating
+        pending,
+        preparing,
+        restoring,
+        creating,
+        running,
+        ready,
+        hibernated,
+        error,
+        terminating,
     )
 
     def __init__(
@@ -70,9 +98,11 @@ class BeibootCluster(StateMachine):
         self.logger = logger
         self.configuration = configuration
         self.parameters = parameters
-        self.custom_api = k8s.client.CustomObjectsApi()
-        self.core_api = k8s.client.CoreV1Api()
-        self.events_api = k8s.client.EventsV1Api()
+        self.custom_api = AsyncApi(k8s.client.CustomObjectsApi())
+        self.core_api = AsyncApi(k8s.client.CoreV1Api())
+        self._provider: Optional[AbstractClusterProvider] = None
+        # the namespace of a standby cluster this Beiboot has been bound to
+        self._bound_namespace: Optional[str] = None
 
     @property
     def name(self) -> str:
@@ -82,12 +112,22 @@ class BeibootCluster(StateMachine):
         """
         return self.model["metadata"]["name"]
 
+    @property
+    def uid(self) -> Optional[str]:
+        """
+        It returns the K8s uid of the cluster
+        :return: The K8s uid of the cluster.
+        """
+        return self.model["metadata"].get("uid")
+
     @property
     def namespace(self) -> str:
         """
         If the namespace was already persisted to the CRD object, take it from there, otherwise, generate the name
         :return: The namespace name.
         """
+        if self._bound_namespace:
+            return self._bound_namespace
         # if the namespace was already persisted to the CRD object, take it from there
         if namespace := self.model.get("beibootNamespace"):
             return namespace
@@ -100,9 +140,12 @@ class BeibootCluster(StateMachine):
     @property
     def provider(self) -> AbstractClusterProvider:
         """
-        It creates a cluster provider object based on the provider type
+        It returns the cluster provider object based on the provider type. The provider is created once per
+        BeibootCluster and reused by the factory for the same Beiboot as long as its parameters do not change.
         :return: The provider is being returned.
         """
+        if self._provider is not None:
+            return self._provider
         provider = cluster_factory.get(
             ProviderType(self.model.get("provider")),
             self.configuration,
@@ -112,11 +155,13 @@ class BeibootCluster(StateMachine):
             self.parameters.ports,
             self.logger,
             self.model.get("fromShelf"),
+            uid=self.uid,
         )
         if provider is None:
             raise kopf.PermanentError(
                 f"Cannot create Beiboot with provider {self.model.get('provider')}: not supported."
             )
+        self._provider = provider
         return provider
 
     @property
@@ -142,40 +187,65 @@ class BeibootCluster(StateMachine):
             return None
 
     @property
-    def should_terminate(self) -> bool:
+    async def should_terminate(self) -> bool:
         if self.sunset and self.sunset <= datetime.utcnow():
             # remove this cluster because the sunset time is in the past
             self.logger.warning(
                 f"Beiboot '{self.name}' should terminate due to reached sunset date"
             )
             return True
-        if self.parameters.maxSessionTimeout:
+        if self.parameters.maxSessionTimeout and not self.hibernate_on_session_timeout:
             # remove this cluster if no heartbeat from any client was received within the timeout window
-            td = parse_timedelta(self.parameters.maxSessionTimeout)
-            latest_heartbeat = get_latest_client_heartbeat(self.namespace)
-            if latest_heartbeat is None and self.completed_transition(
-                BeibootCluster.ready.value
-            ):
-                ready_timestamp = datetime.fromisoformat(
-                    self.completed_transition(BeibootCluster.ready.value).strip("Z")  # type: ignore
-                )
-                if ready_timestamp + td < datetime.utcnow():
-                    self.logger.warning(
-                        f"Beiboot '{self.name}' should terminate due to client timeout (no client connected): "
-                        f"{ready_timestamp + td} < {datetime.utcnow()}"
-                    )
-                    return True
-            elif (
-                latest_heartbeat is not None
-                and latest_heartbeat + td < datetime.utcnow()
-            ):
+            return await self._session_timed_out("terminate")
+        return False
+
+    @property
+    async def should_hibernate(self) -> bool:
+        if (
+            self.parameters.maxSessionTimeout
+            and self.hibernate_on_session_timeout
+            and (self.is_ready or self.is_running)
+        ):
+            # hibernate this cluster if no heartbeat from any client was received within the timeout window
+            return await self._session_timed_out("hibernate")
+        return False
+
+    @property
+    def hibernate_on_session_timeout(self) -> bool:
+        return self.parameters.hibernateOnSessionTimeout is True
+
+    async def _session_timed_out(self, action: str) -> bool:
+        td = parse_timedelta(self.parameters.maxSessionTimeout)  # type: ignore
+        latest_heartbeat = await get_latest_client_heartbeat(self.namespace)
+        if latest_heartbeat is None and self.completed_transition(
+            BeibootCluster.ready.value
+        ):
+            ready_timestamp = datetime.fromisoformat(
+                self.completed_transition(BeibootCluster.ready.value).strip("Z")  # type: ignore
+            )
+            if ready_timestamp + td < datetime.utcnow():
                 self.logger.warning(
-                    f"Beiboot '{self.name}' should terminate due to client timeout: "
-                    f"{latest_heartbeat + td} < {datetime.utcnow()}"
+                    f"Beiboot '{self.name}' should {action} due to client timeout (no client connected): "
+                    f"{ready_timestamp + td} < {datetime.utcnow()}"
                 )
                 return True
+        elif latest_heartbeat is not None and latest_heartbeat + td < datetime.utcnow():
+            self.logger.warning(
+                f"Beiboot '{self.name}' should {action} due to client timeout: "
+                f"{latest_heartbeat + td} < {datetime.utcnow()}"
+            )
+            return True
         return False
 
+    @property
+    def is_resuming(self) -> bool:
+        """
+        Returns True if this cluster is pending after it has been hibernated
+        """
+        return self.is_pending and bool(
+            self.completed_transition(BeibootCluster.hibernated.value)
+        )
+
     def completed_transition(self, state_value: str) -> Optional[str]:
         """
         Read the stateTransitions attribute, return the value of the stateTransitions timestamp for the given
@@ -239,6 +309,9 @@ class BeibootCluster(StateMachine):
                     BeibootCluster.error.value: self.completed_transition(
                         BeibootCluster.error.value
                     ),
+                    BeibootCluster.hibernated.value: self.completed_transition(
+                        BeibootCluster.hibernated.value
+                    ),
                 }.items(),
             )
         )
@@ -257,7 +330,7 @@ class BeibootCluster(StateMachine):
         else:
             return None
 
-    def on_enter_requested(self) -> None:
+    async def on_enter_requested(self) -> None:
         """
         > The function `on_enter_requested` is called when the state machine enters the `requested` state
         """
@@ -278,7 +351,7 @@ class BeibootCluster(StateMachine):
 
     async def on_enter_preparing(self):
         try:
-            handle_create_namespace(self.logger, self.namespace)
+            await handle_create_namespace(self.logger, self.namespace)
         except k8s.client.ApiException as e:
             try:
                 body = json.loads(e.body)
@@ -324,7 +397,7 @@ class BeibootCluster(StateMachine):
                 f"Cluster {self.name} is in state RESTORING, but has not 'fromShelf' set!"
             )
 
-    def on_enter_creating(self):
+    async def on_enter_creating(self):
         """
         > The function posts an event to the Kubernetes API, and then patches the custom resource with the namespace
         """
@@ -339,7 +412,7 @@ class BeibootCluster(StateMachine):
         """
         import dataclasses
 
-        self._patch_object(
+        await self._patch_object(
             {
                 "beibootNamespace": self.namespace,
                 "parameters": dataclasses.asdict(self.parameters),
@@ -373,27 +446,31 @@ class BeibootCluster(StateMachine):
         if additional_services:
             requested_services.extend(additional_services)
 
-        # create the services
-        services = []
-        for svc in requested_services:
-            self.logger.debug("Creating: " + str(svc))
-            services.append(handle_create_service(self.logger, svc, self.namespace))
+        # apply the services
+        services = await apply_objects(self.logger, requested_services, self.namespace)
 
-        # create a service account for this beiboot cluster
-        handle_create_beiboot_serviceaccount(self.logger, self.name, self.namespace)
-        create_clients_heartbeat_configmap(self.logger, self.namespace)
-        # also create the tunnel exports for services
-        try:
-            await ghostunnel.handle_ghostunnel_components(
-                expose_services=services,
-                namespace=self.namespace,
-                configuration=self.configuration,
-                parameters=self.parameters,
-            )
-        except Exception as e:
-            self.logger.error(str(e))
+        async def _ghostunnel_components():
+            # the tunnel exports for services
+            try:
+                await ghostunnel.handle_ghostunnel_components(
+                    expose_services=services,
+                    namespace=self.namespace,
+                    configuration=self.configuration,
+                    parameters=self.parameters,
+                )
+            except Exception as e:
+                self.logger.error(str(e))
+
+        # a service account for this beiboot cluster, the clients ConfigMap and the tunnel are independent
+        await asyncio.gather(
+            handle_create_beiboot_serviceaccount(
+                self.logger, self.name, self.namespace
+            ),
+            create_clients_heartbeat_configmap(self.logger, self.namespace),
+            _ghostunnel_components(),
+        )
 
-        self._patch_object(
+        await self._patch_object(
             {
                 "parameters": {
                     "ports": self.provider.get_ports(),
@@ -401,32 +478,91 @@ class BeibootCluster(StateMachine):
             }
         )
 
+    async def on_bind(self, standby: dict):
+        """
+        It takes over the booted cluster of a standby Beiboot (see `beiboot.pool`): the namespace and parameters of
+        the standby are written to this Beiboot and the service account of the cluster is replaced
+
+        :param standby: The body of the claimed standby Beiboot
+        :type standby: dict
+        """
+        namespace = standby["beibootNamespace"]
+        parameters = dict(standby["parameters"])
+        for key in UNBOUND_PARAMETERS:
+            parameters[key] = getattr(self.parameters, key)
+        data = {"beibootNamespace": namespace, "parameters": parameters}
+        if self.parameters.maxLifetime:
+            td = parse_timedelta(self.parameters.maxLifetime)
+            sunset = datetime.utcnow() + td
+            data["sunset"] = sunset.isoformat(timespec="microseconds") + "Z"
+        # the namespace is handed over right away, not with the state of this transition
+        await self._send_patch(data)
+        self._bound_namespace = namespace
+        self.parameters = self.configuration.refresh_k8s_config(parameters)
+
+        await handle_rebind_beiboot_serviceaccount(
+            self.logger, standby["metadata"]["name"], self.name, namespace
+        )
+        serviceaccount_tokens.remove(namespace)
+        self.post_event(
+            self.running.value,
+            f"The cluster '{self.name}' has been bound to the standby cluster "
+            f"'{standby['metadata']['name']}'",
+        )
+
+    @property
+    def is_bound(self) -> bool:
+        """
+        Returns True if this Beiboot has taken over the cluster of a standby in this transition
+        """
+        return self._bound_namespace is not None
+
     async def on_boot(self):
         self.post_event(
             self.pending.value,
             f"Now waiting for the cluster '{self.name}' to enter ready state",
         )
 
-    async def on_operate(self):
-        """
-        If the cluster is running, post the event and return. If the cluster is pending, check if it's been pending for
-        longer than the timeout. If it has, raise a permanent error. If it hasn't, raise a temporary error
-        """
-        if await self.provider.running() and await ghostunnel.ghostunnel_ready(
-            self.namespace
-        ):
+    async def _workloads_running(self) -> Tuple[bool, bool]:
+        return await asyncio.gather(
+            self.provider.running(), ghostunnel.ghostunnel_ready(self.namespace)
+        )  # type: ignore
+
+    async def on_operate(self, wait: float = 0):
+        """
+        If the cluster is running, post the event and return. If the cluster is pending, wait up to the given number
+        of seconds for it to become running: the workloads are checked again on each StatefulSet or Deployment change
+        in the namespace (see `handle_workload_status`), and at least every PENDING_POLL_INTERVAL. If it is still
+        pending, check if it's been pending for longer than the timeout. If it has, raise a permanent error. If it
+        hasn't, raise a temporary error
+
+        :param wait: The maximum number of seconds to wait for the cluster to become running
+        :type wait: float
+        """
+        provider_running, tunnel_ready = await self._workloads_running()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while not (provider_running and tunnel_ready) and loop.time() < deadline:
+            await workload_signals.wait(
+                self.namespace,
+                timeout=min(
+                    deadline - loop.time(), self.configuration.PENDING_POLL_INTERVAL
+                ),
+            )
+            provider_running, tunnel_ready = await self._workloads_running()
+        if provider_running and tunnel_ready:
             await self._write_tunnel_data()
-            # calculate the sunset time for this Beiboot
-            if self.parameters.maxLifetime:
+            # calculate the sunset time for this Beiboot (once, a resumed cluster keeps it)
+            if self.parameters.maxLifetime and not self.sunset:
                 td = parse_timedelta(self.parameters.maxLifetime)
                 sunset = datetime.utcnow() + td
-                self._patch_object(
+                await self._patch_object(
                     {"sunset": sunset.isoformat(timespec="microseconds") + "Z"}
                 )
         else:
             self.logger.info(
-                f"Beiboot provider running: {await self.provider.running()} | "
-                f"ghostunnel running {await ghostunnel.ghostunnel_ready(self.namespace)}"
+                f"Beiboot provider running: {provider_running} | "
+                f"ghostunnel running {tunnel_ready}"
             )
             # check how long this cluster is pending
             if pending_timestamp := self.completed_transition(
@@ -450,9 +586,10 @@ class BeibootCluster(StateMachine):
                     f"Waiting for cluster '{self.name}' to enter running state", delay=1
                 )
 
-    async def on_enter_running(self) -> None:
+    async def on_enter_running(self, *args, **kwargs) -> None:
         """
-        It creates the Gefyra service in the namespace of the Beiboot, and adds the endpoint and port to the kubeconfig
+        It creates the Gefyra service in the namespace of the Beiboot, and adds the endpoint and port to the kubeconfig.
+        The arguments of the transition into this state (the standby of `bind`, the wait of `operate`) are ignored.
         """
         raw_kubeconfig = await self.kubeconfig
         if raw_kubeconfig:
@@ -496,7 +633,7 @@ class BeibootCluster(StateMachine):
             except Exception as e:
                 self.logger.error(f"Could not set up Gefyra: {str(e)}")
 
-        self._patch_object(body_patch)
+        await self._patch_object(body_patch)
 
     async def on_reconcile(self) -> None:
         """
@@ -511,9 +648,9 @@ class BeibootCluster(StateMachine):
                 )
             await self._write_tunnel_data()
             # write the latest client heartbeat to the Beiboot object
-            latest_heartbeat = get_latest_client_heartbeat(self.namespace)
+            latest_heartbeat = await get_latest_client_heartbeat(self.namespace)
             if latest_heartbeat:
-                self._patch_object(
+                await self._patch_object(
                     {
                         "lastClientContact": latest_heartbeat.isoformat(
                             timespec="microseconds"
@@ -541,6 +678,38 @@ class BeibootCluster(StateMachine):
                 # cannot reconcile cluster that was never in running state
                 raise kopf.TemporaryError(delay=1)
 
+    async def on_hibernate(self):
+        """
+        It scales the cluster and its tunnel down to zero, the volumes of the cluster are kept
+        """
+        try:
+            await ghostunnel.hibernate_ghostunnel(self.namespace)
+            await self.provider.hibernate()
+        except k8s.client.ApiException as e:
+            raise kopf.TemporaryError(
+                f"Cannot hibernate cluster '{self.name}': {e.reason}", delay=5
+            )
+        self.post_event(
+            self.hibernated.value,
+            f"The cluster '{self.name}' has been hibernated due to client timeout",
+        )
+
+    async def on_resume(self):
+        """
+        It scales a hibernated cluster and its tunnel back up, the cluster is running again once it is operated
+        """
+        try:
+            await self.provider.resume()
+            await ghostunnel.resume_ghostunnel(self.namespace)
+        except k8s.client.ApiException as e:
+            raise kopf.TemporaryError(
+                f"Cannot resume cluster '{self.name}': {e.reason}", delay=5
+            )
+        self.post_event(
+            self.pending.value,
+            f"The cluster '{self.name}' is resuming after a client connected",
+        )
+
     async def on_impair(self, reason: str):
         self.post_event(self.error.value, f"The cluster has become defective: {reason}")
 
@@ -551,6 +720,10 @@ class BeibootCluster(StateMachine):
         """
         It deletes the provider and then deletes the namespace
         """
+        if is_bound(self.model):
+            # this standby has been bound to another Beiboot, which owns its cluster now
+            await self._delete_object()
+            return
         try:
             await self.provider.delete()
             await ghostunnel.remove_ghostunnel_components(self.namespace)
@@ -564,8 +737,11 @@ class BeibootCluster(StateMachine):
                 )
         except k8s.client.ApiException:
             pass
+        await self._delete_object()
+
+    async def _delete_object(self):
         try:
-            self.custom_api.delete_namespaced_custom_object(
+            await self.custom_api.delete_namespaced_custom_object(
                 namespace=self.configuration.NAMESPACE,
                 name=self.name,
                 group="getdeck.dev",
@@ -575,7 +751,7 @@ class BeibootCluster(StateMachine):
         except k8s.client.ApiException:
             pass
 
-    def on_enter_state(self, destination, *args, **kwargs):
+    async def on_enter_state(self, destination, *args, **kwargs):
         """
         If the current state value is not the same as the latest state value, write the current state value to the
         Beiboot object
@@ -585,16 +761,16 @@ class BeibootCluster(StateMachine):
         if self.get_latest_state():
             state, _ = self.get_latest_state()
             if self.current_state_value != state:
-                self._write_state()
+                await self._write_state()
         else:
-            self._write_state()
+            await self._write_state()
 
     def _get_now(self) -> str:
         return datetime.utcnow().isoformat(timespec="microseconds") + "Z"
 
     def post_event(self, reason: str, message: str, _type: str = "Normal") -> None:
         """
-        It creates an event object and posts it to the Kubernetes API
+        It queues an event object for the Kubernetes API, the event is posted in the background
 
         :param reason: The reason for the event
         :type reason: str
@@ -603,28 +779,17 @@ class BeibootCluster(StateMachine):
         :param _type: The type of event, defaults to Normal
         :type _type: str (optional)
         """
-        now = self._get_now()
-        event = k8s.client.EventsV1Event(
-            metadata=k8s.client.V1ObjectMeta(
-                name=f"{self.name}-{uuid.uuid4()}",
-                namespace=self.configuration.NAMESPACE,
-            ),
-            reason=reason.capitalize(),
-            note=message[:1024],  # maximum message length
-            event_time=now,
-            action="Beiboot-State",
-            type=_type,
-            reporting_instance="beiboot-operator",
-            reporting_controller="beiboot-operator",
-            regarding=k8s.client.V1ObjectReference(
-                kind="beiboot",
+        event_publisher.publish(
+            create_event(
                 name=self.name,
                 namespace=self.configuration.NAMESPACE,
+                kind="beiboot",
                 uid=self.model.metadata["uid"],
-            ),
-        )
-        self.events_api.create_namespaced_event(
-            namespace=self.configuration.NAMESPACE, body=event
+                action="Beiboot-State",
+                reason=reason,
+                message=message,
+                _type=_type,
+            )
         )
 
     async def _write_tunnel_data(self):
@@ -641,29 +806,46 @@ class BeibootCluster(StateMachine):
         )
         tunnel["ghostunnel"] = {"ports": nodeports, "mtls": tls_data}
         # service account tokens
-        sa_token = await get_serviceaccount_data(self.name, self.namespace)
+        sa_token = serviceaccount_tokens.get(self.namespace)
+        if sa_token is None:
+            sa_token = await get_serviceaccount_data(self.name, self.namespace)
+            if sa_token:
+                serviceaccount_tokens.set(self.namespace, sa_token)
         tunnel["serviceaccount"] = sa_token
-        self._patch_object({"tunnel": tunnel})
-
-    def _write_state(self):
-        self.custom_api.patch_namespaced_custom_object(
-            namespace=self.configuration.NAMESPACE,
-            name=self.name,
-            body={
-                "state": self.current_state.value,
-                "stateTransitions": {self.current_state.value: self._get_now()},
-            },
-            group="getdeck.dev",
-            plural="beiboots",
-            version="v1",
-        )
+        if self._is_stored("tunnel", tunnel):
+            return
+        await self._patch_object({"tunnel": tunnel})
 
-    def _patch_object(self, data: dict):
-        self.custom_api.patch_namespaced_custom_object(
-            namespace=self.configuration.NAMESPACE,
-            name=self.name,
-            body=data,
-            group="getdeck.dev",
-            plural="beiboots",
-            version="v1",
+    def _is_stored(self, key: str, value) -> bool:
+        """
+        Returns True if the Beiboot object already holds the given value for the given key
+        """
+        stored = self.model.get(key)
+        if stored is None:
+            return False
+        return json.dumps(stored, sort_keys=True, default=dict) == json.dumps(
+            value, sort_keys=True, default=dict
         )
+
+    async def _write_state(self):
+        data = {
+            "state": self.current_state.value,
+            "stateTransitions": {self.current_state.value: self._get_now()},
+        }
+        await self._patch_object(data)
+
+    async def _send_patch(self, data: dict):
+        try:
+            await self.custom_api.patch_namespaced_custom_object(
+                namespace=self.configuration.NAMESPACE,
+                name=self.name,
+                body=data,
+                group="getdeck.dev",
+                plural="beiboots",
+                version="v1",
+            )
+        except k8s.client.exceptions.ApiException as e:
+            if e.status == 404:
+                # the object has been removed in the meantime
+                return
+            raise e
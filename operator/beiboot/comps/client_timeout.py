@@ -3,14 +3,21 @@ from typing import Optional
 
 import kubernetes as k8s
 
+from beiboot.api import AsyncApi
+from beiboot.cache import client_heartbeats, client_leases
+from beiboot.resources.apply import apply_object
+
+# the legacy heartbeat ConfigMap, clients write a Lease each (see LEASE_LABEL) instead
 CONFIGMAP_NAME = "beiboot-clients"
+CONFIGMAP_LABELS = {"beiboot.getdeck.dev/clients": "true"}
+LEASE_LABEL = "beiboot.getdeck.dev/client-heartbeat"
 
-core_api = k8s.client.CoreV1Api()
+core_api = AsyncApi(k8s.client.CoreV1Api())
 
 
-def create_clients_heartbeat_configmap(logger, namespace: str) -> None:
+async def create_clients_heartbeat_configmap(logger, namespace: str) -> None:
     """
-    It creates a ConfigMap in the namespace where the Beiboot is running
+    It applies a ConfigMap in the namespace where the Beiboot is running, the data is left to the clients
 
     :param logger: a logger object
     :param namespace: The namespace where the ConfigMap will be created
@@ -19,37 +26,27 @@ def create_clients_heartbeat_configmap(logger, namespace: str) -> None:
     configmap = k8s.client.V1ConfigMap(
         api_version="v1",
         kind="ConfigMap",
-        data={},
         metadata=k8s.client.V1ObjectMeta(
             name=CONFIGMAP_NAME,
             namespace=namespace,
+            labels=CONFIGMAP_LABELS,
         ),
     )
     try:
-        core_api.create_namespaced_config_map(namespace=namespace, body=configmap)
+        await apply_object(configmap, namespace)
     except k8s.client.exceptions.ApiException as e:
         logger.error(e)
         logger.error(f"Cannot create ConfigMap for Beiboot clients: {e.reason}")
 
 
-def get_latest_client_heartbeat(namespace: str) -> Optional[datetime]:
+def parse_latest_heartbeat(clients: Optional[dict]) -> Optional[datetime]:
     """
-    It reads the configmap, and returns the most recent heartbeat
+    It returns the most recent heartbeat of the data of the clients ConfigMap
 
-    :param namespace: The namespace that the configmap is in
-    :type namespace: str
-    :return: The most recent heartbeat from the configmap.
+    :param clients: The data of the clients ConfigMap
+    :type clients: dict
+    :return: The most recent heartbeat
     """
-    try:
-        configmap = core_api.read_namespaced_config_map(
-            name=CONFIGMAP_NAME, namespace=namespace
-        )
-    except k8s.client.exceptions.ApiException as e:
-        if e.status == 404:
-            return None
-        else:
-            raise e
-    clients = configmap.data
     if not clients:
         return None
     most_recent_connect: Optional[str] = None
@@ -63,3 +60,64 @@ def get_latest_client_heartbeat(namespace: str) -> Optional[datetime]:
         return datetime.fromisoformat(most_recent_connect)
     else:
         return None
+
+
+def parse_lease_renew_time(lease: dict) -> Optional[datetime]:
+    """
+    It returns the renew time of a client heartbeat Lease
+
+    :param lease: The body of the Lease
+    :type lease: dict
+    :return: The renew time
+    """
+    renew_time = (lease.get("spec") or {}).get("renewTime")
+    if not renew_time:
+        return None
+    try:
+        return datetime.fromisoformat(renew_time.strip("Z"))
+    except ValueError:
+        return None
+
+
+def _latest(*heartbeats: Optional[datetime]) -> Optional[datetime]:
+    known = [heartbeat for heartbeat in heartbeats if heartbeat is not None]
+    return max(known) if known else None
+
+
+def cached_client_heartbeat(namespace: str) -> Optional[datetime]:
+    """
+    It returns the most recent heartbeat that is known from the client Lease and ConfigMap watches
+
+    :param namespace: The namespace of the Beiboot cluster
+    :type namespace: str
+    :return: The most recent heartbeat
+    """
+    leases = client_leases.get(namespace) or {}
+    return _latest(client_heartbeats.get(namespace), *leases.values())
+
+
+async def get_latest_client_heartbeat(namespace: str) -> Optional[datetime]:
+    """
+    It returns the most recent heartbeat of all client Leases and the (legacy) clients ConfigMap. The ConfigMap is
+    only read if the ConfigMap watch has not yet seen it.
+
+    :param namespace: The namespace of the Beiboot cluster
+    :type namespace: str
+    :return: The most recent heartbeat
+    """
+    if namespace in client_heartbeats:
+        return cached_client_heartbeat(namespace)
+    try:
+        configmap = await core_api.read_namespaced_config_map(
+            name=CONFIGMAP_NAME, namespace=namespace
+        )
+    except k8s.client.exceptions.ApiException as e:
+        if e.status == 404:
+            configmap = None
+        else:
+            raise e
+    leases = client_leases.get(namespace) or {}
+    return _latest(
+        parse_latest_heartbeat(configmap.data if configmap else None),
+        *leases.values(),
+    )
@@ -5,13 +5,14 @@ import yaml  # type: ignore
 
 import kubernetes as k8s
 
+from beiboot.api import AsyncApi
 from beiboot.configuration import ClusterConfiguration
-from beiboot.resources.utils import handle_create_service
+from beiboot.resources.apply import apply_object
 from beiboot.utils import get_external_node_ips
 
 logger = logging.getLogger("beiboot.gefyra")
-custom_api = k8s.client.CustomObjectsApi()
-core_api = k8s.client.CoreV1Api()
+custom_api = AsyncApi(k8s.client.CustomObjectsApi())
+core_api = AsyncApi(k8s.client.CoreV1Api())
 
 GEFYRA_SERVICE_NAME = "gefyra-nodeport"
 
@@ -45,15 +46,11 @@ async def create_gefyra_components(
     namespace: str,
     parameters: ClusterConfiguration,
 ) -> Tuple[int, str]:
-    svc = handle_create_service(
-        logger,
-        gefyra_service(namespace, parameters),
-        namespace,
-    )
+    svc = await apply_object(gefyra_service(namespace, parameters), namespace)
     gefyra_nodeport = svc.spec.ports[0].node_port
     gefyra_endpoint = parameters.gefyra.get("endpoint")
     if bool(gefyra_endpoint) is False:
-        _ips = get_external_node_ips(core_api)
+        _ips = await get_external_node_ips(core_api)
         gefyra_endpoint = _ips[0] if _ips else None
     return int(gefyra_nodeport), str(gefyra_endpoint)
 
@@ -64,7 +61,7 @@ async def handle_gefyra_components(
     parameters: ClusterConfiguration,
 ) -> Tuple[str, str, str]:
     try:
-        gefyra_service = core_api.read_namespaced_service(
+        gefyra_service = await core_api.read_namespaced_service(
             name=GEFYRA_SERVICE_NAME, namespace=namespace
         )
         gefyra_nodeport = (
@@ -74,7 +71,7 @@ async def handle_gefyra_components(
         )
         gefyra_endpoint = parameters.gefyra.get("endpoint")
         if bool(gefyra_endpoint) is False:
-            _ips = get_external_node_ips(core_api)
+            _ips = await get_external_node_ips(core_api)
             gefyra_endpoint = _ips[0] if _ips else None
     except k8s.client.ApiException as e:
         if e.status == 404:
@@ -1,21 +1,31 @@
+import base64
 import logging
+import shlex
 from typing import Optional, Tuple
 
 import kopf
 import kubernetes as k8s
 
+from beiboot.api import AsyncApi
+from beiboot.cache import client_tls, tunnel_services
+from beiboot.comps.pki import create_tunnel_pki
 from beiboot.configuration import BeibootConfiguration, ClusterConfiguration
-from beiboot.resources.utils import handle_create_service, handle_create_deployment
+from beiboot.resources.apply import apply_all, apply_object
+from beiboot.signals import WORKLOAD_LABELS
 from beiboot.utils import get_external_node_ips, get_label_selector, exec_command_pod
 
 logger = logging.getLogger("beiboot.ghostunnel")
-app_api = k8s.client.AppsV1Api()
-core_api = k8s.client.CoreV1Api()
+app_api = AsyncApi(k8s.client.AppsV1Api())
+core_api = AsyncApi(k8s.client.CoreV1Api())
 
 GHOSTUNNEL_NAME = "beiboot-tunnel"
 GHOSTUNNEL_LABELS = {"beiboot.dev": "tunnel"}
 GHOSTUNNEL_PROBE_PORT = 61535
+# the entrypoint of the ghostunnel image
+GHOSTUNNEL_BINARY = "/usr/bin/ghostunnel"
 GHOSTUNNEL_DEPOT = "/pki"
+# the PKI of the tunnel (see `handle_tunnel_pki`)
+GHOSTUNNEL_PKI_SECRET = "beiboot-tunnel-pki"
 
 
 def _ghostunnel_service_mapping(svc: k8s.client.V1Service) -> Tuple[str, str]:
@@ -49,101 +59,95 @@ def ghostunnel_service(port: int, namespace: str) -> k8s.client.V1Service:
     return service
 
 
-def create_ghostunnel_workload(
-    port_mappings: list[Tuple[str, str]],
-    namespace: str,
-    configuration: BeibootConfiguration,
-    parameters: ClusterConfiguration,
-) -> k8s.client.V1Deployment:
-    certstrap_init = k8s.client.V1Container(
-        name="certstrap-init",
-        image=configuration.CERTSTRAP_IMAGE,
-        image_pull_policy="IfNotPresent",
-        args=[
-            "--depot-path",
-            "/out",
-            "init",
-            "--common-name",
-            namespace,
-            "--passphrase",
-            "",
-        ],
-        volume_mounts=[
-            k8s.client.V1VolumeMount(name="pki-data", mount_path="/out"),
-        ],
-    )
-    _ips = get_external_node_ips(core_api)
+async def handle_tunnel_pki(namespace: str, parameters: ClusterConfiguration) -> None:
+    """
+    It creates the PKI of the tunnel and stores it in a Secret that is mounted by the tunnel (see
+    `create_ghostunnel_workload`). An existing PKI is kept, as the clients hold the tunnel data of it.
+
+    :param namespace: The namespace of the Beiboot cluster
+    :type namespace: str
+    :param parameters: The parameters of the Beiboot cluster
+    :type parameters: ClusterConfiguration
+    """
+    try:
+        await core_api.read_namespaced_secret(GHOSTUNNEL_PKI_SECRET, namespace)
+        return
+    except k8s.client.ApiException as e:
+        if e.status != 404:
+            raise e
+    _ips = await get_external_node_ips(core_api)
     _endpoint = parameters.tunnel.get("endpoint")
     if _endpoint:
         _ips.append(_endpoint)
-    certstrap_request_server = k8s.client.V1Container(
-        name="certstrap-server-request",
-        image=configuration.CERTSTRAP_IMAGE,
-        image_pull_policy="IfNotPresent",
-        args=[
-            "--depot-path",
-            "/out",
-            "request-cert",
-            "server",
-            "--common-name",
-            "server",
-            "--passphrase",
-            "",
-            "-ip",
-            f"{','.join(_ips)}",
-        ],
-        volume_mounts=[
-            k8s.client.V1VolumeMount(name="pki-data", mount_path="/out"),
-        ],
-    )
-    certstrap_request_client = k8s.client.V1Container(
-        name="certstrap-client-request",
-        image=configuration.CERTSTRAP_IMAGE,
-        image_pull_policy="IfNotPresent",
-        args=[
-            "--depot-path",
-            "/out",
-            "request-cert",
-            "client",
-            "--common-name",
-            "client",
-            "--passphrase",
-            "",
-        ],
-        volume_mounts=[
-            k8s.client.V1VolumeMount(name="pki-data", mount_path="/out"),
-        ],
-    )
-    certstrap_sign_server = k8s.client.V1Container(
-        name="certstrap-server-sign",
-        image=configuration.CERTSTRAP_IMAGE,
-        image_pull_policy="IfNotPresent",
-        args=["--depot-path", "/out", "sign", "server", "--CA", namespace],
-        volume_mounts=[
-            k8s.client.V1VolumeMount(name="pki-data", mount_path="/out"),
-        ],
+    files = await create_tunnel_pki(namespace, _ips)
+    secret = k8s.client.V1Secret(
+        metadata=k8s.client.V1ObjectMeta(
+            name=GHOSTUNNEL_PKI_SECRET, namespace=namespace, labels=GHOSTUNNEL_LABELS
+        ),
+        string_data=files,
     )
-    certstrap_sign_client = k8s.client.V1Container(
-        name="certstrap-client-sign",
-        image=configuration.CERTSTRAP_IMAGE,
-        image_pull_policy="IfNotPresent",
-        args=["--depot-path", "/out", "sign", "client", "--CA", namespace],
-        volume_mounts=[
-            k8s.client.V1VolumeMount(name="pki-data", mount_path="/out"),
-        ],
+    try:
+        # not applied, a PKI created in the meantime must not be replaced
+        await core_api.create_namespaced_secret(namespace, secret)
+        logger.info(f"Created the tunnel PKI in {namespace}")
+    except k8s.client.ApiException as e:
+        if e.status != 409:
+            raise e
+
+
+def _supervise(commands: list[list[str]]) -> str:
+    """
+    It returns a shell script that runs all commands in the background and exits as soon as one of them exits, hence
+    the container is restarted if one listener fails. Stopping the script stops all commands.
+
+    :param commands: The commands to run
+    :type commands: list[list[str]]
+    :return: The shell script
+    """
+    lines = ["trap 'exit 0' TERM INT", "trap 'trap - TERM INT; kill 0' EXIT", "pids="]
+    for command in commands:
+        lines.append(f"{shlex.join(command)} &")
+        lines.append('pids="$pids $!"')
+    # kill -0 fails if any of the processes is gone
+    lines.append("while kill -0 $pids 2>/dev/null; do sleep 2; done")
+    lines.append("exit 1")
+    return "\n".join(lines)
+
+
+def _probe_command(probe_ports: list[int]) -> list[str]:
+    checks = " && ".join(
+        f"curl -s http://localhost:{probe_port}/_status | grep -q listening"
+        for probe_port in probe_ports
     )
+    return ["sh", "-c", checks]
 
-    proxy_containers = []
 
+def create_ghostunnel_workload(
+    port_mappings: list[Tuple[str, str]],
+    namespace: str,
+    configuration: BeibootConfiguration,
+) -> k8s.client.V1Deployment:
+    """
+    It returns the tunnel Deployment. Ghostunnel serves one listener per process, all of them run in a single
+    container (with a single probe) instead of one container per port.
+
+    :param port_mappings: The listen address and the target of each tunneled port
+    :type port_mappings: list[Tuple[str, str]]
+    :param namespace: The namespace of the Beiboot cluster
+    :type namespace: str
+    :param configuration: The Beiboot configuration
+    :type configuration: BeibootConfiguration
+    :return: The Deployment
+    """
+    commands = []
+    ports = []
+    probe_ports = []
     for idx, mapping in enumerate(port_mappings):
         source, target = mapping
-        port = int(source.split(":")[1])
         probe_port = GHOSTUNNEL_PROBE_PORT + idx
-        container = k8s.client.V1Container(
-            name=f"ghostunnel-{port}",
-            image=configuration.GHOSTUNNEL_IMAGE,
-            image_pull_policy="IfNotPresent",
-            args=[
+        commands.append(
+            [
+                GHOSTUNNEL_BINARY,
                 "server",
                 "--listen",
                 source,
@@ -160,57 +164,49 @@ def create_ghostunnel_workload(
                 "client",
                 "--status",
                 f"http://localhost:{probe_port}",
-            ],
-            ports=[
-                k8s.client.V1ContainerPort(container_port=port),
-                k8s.client.V1ContainerPort(container_port=probe_port),
-            ],
-            resources=k8s.client.V1ResourceRequirements(
-                requests={"cpu": "0.2", "memory": "32Mi"},
-                limits={"memory": "128Mi"},
-            ),
-            readiness_probe=k8s.client.V1Probe(
-                _exec=k8s.client.V1ExecAction(
-                    command=[
-                        "sh",
-                        "-c",
-                        f"curl http://localhost:{probe_port}/_status 2>/dev/null | grep listening",
-                    ]
-                ),
-                period_seconds=2,
-                initial_delay_seconds=5,
-            ),
-            startup_probe=k8s.client.V1Probe(
-                _exec=k8s.client.V1ExecAction(
-                    command=[
-                        "sh",
-                        "-c",
-                        f"curl http://localhost:{probe_port}/_status 2>/dev/null | grep listening",
-                    ]
-                ),
-                period_seconds=2,
-                failure_threshold=10,
-            ),
-            volume_mounts=[
-                k8s.client.V1VolumeMount(name="pki-data", mount_path=GHOSTUNNEL_DEPOT),
-            ],
+            ]
         )
-        proxy_containers.append(container)
+        ports.append(
+            k8s.client.V1ContainerPort(container_port=int(source.split(":")[1]))
+        )
+        probe_ports.append(probe_port)
+
+    container = k8s.client.V1Container(
+        name="ghostunnel",
+        image=configuration.GHOSTUNNEL_IMAGE,
+        image_pull_policy="IfNotPresent",
+        command=["sh", "-c", _supervise(commands)],
+        ports=ports,
+        resources=k8s.client.V1ResourceRequirements(
+            # a ghostunnel process takes about 16Mi
+            requests={"cpu": "0.2", "memory": f"{16 + 16 * len(commands)}Mi"},
+            limits={"memory": f"{64 + 64 * len(commands)}Mi"},
+        ),
+        readiness_probe=k8s.client.V1Probe(
+            _exec=k8s.client.V1ExecAction(command=_probe_command(probe_ports)),
+            period_seconds=2,
+            initial_delay_seconds=5,
+        ),
+        startup_probe=k8s.client.V1Probe(
+            _exec=k8s.client.V1ExecAction(command=_probe_command(probe_ports)),
+            period_seconds=2,
+            failure_threshold=10,
+        ),
+        volume_mounts=[
+            k8s.client.V1VolumeMount(name="pki-data", mount_path=GHOSTUNNEL_DEPOT),
+        ],
+    )
 
     template = k8s.client.V1PodTemplateSpec(
         metadata=k8s.client.V1ObjectMeta(labels=GHOSTUNNEL_LABELS),
         spec=k8s.client.V1PodSpec(
-            init_containers=[
-                certstrap_init,
-                certstrap_request_server,
-                certstrap_request_client,
-                certstrap_sign_server,
-                certstrap_sign_client,
-            ],
-            containers=proxy_containers,
+            containers=[container],
             volumes=[
                 k8s.client.V1Volume(
-                    name="pki-data", empty_dir=k8s.client.V1EmptyDirVolumeSource()
+                    name="pki-data",
+                    secret=k8s.client.V1SecretVolumeSource(
+                        secret_name=GHOSTUNNEL_PKI_SECRET
+                    ),
                 )
             ],
         ),
@@ -225,7 +221,9 @@ def create_ghostunnel_workload(
     workload = k8s.client.V1Deployment(
         api_version="apps/v1",
         metadata=k8s.client.V1ObjectMeta(
-            name=GHOSTUNNEL_NAME, namespace=namespace, labels=GHOSTUNNEL_LABELS
+            name=GHOSTUNNEL_NAME,
+            namespace=namespace,
+            labels={**GHOSTUNNEL_LABELS, **WORKLOAD_LABELS},
         ),
         spec=spec,
     )
@@ -241,8 +239,8 @@ async def handle_ghostunnel_components(
 
     _mappings = list(map(_ghostunnel_service_mapping, expose_services))
     logger.info("Creating ghostunnel mTLS")
-    deploy = create_ghostunnel_workload(_mappings, namespace, configuration, parameters)
-    handle_create_deployment(logger, deploy, namespace)
+    await handle_tunnel_pki(namespace, parameters)
+    deploy = create_ghostunnel_workload(_mappings, namespace, configuration)
 
     # creating multiple services, must be handled appropriately
     nodeport_services = []
@@ -259,32 +257,118 @@ async def handle_ghostunnel_components(
             nodeport_services.append(ghostunnel_service(int(port), namespace))
     for nodeport_service in nodeport_services:
         logger.info(f"Requesting tunnel Nodeport: {nodeport_service.metadata.name}")
-        handle_create_service(logger, nodeport_service, namespace)
+    deploy_result, *service_results = await apply_all(
+        logger, [deploy] + nodeport_services, namespace
+    )
+    if not deploy_result.ok:
+        raise deploy_result.error  # type: ignore
+    for result in service_results:
+        if not result.ok:
+            # the other ports are still tunneled
+            logger.error(f"Cannot create tunnel service {result.name}: {result.error}")
 
 
 async def remove_ghostunnel_components(namespace: str) -> None:
     try:
-        app_api.delete_namespaced_stateful_set(
+        await app_api.delete_namespaced_stateful_set(
             namespace=namespace, name=GHOSTUNNEL_NAME
         )
     except k8s.client.ApiException:
         pass
     try:
-        svcs = core_api.list_namespaced_service(
+        svcs = await core_api.list_namespaced_service(
             namespace=namespace, label_selector=get_label_selector(GHOSTUNNEL_LABELS)
         )
         for svc in svcs.items:
-            core_api.delete_namespaced_service(
+            await core_api.delete_namespaced_service(
                 namespace=namespace, name=svc.metadata.name
             )
     except k8s.client.ApiException:
         pass
 
 
+async def hibernate_ghostunnel(namespace: str) -> None:
+    """
+    It scales the tunnel down to zero. The tunnel is resumed with the same PKI (see `resume_ghostunnel`), hence the
+    tunnel data of the clients stays valid. Tunnels that created their PKI themselves (before the PKI was stored in
+    a Secret) get it backed up to that Secret.
+
+    :param namespace: The namespace of the Beiboot cluster
+    :type namespace: str
+    """
+    if await _read_tunnel_pki(namespace) is None:
+        await _backup_tunnel_pki(namespace)
+    await app_api.patch_namespaced_deployment_scale(
+        name=GHOSTUNNEL_NAME, namespace=namespace, body={"spec": {"replicas": 0}}
+    )
+
+
+async def _backup_tunnel_pki(namespace: str) -> None:
+    tunnel_pods = await core_api.list_namespaced_pod(
+        namespace, label_selector=get_label_selector(GHOSTUNNEL_LABELS)
+    )
+    if tunnel_pods.items:
+        tunnel_pod = tunnel_pods.items[0]
+        files = {}
+        for filename in [
+            f"{namespace}.crt",
+            "server.crt",
+            "server.key",
+            "client.crt",
+            "client.key",
+        ]:
+            files[filename] = await exec_command_pod(
+                core_api,
+                tunnel_pod.metadata.name,
+                namespace,
+                tunnel_pod.spec.containers[0].name,
+                ["cat", f"{GHOSTUNNEL_DEPOT}/{filename}"],
+            )
+        secret = k8s.client.V1Secret(
+            metadata=k8s.client.V1ObjectMeta(
+                name=GHOSTUNNEL_PKI_SECRET, namespace=namespace
+            ),
+            string_data=files,
+        )
+        await apply_object(secret, namespace)
+    else:
+        logger.warning(f"There is no tunnel Pod to back up the PKI in {namespace}")
+
+
+async def resume_ghostunnel(namespace: str) -> None:
+    """
+    It scales the tunnel of a hibernated cluster back up, the tunnel uses the PKI from its Secret (if there is one)
+    instead of generating a new one
+
+    :param namespace: The namespace of the Beiboot cluster
+    :type namespace: str
+    """
+    deployment = await app_api.read_namespaced_deployment(GHOSTUNNEL_NAME, namespace)
+    try:
+        await core_api.read_namespaced_secret(GHOSTUNNEL_PKI_SECRET, namespace)
+    except k8s.client.ApiException as e:
+        if e.status != 404:
+            raise e
+        logger.warning(f"There is no tunnel PKI backup in {namespace}")
+    else:
+        pod_spec = deployment.spec.template.spec
+        pod_spec.init_containers = None
+        pod_spec.volumes = [
+            k8s.client.V1Volume(
+                name="pki-data",
+                secret=k8s.client.V1SecretVolumeSource(
+                    secret_name=GHOSTUNNEL_PKI_SECRET
+                ),
+            )
+        ]
+    deployment.spec.replicas = 1
+    await app_api.replace_namespaced_deployment(GHOSTUNNEL_NAME, namespace, deployment)
+
+
 async def ghostunnel_ready(namespace: str) -> bool:
     labels = get_label_selector(GHOSTUNNEL_LABELS)
     try:
-        deploys = app_api.list_namespaced_deployment(
+        deploys = await app_api.list_namespaced_deployment(
             namespace,
             label_selector=labels,
         )
@@ -308,45 +392,86 @@ async def ghostunnel_ready(namespace: str) -> bool:
         return False
 
 
+async def _read_tunnel_pki(namespace: str) -> Optional[dict[str, str]]:
+    try:
+        secret = await core_api.read_namespaced_secret(GHOSTUNNEL_PKI_SECRET, namespace)
+    except k8s.client.ApiException as e:
+        if e.status != 404:
+            raise e
+        return None
+    return {
+        filename: base64.b64decode(content).decode("utf-8")
+        for filename, content in (secret.data or {}).items()
+    }
+
+
 async def extract_client_tls(namespace: str) -> dict[str, str]:
-    labels = get_label_selector(GHOSTUNNEL_LABELS)
+    if cached := client_tls.get(namespace):
+        return cached[1]
     try:
-        tunnel_pods = core_api.list_namespaced_pod(
-            namespace,
-            label_selector=labels,
+        if pki := await _read_tunnel_pki(namespace):
+            files = {
+                "client.crt": pki["client.crt"],
+                "client.key": pki["client.key"],
+                "ca.crt": pki[f"{namespace}.crt"],
+            }
+            # the PKI does not change for the lifetime of the cluster
+            client_tls.set(namespace, (None, files))
+            return files
+        return await _extract_client_tls_exec(namespace)
+    except k8s.client.ApiException as e:
+        logger.error(e)
+        raise kopf.TemporaryError("The beiboot tunnel is not yet ready.", delay=2)
+
+
+async def _extract_client_tls_exec(namespace: str) -> dict[str, str]:
+    # tunnels that created their PKI themselves, it does not change for the lifetime of the tunnel Pod (see
+    # `handle_tunnel_pod_events`)
+    labels = get_label_selector(GHOSTUNNEL_LABELS)
+    tunnel_pods = await core_api.list_namespaced_pod(
+        namespace,
+        label_selector=labels,
+    )
+    if len(tunnel_pods.items) != 1:
+        logger.warning(
+            f"There is not exactly one API Pod, it is {len(tunnel_pods.items)}"
         )
-        if len(tunnel_pods.items) != 1:
-            logger.warning(
-                f"There is not exactly one API Pod, it is {len(tunnel_pods.items)}"
-            )
-        tunnel_pod = tunnel_pods.items[0]
-        # we can use the first container, as all running container sharing the same volume containing the PKI
-        _container = tunnel_pod.spec.containers[0]
+    tunnel_pod = tunnel_pods.items[0]
+    # we can use the first container, as all running container sharing the same volume containing the PKI
+    _container = tunnel_pod.spec.containers[0]
 
-        files = {}
-        for filename in ["client.crt", "client.key", f"{namespace}.crt"]:
-            content = exec_command_pod(
-                core_api,
-                tunnel_pod.metadata.name,
-                namespace,
-                _container.name,
-                ["cat", f"{GHOSTUNNEL_DEPOT}/{filename}"],
+    files = {}
+    for filename in ["client.crt", "client.key", f"{namespace}.crt"]:
+        content = await exec_command_pod(
+            core_api,
+            tunnel_pod.metadata.name,
+            namespace,
+            _container.name,
+            ["cat", f"{GHOSTUNNEL_DEPOT}/{filename}"],
+        )
+        if "No such file or directory" in content:
+            raise kopf.TemporaryError(
+                f"The tunnel certificate {filename} is not yet ready.", delay=2
             )
-            if "No such file or directory" in content:
-                raise kopf.TemporaryError(
-                    f"The tunnel certificate {filename} is not yet ready.", delay=2
-                )
-            else:
-                if filename == f"{namespace}.crt":
-                    files["ca.crt"] = content
-                else:
-                    files[filename] = content
         else:
-            return files
+            if filename == f"{namespace}.crt":
+                files["ca.crt"] = content
+            else:
+                files[filename] = content
+    client_tls.set(namespace, (tunnel_pod.metadata.uid, files))
+    return files
 
-    except k8s.client.ApiException as e:
-        logger.error(e)
-        raise kopf.TemporaryError("The beiboot tunnel is not yet ready.", delay=2)
+
+def tunnel_service_ports(service: dict) -> dict:
+    """
+    It returns the node port and the target port of a (raw) tunnel service
+
+    :param service: The raw body of the tunnel service
+    :type service: dict
+    :return: The node port and the target port
+    """
+    port = service["spec"]["ports"][0]
+    return {"nodePort": port.get("nodePort"), "targetPort": port.get("targetPort")}
 
 
 async def get_tunnel_nodeports(
@@ -354,18 +479,29 @@ async def get_tunnel_nodeports(
 ) -> Optional[list[dict]]:
     node_mappings = []
     try:
-        services = core_api.list_namespaced_service(
-            namespace=namespace, label_selector=get_label_selector(GHOSTUNNEL_LABELS)
-        )
-        for service in services.items:
-            tunnel_endpoint = parameters.tunnel.get("endpoint")
-            if bool(tunnel_endpoint) is False:
-                _ips = get_external_node_ips(core_api)
-                tunnel_endpoint = _ips[0] if _ips else None
+        # the tunnel services are tracked by the operator (see `handle_tunnel_service_events`)
+        ports = tunnel_services.get(namespace)
+        if ports is None:
+            services = await core_api.list_namespaced_service(
+                namespace=namespace,
+                label_selector=get_label_selector(GHOSTUNNEL_LABELS),
+            )
+            ports = {
+                service.metadata.name: {
+                    "nodePort": service.spec.ports[0].node_port,
+                    "targetPort": service.spec.ports[0].target_port,
+                }
+                for service in services.items
+            }
+        tunnel_endpoint = parameters.tunnel.get("endpoint")
+        if ports and bool(tunnel_endpoint) is False:
+            _ips = await get_external_node_ips(core_api)
+            tunnel_endpoint = _ips[0] if _ips else None
+        for name in sorted(ports):
             node_mappings.append(
                 {
-                    "endpoint": f"{tunnel_endpoint}:{service.spec.ports[0].node_port}",
-                    "target": service.spec.ports[0].target_port,
+                    "endpoint": f"{tunnel_endpoint}:{ports[name]['nodePort']}",
+                    "target": ports[name]["targetPort"],
                 }
             )
     except k8s.client.ApiException as e:
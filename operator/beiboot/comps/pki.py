@@ -0,0 +1,162 @@
+import asyncio
+import ipaddress
+import logging
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from certbuilder import CertificateBuilder, pem_armor_certificate  # type: ignore
+from oscrypto import asymmetric  # type: ignore
+
+from beiboot.api import run_sync
+from beiboot.configuration import configuration
+
+logger = logging.getLogger("beiboot.pki")
+
+# the common names of the tunnel certificates, ghostunnel only accepts clients with CLIENT_CN (see `--allow-cn`)
+SERVER_CN = "server"
+CLIENT_CN = "client"
+CERTIFICATE_LIFETIME = timedelta(days=730)
+
+KeyPair = Tuple[asymmetric.PublicKey, asymmetric.PrivateKey]
+
+
+class KeyPool:
+    """
+    A pool of pre-generated RSA key pairs for the tunnel PKI of Beiboot clusters. Generating a key pair takes a
+    while, hence the pool is refilled up to its size in the background (in the bounded API thread pool). If the pool
+    is empty, a key pair is generated on demand.
+    """
+
+    def __init__(self, size: int, bit_size: int = 2048):
+        self.size = size
+        self.bit_size = bit_size
+        self._keys: Deque[KeyPair] = deque()
+        self._task: Optional[asyncio.Task] = None
+
+    def _generate(self) -> KeyPair:
+        return asymmetric.generate_pair("rsa", bit_size=self.bit_size)
+
+    async def get(self) -> KeyPair:
+        """
+        It returns a key pair, either from the pool or freshly generated
+
+        :return: The public and the private key
+        """
+        try:
+            pair = self._keys.popleft()
+        except IndexError:
+            pair = await run_sync(self._generate)
+        self.start()
+        return pair
+
+    async def _refill(self) -> None:
+        while len(self._keys) < self.size:
+            self._keys.append(await run_sync(self._generate))
+        logger.debug(f"The key pool holds {len(self._keys)} key pair(s)")
+
+    def start(self) -> None:
+        """
+        Refill the pool in the background, unless it is full or a refill is running
+        """
+        if len(self._keys) >= self.size or (self._task and not self._task.done()):
+            return
+        self._task = asyncio.get_running_loop().create_task(self._refill())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+def _split_hosts(hosts: List[str]) -> Tuple[List[str], List[str]]:
+    ips, domains = [], []
+    for host in hosts:
+        try:
+            ips.append(str(ipaddress.ip_address(host)))
+        except ValueError:
+            domains.append(host)
+    return ips, domains
+
+
+def _certificate(
+    common_name: str,
+    public_key: asymmetric.PublicKey,
+    signing_key: asymmetric.PrivateKey,
+    issuer=None,
+    usage: Optional[Set[str]] = None,
+    hosts: Optional[List[str]] = None,
+):
+    builder = CertificateBuilder({"common_name": common_name}, public_key)
+    now = datetime.now(timezone.utc)
+    builder.begin_date = now - timedelta(minutes=5)
+    builder.end_date = now + CERTIFICATE_LIFETIME
+    if issuer is None:
+        builder.self_signed = True
+        builder.ca = True
+    else:
+        builder.issuer = issuer
+        builder.extended_key_usage = usage
+    if hosts:
+        builder.subject_alt_ips, builder.subject_alt_domains = _split_hosts(hosts)
+    return builder.build(signing_key)
+
+
+def _private_key_pem(private_key: asymmetric.PrivateKey) -> str:
+    return asymmetric.dump_private_key(private_key, None).decode("utf-8")
+
+
+def _certificate_pem(certificate) -> str:
+    return pem_armor_certificate(certificate).decode("utf-8")
+
+
+async def create_tunnel_pki(namespace: str, server_hosts: List[str]) -> Dict[str, str]:
+    """
+    It creates the PKI of the tunnel of a Beiboot cluster: a CA (named after the namespace), a server certificate
+    for the given hosts and a client certificate, both signed by the CA. The files are named like the ones certstrap
+    used to create, i.e. {namespace}.crt, server.crt, server.key, client.crt and client.key.
+
+    :param namespace: The namespace of the Beiboot cluster
+    :type namespace: str
+    :param server_hosts: The IP addresses (or domains) the tunnel is reachable at
+    :type server_hosts: List[str]
+    :return: The PEM encoded files of the PKI
+    """
+    ca_keys, server_keys, client_keys = await asyncio.gather(
+        key_pool.get(), key_pool.get(), key_pool.get()
+    )
+    ca_public, ca_private = ca_keys
+    server_public, server_private = server_keys
+    client_public, client_private = client_keys
+
+    def _sign() -> Dict[str, str]:
+        ca = _certificate(namespace, ca_public, ca_private)
+        server = _certificate(
+            SERVER_CN,
+            server_public,
+            ca_private,
+            issuer=ca,
+            usage={"server_auth"},
+            hosts=server_hosts,
+        )
+        client = _certificate(
+            CLIENT_CN, client_public, ca_private, issuer=ca, usage={"client_auth"}
+        )
+        return {
+            f"{namespace}.crt": _certificate_pem(ca),
+            "server.crt": _certificate_pem(server),
+            "server.key": _private_key_pem(server_private),
+            "client.crt": _certificate_pem(client),
+            "client.key": _private_key_pem(client_private),
+        }
+
+    return await run_sync(_sign)
+
+
+key_pool = KeyPool(
+    size=configuration.PKI_KEY_POOL_SIZE, bit_size=configuration.PKI_KEY_SIZE
+)
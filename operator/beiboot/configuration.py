@@ -1,4 +1,6 @@
+import copy
 import logging
+import threading
 from dataclasses import dataclass, fields, field
 from json import JSONDecodeError
 from typing import Optional
@@ -12,6 +14,11 @@ __VERSION__ = "0.12.0"
 logger = logging.getLogger("beiboot")
 
 
+# keys of the Beiboot configuration ConfigMap that configure the operator rather than the clusters
+K3S_TAG_CATALOG_KEY = "k3sImageTags"
+OPERATOR_CONFIGMAP_KEYS = [K3S_TAG_CATALOG_KEY]
+
+
 @dataclass
 class ClusterConfiguration:
     k8sVersion: Optional[str] = field(default_factory=lambda: None)
@@ -66,6 +73,8 @@ class ClusterConfiguration:
     ports: Optional[list[str]] = field(default_factory=lambda: None)
     maxLifetime: Optional[str] = field(default_factory=lambda: None)
     maxSessionTimeout: Optional[str] = field(default_factory=lambda: None)
+    # hibernate the cluster instead of removing it once the session timeout is reached
+    hibernateOnSessionTimeout: bool = field(default_factory=lambda: False)
 
     @staticmethod
     def _merge(source, destination):
@@ -125,6 +134,8 @@ class ClusterConfiguration:
         _s = cls()
         field_names = [field.name for field in fields(_s)]
         for k, v in configmap.data.items():
+            if k in OPERATOR_CONFIGMAP_KEYS:
+                continue
             if k not in field_names:
                 logger.warning(f"The configuration key '{k}' is unknown.")
             else:
@@ -139,6 +150,44 @@ class BeibootConfiguration:
     def refresh_k8s_config(
         self, overrides: Optional[dict] = None
     ) -> ClusterConfiguration:
+        """
+        It returns a copy of the cluster configuration with the given overrides merged in. The cluster configuration
+        is read from the Beiboot ConfigMap only once and then kept up to date by the ConfigMap watch (see
+        `set_cluster_config` and `invalidate_cluster_config`)
+
+        :param overrides: Parameters that override the cluster configuration, e.g. from a Beiboot object
+        :type overrides: Optional[dict]
+        :return: The ClusterConfiguration
+        """
+        with self._lock:
+            if self._cluster_config is None:
+                self._cluster_config = self._read_k8s_config()
+            _original = copy.deepcopy(self._cluster_config)
+        if overrides:
+            # update the configs coming from the overrides
+            _original.update(overrides)
+        return _original
+
+    def set_cluster_config(self, configmap: k8s.client.V1ConfigMap) -> None:
+        """
+        Replace the cached cluster configuration with the content of the given Beiboot ConfigMap
+
+        :param configmap: The Beiboot ConfigMap
+        :type configmap: k8s.client.V1ConfigMap
+        """
+        cluster_config = ClusterConfiguration.decode_cluster_configuration(configmap)
+        with self._lock:
+            self._cluster_config = cluster_config
+        logger.debug("Beiboot configmap changed; cached cluster configuration updated")
+
+    def invalidate_cluster_config(self) -> None:
+        """
+        Drop the cached cluster configuration, it will be read from the Kubernetes API with the next refresh
+        """
+        with self._lock:
+            self._cluster_config = None
+
+    def _read_k8s_config(self) -> ClusterConfiguration:
         from beiboot.resources.configmaps import create_beiboot_configmap
 
         core_v1_api = k8s.client.CoreV1Api()
@@ -163,18 +212,67 @@ class BeibootConfiguration:
                     logger.error(f"Cannot create configmap for Beiboot: {e.reason}")
             else:
                 raise e  # type: ignore
-        _original = ClusterConfiguration.decode_cluster_configuration(configmap)
-        if overrides:
-            # update the configs coming from the overrides
-            _original.update(overrides)
-        return _original
+        return ClusterConfiguration.decode_cluster_configuration(configmap)
 
     def __init__(self):
         self.NAMESPACE = config("BEIBOOT_NAMESPACE", default="getdeck")
         self.CONFIGMAP_NAME = config("BEIBOOT_CONFIGMAP", default="beiboot-config")
         self.GHOSTUNNEL_IMAGE = "ghostunnel/ghostunnel:v1.7.0"
-        self.CERTSTRAP_IMAGE = "squareup/certstrap:1.3.0"
-        self._cluster_config = None
+        # the number of pre-generated key pairs for the tunnel PKI (three per Beiboot) and their size
+        self.PKI_KEY_POOL_SIZE = config(
+            "BEIBOOT_PKI_KEY_POOL_SIZE", default=6, cast=int
+        )
+        self.PKI_KEY_SIZE = config("BEIBOOT_PKI_KEY_SIZE", default=2048, cast=int)
+        # the maximum number of concurrent (blocking) Kubernetes API calls
+        self.API_WORKERS = config("BEIBOOT_API_WORKERS", default=16, cast=int)
+        # the maximum number of objects applied concurrently for one Beiboot cluster
+        self.APPLY_CONCURRENCY = config(
+            "BEIBOOT_APPLY_CONCURRENCY", default=8, cast=int
+        )
+        # the window (in seconds) in which workload events of a Beiboot cluster are merged into one reconciliation
+        self.RECONCILE_DEBOUNCE = config(
+            "BEIBOOT_RECONCILE_DEBOUNCE", default=5.0, cast=float
+        )
+        # the number of seconds the Beiboot handler waits for a pending cluster to become running, before it retries
+        self.PENDING_WAIT = config("BEIBOOT_PENDING_WAIT", default=20.0, cast=float)
+        # the maximum number of seconds between two checks of a pending cluster, if none of its workloads changes
+        self.PENDING_POLL_INTERVAL = config(
+            "BEIBOOT_PENDING_POLL_INTERVAL", default=5.0, cast=float
+        )
+        # the file of known k3s image tags (a JSON list or one tag per line), they are not looked up in the registry
+        self.K3S_TAG_CATALOG = config("BEIBOOT_K3S_TAG_CATALOG", default="")
+        # the registry (mirror) the k3s image tags are looked up in, defaults to Docker Hub
+        self.K3S_REGISTRY_MIRROR = config("BEIBOOT_K3S_REGISTRY_MIRROR", default="")
+        # the timeout (in seconds) of a k3s image tag lookup in the registry
+        self.K3S_TAG_LOOKUP_TIMEOUT = config(
+            "BEIBOOT_K3S_TAG_LOOKUP_TIMEOUT", default=5.0, cast=float
+        )
+        # only accept the k3s image tags of the catalog, the registry is never contacted (e.g. air-gapped clusters)
+        self.K3S_TAG_CATALOG_ONLY = config(
+            "BEIBOOT_K3S_TAG_CATALOG_ONLY", default=False, cast=bool
+        )
+        # the port of the Prometheus metrics endpoint (/metrics), 0 disables it
+        self.METRICS_PORT = config("BEIBOOT_METRICS_PORT", default=9090, cast=int)
+        # the span exporter of the (optional) tracing: otlp, file or empty to disable tracing
+        self.TRACING = config("BEIBOOT_TRACING", default="")
+        # the OTLP endpoint, defaults to OTEL_EXPORTER_OTLP_TRACES_ENDPOINT or http://localhost:4318/v1/traces
+        self.TRACING_ENDPOINT = config("BEIBOOT_TRACING_ENDPOINT", default="")
+        # the file of the file exporter, one JSON span per line
+        self.TRACING_FILE = config(
+            "BEIBOOT_TRACING_FILE", default="/tmp/beiboot-traces.jsonl"
+        )
+        # the trace file of the (optional) recording of the Kubernetes API traffic, .gz compresses it, empty disables it
+        self.RECORD_FILE = config("BEIBOOT_RECORD_FILE", default="")
+        # record the data of Secrets as is, by default their values are redacted from the trace
+        self.RECORD_SECRETS = config("BEIBOOT_RECORD_SECRETS", default=False, cast=bool)
+        # the standby pools of booted clusters, a JSON list of {"size": <int>, "parameters": {...}}
+        self.WARM_POOL = config("BEIBOOT_WARM_POOL", default="[]")
+        # the interval (in seconds) in which the standby pools are checked and refilled
+        self.WARM_POOL_REFILL_INTERVAL = config(
+            "BEIBOOT_WARM_POOL_REFILL_INTERVAL", default=60.0, cast=float
+        )
+        self._cluster_config: Optional[ClusterConfiguration] = None
+        self._lock = threading.Lock()
 
     def to_dict(self):
         return {k: v for k, v in self.__dict__.items() if k.isupper()}
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict
+
+logger = logging.getLogger("beiboot")
+
+
+class Debouncer:
+    """
+    Runs a coroutine function at most once per window for each key. All triggers for a key that arrive while a run is
+    scheduled are merged into that run; triggers that arrive while a run is in progress schedule one more run.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._dirty: Dict[str, bool] = {}
+        self._functions: Dict[str, Callable[[], Awaitable]] = {}
+
+    def trigger(self, key: str, func: Callable[[], Awaitable]) -> None:
+        """
+        Mark the key as dirty and schedule a run of the given coroutine function, unless one is already scheduled
+
+        :param key: The key to debounce, e.g. the Beiboot namespace
+        :type key: str
+        :param func: The coroutine function to run, the latest one for a key wins
+        :type func: Callable[[], Awaitable]
+        """
+        self._functions[key] = func
+        self._dirty[key] = True
+        task = self._tasks.get(key)
+        if task is None or task.done():
+            self._tasks[key] = asyncio.get_running_loop().create_task(self._run(key))
+
+    def pending(self, key: str) -> bool:
+        return self._dirty.get(key, False)
+
+    async def _run(self, key: str) -> None:
+        try:
+            while self._dirty.get(key):
+                await asyncio.sleep(self.window)
+                self._dirty[key] = False
+                func = self._functions[key]
+                try:
+                    await func()
+                except Exception as e:  # noqa
+                    logger.error(f"Debounced run for {key} failed: {e}")
+        finally:
+            self._tasks.pop(key, None)
+            self._functions.pop(key, None)
+            self._dirty.pop(key, None)
+
+    async def cancel(self) -> None:
+        """
+        Cancel all scheduled runs
+        """
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import kubernetes as k8s
+
+from beiboot import tracing
+from beiboot.api import AsyncApi
+
+logger = logging.getLogger("beiboot.events")
+
+
+class _Series:
+    def __init__(self, uid: str, event: k8s.client.EventsV1Event):
+        self.uid = uid
+        self.name = event.metadata.name
+        self.namespace = event.metadata.namespace
+        # the event until it is created
+        self.event: Optional[k8s.client.EventsV1Event] = event
+        self.count = 1
+        self.sent_count = 0
+        self.last_observed = datetime.utcnow()
+
+    @property
+    def pending(self) -> bool:
+        return self.event is not None or self.count > self.sent_count
+
+
+class _TokenBucket:
+    def __init__(self, burst: int, refill: timedelta):
+        self.burst = burst
+        self.refill = refill
+        self.tokens = float(burst)
+        self.updated = datetime.utcnow()
+
+    def take(self) -> bool:
+        now = datetime.utcnow()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) / self.refill  # type: ignore
+        )
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def next_token(self) -> float:
+        """
+        The seconds until the next token is available
+        """
+        return max(0.0, (1 - self.tokens) * self.refill.total_seconds())
+
+
+class EventPublisher:
+    """
+    A background publisher for the Kubernetes events of the operator. Events are put into a bounded queue and never
+    block the caller; if the queue is full, the event is dropped.
+    Repeated events for the same object with the same reason and message are collapsed into the `series` of the
+    first event. Each object has a token bucket of `burst` events that is refilled by one event per `refill`; events
+    (and series updates) exceeding that are counted in their series and sent with the next token of the object, or
+    when the publisher is stopped.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        burst: int = 25,
+        refill: timedelta = timedelta(seconds=12),
+        series_window: timedelta = timedelta(minutes=10),
+    ):
+        self.maxsize = maxsize
+        self.burst = burst
+        self.refill = refill
+        self.series_window = series_window
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._events_api = AsyncApi(k8s.client.EventsV1Api())
+        self._series: Dict[Tuple[str, str, str], _Series] = {}
+        self._buckets: Dict[str, _TokenBucket] = {}
+        # the scheduled sends of rate limited series, by the uid of the object
+        self._deferred: Dict[str, asyncio.TimerHandle] = {}
+
+    def publish(self, event: k8s.client.EventsV1Event) -> None:
+        """
+        Queue an event for publishing, this never blocks
+
+        :param event: The event to publish
+        :type event: k8s.client.EventsV1Event
+        """
+        self._ensure_running()
+        try:
+            self._queue.put_nowait(event)  # type: ignore
+        except asyncio.QueueFull:
+            logger.warning(f"Event queue is full, dropping event {event.reason}")
+
+    def _ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            item = await self._queue.get()  # type: ignore
+            try:
+                if isinstance(item, str):
+                    # the next token of a rate limited object is available
+                    await self._send_deferred(item)
+                else:
+                    await self._send(item)
+            except Exception as e:  # noqa
+                logger.error(f"Could not publish event: {e}")
+            finally:
+                self._queue.task_done()  # type: ignore
+
+    async def _send(self, event: k8s.client.EventsV1Event) -> None:
+        regarding = event.regarding
+        key = (regarding.uid, event.reason, event.note)
+        now = datetime.utcnow()
+        self._expire(now)
+
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _Series(regarding.uid, event)
+        else:
+            series.count += 1
+            series.last_observed = now
+        bucket = self._buckets.setdefault(
+            regarding.uid, _TokenBucket(self.burst, self.refill)
+        )
+        if not bucket.take():
+            logger.debug(f"Rate limit for events of {regarding.name} exceeded")
+            self._defer(regarding.uid, bucket)
+            return
+        await self._send_series(series)
+
+    async def _send_deferred(self, uid: str) -> None:
+        self._deferred.pop(uid, None)
+        bucket = self._buckets.get(uid)
+        for series in list(self._series.values()):
+            if series.uid != uid or not series.pending:
+                continue
+            if bucket is not None and not bucket.take():
+                self._defer(uid, bucket)
+                return
+            await self._send_series(series)
+
+    async def _send_series(self, series: _Series) -> None:
+        # the series is only updated once the request succeeded, a failed one is sent again with the next repeat
+        count = series.count
+        last_observed = series.last_observed.isoformat(timespec="microseconds") + "Z"
+        if series.event is not None:
+            event = series.event
+            if count > 1:
+                event.series = k8s.client.EventsV1EventSeries(
+                    count=count, last_observed_time=last_observed
+                )
+            await self._events_api.create_namespaced_event(
+                namespace=series.namespace, body=event
+            )
+            series.event = None
+            series.sent_count = count
+        elif count > series.sent_count:
+            await self._events_api.patch_namespaced_event(
+                name=series.name,
+                namespace=series.namespace,
+                body={"series": {"count": count, "lastObservedTime": last_observed}},
+            )
+            series.sent_count = count
+
+    def _defer(self, uid: str, bucket: _TokenBucket) -> None:
+        if uid not in self._deferred:
+            self._deferred[uid] = asyncio.get_running_loop().call_later(
+                bucket.next_token(), self._wake, uid
+            )
+
+    def _wake(self, uid: str) -> None:
+        try:
+            self._queue.put_nowait(uid)  # type: ignore
+        except asyncio.QueueFull:
+            # try again with the next token
+            self._deferred.pop(uid, None)
+            self._defer(uid, self._buckets[uid])
+
+    def _expire(self, now: datetime) -> None:
+        for key, series in list(self._series.items()):
+            if not series.pending and now - series.last_observed > self.series_window:
+                del self._series[key]
+        for uid, bucket in list(self._buckets.items()):
+            if (
+                uid not in self._deferred
+                and bucket.tokens >= bucket.burst
+                and now - bucket.updated > bucket.refill
+            ):
+                del self._buckets[uid]
+
+    async def stop(self) -> None:
+        """
+        Publish the queued events, as well as the rate limited ones, and stop the publisher
+        """
+        if self._task is None:
+            return
+        if not self._task.done():
+            await self._queue.join()  # type: ignore
+            self._task.cancel()
+        self._task = None
+        for handle in self._deferred.values():
+            handle.cancel()
+        self._deferred.clear()
+        for series in list(self._series.values()):
+            if series.pending:
+                try:
+                    await self._send_series(series)
+                except Exception as e:  # noqa
+                    logger.error(f"Could not publish event: {e}")
+
+
+def create_event(
+    name: str,
+    namespace: str,
+    kind: str,
+    uid: str,
+    action: str,
+    reason: str,
+    message: str,
+    _type: str = "Normal",
+) -> k8s.client.EventsV1Event:
+    """
+    It creates an event object for a custom object of the operator
+
+    :param name: The name of the regarding object
+    :type name: str
+    :param namespace: The namespace of the regarding object
+    :type namespace: str
+    :param kind: The kind of the regarding object
+    :type kind: str
+    :param uid: The uid of the regarding object
+    :type uid: str
+    :param action: The action of the event
+    :type action: str
+    :param reason: The reason for the event
+    :type reason: str
+    :param message: The message to be displayed in the event
+    :type message: str
+    :param _type: The type of event, defaults to Normal
+    :type _type: str (optional)
+    :return: The EventsV1Event object
+    """
+    annotations = None
+    if traceparent := tracing.traceparent():
+        # the span that posted this event
+        annotations = {tracing.TRACEPARENT_ANNOTATION: traceparent}
+    return k8s.client.EventsV1Event(
+        metadata=k8s.client.V1ObjectMeta(
+            name=f"{name}-{uuid.uuid4()}",
+            namespace=namespace,
+            annotations=annotations,
+        ),
+        reason=reason.capitalize(),
+        note=message[:1024],  # maximum message length
+        event_time=datetime.utcnow().isoformat(timespec="microseconds") + "Z",
+        action=action,
+        type=_type,
+        reporting_instance="beiboot-operator",
+        reporting_controller="beiboot-operator",
+        regarding=k8s.client.V1ObjectReference(
+            kind=kind,
+            name=name,
+            namespace=namespace,
+            uid=uid,
+        ),
+    )
+
+
+event_publisher = EventPublisher()
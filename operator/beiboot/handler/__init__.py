@@ -3,5 +3,11 @@ from .components import *  # noqa
 from .configure import *  # noqa
 from .beiboots import *  # noqa
 from .clusters import *  # noqa
+from .metrics import *  # noqa
+from .recording import *  # noqa
+from .tracing import *  # noqa
 from .validation import *  # noqa
 from .shelves import *  # noqa
+
+# the filtered watch streams start after all other startup handlers
+from .watches import *  # noqa
@@ -1,15 +1,99 @@
+import logging
 import traceback
 from asyncio import sleep
+from datetime import datetime
 
 import click
 import kopf
+import kubernetes as k8s
 
+from beiboot.cache import (
+    beiboot_index,
+    client_heartbeats,
+    client_leases,
+    forget_namespace,
+)
+from beiboot.comps.client_timeout import (
+    CONFIGMAP_NAME,
+    LEASE_LABEL,
+    cached_client_heartbeat,
+    parse_latest_heartbeat,
+    parse_lease_renew_time,
+)
 from beiboot.configuration import configuration
 from beiboot.clusterstate import BeibootCluster
+from beiboot.comps.pki import key_pool
+from beiboot.metrics import timed
+from beiboot.recording import recorded
+from beiboot.tracing import traced
+from beiboot.pool import is_bound, is_standby, warm_pool
+from beiboot.provider.factory import cluster_factory
+from beiboot.scheduler import DeadlineQueue, ReconcileScheduler, nearest_deadline
+from beiboot.utils import get_label_selector
+from beiboot.watches import on_event
+
+core_api = k8s.client.CoreV1Api()
+coordination_api = k8s.client.CoordinationV1Api()
+objects_api = k8s.client.CustomObjectsApi()
+scheduler_logger = logging.getLogger("beiboot.scheduler")
+
+
+@kopf.on.startup()
+def prime_beiboot_index(logger, **kwargs) -> None:
+    """
+    It lists all Beiboot objects once and primes the in-memory Beiboot index with them. Afterwards the index is
+    kept up to date by the Beiboot watch stream (see `index_beiboot`).
+
+    :param logger: a logger object
+    """
+    try:
+        beiboots = objects_api.list_namespaced_custom_object(
+            group="getdeck.dev",
+            version="v1",
+            namespace=configuration.NAMESPACE,
+            plural="beiboots",
+        )
+        items = beiboots["items"]
+    except k8s.client.exceptions.ApiException as e:
+        if e.status == 404:
+            # the CRD is not yet available, hence there are no Beiboot objects
+            items = []
+        else:
+            raise e
+    beiboot_index.prime(items)
+    logger.info(f"Beiboot index primed with {len(items)} Beiboot(s)")
+
+
+@kopf.on.event("beiboot")
+async def index_beiboot(event, namespace, **kwargs) -> None:
+    """
+    It keeps the in-memory Beiboot index in sync with the Beiboot watch stream
+
+    :param event: The raw watch event of the Beiboot object
+    :param namespace: The namespace of the Beiboot object
+    """
+    if namespace != configuration.NAMESPACE:
+        return
+    if event["type"] == "DELETED":
+        beiboot_index.remove(event["object"])
+        reconcile_scheduler.remove(event["object"]["metadata"]["name"])
+        deadline_queue.remove(event["object"]["metadata"]["name"])
+        cluster_factory.evict(event["object"]["metadata"]["uid"])
+        if is_standby(event["object"]):
+            warm_pool.trigger_refill()
+        if beiboot_namespace := event["object"].get("beibootNamespace"):
+            forget_namespace(beiboot_namespace)
+    else:
+        beiboot_index.upsert(event["object"])
+        schedule_reconciliation(event["object"])
+        schedule_deadline(event["object"])
 
 
 @kopf.on.resume("beiboot")
 @kopf.on.create("beiboot")
+@timed
+@traced
+@recorded
 async def beiboot_created(body, logger, **kwargs):
     """
     > If the cluster is not running, try to create it. If it is running, reconcile it
@@ -21,6 +105,8 @@ async def beiboot_created(body, logger, **kwargs):
     logger.debug(parameters)
     cluster = BeibootCluster(configuration, parameters, model=body, logger=logger)
 
+    await bind_standby(cluster, logger)
+
     if (
         cluster.is_requested
         or cluster.is_preparing
@@ -59,7 +145,8 @@ async def beiboot_created(body, logger, **kwargs):
 
     if cluster.is_pending:
         try:
-            await cluster.operate()  # become running
+            # become running, woken up by the workload changes of the cluster
+            await cluster.operate(wait=configuration.PENDING_WAIT)
             await sleep(1)
         except kopf.PermanentError as e:
             await cluster.impair(str(e))
@@ -91,6 +178,60 @@ async def beiboot_created(body, logger, **kwargs):
                 raise e from None
 
 
+async def bind_standby(cluster: BeibootCluster, logger) -> None:
+    """
+    It binds a ready standby cluster of the warm pool to a requested Beiboot, if there is a matching one
+
+    :param cluster: The Beiboot cluster
+    :param logger: the logger object
+    """
+    if (
+        not cluster.is_requested
+        or not warm_pool.enabled
+        or is_standby(cluster.model)
+        or cluster.model.get("fromShelf")
+    ):
+        return
+    standby = await warm_pool.claim(cluster.name, cluster.parameters)
+    if standby is None:
+        return
+    try:
+        await cluster.bind(standby)
+    except Exception as e:  # noqa
+        if not cluster.is_bound:
+            # the standby has not been handed over, the Beiboot is created as usual
+            logger.warning(f"Could not bind standby: {e}")
+            await warm_pool.unclaim(standby)
+            return
+        await warm_pool.release(standby)
+        await cluster.impair(str(e))
+        raise kopf.PermanentError(str(e))
+    await warm_pool.release(standby)
+
+
+@kopf.on.startup()
+async def start_warm_pool(logger, **kwargs) -> None:
+    """
+    It starts refilling the standby pools of the warm pool, if any are configured (BEIBOOT_WARM_POOL)
+
+    :param logger: a logger object
+    """
+    warm_pool.start()
+    if warm_pool.enabled:
+        logger.info(f"Warm pool started with {len(warm_pool.specs)} pool(s)")
+
+
+@kopf.on.startup()
+async def start_key_pool(logger, **kwargs) -> None:
+    """
+    It starts generating the key pairs for the tunnel PKI of new Beiboots (BEIBOOT_PKI_KEY_POOL_SIZE)
+
+    :param logger: a logger object
+    """
+    key_pool.start()
+    logger.info(f"Key pool started with a size of {key_pool.size}")
+
+
 # this is a workaround to get the --dev flag from the CLI for testing
 # https://kopf.readthedocs.io/en/stable/cli/#development-mode
 try:
@@ -104,24 +245,71 @@ except RuntimeError:
     RECONCILIATION_INTERVAL = 2
 
 
-@kopf.timer("beiboot", interval=RECONCILIATION_INTERVAL)
-async def reconcile_beiboot(body, logger, **kwargs):
+reconcile_scheduler = ReconcileScheduler(interval=RECONCILIATION_INTERVAL)
+
+
+def schedule_reconciliation(body, reschedule: bool = False) -> None:
     """
-    If the cluster is running or ready, it calls the `reconcile` method on it
+    Schedule the next periodic reconciliation of a Beiboot
+
+    :param body: The body of the Beiboot object
+    :param reschedule: Replace an existing schedule (otherwise it is only moved to an earlier time)
+    """
+    reconcile_scheduler.schedule(body, reschedule=reschedule)
+
+
+@kopf.on.startup()
+async def start_reconcile_scheduler(logger, **kwargs) -> None:
+    """
+    It starts the scheduler for the periodic reconciliation of all Beiboots, the Beiboots are scheduled from the
+    Beiboot watch stream (see `index_beiboot`)
 
-    :param body: The body of the Kubernetes resource that triggered the handler
     :param logger: a logger object
     """
+    reconcile_scheduler.start(reconcile_beiboot)
+    logger.info(
+        f"Reconcile scheduler started with a base interval of {RECONCILIATION_INTERVAL}s"
+    )
+
+
+@timed
+async def reconcile_beiboot(name: str):
+    """
+    If the cluster is running or ready, it calls the `reconcile` method on it
+
+    :param name: The name of the Beiboot object that is due
+    """
+    body = beiboot_index.get_by_name(name)
+    if body is None:
+        reconcile_scheduler.remove(name)
+        return
+    success = False
+    try:
+        await _reconcile_beiboot(body, scheduler_logger)
+        success = True
+    finally:
+        reconcile_scheduler.record(name, success)
+        # schedule the next check from the latest state of the Beiboot
+        if body := beiboot_index.get_by_name(name):
+            schedule_reconciliation(body, reschedule=True)
+
+
+async def _reconcile_beiboot(body, logger):
+    if is_bound(body):
+        # a bound standby is about to be removed, its cluster belongs to another Beiboot
+        return
     parameters = configuration.refresh_k8s_config(body.get("parameters"))
     cluster = BeibootCluster(configuration, parameters, model=body, logger=logger)
 
-    if cluster.should_terminate:
-        # terminate this cluster
+    if cluster.is_resuming:
+        # a resumed cluster is not driven by the Beiboot handlers
         try:
-            await cluster.terminate()
-        except Exception as e:
-            logger.error(e)
-            raise kopf.PermanentError(e)
+            await cluster.operate()
+        except kopf.TemporaryError:
+            return
+        except kopf.PermanentError as e:
+            await cluster.impair(str(e))
+            raise e from None
 
     if cluster.is_running or cluster.is_ready:
         try:
@@ -137,7 +325,155 @@ async def reconcile_beiboot(body, logger, **kwargs):
             raise e from None
 
 
+deadline_queue = DeadlineQueue()
+
+
+def schedule_deadline(body, passed: bool = True) -> None:
+    """
+    Set the deadline (sunset or end of the client session timeout) of a Beiboot
+
+    :param body: The body of the Beiboot object
+    :param passed: Set the deadline even if it has already passed
+    :type passed: bool
+    """
+    name = body["metadata"]["name"]
+    if body.get("state") == BeibootCluster.terminating.value:
+        deadline_queue.remove(name)
+        return
+    parameters = configuration.refresh_k8s_config(body.get("parameters"))
+    session_timeout = parameters.maxSessionTimeout
+    if body.get("state") == BeibootCluster.hibernated.value:
+        # a hibernated cluster is only removed at its sunset
+        session_timeout = None
+    last_heartbeat = None
+    if beiboot_namespace := body.get("beibootNamespace"):
+        last_heartbeat = cached_client_heartbeat(beiboot_namespace)
+    deadline = nearest_deadline(body, session_timeout, last_heartbeat)
+    if not passed and deadline is not None and deadline <= datetime.utcnow():
+        deadline_queue.remove(name)
+        return
+    deadline_queue.set(name, deadline)
+
+
+@kopf.on.startup()
+async def start_deadline_queue(logger, **kwargs) -> None:
+    """
+    It starts the queue of the termination deadlines of all Beiboots, the deadlines are set from the Beiboot watch
+    stream (see `index_beiboot`) and the client heartbeat watch streams (see `index_client_leases`)
+
+    :param logger: a logger object
+    """
+    deadline_queue.start(handle_beiboot_deadline)
+    logger.info("Deadline queue started")
+
+
+@on_event(
+    core_api.list_config_map_for_all_namespaces,
+    field_selector=f"metadata.name={CONFIGMAP_NAME}",
+)
+@timed
+async def index_client_heartbeats(event, namespace, logger, **kwargs) -> None:
+    """
+    It keeps the latest client heartbeat of each Beiboot cluster in sync with the clients ConfigMap and moves the
+    session timeout deadline of that Beiboot accordingly
+
+    :param event: The raw watch event of the clients ConfigMap
+    :param namespace: The namespace of the Beiboot cluster
+    """
+    if event["type"] == "DELETED":
+        client_heartbeats.set(namespace, None)
+    else:
+        client_heartbeats.set(
+            namespace, parse_latest_heartbeat(event["object"].get("data"))
+        )
+    if body := beiboot_index.get_by_namespace(namespace):
+        await handle_client_heartbeat(body, logger)
+
+
+@on_event(
+    coordination_api.list_lease_for_all_namespaces,
+    label_selector=get_label_selector({LEASE_LABEL: "true"}),
+)
+@timed
+async def index_client_leases(event, name, namespace, logger, **kwargs) -> None:
+    """
+    It keeps the heartbeats of the clients of each Beiboot cluster in sync with their Leases and moves the session
+    timeout deadline of that Beiboot accordingly
+
+    :param event: The raw watch event of the client Lease
+    :param name: The name of the Lease
+    :param namespace: The namespace of the Beiboot cluster
+    """
+    leases = dict(client_leases.get(namespace) or {})
+    renew_time = (
+        parse_lease_renew_time(event["object"]) if event["type"] != "DELETED" else None
+    )
+    if renew_time is None:
+        leases.pop(name, None)
+    else:
+        leases[name] = renew_time
+    client_leases.set(namespace, leases)
+    if body := beiboot_index.get_by_namespace(namespace):
+        await handle_client_heartbeat(body, logger)
+
+
+async def handle_client_heartbeat(body, logger) -> None:
+    """
+    It moves the session timeout deadline of a Beiboot and resumes a hibernated Beiboot once a client sent a
+    heartbeat after it has been hibernated
+
+    :param body: The body of the Beiboot object
+    :param logger: a logger object
+    """
+    schedule_deadline(body)
+    if body.get("state") != BeibootCluster.hibernated.value:
+        return
+    heartbeat = cached_client_heartbeat(body["beibootNamespace"])
+    hibernated = (body.get("stateTransitions") or {}).get(
+        BeibootCluster.hibernated.value
+    )
+    if (
+        heartbeat
+        and hibernated
+        and heartbeat > datetime.fromisoformat(hibernated.strip("Z"))
+    ):
+        parameters = configuration.refresh_k8s_config(body.get("parameters"))
+        cluster = BeibootCluster(configuration, parameters, model=body, logger=logger)
+        await cluster.resume()
+
+
+@timed
+async def handle_beiboot_deadline(name: str):
+    """
+    It terminates (or hibernates, see `hibernateOnSessionTimeout`) the Beiboot once its deadline has passed
+
+    :param name: The name of the Beiboot object that reached its deadline
+    """
+    body = beiboot_index.get_by_name(name)
+    if body is None:
+        return
+    parameters = configuration.refresh_k8s_config(body.get("parameters"))
+    cluster = BeibootCluster(
+        configuration, parameters, model=body, logger=scheduler_logger
+    )
+    if await cluster.should_terminate:
+        try:
+            await cluster.terminate()
+        except Exception as e:
+            scheduler_logger.error(e)
+            raise kopf.PermanentError(e)
+    elif await cluster.should_hibernate:
+        await cluster.hibernate()
+    elif body := beiboot_index.get_by_name(name):
+        # the deadline has moved in the meantime, or the Beiboot cannot be hibernated in its current state (e.g. it
+        # is still pending): in that case the deadline is set again with the next change of the Beiboot
+        schedule_deadline(body, passed=False)
+
+
 @kopf.on.delete("beiboot")
+@timed
+@traced
+@recorded
 async def beiboot_deleted(body, logger, **kwargs):
     """
     It deletes the cluster if it's not REQUESTED state
@@ -149,3 +485,4 @@ async def beiboot_deleted(body, logger, **kwargs):
     cluster = BeibootCluster(configuration, parameters, model=body, logger=logger)
     if not cluster.is_requested:
         await cluster.terminate()
+    cluster_factory.evict(body["metadata"]["uid"])
@@ -1,6 +1,28 @@
 import kopf
 
+from beiboot.comps.pki import key_pool
+from beiboot.events import event_publisher
+from beiboot.handler.beiboots import deadline_queue, reconcile_scheduler
+from beiboot.handler.clusters import reconcile_debouncer
+from beiboot.handler.metrics import metrics_server
+from beiboot.metrics import loop_lag_monitor
+from beiboot.pool import warm_pool
+from beiboot.recording import shutdown as shutdown_recording
+from beiboot.tracing import shutdown as shutdown_tracing
+from beiboot.watches import stop_watches
+
 
 @kopf.on.cleanup()
-def remove_everything(logger, **kwargs):
+async def remove_everything(logger, **kwargs):
     logger.info("Beiboot shutdown requested")
+    stop_watches()
+    await reconcile_scheduler.stop()
+    await deadline_queue.stop()
+    await warm_pool.stop()
+    await key_pool.stop()
+    await reconcile_debouncer.cancel()
+    await event_publisher.stop()
+    await loop_lag_monitor.stop()
+    await metrics_server.stop()
+    shutdown_tracing()
+    shutdown_recording()
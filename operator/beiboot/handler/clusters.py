@@ -1,25 +1,38 @@
+import base64
+import functools
 from datetime import datetime
 
 import kubernetes as k8s
 import kopf
 
+from beiboot.cache import (
+    beiboot_index,
+    client_tls,
+    kubeconfigs,
+    node_index,
+    tunnel_services,
+)
 from beiboot.clusterstate import BeibootCluster
+from beiboot.comps.ghostunnel import GHOSTUNNEL_LABELS, tunnel_service_ports
 from beiboot.configuration import configuration
-from beiboot.utils import get_beiboot_for_namespace
+from beiboot.debounce import Debouncer
+from beiboot.metrics import timed
+from beiboot.provider.k3s.utils import KUBECONFIG_SECRET_KEY, KUBECONFIG_SECRET_LABEL
+from beiboot.signals import WORKLOAD_LABELS, workload_signals
+from beiboot.utils import get_beiboot_for_namespace, get_label_selector
+from beiboot.watches import on_event
 
+apps_api = k8s.client.AppsV1Api()
 core_api = k8s.client.CoreV1Api()
 objects_api = k8s.client.CustomObjectsApi()
+reconcile_debouncer = Debouncer(configuration.RECONCILE_DEBOUNCE)
 
 
 def _in_any_beiboot_namespace(event, namespace, kind: list, **_):
-    beiboots = objects_api.list_namespaced_custom_object(
-        group="getdeck.dev",
-        version="v1",
-        namespace=configuration.NAMESPACE,
-        plural="beiboots",
+    return (
+        beiboot_index.has_namespace(namespace)
+        and event["object"]["involvedObject"]["kind"] in kind
     )
-    namespaces = set(bbt.get("beibootNamespace") for bbt in beiboots["items"])
-    return namespace in namespaces and event["object"]["involvedObject"]["kind"] in kind
 
 
 def _workloads_in_beiboot_namespace(event, namespace, **_) -> bool:
@@ -57,9 +70,11 @@ def _event_reason_not_in(event, **_) -> bool:
         [_event_type_not_none, _workloads_in_beiboot_namespace, _event_reason_not_in]
     ),
 )
+@timed
 async def handle_cluster_workload_events(event, namespace, logger, **kwargs):
     """
-    It handles workload events for a cluster (such as StatefulSet, Deployment, Pod)
+    It handles workload events for a cluster (such as StatefulSet, Deployment, Pod). The events are posted right
+    away, the resulting reconciliation runs at most once per BEIBOOT_RECONCILE_DEBOUNCE for each cluster.
 
     :param event: The event that triggered the handler
     :param namespace: The namespace of the Beiboot object
@@ -93,17 +108,167 @@ async def handle_cluster_workload_events(event, namespace, logger, **kwargs):
     if cluster.is_running or cluster.is_ready:
         if reason := event["object"].get("reason"):
             cluster.post_event(reason, message=event["object"].get("message", ""))
+        reconcile_debouncer.trigger(
+            namespace, functools.partial(_reconcile_cluster, namespace, logger)
+        )
+    elif cluster.is_creating or cluster.is_pending:
+        # this cluster is just booting up
+        if reason := event["object"].get("reason"):
+            cluster.post_event(reason, message=event["object"].get("message", ""))
+        if cluster.is_resuming:
+            # a resumed cluster is not driven by the Beiboot handlers
+            reconcile_debouncer.trigger(
+                namespace, functools.partial(_reconcile_cluster, namespace, logger)
+            )
+    elif cluster.is_error and cluster.completed_transition(
+        BeibootCluster.running.value
+    ):
+        reconcile_debouncer.trigger(
+            namespace, functools.partial(_reconcile_cluster, namespace, logger)
+        )
+
+
+@on_event(
+    apps_api.list_stateful_set_for_all_namespaces,
+    label_selector=get_label_selector(WORKLOAD_LABELS),
+)
+@on_event(
+    apps_api.list_deployment_for_all_namespaces,
+    label_selector=get_label_selector(WORKLOAD_LABELS),
+)
+async def handle_workload_status(namespace, **kwargs) -> None:
+    """
+    It wakes up the handlers that wait for the workloads of a pending cluster to become running (see
+    `BeibootCluster.on_operate`)
+
+    :param namespace: The namespace of the Beiboot cluster
+    """
+    workload_signals.notify(namespace)
+
+
+async def _reconcile_cluster(namespace: str, logger) -> None:
+    """
+    It reconciles (or recovers) the cluster in the given namespace, this runs debounced for workload events
+
+    :param namespace: The namespace of the Beiboot object
+    :param logger: The logger object that you can use to log messages
+    """
+    # the Beiboot object may have changed since the triggering event
+    beiboot = get_beiboot_for_namespace(namespace, objects_api, configuration)
+    if beiboot is None:
+        return
+    parameters = configuration.refresh_k8s_config(beiboot.get("parameters"))
+    cluster = BeibootCluster(configuration, parameters, model=beiboot, logger=logger)
+    if cluster.is_resuming:
+        try:
+            await cluster.operate()
+        except kopf.TemporaryError:
+            # the next workload event tries again
+            return
+        except kopf.PermanentError as e:
+            logger.error(e)
+            await cluster.impair(str(e))
+            return
+    if cluster.is_running or cluster.is_ready:
         try:
             await cluster.reconcile()
         except (kopf.PermanentError, kopf.TemporaryError) as e:
             logger.error(e)
             await cluster.impair(str(e))
-            raise e
-    elif cluster.is_creating or cluster.is_pending:
-        # this cluster is just booting up
-        if reason := event["object"].get("reason"):
-            cluster.post_event(reason, message=event["object"].get("message", ""))
     elif cluster.is_error and cluster.completed_transition(
         BeibootCluster.running.value
     ):
         await cluster.recover()
+
+
+@on_event(
+    core_api.list_secret_for_all_namespaces,
+    label_selector=get_label_selector({KUBECONFIG_SECRET_LABEL: "true"}),
+)
+@timed
+async def handle_cluster_kubeconfig(event, namespace, logger, **kwargs):
+    """
+    It stores the kubeconfig that was published by a cluster and wakes up the handlers that wait for that pending
+    cluster to become running (see `BeibootCluster.on_operate`). The waiting handler moves the cluster on, this
+    handler never drives the state machine itself.
+
+    :param event: The raw watch event of the kubeconfig Secret
+    :param namespace: The namespace of the Beiboot cluster
+    :param logger: The logger object that you can use to log messages
+    """
+    if event["type"] == "DELETED":
+        kubeconfigs.remove(namespace)
+        return
+    source = (event["object"].get("data") or {}).get(KUBECONFIG_SECRET_KEY)
+    if not source:
+        return
+    kubeconfigs.set(namespace, base64.b64decode(source).decode("utf-8"))
+    workload_signals.notify(namespace)
+
+
+@kopf.on.startup()
+def prime_node_index(logger, **kwargs) -> None:
+    """
+    It lists all nodes of the host cluster once and primes the in-memory node index with them. Afterwards the index
+    is kept up to date by the node watch stream (see `index_node`).
+
+    :param logger: a logger object
+    """
+    nodes = core_api.list_node()
+    node_index.prime(
+        [core_api.api_client.sanitize_for_serialization(node) for node in nodes.items]
+    )
+    logger.info(f"Node index primed with {len(nodes.items)} node(s)")
+
+
+@kopf.on.event("node")
+async def index_node(event, **kwargs) -> None:
+    """
+    It keeps the in-memory node index in sync with the node watch stream
+
+    :param event: The raw watch event of the node
+    """
+    if event["type"] == "DELETED":
+        node_index.remove(event["object"])
+    else:
+        node_index.upsert(event["object"])
+
+
+@on_event(
+    core_api.list_service_for_all_namespaces,
+    label_selector=get_label_selector(GHOSTUNNEL_LABELS),
+)
+async def handle_tunnel_service_events(event, name, namespace, **kwargs) -> None:
+    """
+    It keeps track of the node ports of the tunnel services of all Beiboot clusters
+
+    :param event: The raw watch event of the tunnel service
+    :param name: The name of the tunnel service
+    :param namespace: The namespace of the Beiboot cluster
+    """
+    services = dict(tunnel_services.get(namespace) or {})
+    if event["type"] == "DELETED":
+        services.pop(name, None)
+    else:
+        services[name] = tunnel_service_ports(event["object"])
+    tunnel_services.set(namespace, services)
+
+
+@on_event(
+    core_api.list_pod_for_all_namespaces,
+    label_selector=get_label_selector(GHOSTUNNEL_LABELS),
+)
+async def handle_tunnel_pod_events(event, namespace, **kwargs) -> None:
+    """
+    It drops the cached client TLS material of a Beiboot cluster once its tunnel Pod is replaced, if that Pod created
+    the PKI itself (tunnels created before the PKI was stored in a Secret)
+
+    :param event: The raw watch event of the tunnel Pod
+    :param namespace: The namespace of the Beiboot cluster
+    """
+    if (cached := client_tls.get(namespace)) and cached[0] is not None:
+        pod_uid = event["object"]["metadata"]["uid"]
+        if event["type"] == "DELETED" and cached[0] == pod_uid:
+            client_tls.remove(namespace)
+        elif event["type"] != "DELETED" and cached[0] != pod_uid:
+            client_tls.remove(namespace)
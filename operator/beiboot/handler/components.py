@@ -1,7 +1,9 @@
 import kopf
 import kubernetes as k8s
 
+from beiboot.configuration import configuration
 from beiboot.resources.crds import create_beiboot_definition, create_shelf_definition
+from beiboot.watches import on_event
 
 app = k8s.client.AppsV1Api()
 core_v1_api = k8s.client.CoreV1Api()
@@ -75,3 +77,28 @@ async def check_beiboot_components(logger, **kwargs) -> None:
     handle_shelf_crds(logger, configuration.NAMESPACE)
 
     logger.info("Beiboot components installed/patched")
+
+
+@on_event(
+    core_v1_api.list_namespaced_config_map,
+    namespace=configuration.NAMESPACE,
+    field_selector=f"metadata.name={configuration.CONFIGMAP_NAME}",
+)
+async def beiboot_configmap_changed(event, logger, **kwargs) -> None:
+    """
+    It keeps the cached cluster configuration in sync with the Beiboot configuration ConfigMap
+
+    :param event: The raw watch event of the ConfigMap
+    :param logger: a logger object
+    """
+    from beiboot.configuration import K3S_TAG_CATALOG_KEY
+    from beiboot.provider.k3s.tags import tag_resolver
+
+    if event["type"] == "DELETED":
+        logger.warning("Beiboot configmap has been deleted")
+        configuration.invalidate_cluster_config()
+        tag_resolver.set_configmap_catalog(None)
+    else:
+        data = event["object"].get("data") or {}
+        configuration.set_cluster_config(k8s.client.V1ConfigMap(data=data))
+        tag_resolver.set_configmap_catalog(data.get(K3S_TAG_CATALOG_KEY))
@@ -0,0 +1,32 @@
+import kopf
+
+from beiboot import metrics as bbt_metrics
+from beiboot.cache import beiboot_index
+from beiboot.configuration import configuration
+from beiboot.handler.beiboots import reconcile_scheduler
+
+metrics_server = bbt_metrics.MetricsServer(port=configuration.METRICS_PORT)
+
+
+@kopf.on.startup()
+async def start_metrics(logger, **kwargs) -> None:
+    """
+    It starts the Prometheus metrics endpoint of the operator (BEIBOOT_METRICS_PORT)
+
+    :param logger: a logger object
+    """
+    if not configuration.METRICS_PORT:
+        return
+    bbt_metrics.instrument_kubernetes_client()
+    bbt_metrics.beiboots.set_function(
+        lambda: {
+            (state,): count for state, count in beiboot_index.count_by_state().items()
+        }
+    )
+    bbt_metrics.reconcile_queue_depth.set_function(
+        lambda: reconcile_scheduler.queue_depth
+    )
+    bbt_metrics.reconcile_lag.set_function(lambda: reconcile_scheduler.lag)
+    bbt_metrics.loop_lag_monitor.start()
+    await metrics_server.start()
+    logger.info(f"Serving metrics on port {configuration.METRICS_PORT}")
@@ -0,0 +1,21 @@
+import kopf
+
+from beiboot import recording as bbt_recording
+from beiboot.configuration import configuration
+
+
+@kopf.on.startup()
+async def start_recording(logger, **kwargs) -> None:
+    """
+    It starts the (optional) recording of the Kubernetes API traffic of the operator (BEIBOOT_RECORD_FILE), the data
+    of Secrets is only recorded with BEIBOOT_RECORD_SECRETS
+
+    :param logger: a logger object
+    """
+    if bbt_recording.setup(
+        configuration.RECORD_FILE, secrets=configuration.RECORD_SECRETS
+    ):
+        bbt_recording.instrument_kubernetes_client()
+        logger.info(
+            f"Recording the Kubernetes API traffic to {configuration.RECORD_FILE}"
+        )
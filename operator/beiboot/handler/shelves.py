@@ -5,21 +5,28 @@ import kubernetes as k8s
 import kopf
 from kopf import Body
 
+from beiboot.api import AsyncApi, run_sync
 from beiboot.clusterstate import BeibootCluster
 from beiboot.configuration import ShelfConfiguration, configuration as bbt_configuration
+from beiboot.metrics import timed
+from beiboot.recording import recorded
+from beiboot.tracing import traced
 from beiboot.shelfstate import Shelf
 from beiboot.utils import get_beiboot_by_name
 
-core_api = k8s.client.CoreV1Api()
-objects_api = k8s.client.CustomObjectsApi()
+core_api = AsyncApi(k8s.client.CoreV1Api())
+objects_api = AsyncApi(k8s.client.CustomObjectsApi())
 
 
-def _get_bbt_cluster(logger, cluster_name, namespace):
+async def _get_bbt_cluster(logger, cluster_name, namespace):
     """
     Get beiboot cluster and parameters from beiboot CRD
     """
-    bbt = get_beiboot_by_name(
-        cluster_name, api_instance=objects_api, namespace=namespace
+    bbt = await run_sync(
+        get_beiboot_by_name,
+        cluster_name,
+        api_instance=objects_api.sync,
+        namespace=namespace,
     )
     bbt = Body(bbt)
     parameters = bbt_configuration.refresh_k8s_config(bbt.get("parameters"))
@@ -31,6 +38,9 @@ def _get_bbt_cluster(logger, cluster_name, namespace):
 
 @kopf.on.resume("shelf")
 @kopf.on.create("shelf")
+@timed
+@traced
+@recorded
 async def shelf_created(body, logger, **kwargs):
     """
 
@@ -41,7 +51,7 @@ async def shelf_created(body, logger, **kwargs):
     shelf = Shelf(configuration, model=body, logger=logger)
 
     if shelf.is_requested:
-        cluster, parameters = _get_bbt_cluster(
+        cluster, parameters = await _get_bbt_cluster(
             logger, body["clusterName"], configuration.NAMESPACE
         )
         pvcs = await cluster.provider.get_pvc_mapping()
@@ -51,7 +61,7 @@ async def shelf_created(body, logger, **kwargs):
         # figure out whether volumeSnapshotClass needs to be set and to which value
         if not shelf.volume_snapshot_class:
             configmap_name = cluster.configuration.CONFIGMAP_NAME
-            configmap = core_api.read_namespaced_config_map(
+            configmap = await core_api.read_namespaced_config_map(
                 name=configmap_name, namespace=cluster.configuration.NAMESPACE
             )
             if not configmap.data["shelfStorageClass"]:
@@ -59,7 +69,7 @@ async def shelf_created(body, logger, **kwargs):
                     f"Neither volumeSnapshotClass is set on shelf CRD '{shelf.name}, nor shelfStorageClass "
                     f"is configured for beiboot cluster {cluster.name}"
                 )
-                shelf.impair(error_msg)
+                await shelf.impair(error_msg)
                 raise kopf.PermanentError(error_msg)
             shelf.set_cluster_default_volume_snapshot_class(
                 configmap.data["shelfStorageClass"]
@@ -77,7 +87,7 @@ async def shelf_created(body, logger, **kwargs):
             raise kopf.PermanentError(str(e))
 
     if shelf.is_creating:
-        cluster, _ = _get_bbt_cluster(
+        cluster, _ = await _get_bbt_cluster(
             logger, body["clusterName"], configuration.NAMESPACE
         )
         try:
@@ -118,6 +128,9 @@ async def shelf_created(body, logger, **kwargs):
 
 
 @kopf.on.delete("shelf")
+@timed
+@traced
+@recorded
 async def shelf_deleted(body, logger, **kwargs):
     """
     It deletes the shelf if it's not REQUESTED state
@@ -0,0 +1,20 @@
+import kopf
+
+from beiboot import tracing as bbt_tracing
+from beiboot.configuration import configuration
+
+
+@kopf.on.startup()
+async def start_tracing(logger, **kwargs) -> None:
+    """
+    It starts the (optional) tracing of the Beiboot lifecycles (BEIBOOT_TRACING)
+
+    :param logger: a logger object
+    """
+    if bbt_tracing.setup(
+        configuration.TRACING,
+        endpoint=configuration.TRACING_ENDPOINT or None,
+        path=configuration.TRACING_FILE,
+    ):
+        bbt_tracing.instrument_kubernetes_client()
+        logger.info(f"Tracing enabled with the {configuration.TRACING} exporter")
@@ -0,0 +1,15 @@
+import kopf
+
+from beiboot.watches import selector_watches, start_watches
+
+
+@kopf.on.startup()
+async def start_selector_watches(logger, **kwargs) -> None:
+    """
+    It starts the watch streams that are filtered by the API server (see `beiboot.watches`), after the indexes have
+    been primed by the other startup handlers
+
+    :param logger: a logger object
+    """
+    start_watches()
+    logger.info(f"Started {len(selector_watches)} filtered watch stream(s)")
@@ -0,0 +1,309 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+from beiboot.api import ApiRequest, add_request_hook
+
+logger = logging.getLogger("beiboot.metrics")
+
+Labels = Tuple[str, ...]
+
+# the metrics of the operator are kept apart from the default registry of prometheus_client
+REGISTRY = CollectorRegistry(auto_describe=True)
+
+
+class CallbackGauge(Collector):
+    """
+    A gauge that is collected from a function at each scrape (see `set_function`). Other than the gauge of
+    prometheus_client, it may have labels: the function returns the values by label values.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        registry: Optional[CollectorRegistry] = REGISTRY,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._function: Optional[Callable[[], Union[float, Dict[Labels, float]]]] = None
+        if registry is not None:
+            registry.register(self)
+
+    def set_function(
+        self, function: Callable[[], Union[float, Dict[Labels, float]]]
+    ) -> None:
+        self._function = function
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        family = GaugeMetricFamily(
+            self.name, self.documentation, labels=self.labelnames
+        )
+        values: Union[float, Dict[Labels, float]] = {}
+        if self._function is not None:
+            try:
+                values = self._function()
+            except Exception as e:  # noqa
+                logger.warning(f"Cannot collect {self.name}: {e}")
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            family.add_metric(list(key), value)
+        yield family
+
+
+# seconds to days, Beiboots may stay in one state for a long time
+STATE_DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 14400, 86400)
+REQUEST_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+HANDLER_DURATION_BUCKETS = REQUEST_DURATION_BUCKETS + (30, 60, 120)
+
+state_duration = Histogram(
+    "beiboot_state_duration_seconds",
+    "The time a Beiboot or Shelf spent in a state before it moved to another one",
+    ["kind", "state"],
+    buckets=STATE_DURATION_BUCKETS,
+    registry=REGISTRY,
+)
+api_requests = Counter(
+    "beiboot_kubernetes_api_requests",
+    "The number of Kubernetes API requests of the operator",
+    ["verb", "resource", "code"],
+    registry=REGISTRY,
+)
+api_request_duration = Histogram(
+    "beiboot_kubernetes_api_request_duration_seconds",
+    "The latency of the Kubernetes API requests of the operator",
+    ["verb", "resource"],
+    buckets=REQUEST_DURATION_BUCKETS,
+    registry=REGISTRY,
+)
+pod_execs = Counter(
+    "beiboot_pod_execs",
+    "The number of commands executed in Pods",
+    ["result"],
+    registry=REGISTRY,
+)
+handler_duration = Histogram(
+    "beiboot_handler_duration_seconds",
+    "The duration of the operator handlers",
+    ["handler", "result"],
+    buckets=HANDLER_DURATION_BUCKETS,
+    registry=REGISTRY,
+)
+event_loop_lag = Gauge(
+    "beiboot_event_loop_lag_seconds",
+    "The delay of a scheduled callback of the operator's event loop",
+    registry=REGISTRY,
+)
+beiboots = CallbackGauge(
+    "beiboot_beiboots",
+    "The number of Beiboots by state",
+    ["state"],
+)
+reconcile_queue_depth = Gauge(
+    "beiboot_reconcile_queue_depth",
+    "The number of Beiboots scheduled for the periodic reconciliation",
+    registry=REGISTRY,
+)
+reconcile_lag = Gauge(
+    "beiboot_reconcile_lag_seconds",
+    "The time the most overdue Beiboot is behind its reconciliation schedule",
+    registry=REGISTRY,
+)
+
+
+def observe_state_duration(kind: str, state: str, entered: Optional[str]) -> None:
+    """
+    It records the time spent in a state, from the timestamp the state was entered (see `stateTransitions`) until now
+
+    :param kind: The kind of the object, e.g. beiboot
+    :type kind: str
+    :param state: The state the object leaves
+    :type state: str
+    :param entered: The timestamp the state was entered
+    :type entered: str
+    """
+    if not entered:
+        return
+    try:
+        since = datetime.fromisoformat(entered.strip("Z"))
+    except ValueError:
+        return
+    duration = (datetime.utcnow() - since).total_seconds()
+    state_duration.labels(kind=kind, state=state).observe(max(duration, 0))
+
+
+def timed(func: Callable) -> Callable:
+    """
+    A decorator for (kopf) handlers that records their duration and whether they raised
+    """
+
+    @functools.wraps(func)
+    async def _timed(*args, **kwargs):
+        start = time.monotonic()
+        result = "error"
+        try:
+            value = await func(*args, **kwargs)
+            result = "success"
+            return value
+        finally:
+            handler_duration.labels(handler=func.__name__, result=result).observe(
+                time.monotonic() - start
+            )
+
+    return _timed
+
+
+# the subresources that are part of the path of a namespace
+_NAMESPACE_SUBRESOURCES = ["status", "finalize"]
+
+
+def api_request_labels(
+    method: str, url: str, content_type: str = ""
+) -> Tuple[str, str]:
+    """
+    It returns the verb (e.g. list, apply) and the resource (e.g. pods, pods/exec) of a Kubernetes API request
+
+    :param method: The HTTP method
+    :type method: str
+    :param url: The URL of the request
+    :type url: str
+    :param content_type: The Content-Type of the request
+    :type content_type: str
+    :return: The verb and the resource
+    """
+    parts = [part for part in urlsplit(url).path.split("/") if part]
+    if parts[:1] == ["api"]:
+        parts = parts[2:]
+    elif parts[:1] == ["apis"]:
+        parts = parts[3:]
+    else:
+        return method.lower(), "other"
+    if (
+        parts[:1] == ["namespaces"]
+        and len(parts) > 2
+        and parts[2] not in _NAMESPACE_SUBRESOURCES
+    ):
+        parts = parts[2:]
+    resource = parts[0] if parts else ""
+    if len(parts) > 2:
+        resource = f"{parts[0]}/{parts[2]}"
+    named = len(parts) > 1
+    method = method.upper()
+    if method == "PATCH" and content_type.startswith("application/apply-patch"):
+        return "apply", resource
+    verbs = {
+        "GET": "get" if named else "list",
+        "POST": "create",
+        "PUT": "update",
+        "PATCH": "patch",
+        "DELETE": "delete" if named else "deletecollection",
+    }
+    return verbs.get(method, method.lower()), resource
+
+
+@contextlib.contextmanager
+def _observe_request(request: ApiRequest) -> Iterator[None]:
+    verb, resource = api_request_labels(
+        request.method, request.url, request.headers.get("Content-Type", "")
+    )
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        code = str(request.status) if request.status is not None else "error"
+        api_request_duration.labels(verb=verb, resource=resource).observe(
+            time.monotonic() - start
+        )
+        api_requests.labels(verb=verb, resource=resource, code=code).inc()
+
+
+def instrument_kubernetes_client() -> None:
+    """
+    It records the count and the latency of all requests of the (blocking) kubernetes client (see
+    `beiboot.api.add_request_hook`)
+    """
+    add_request_hook(_observe_request)
+
+
+class LoopLagMonitor:
+    """
+    It measures the lag of the event loop, i.e. how much later than scheduled a sleeping task wakes up. A high lag
+    means that the loop is blocked, e.g. by a blocking call outside of the API thread pool.
+    """
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            event_loop_lag.set(max(loop.time() - start - self.interval, 0))
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class MetricsServer:
+    """
+    It serves the metrics of a registry at /metrics, using the aiohttp server that comes with kopf
+    """
+
+    def __init__(self, port: int, registry: CollectorRegistry = REGISTRY):
+        self.port = port
+        self.registry = registry
+        self._runner = None
+
+    async def _handle(self, request):
+        from aiohttp import web
+
+        return web.Response(
+            body=generate_latest(self.registry),
+            headers={"Content-Type": CONTENT_TYPE_LATEST},
+        )
+
+    async def start(self) -> None:
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()  # type: ignore
+        site = web.TCPSite(self._runner, port=self.port)
+        await site.start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+loop_lag_monitor = LoopLagMonitor()
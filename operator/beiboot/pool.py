@@ -0,0 +1,298 @@
+import asyncio
+import dataclasses
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+import kubernetes as k8s
+
+from beiboot.api import AsyncApi
+from beiboot.cache import AttrDict, beiboot_index
+from beiboot.configuration import (
+    BeibootConfiguration,
+    ClusterConfiguration,
+    configuration,
+)
+from beiboot.utils import generate_token
+
+logger = logging.getLogger("beiboot.pool")
+
+# the label of a standby Beiboot, the value is the key of its pool
+STANDBY_LABEL = "beiboot.getdeck.dev/standby"
+# the label of a standby Beiboot that has been handed over, the value is the name of the Beiboot it is bound to
+BOUND_LABEL = "beiboot.getdeck.dev/bound-to"
+# parameters that do not affect the booted cluster, they are taken from the request when a standby is bound
+UNBOUND_PARAMETERS = ["maxLifetime", "maxSessionTimeout", "clusterReadyTimeout"]
+
+
+@dataclass
+class PoolSpec:
+    size: int
+    parameters: dict
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha1(
+            json.dumps(self.parameters, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:8]
+
+
+def parse_pool_config(raw: Optional[str]) -> List[PoolSpec]:
+    """
+    It parses the standby pool configuration, a JSON list of {"size": <int>, "parameters": {...}}
+
+    :param raw: The raw configuration
+    :type raw: str
+    :return: The list of pools
+    """
+    if not raw:
+        return []
+    try:
+        pools = json.loads(raw)
+    except json.JSONDecodeError as e:
+        logger.error(f"The warm pool configuration is not valid JSON: {e}")
+        return []
+    specs = []
+    for pool in pools:
+        try:
+            size = int(pool.get("size", 0))
+        except (TypeError, ValueError):
+            logger.error(f"The warm pool size is not valid: {pool.get('size')}")
+            continue
+        if size > 0:
+            specs.append(PoolSpec(size=size, parameters=pool.get("parameters") or {}))
+    return specs
+
+
+def comparable_parameters(parameters: dict) -> str:
+    """
+    It returns the parameters of a Beiboot that determine the booted cluster in a comparable form
+
+    :param parameters: The parameters of a Beiboot
+    :type parameters: dict
+    :return: The comparable parameters
+    """
+    _parameters = {
+        k: v for k, v in parameters.items() if k not in UNBOUND_PARAMETERS + ["ports"]
+    }
+    # the API port is always published by the cluster provider (see `K3s.get_ports`)
+    _parameters["ports"] = sorted(set(parameters.get("ports") or []) | {"6443:6443"})
+    return json.dumps(_parameters, sort_keys=True, default=str)
+
+
+def is_standby(body) -> bool:
+    return STANDBY_LABEL in (body["metadata"].get("labels") or {})
+
+
+def is_bound(body) -> bool:
+    return BOUND_LABEL in (body["metadata"].get("labels") or {})
+
+
+class WarmPool:
+    """
+    Pools of booted standby clusters. A standby is a Beiboot object labelled with the key of its pool that is
+    created and booted by the operator like any other Beiboot. A new Beiboot whose parameters match a ready standby
+    is bound to it: the Beiboot takes over the namespace of the standby, and the standby object is removed without
+    tearing down the cluster. The pools are refilled in the background; a requested standby counts for its pool
+    until its watch event puts it into the Beiboot index.
+    """
+
+    def __init__(self, configuration: BeibootConfiguration):
+        self.configuration = configuration
+        self.specs = parse_pool_config(configuration.WARM_POOL)
+        self.custom_api = AsyncApi(k8s.client.CustomObjectsApi())
+        self._refill: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # the names of the requested standbys that are not yet in the Beiboot index, by pool key
+        self._requested: Dict[str, Set[str]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.specs)
+
+    def standby_parameters(self, spec: PoolSpec) -> dict:
+        # a standby must never expire on its own
+        return {**spec.parameters, "maxLifetime": None, "maxSessionTimeout": None}
+
+    def _standbys(self, key: str) -> List[AttrDict]:
+        return [
+            body
+            for body in beiboot_index.all()
+            if (body["metadata"].get("labels") or {}).get(STANDBY_LABEL) == key
+            and not is_bound(body)
+            and body.get("state") not in ["ERROR", "TERMINATING"]
+        ]
+
+    def candidates(self, parameters: ClusterConfiguration) -> List[AttrDict]:
+        """
+        It returns the ready standby Beiboots that match the given cluster parameters
+
+        :param parameters: The parameters of the requested Beiboot
+        :type parameters: ClusterConfiguration
+        :return: The matching standby Beiboots
+        """
+        requested = comparable_parameters(dataclasses.asdict(parameters))
+        return [
+            body
+            for body in beiboot_index.get_by_state("READY")
+            if is_standby(body)
+            and not is_bound(body)
+            and body.get("beibootNamespace")
+            and comparable_parameters(body.get("parameters") or {}) == requested
+        ]
+
+    async def claim(self, name: str, parameters: ClusterConfiguration):
+        """
+        It claims a ready standby for the given Beiboot. The claim is guarded by the resourceVersion of the standby,
+        so that a standby is never handed out twice.
+
+        :param name: The name of the Beiboot to bind a standby to
+        :type name: str
+        :param parameters: The parameters of the Beiboot
+        :type parameters: ClusterConfiguration
+        :return: The body of the claimed standby, or None
+        """
+        for standby in self.candidates(parameters):
+            try:
+                await self.custom_api.patch_namespaced_custom_object(
+                    namespace=self.configuration.NAMESPACE,
+                    name=standby["metadata"]["name"],
+                    body={
+                        "metadata": {
+                            "resourceVersion": standby["metadata"]["resourceVersion"],
+                            "labels": {BOUND_LABEL: name},
+                        },
+                        # the namespace now belongs to the bound Beiboot
+                        "beibootNamespace": None,
+                    },
+                    group="getdeck.dev",
+                    plural="beiboots",
+                    version="v1",
+                )
+            except k8s.client.exceptions.ApiException as e:
+                if e.status in [404, 409]:
+                    # the standby has been claimed or removed in the meantime
+                    continue
+                raise e
+            logger.info(f"Standby {standby['metadata']['name']} claimed for {name}")
+            return standby
+        return None
+
+    async def unclaim(self, standby) -> None:
+        """
+        Return a claimed standby to its pool, e.g. if the binding failed
+
+        :param standby: The body of the claimed standby
+        """
+        await self.custom_api.patch_namespaced_custom_object(
+            namespace=self.configuration.NAMESPACE,
+            name=standby["metadata"]["name"],
+            body={
+                "metadata": {"labels": {BOUND_LABEL: None}},
+                "beibootNamespace": standby["beibootNamespace"],
+            },
+            group="getdeck.dev",
+            plural="beiboots",
+            version="v1",
+        )
+
+    async def release(self, standby) -> None:
+        """
+        Remove a standby object that has been bound, its cluster is kept (see `BeibootCluster.on_enter_terminating`)
+
+        :param standby: The body of the bound standby
+        """
+        try:
+            await self.custom_api.delete_namespaced_custom_object(
+                namespace=self.configuration.NAMESPACE,
+                name=standby["metadata"]["name"],
+                group="getdeck.dev",
+                plural="beiboots",
+                version="v1",
+            )
+        except k8s.client.exceptions.ApiException as e:
+            if e.status != 404:
+                raise e
+        self.trigger_refill()
+
+    async def refill(self) -> None:
+        """
+        Create standby Beiboots until every pool has its configured size
+        """
+        if not beiboot_index.primed:
+            return
+        for body in beiboot_index.get_by_state("ERROR"):
+            if is_standby(body) and not is_bound(body):
+                # a defective standby is replaced
+                logger.warning(f"Removing defective standby {body['metadata']['name']}")
+                await self.release(body)
+        for spec in self.specs:
+            requested = self._requested.setdefault(spec.key, set())
+            requested.difference_update(
+                [name for name in requested if beiboot_index.get_by_name(name)]
+            )
+            missing = spec.size - len(self._standbys(spec.key)) - len(requested)
+            for _ in range(missing):
+                name = f"standby-{spec.key}-{generate_token(5).lower()}"
+                try:
+                    await self.custom_api.create_namespaced_custom_object(
+                        namespace=self.configuration.NAMESPACE,
+                        body={
+                            "apiVersion": "getdeck.dev/v1",
+                            "kind": "beiboot",
+                            "provider": "k3s",
+                            "parameters": self.standby_parameters(spec),
+                            "metadata": {
+                                "name": name,
+                                "namespace": self.configuration.NAMESPACE,
+                                "labels": {STANDBY_LABEL: spec.key},
+                            },
+                        },
+                        group="getdeck.dev",
+                        plural="beiboots",
+                        version="v1",
+                    )
+                    requested.add(name)
+                    logger.info(f"Standby {name} requested for pool {spec.key}")
+                except k8s.client.exceptions.ApiException as e:
+                    logger.error(f"Cannot create standby for pool {spec.key}: {e}")
+                    break
+
+    def trigger_refill(self) -> None:
+        if self._refill is not None:
+            self._refill.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refill()
+            except Exception as e:  # noqa
+                logger.error(f"Warm pool refill failed: {e}")
+            self._refill.clear()  # type: ignore
+            try:
+                await asyncio.wait_for(
+                    self._refill.wait(),  # type: ignore
+                    timeout=self.configuration.WARM_POOL_REFILL_INTERVAL,
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """
+        Start refilling the pools in the background
+        """
+        if not self.enabled:
+            return
+        self._refill = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+warm_pool = WarmPool(configuration)
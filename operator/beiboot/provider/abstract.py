@@ -103,6 +103,20 @@ class AbstractClusterProvider(ABC):
         """
         return self.ports
 
+    @abstractmethod
+    async def hibernate(self) -> bool:
+        """
+        Scale the Beiboot cluster down to zero while keeping its data and return the result
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def resume(self) -> bool:
+        """
+        Scale a hibernated Beiboot cluster back up and return the result
+        """
+        raise NotImplementedError
+
     async def get_pvc_mapping(self) -> Dict:
         """
         Return a mapping of node-names to the PVC that node uses.
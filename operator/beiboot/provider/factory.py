@@ -27,7 +27,7 @@ class ClusterFactory:
         ports: Optional[List[str]],
         logger,
         shelf_name,
-        **kwargs
+        **kwargs,
     ):
         builder = self._builders.get(provider_type.value)
         if not builder:
@@ -40,7 +40,7 @@ class ClusterFactory:
             ports,
             logger,
             shelf_name,
-            **kwargs
+            **kwargs,
         )
 
     def get(
@@ -53,7 +53,7 @@ class ClusterFactory:
         ports: Optional[List[str]],
         logger,
         shelf_name: str = "",
-        **kwargs
+        **kwargs,
     ) -> AbstractClusterProvider:
         return self.__create(
             provider_type,
@@ -64,9 +64,20 @@ class ClusterFactory:
             ports,
             logger,
             shelf_name,
-            **kwargs
+            **kwargs,
         )
 
+    def evict(self, uid: str) -> None:
+        """
+        Drop all memoized provider instances of the Beiboot with the given uid
+
+        :param uid: The uid of the Beiboot object
+        :type uid: str
+        """
+        for builder in self._builders.values():
+            if evict := getattr(builder, "evict", None):
+                evict(uid)
+
 
 cluster_factory = ClusterFactory()
 cluster_factory.register_builder(ProviderType.K3S, K3sBuilder())
@@ -1,35 +1,48 @@
+import asyncio
+import contextvars
 import os
 import base64
 import re
-from datetime import timedelta
-from typing import List, Optional, Dict
-import urllib
+from datetime import datetime, timedelta, timezone
+from dataclasses import asdict
+from typing import List, Optional, Dict, Tuple
 
 import kopf
 import kubernetes as k8s
 
+from beiboot.api import AsyncApi, run_sync
+from beiboot.cache import kubeconfigs
 from beiboot.configuration import BeibootConfiguration, ClusterConfiguration
 from beiboot.provider.abstract import AbstractClusterProvider
-from beiboot.utils import exec_command_pod, get_label_selector, get_shelf_by_name
+from beiboot.utils import exec_command_pod, get_label_selector
 
+from .tags import tag_resolver
+from .client import inner_cluster_clients, INNER_API_TIMEOUT
 from .utils import (
     create_k3s_server_workload,
     create_k3s_agent_workload,
     create_k3s_kubeapi_service,
+    create_k3s_kubeconfig_publisher,
     create_k3d_pod_distuption_budget,
     PVC_PREFIX_SERVER,
     PVC_PREFIX_NODE,
+    KUBECONFIG_SECRET_KEY,
+    KUBECONFIG_SECRET_NAME,
 )
+from ...resources.apply import apply_object, apply_objects
 from ...resources.utils import (
     handle_delete_statefulset,
     handle_delete_service,
     create_volume_snapshots_from_shelf,
 )
 
-core_api = k8s.client.CoreV1Api()
-app_api = k8s.client.AppsV1Api()
-custom_api = k8s.client.CustomObjectsApi()
-batch_api = k8s.client.BatchV1Api()
+core_api = AsyncApi(k8s.client.CoreV1Api())
+app_api = AsyncApi(k8s.client.AppsV1Api())
+custom_api = AsyncApi(k8s.client.CustomObjectsApi())
+batch_api = AsyncApi(k8s.client.BatchV1Api())
+
+# the logger of the handler that uses a (memoized) K3s instance, it is set per handler task by the K3sBuilder
+handler_logger: contextvars.ContextVar = contextvars.ContextVar("k3s_handler_logger")
 
 
 class K3s(AbstractClusterProvider):
@@ -39,7 +52,8 @@ class K3s(AbstractClusterProvider):
     k3s_image: str = "rancher/k3s"
     k3s_default_image_tag: str = "v1.24.3-k3s1"
     k3s_image_pullpolicy: str = os.getenv("K3S_IMAGE_PULLPOLICY", "IfNotPresent")
-    kubeconfig_from_location: str = "/getdeck/kube-config.yaml"
+    kubeconfig_from_location: str = "/getdeck/kubeconfig/kube-config.yaml"
+    legacy_kubeconfig_from_location: str = "/getdeck/kube-config.yaml"
     api_server_container_name: str = "apiserver"
 
     def __init__(
@@ -54,36 +68,40 @@ class K3s(AbstractClusterProvider):
     ):
         super().__init__(name, namespace, ports, shelf_name)
         self.configuration = configuration
-        if shelf_name:
-            shelf = get_shelf_by_name(
-                name=shelf_name,
-                api_instance=custom_api,
-                namespace=configuration.NAMESPACE,
-            )
-            self.shelf = shelf
-            cluster_parameter.update(shelf["clusterParameters"])
-        else:
-            self.shelf = None
+        # the Shelf to restore from is read with the first restore step, see `load_shelf`
+        self.shelf: Optional[dict] = None
         self.parameters = cluster_parameter
-        self.logger = logger
-
-    def _check_image_exists(self, k8s_version: str) -> Optional[str]:
-        _b = k8s_version.lower().replace("v", "")
-        k3s_tag = f"v{_b.strip()}-k3s1"
-        req = urllib.request.Request(
-            f"https://hub.docker.com/v2/repositories/rancher/k3s/tags/{k3s_tag}",
-            method="HEAD",
-        )
-        try:
-            _ = urllib.request.urlopen(req)
-            return k3s_tag
-        except urllib.error.HTTPError:
-            return None
+        self._logger = logger
+
+    @property
+    def logger(self):
+        """
+        The logger of the handler that currently uses this instance, the instance is shared by all handlers of a
+        Beiboot (see `K3sBuilder`)
+        """
+        return handler_logger.get(self._logger)
+
+    async def load_shelf(self) -> Optional[dict]:
+        """
+        It reads the Shelf this cluster is restored from (once) and applies its cluster parameters
+
+        :return: The Shelf object, None if the cluster is not restored from a Shelf
+        """
+        if self.shelf_name and self.shelf is None:
+            self.shelf = await custom_api.get_namespaced_custom_object(
+                namespace=self.configuration.NAMESPACE,
+                name=self.shelf_name,
+                group="beiboots.getdeck.dev",
+                plural="shelves",
+                version="v1",
+            )
+            self.parameters.update(self.shelf["clusterParameters"])
+        return self.shelf
 
     @property
     def k3s_image_tag(self):
         if k8s_version := self.parameters.k8sVersion:
-            tag = self._check_image_exists(k8s_version)
+            tag = tag_resolver.resolve(k8s_version)
             if tag is None:
                 raise kopf.PermanentError(
                     "Cannot create a Beiboot with provider 'k3s' and Kubernetes API version "
@@ -92,6 +110,12 @@ class K3s(AbstractClusterProvider):
             return tag
         return self.k3s_default_image_tag
 
+    async def resolve_image_tag(self) -> str:
+        """
+        It returns the k3s image tag without blocking the event loop, as resolving it may require a registry lookup
+        """
+        return await run_sync(lambda: self.k3s_image_tag)
+
     def _parse_kubectl_nodes_output(self, string: str) -> dict:
 
         regex = re.compile(
@@ -122,8 +146,8 @@ class K3s(AbstractClusterProvider):
             }
         return result
 
-    def _remove_cluster_node(self, api_pod_name: str, node_name: str):
-        exec_command_pod(
+    async def _remove_cluster_node(self, api_pod_name: str, node_name: str):
+        await exec_command_pod(
             core_api,
             api_pod_name,
             self.namespace,
@@ -132,8 +156,26 @@ class K3s(AbstractClusterProvider):
         )
 
     async def get_kubeconfig(self) -> str:
+        # the server Pod publishes its kubeconfig to a Secret, which is watched by the operator
+        if kubeconfig := kubeconfigs.get(self.namespace):
+            return kubeconfig
+        try:
+            secret = await core_api.read_namespaced_secret(
+                KUBECONFIG_SECRET_NAME, self.namespace
+            )
+            if source := (secret.data or {}).get(KUBECONFIG_SECRET_KEY):
+                kubeconfig = base64.b64decode(source).decode("utf-8")
+                kubeconfigs.set(self.namespace, kubeconfig)
+                return kubeconfig
+        except k8s.client.ApiException as e:
+            if e.status != 404:
+                self.logger.error(str(e))
+        # clusters that have been created without the kubeconfig publisher
+        return await self._get_kubeconfig_exec()
+
+    async def _get_kubeconfig_exec(self) -> str:
         try:
-            api_pod = core_api.list_namespaced_pod(
+            api_pod = await core_api.list_namespaced_pod(
                 self.namespace,
                 label_selector=get_label_selector(self.parameters.serverLabels),
             )
@@ -142,42 +184,45 @@ class K3s(AbstractClusterProvider):
                     f"There is not exactly one API Pod, it is {len(api_pod.items)}"
                 )
 
-            kubeconfig = exec_command_pod(
-                core_api,
-                api_pod.items[0].metadata.name,
-                self.namespace,
-                self.api_server_container_name,
-                ["cat", self.kubeconfig_from_location],
-            )
-            if "No such file or directory" in kubeconfig:
-                raise kopf.TemporaryError("The kubeconfig is not yet ready.", delay=2)
-            else:
-                return kubeconfig
+            for location in [
+                self.kubeconfig_from_location,
+                self.legacy_kubeconfig_from_location,
+            ]:
+                kubeconfig = await exec_command_pod(
+                    core_api,
+                    api_pod.items[0].metadata.name,
+                    self.namespace,
+                    self.api_server_container_name,
+                    ["cat", location],
+                )
+                if "No such file or directory" not in kubeconfig:
+                    return kubeconfig
+            raise kopf.TemporaryError("The kubeconfig is not yet ready.", delay=2)
         except k8s.client.ApiException as e:
             self.logger.error(str(e))
             raise kopf.TemporaryError("The kubeconfig is not yet ready.", delay=2)
 
+    def _kubeconfig_publisher(self) -> list:
+        return list(create_k3s_kubeconfig_publisher(self.namespace))
+
     async def prepare_restore_from_shelf(self) -> bool:
         """
-        Returns True, as k3s doesn't need this state
+        Returns True, as k3s doesn't need this state besides reading the Shelf
         """
+        await self.load_shelf()
         return True
 
     async def create_new(self) -> bool:
         from beiboot.utils import generate_token
-        from beiboot.resources.utils import (
-            handle_create_statefulset,
-            handle_create_service,
-            handle_create_pod_disruption_budgets,
-        )
 
         node_token = generate_token()
+        k3s_image_tag = await self.resolve_image_tag()
         server_workloads = [
             create_k3s_server_workload(
                 self.namespace,
                 node_token,
                 self.k3s_image,
-                self.k3s_image_tag,
+                k3s_image_tag,
                 self.k3s_image_pullpolicy,
                 self.kubeconfig_from_location,
                 self.api_server_container_name,
@@ -189,7 +234,7 @@ class K3s(AbstractClusterProvider):
                 self.namespace,
                 node_token,
                 self.k3s_image,
-                self.k3s_image_tag,
+                k3s_image_tag,
                 self.k3s_image_pullpolicy,
                 self.parameters,
                 node,
@@ -199,41 +244,28 @@ class K3s(AbstractClusterProvider):
             )  # (no +1 ) since the server deployment already runs one node
         ]
         services = [create_k3s_kubeapi_service(self.namespace, self.parameters)]
-
         pdbs = create_k3d_pod_distuption_budget(self.namespace)
 
-        for pdb in pdbs:
-            self.logger.debug("Creating: " + str(pdb))
-            handle_create_pod_disruption_budgets(
-                self.logger, pdb=pdb, namespace=self.namespace
-            )
-
-        #
-        # Create the workloads
-        #
-        workloads = server_workloads + node_workloads
-        for sts in workloads:
-            self.logger.debug("Creating: " + str(sts))
-            handle_create_statefulset(self.logger, sts, self.namespace)
-
         #
-        # Create the services
+        # Apply the kubeconfig publisher, budgets, workloads and services at once
         #
-        for svc in services:
-            self.logger.debug("Creating: " + str(svc))
-            handle_create_service(self.logger, svc, self.namespace)
+        await apply_objects(
+            self.logger,
+            self._kubeconfig_publisher()
+            + pdbs
+            + server_workloads
+            + node_workloads
+            + services,
+            self.namespace,
+        )
         return True
 
     async def restore_from_shelf(self) -> bool:
         from beiboot.utils import generate_token
-        from beiboot.resources.utils import (
-            handle_create_statefulset,
-            handle_create_service,
-            handle_create_pod_disruption_budgets,
-        )
 
+        await self.load_shelf()
         try:
-            pod = core_api.read_namespaced_pod("server-0", self.namespace)
+            pod = await core_api.read_namespaced_pod("server-0", self.namespace)
         except k8s.client.ApiException as e:
             if e.status == 404:
                 self.logger.info("Server pod doesn't exist, creating it")
@@ -243,6 +275,7 @@ class K3s(AbstractClusterProvider):
                 )
 
                 node_token = generate_token()
+                k3s_image_tag = await self.resolve_image_tag()
                 node_to_snapshot_mapping["node_token"] = node_token
                 secret_body = k8s.client.V1Secret(
                     metadata=k8s.client.V1ObjectMeta(
@@ -251,13 +284,13 @@ class K3s(AbstractClusterProvider):
                     ),
                     string_data=node_to_snapshot_mapping,
                 )
-                core_api.create_namespaced_secret(self.namespace, secret_body)
+                await apply_object(secret_body, self.namespace)
                 server_workloads = [
                     create_k3s_server_workload(
                         self.namespace,
                         node_token,
                         self.k3s_image,
-                        self.k3s_image_tag,
+                        k3s_image_tag,
                         self.k3s_image_pullpolicy,
                         self.kubeconfig_from_location,
                         self.api_server_container_name,
@@ -268,28 +301,16 @@ class K3s(AbstractClusterProvider):
                 ]
 
                 services = [create_k3s_kubeapi_service(self.namespace, self.parameters)]
-
                 pdbs = create_k3d_pod_distuption_budget(self.namespace)
 
-                for pdb in pdbs:
-                    self.logger.debug("Creating: " + str(pdb))
-                    handle_create_pod_disruption_budgets(
-                        self.logger, pdb=pdb, namespace=self.namespace
-                    )
-
-                #
-                # Create the server workload
-                #
-                for sts in server_workloads:
-                    self.logger.debug("Creating: " + str(sts))
-                    handle_create_statefulset(self.logger, sts, self.namespace)
-
                 #
-                # Create the services
+                # Apply the kubeconfig publisher, budgets, server workload and services at once
                 #
-                for svc in services:
-                    self.logger.debug("Creating: " + str(svc))
-                    handle_create_service(self.logger, svc, self.namespace)
+                await apply_objects(
+                    self.logger,
+                    self._kubeconfig_publisher() + pdbs + server_workloads + services,
+                    self.namespace,
+                )
 
                 # as we've just created the server, we return False so that the agents are created next time
                 return False
@@ -299,7 +320,7 @@ class K3s(AbstractClusterProvider):
             # check whether server-0 is running
             if pod.status.phase == "Running":
                 # get nodes to infer whether apiserver is runnning
-                output = exec_command_pod(
+                output = await exec_command_pod(
                     core_api,
                     "server-0",
                     self.namespace,
@@ -315,15 +336,16 @@ class K3s(AbstractClusterProvider):
 
                 self.logger.info("Server pod is running, creating agents")
                 # create agents when server is running
-                secret = core_api.read_namespaced_secret(
+                secret = await core_api.read_namespaced_secret(
                     "shelf-restore-data", self.namespace
                 )
+                k3s_image_tag = await self.resolve_image_tag()
                 node_workloads = [
                     create_k3s_agent_workload(
                         self.namespace,
                         base64.b64decode(secret.data["node_token"]).decode("utf-8"),
                         self.k3s_image,
-                        self.k3s_image_tag,
+                        k3s_image_tag,
                         self.k3s_image_pullpolicy,
                         self.parameters,
                         node,
@@ -335,14 +357,16 @@ class K3s(AbstractClusterProvider):
                     )  # (no +1 ) since the server deployment already runs one node
                 ]
                 # remove the old agents, so that they are freshly joined to the cluster
-                for node in range(1, self.parameters.nodes):
-                    self._remove_cluster_node("server-0", f"agent-{node}-0")
+                await asyncio.gather(
+                    *[
+                        self._remove_cluster_node("server-0", f"agent-{node}-0")
+                        for node in range(1, self.parameters.nodes)
+                    ]
+                )
                 #
-                # Create the agent workloads
+                # Apply the agent workloads
                 #
-                for sts in node_workloads:
-                    self.logger.debug("Creating: " + str(sts))
-                    handle_create_statefulset(self.logger, sts, self.namespace)
+                await apply_objects(self.logger, node_workloads, self.namespace)
                 return True
             else:
                 self.logger.info(
@@ -352,27 +376,28 @@ class K3s(AbstractClusterProvider):
                 return False
 
     async def delete(self) -> bool:
+        inner_cluster_clients.evict(self.namespace)
+        kubeconfigs.remove(self.namespace)
         try:
-            stss = app_api.list_namespaced_stateful_set(
+            stss = await app_api.list_namespaced_stateful_set(
                 self.namespace,
-                async_req=True,
                 label_selector=get_label_selector(self.parameters.nodeLabels),
             )
-            for sts in stss.get().items:
-                handle_delete_statefulset(
+            for sts in stss.items:
+                await handle_delete_statefulset(
                     logger=self.logger, name=sts.metadata.name, namespace=self.namespace
                 )
 
-            volume_claims = core_api.list_namespaced_persistent_volume_claim(
-                self.namespace, async_req=True
+            volume_claims = await core_api.list_namespaced_persistent_volume_claim(
+                self.namespace
             )
-            for pvc in volume_claims.get().items:
+            for pvc in volume_claims.items:
                 try:
                     if pvc.spec.volume_name:
-                        core_api.delete_persistent_volume(
+                        await core_api.delete_persistent_volume(
                             name=pvc.spec.volume_name, grace_period_seconds=0
                         )
-                    core_api.delete_namespaced_persistent_volume_claim(
+                    await core_api.delete_namespaced_persistent_volume_claim(
                         name=pvc.metadata.name,
                         namespace=self.namespace,
                         grace_period_seconds=0,
@@ -384,20 +409,42 @@ class K3s(AbstractClusterProvider):
                         raise e
 
             service = create_k3s_kubeapi_service(self.namespace, self.parameters)
-            handle_delete_service(
+            await handle_delete_service(
                 self.logger, name=service.metadata.name, namespace=self.namespace
             )
         except k8s.client.ApiException:
             pass
         return True
 
+    async def _scale(self, replicas: int) -> None:
+        stss = await app_api.list_namespaced_stateful_set(
+            self.namespace,
+            label_selector=get_label_selector(self.parameters.nodeLabels),
+        )
+        for sts in stss.items:
+            await app_api.patch_namespaced_stateful_set_scale(
+                name=sts.metadata.name,
+                namespace=self.namespace,
+                body={"spec": {"replicas": replicas}},
+            )
+
+    async def hibernate(self) -> bool:
+        # the K3s API server is gone until the cluster is resumed
+        inner_cluster_clients.evict(self.namespace)
+        await self._scale(0)
+        return True
+
+    async def resume(self) -> bool:
+        await self._scale(1)
+        return True
+
     async def exists(self) -> bool:
         raise NotImplementedError
 
     async def running(self) -> bool:
         # waiting for all StatefulSets to become ready
         try:
-            stss = app_api.list_namespaced_stateful_set(
+            stss = await app_api.list_namespaced_stateful_set(
                 self.namespace,
                 label_selector=get_label_selector(self.parameters.nodeLabels),
             )
@@ -420,11 +467,65 @@ class K3s(AbstractClusterProvider):
             self.logger.error(str(e))
             return False
 
+    async def _get_node_states(self) -> Optional[Dict[str, dict]]:
+        """
+        Read the nodes of the K3s cluster with the pooled API client. Returns None if the K3s API server cannot be
+        reached with it.
+        """
+        api = inner_cluster_clients.get(self.namespace)
+        if api is None:
+            return None
+        try:
+            nodes = await api.list_node(_request_timeout=INNER_API_TIMEOUT)
+        except k8s.client.exceptions.ApiException as e:
+            self.logger.debug(f"Cannot list nodes of the cluster: {e}")
+            return None
+        except Exception as e:  # noqa
+            self.logger.debug(f"The cluster API is not reachable: {e}")
+            inner_cluster_clients.mark_unreachable(self.namespace)
+            return None
+        now = datetime.now(timezone.utc)
+        result = {}
+        for node in nodes.items:
+            conditions = node.status.conditions or []
+            result[node.metadata.name] = {
+                "ready": any(
+                    c.type == "Ready" and c.status == "True" for c in conditions
+                ),
+                "age": now - node.metadata.creation_timestamp,
+            }
+        return result
+
+    async def _get_node_states_exec(self, api_pod_name: str) -> Dict[str, dict]:
+        output = await exec_command_pod(
+            core_api,
+            api_pod_name,
+            self.namespace,
+            self.api_server_container_name,
+            ["kubectl", "get", "node"],
+        )
+        if "No resources found" in output:
+            return {}
+        return {
+            name: {"ready": node["status"] == "Ready", "age": node["age"]}
+            for name, node in self._parse_kubectl_nodes_output(output).items()
+        }
+
+    async def _delete_cluster_node(self, api_pod_name: str, node_name: str):
+        api = inner_cluster_clients.get(self.namespace)
+        if api is not None:
+            try:
+                await api.delete_node(node_name, _request_timeout=INNER_API_TIMEOUT)
+                return
+            except Exception as e:  # noqa
+                self.logger.debug(f"Cannot delete node {node_name} via API: {e}")
+        await self._remove_cluster_node(api_pod_name, node_name)
+
     async def ready(self) -> bool:
         if not await self.running():
             return False
 
-        api_pod = core_api.list_namespaced_pod(
+        api_pod = await core_api.list_namespaced_pod(
             self.namespace,
             label_selector=get_label_selector(self.parameters.serverLabels),
         )
@@ -438,36 +539,29 @@ class K3s(AbstractClusterProvider):
             pass
 
         try:
-            output = exec_command_pod(
-                core_api,
-                api_pod.items[0].metadata.name,
-                self.namespace,
-                self.api_server_container_name,
-                ["kubectl", "get", "node"],
-            )
-            if "No resources found" in output:
+            node_data = await self._get_node_states()
+            if node_data is None:
+                node_data = await self._get_node_states_exec(
+                    api_pod.items[0].metadata.name
+                )
+            if not node_data:
                 return False
-            else:
-                node_data = self._parse_kubectl_nodes_output(output)
-                _ready = []
-                for node in node_data.values():
-                    _ready.append(node["status"] == "Ready")
-                if all(_ready):
-                    return True
-                else:
-                    # there are unready nodes
-                    for name, node in node_data.items():
-                        if node["status"] == "Ready":
-                            continue
-                        else:
-                            self.logger.info(f"Node {name} is not ready")
-                            # wait for a node to become ready within 30 seconds
-                            if node["age"] > timedelta(seconds=30):
-                                self.logger.info(f"Removing cluster node {name}")
-                                self._remove_cluster_node(
-                                    api_pod.items[0].metadata.name, name
-                                )
+            if all(node["ready"] for node in node_data.values()):
                 return True
+            else:
+                # there are unready nodes
+                for name, node in node_data.items():
+                    if node["ready"]:
+                        continue
+                    else:
+                        self.logger.info(f"Node {name} is not ready")
+                        # wait for a node to become ready within 30 seconds
+                        if node["age"] > timedelta(seconds=30):
+                            self.logger.info(f"Removing cluster node {name}")
+                            await self._delete_cluster_node(
+                                api_pod.items[0].metadata.name, name
+                            )
+            return True
         except k8s.client.exceptions.ApiException as e:
             self.logger.error(str(e))
             return False
@@ -502,7 +596,7 @@ class K3s(AbstractClusterProvider):
             "agent-2": "k8s-node-data-2-agent-2-0",
         }
         """
-        pods = core_api.list_namespaced_pod(
+        pods = await core_api.list_namespaced_pod(
             self.namespace,
             label_selector=get_label_selector(self.parameters.nodeLabels),
         )
@@ -533,7 +627,7 @@ class K3s(AbstractClusterProvider):
         self.logger.debug("K3s.on_shelf_request")
         # we need three calls, as we can't seem to chain commands...
         # ensure directory exists
-        resp = exec_command_pod(
+        resp = await exec_command_pod(
             core_api,
             "server-0",
             self.namespace,
@@ -542,7 +636,7 @@ class K3s(AbstractClusterProvider):
         )
         self.logger.debug(f"K3s.on_shelf_request mkdir response: {resp}")
         # take k3s snapshot
-        resp = exec_command_pod(
+        resp = await exec_command_pod(
             core_api,
             "server-0",
             self.namespace,
@@ -560,7 +654,7 @@ class K3s(AbstractClusterProvider):
         )
         self.logger.debug(f"K3s.on_shelf_request snapshot response: {resp}")
         # prune k3s snapshots except the most recent one
-        resp = exec_command_pod(
+        resp = await exec_command_pod(
             core_api,
             "server-0",
             self.namespace,
@@ -579,11 +673,11 @@ class K3s(AbstractClusterProvider):
         )
         self.logger.debug(f"K3s.on_shelf_request prune response: {resp}")
         # sync and drop caches to ensure that compressed snapshot is written to disk before VolumeSnapshots are created
-        resp = exec_command_pod(
+        resp = await exec_command_pod(
             core_api, "server-0", self.namespace, "apiserver", ["sync"]
         )
         self.logger.debug(f"K3s.on_shelf_request sync response: {resp}")
-        resp = exec_command_pod(
+        resp = await exec_command_pod(
             core_api,
             "server-0",
             self.namespace,
@@ -596,7 +690,17 @@ class K3s(AbstractClusterProvider):
 
 class K3sBuilder:
     def __init__(self):
-        self._instances = {}
+        self._instances: Dict[str, Tuple[str, K3s]] = {}
+
+    @staticmethod
+    def _fingerprint(
+        cluster_parameter: ClusterConfiguration,
+        name: str,
+        namespace: str,
+        ports: Optional[List[str]],
+        shelf_name: str,
+    ) -> str:
+        return repr((asdict(cluster_parameter), name, namespace, ports, shelf_name))
 
     def __call__(
         self,
@@ -607,8 +711,19 @@ class K3sBuilder:
         ports: Optional[List[str]],
         logger,
         shelf_name: str = "",
+        uid: Optional[str] = None,
         **_ignored,
     ):
+        # the fingerprint must be taken before the instance applies the Shelf parameters
+        fingerprint = self._fingerprint(
+            cluster_parameter, name, namespace, ports, shelf_name
+        )
+        # concurrent handlers share the instance, each of them logs with its own logger
+        handler_logger.set(logger)
+        if uid and (cached := self._instances.get(uid)):
+            cached_fingerprint, instance = cached
+            if cached_fingerprint == fingerprint:
+                return instance
         instance = K3s(
             configuration=configuration,
             cluster_parameter=cluster_parameter,
@@ -618,4 +733,9 @@ class K3sBuilder:
             logger=logger,
             shelf_name=shelf_name,
         )
+        if uid:
+            self._instances[uid] = (fingerprint, instance)
         return instance
+
+    def evict(self, uid: str) -> None:
+        self._instances.pop(uid, None)
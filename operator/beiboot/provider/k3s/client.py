@@ -0,0 +1,127 @@
+import base64
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import kubernetes as k8s
+import yaml  # type: ignore
+
+from beiboot.api import AsyncApi
+from beiboot.cache import beiboot_index
+
+logger = logging.getLogger("beiboot")
+
+INNER_API_PORT = 6443
+# time to wait for a response of the K3s API server
+INNER_API_TIMEOUT = 5
+# time to skip the API client of a Beiboot after its K3s API server could not be reached
+INNER_API_BACKOFF = timedelta(seconds=60)
+
+
+def inner_api_host(namespace: str) -> str:
+    """
+    It returns the in-cluster address of the K3s API server of a Beiboot cluster (see `create_k3s_kubeapi_service`)
+
+    :param namespace: The namespace of the Beiboot cluster
+    :type namespace: str
+    :return: The URL of the K3s API server
+    """
+    return f"https://kubeapi.{namespace}.svc:{INNER_API_PORT}"
+
+
+class InnerClusterClients:
+    """
+    A pool of long-lived API clients to the K3s API servers of Beiboot clusters, keyed by the Beiboot namespace.
+    The clients are built from the kubeconfig stored in the Beiboot object and rebuilt once that kubeconfig changes.
+    If a K3s API server is not reachable from the operator, the client of that Beiboot is skipped for a while, so
+    that callers can fall back to other means (e.g. exec into the server Pod).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[str, Tuple[str, AsyncApi]] = {}
+        self._unreachable: Dict[str, datetime] = {}
+
+    @staticmethod
+    def _stored_kubeconfig(namespace: str) -> Optional[str]:
+        beiboot = beiboot_index.get_by_namespace(namespace)
+        if beiboot is None:
+            return None
+        if source := (beiboot.get("kubeconfig") or {}).get("source"):
+            return base64.b64decode(source).decode("utf-8")
+        return None
+
+    @staticmethod
+    def _build(namespace: str, kubeconfig: str) -> AsyncApi:
+        api_client = k8s.config.new_client_from_config_dict(yaml.safe_load(kubeconfig))
+        api_client.configuration.host = inner_api_host(namespace)
+        # do not retry a request to an unreachable API server, the caller falls back instead
+        api_client.configuration.retries = 0
+        return AsyncApi(k8s.client.CoreV1Api(api_client=api_client))
+
+    def get(self, namespace: str) -> Optional[AsyncApi]:
+        """
+        It returns the CoreV1Api of the K3s cluster in the given namespace, or None if there is no usable client
+
+        :param namespace: The namespace of the Beiboot cluster
+        :type namespace: str
+        :return: The (async) CoreV1Api of the K3s cluster
+        """
+        with self._lock:
+            if (
+                until := self._unreachable.get(namespace)
+            ) and until > datetime.utcnow():
+                return None
+            kubeconfig = self._stored_kubeconfig(namespace)
+            if kubeconfig is None:
+                return None
+            if cached := self._clients.get(namespace):
+                cached_kubeconfig, api = cached
+                if cached_kubeconfig == kubeconfig:
+                    return api
+                self._close(api)
+            try:
+                api = self._build(namespace, kubeconfig)
+            except Exception as e:  # noqa
+                logger.debug(
+                    f"Cannot create API client for Beiboot in {namespace}: {e}"
+                )
+                return None
+            self._clients[namespace] = (kubeconfig, api)
+            self._unreachable.pop(namespace, None)
+            return api
+
+    def mark_unreachable(self, namespace: str) -> None:
+        """
+        Drop the client of the given namespace and skip it for INNER_API_BACKOFF
+
+        :param namespace: The namespace of the Beiboot cluster
+        :type namespace: str
+        """
+        with self._lock:
+            self._unreachable[namespace] = datetime.utcnow() + INNER_API_BACKOFF
+            if cached := self._clients.pop(namespace, None):
+                self._close(cached[1])
+
+    def evict(self, namespace: str) -> None:
+        """
+        Drop the client of the given namespace, e.g. once the Beiboot cluster is deleted
+
+        :param namespace: The namespace of the Beiboot cluster
+        :type namespace: str
+        """
+        with self._lock:
+            self._unreachable.pop(namespace, None)
+            if cached := self._clients.pop(namespace, None):
+                self._close(cached[1])
+
+    @staticmethod
+    def _close(api: AsyncApi) -> None:
+        try:
+            api.sync.api_client.close()
+        except Exception:  # noqa
+            pass
+
+
+inner_cluster_clients = InnerClusterClients()
@@ -0,0 +1,190 @@
+import json
+import logging
+import re
+import socket
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
+
+import kopf
+
+from beiboot.configuration import BeibootConfiguration, configuration
+
+logger = logging.getLogger("beiboot.k3s")
+
+K3S_TAG_PATTERN = re.compile(r"^v\d+\.\d+\.\d+-k3s\d+$")
+
+
+def k3s_tag_for_version(k8s_version: str) -> str:
+    """
+    It returns the k3s image tag for a Kubernetes version, e.g. 1.24.3 -> v1.24.3-k3s1
+
+    :param k8s_version: The requested Kubernetes version
+    :type k8s_version: str
+    :return: The k3s image tag
+    """
+    _b = k8s_version.lower().replace("v", "")
+    return f"v{_b.strip()}-k3s1"
+
+
+def parse_catalog(raw: Optional[str]) -> Set[str]:
+    """
+    It parses a tag catalog, either a JSON list or one tag per line
+
+    :param raw: The raw catalog
+    :type raw: str
+    :return: The set of tags
+    """
+    if not raw:
+        return set()
+    try:
+        tags = json.loads(raw)
+        if isinstance(tags, list):
+            return {str(tag).strip() for tag in tags if str(tag).strip()}
+    except json.JSONDecodeError:
+        pass
+    return {
+        line.strip()
+        for line in raw.splitlines()
+        if line.strip() and not line.strip().startswith("#")
+    }
+
+
+class K3sTagResolver:
+    """
+    It resolves Kubernetes versions to existing k3s image tags. The tags are looked up in
+    1. a local catalog, preloaded from a file (BEIBOOT_K3S_TAG_CATALOG) and from the Beiboot configuration ConfigMap
+    2. an in-memory cache of previous lookups, positive and negative results expire after their TTL
+    3. the registry: a mirror (BEIBOOT_K3S_REGISTRY_MIRROR) if configured, otherwise Docker Hub
+    If the catalog is authoritative (BEIBOOT_K3S_TAG_CATALOG_ONLY), the registry is never contacted and a tag that
+    is not in the catalog is rejected, e.g. for air-gapped host clusters.
+    """
+
+    def __init__(
+        self,
+        catalog_file: Optional[str] = None,
+        registry_mirror: Optional[str] = None,
+        timeout: float = 5.0,
+        positive_ttl: timedelta = timedelta(hours=24),
+        negative_ttl: timedelta = timedelta(minutes=10),
+        authoritative: bool = False,
+    ):
+        self.registry_mirror = registry_mirror.rstrip("/") if registry_mirror else None
+        self.timeout = timeout
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.authoritative = authoritative
+        self._lock = threading.Lock()
+        self._file_catalog: Set[str] = set()
+        self._configmap_catalog: Set[str] = set()
+        self._cache: Dict[str, Tuple[bool, datetime]] = {}
+        if catalog_file:
+            self.load_catalog_file(catalog_file)
+
+    def load_catalog_file(self, path: str) -> None:
+        try:
+            with open(path, "r") as f:
+                tags = parse_catalog(f.read())
+        except OSError as e:
+            logger.warning(f"Cannot read the k3s tag catalog {path}: {e}")
+            return
+        with self._lock:
+            self._file_catalog = tags
+        logger.info(f"Loaded {len(tags)} k3s image tag(s) from {path}")
+
+    def set_configmap_catalog(self, raw: Optional[str]) -> None:
+        with self._lock:
+            self._configmap_catalog = parse_catalog(raw)
+
+    def _cached(self, tag: str) -> Optional[bool]:
+        with self._lock:
+            if tag in self._file_catalog or tag in self._configmap_catalog:
+                return True
+            if cached := self._cache.get(tag):
+                exists, expires = cached
+                if expires > datetime.utcnow():
+                    return exists
+                del self._cache[tag]
+        return None
+
+    def _remember(self, tag: str, exists: bool) -> None:
+        ttl = self.positive_ttl if exists else self.negative_ttl
+        with self._lock:
+            self._cache[tag] = (exists, datetime.utcnow() + ttl)
+
+    def _lookup_url(self, tag: str) -> str:
+        if self.registry_mirror:
+            return f"{self.registry_mirror}/v2/rancher/k3s/manifests/{tag}"
+        return f"https://hub.docker.com/v2/repositories/rancher/k3s/tags/{tag}"
+
+    def _lookup(self, tag: str) -> bool:
+        req = urllib.request.Request(
+            self._lookup_url(tag),
+            method="HEAD",
+            headers={
+                "Accept": "application/vnd.docker.distribution.manifest.list.v2+json"
+            },
+        )
+        try:
+            urllib.request.urlopen(req, timeout=self.timeout)
+            return True
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return False
+            raise kopf.TemporaryError(
+                f"Cannot look up the k3s image tag {tag}: {e}", delay=10
+            )
+        except (urllib.error.URLError, socket.timeout, OSError) as e:
+            raise kopf.TemporaryError(
+                f"Cannot look up the k3s image tag {tag}: {e}", delay=10
+            )
+
+    def exists(self, tag: str) -> bool:
+        """
+        Returns True if the k3s image tag exists. Raises kopf.TemporaryError if the registry cannot be reached, or
+        kopf.PermanentError if the catalog is authoritative and does not contain the tag.
+        """
+        if not K3S_TAG_PATTERN.match(tag):
+            return False
+        cached = self._cached(tag)
+        if cached is not None:
+            return cached
+        if self.authoritative:
+            raise kopf.PermanentError(
+                f"The k3s image tag {tag} is not in the tag catalog of the operator"
+            )
+        exists = self._lookup(tag)
+        self._remember(tag, exists)
+        return exists
+
+    def resolve(self, k8s_version: str) -> Optional[str]:
+        """
+        It returns the k3s image tag for a Kubernetes version, or None if there is no such image
+
+        :param k8s_version: The requested Kubernetes version
+        :type k8s_version: str
+        :return: The k3s image tag
+        """
+        tag = k3s_tag_for_version(k8s_version)
+        return tag if self.exists(tag) else None
+
+
+def build_tag_resolver(configuration: BeibootConfiguration) -> K3sTagResolver:
+    """
+    It returns a K3sTagResolver with the tag catalog and the registry settings of the operator
+
+    :param configuration: The configuration of the operator
+    :type configuration: BeibootConfiguration
+    :return: The tag resolver
+    """
+    return K3sTagResolver(
+        catalog_file=configuration.K3S_TAG_CATALOG,
+        registry_mirror=configuration.K3S_REGISTRY_MIRROR,
+        timeout=configuration.K3S_TAG_LOOKUP_TIMEOUT,
+        authoritative=configuration.K3S_TAG_CATALOG_ONLY,
+    )
+
+
+tag_resolver = build_tag_resolver(configuration)
@@ -1,12 +1,25 @@
 import logging
+import os
+from typing import Tuple
 
 import kubernetes as k8s
 
 from beiboot.configuration import ClusterConfiguration
+from beiboot.signals import WORKLOAD_LABELS
 
 PVC_PREFIX_NODE = "k8s-node-data"
 PVC_PREFIX_SERVER = "k8s-server-data"
 PRIORITY = 0
+# the server Pod publishes its kubeconfig to this Secret (see `create_k3s_kubeconfig_publisher`)
+KUBECONFIG_SECRET_NAME = "beiboot-kubeconfig"
+KUBECONFIG_SECRET_KEY = "kubeconfig"
+KUBECONFIG_SECRET_LABEL = "beiboot.getdeck.dev/kubeconfig"
+KUBECONFIG_PUBLISHER = "beiboot-kubeconfig-publisher"
+KUBECONFIG_VOLUME = "kubeconfig"
+# the projected token of KUBECONFIG_PUBLISHER, it is only mounted into the publisher container
+KUBECONFIG_PUBLISHER_TOKEN_VOLUME = "kubeconfig-publisher-token"
+# the seconds between two checks of the published kubeconfig for changes
+KUBECONFIG_PUBLISH_INTERVAL = 60
 
 logger = logging.getLogger(__name__)
 
@@ -52,6 +65,7 @@ def create_k3s_server_workload(
         "k3s server "
         "--https-listen-port=6443 "
         "--tls-san=0.0.0.0 "
+        f"--tls-san=kubeapi.{namespace}.svc "
         "--data-dir /getdeck/data "
         "--cluster-cidr=10.45.0.0/16 "
         "--service-cidr=10.46.0.0/16 "
@@ -68,6 +82,7 @@ def create_k3s_server_workload(
         "--https-listen-port=6443 "
         "--write-kubeconfig-mode=0644 "
         "--tls-san=0.0.0.0 "
+        f"--tls-san=kubeapi.{namespace}.svc "
         "--data-dir /getdeck/data "
         f"--write-kubeconfig={kubeconfig_from_location} "
         "--cluster-cidr=10.45.0.0/16 "
@@ -112,6 +127,10 @@ def create_k3s_server_workload(
             k8s.client.V1VolumeMount(
                 name=PVC_PREFIX_SERVER, mount_path="/getdeck/data"
             ),
+            k8s.client.V1VolumeMount(
+                name=KUBECONFIG_VOLUME,
+                mount_path=os.path.dirname(kubeconfig_from_location),
+            ),
         ],
         readiness_probe=k8s.client.V1Probe(
             _exec=k8s.client.V1ExecAction(
@@ -148,11 +167,50 @@ def create_k3s_server_workload(
         ),
     )
 
+    publisher = create_k3s_kubeconfig_publisher_container(
+        namespace,
+        k3s_image,
+        k3s_image_tag,
+        k3s_image_pullpolicy,
+        kubeconfig_from_location,
+    )
+
     template = k8s.client.V1PodTemplateSpec(
         metadata=k8s.client.V1ObjectMeta(labels=parameters.serverLabels),
         spec=k8s.client.V1PodSpec(
-            containers=[container],
+            containers=[container, publisher],
             priority=PRIORITY,
+            service_account_name=KUBECONFIG_PUBLISHER,
+            # the token is only projected into the publisher container, not into the k3s server
+            automount_service_account_token=False,
+            volumes=[
+                k8s.client.V1Volume(
+                    name=KUBECONFIG_VOLUME,
+                    empty_dir=k8s.client.V1EmptyDirVolumeSource(),
+                ),
+                k8s.client.V1Volume(
+                    name=KUBECONFIG_PUBLISHER_TOKEN_VOLUME,
+                    projected=k8s.client.V1ProjectedVolumeSource(
+                        sources=[
+                            k8s.client.V1VolumeProjection(
+                                service_account_token=k8s.client.V1ServiceAccountTokenProjection(
+                                    path="token", expiration_seconds=3600
+                                )
+                            ),
+                            k8s.client.V1VolumeProjection(
+                                config_map=k8s.client.V1ConfigMapProjection(
+                                    name="kube-root-ca.crt",
+                                    items=[
+                                        k8s.client.V1KeyToPath(
+                                            key="ca.crt", path="ca.crt"
+                                        )
+                                    ],
+                                )
+                            ),
+                        ]
+                    ),
+                ),
+            ],
         ),
     )
 
@@ -167,7 +225,9 @@ def create_k3s_server_workload(
     workload = k8s.client.V1StatefulSet(
         api_version="apps/v1",
         metadata=k8s.client.V1ObjectMeta(
-            name="server", namespace=namespace, labels=parameters.serverLabels
+            name="server",
+            namespace=namespace,
+            labels={**parameters.serverLabels, **WORKLOAD_LABELS},
         ),
         spec=spec,
     )
@@ -175,6 +235,134 @@ def create_k3s_server_workload(
     return workload
 
 
+def create_k3s_kubeconfig_publisher_container(
+    namespace: str,
+    k3s_image: str,
+    k3s_image_tag: str,
+    k3s_image_pullpolicy: str,
+    kubeconfig_from_location: str,
+) -> k8s.client.V1Container:
+    """
+    It creates the sidecar container of the k3s server that publishes the kubeconfig to the Secret
+    KUBECONFIG_SECRET_NAME once it was written by the server, and again when its checksum changes (checked every
+    KUBECONFIG_PUBLISH_INTERVAL seconds). It uses the kubectl of the k3s image with the projected token of the
+    KUBECONFIG_PUBLISHER service account, which is only mounted into this container.
+
+    :param namespace: The namespace of the k3s server
+    :type namespace: str
+    :param k3s_image: The image to use for the sidecar
+    :type k3s_image: str
+    :param k3s_image_tag: The tag of the k3s image
+    :type k3s_image_tag: str
+    :param k3s_image_pullpolicy: The image pull policy for the k3s image
+    :type k3s_image_pullpolicy: str
+    :param kubeconfig_from_location: The location of the kubeconfig file that will be created by the server
+    :type kubeconfig_from_location: str
+    :return: A V1Container object
+    """
+    sa_path = "/var/run/secrets/kubernetes.io/serviceaccount"
+    kubectl = (
+        "kubectl "
+        "--server=https://$KUBERNETES_SERVICE_HOST:$KUBERNETES_SERVICE_PORT "
+        f"--certificate-authority={sa_path}/ca.crt "
+        f'--token="$(cat {sa_path}/token)" '
+        f"--namespace={namespace}"
+    )
+    args = [
+        'LAST=""; '
+        "while true; do "
+        f"if [ -f {kubeconfig_from_location} ]; then "
+        f'CURRENT="$(cksum < {kubeconfig_from_location})"; '
+        'if [ "$CURRENT" != "$LAST" ]; then '
+        f"{kubectl} create secret generic {KUBECONFIG_SECRET_NAME} "
+        f"--from-file={KUBECONFIG_SECRET_KEY}={kubeconfig_from_location} "
+        "--dry-run=client -o yaml | "
+        f"{kubectl} label --local -f - {KUBECONFIG_SECRET_LABEL}=true -o yaml | "
+        f'{kubectl} apply -f - && LAST="$CURRENT"; '
+        "fi; "
+        "fi; "
+        # poll quickly until the server has written the kubeconfig, then only look for changes
+        f'if [ -n "$LAST" ]; then sleep {KUBECONFIG_PUBLISH_INTERVAL}; else sleep 2; fi; '
+        "done"
+    ]
+    return k8s.client.V1Container(
+        name="kubeconfig-publisher",
+        image=f"{k3s_image}:{k3s_image_tag}",
+        image_pull_policy=k3s_image_pullpolicy,
+        command=["/bin/sh", "-c"],
+        args=args,
+        volume_mounts=[
+            k8s.client.V1VolumeMount(
+                name=KUBECONFIG_VOLUME,
+                mount_path=os.path.dirname(kubeconfig_from_location),
+                read_only=True,
+            ),
+            k8s.client.V1VolumeMount(
+                name=KUBECONFIG_PUBLISHER_TOKEN_VOLUME,
+                mount_path=sa_path,
+                read_only=True,
+            ),
+        ],
+        resources=k8s.client.V1ResourceRequirements(
+            requests={"cpu": "10m", "memory": "32Mi"},
+            limits={"memory": "64Mi"},
+        ),
+    )
+
+
+def create_k3s_kubeconfig_publisher(
+    namespace: str,
+) -> Tuple[
+    k8s.client.V1ServiceAccount,
+    k8s.client.V1Role,
+    k8s.client.V1RoleBinding,
+    k8s.client.V1Secret,
+]:
+    """
+    It creates the service account of the kubeconfig publisher (see `create_k3s_kubeconfig_publisher_container`),
+    the (empty) kubeconfig Secret and the permission to update only this Secret
+
+    :param namespace: The namespace of the k3s server
+    :type namespace: str
+    :return: The V1ServiceAccount, V1Role, V1RoleBinding and V1Secret objects
+    """
+    metadata = k8s.client.V1ObjectMeta(name=KUBECONFIG_PUBLISHER, namespace=namespace)
+    service_account = k8s.client.V1ServiceAccount(metadata=metadata)
+    role = k8s.client.V1Role(
+        metadata=metadata,
+        rules=[
+            # the Secret is created by the operator, as "create" cannot be restricted to resource names
+            k8s.client.V1PolicyRule(
+                api_groups=[""],
+                resources=["secrets"],
+                resource_names=[KUBECONFIG_SECRET_NAME],
+                verbs=["get", "patch"],
+            ),
+        ],
+    )
+    role_binding = k8s.client.V1RoleBinding(
+        metadata=metadata,
+        subjects=[
+            k8s.client.V1Subject(
+                kind="ServiceAccount", name=KUBECONFIG_PUBLISHER, namespace=namespace
+            )
+        ],
+        role_ref=k8s.client.V1RoleRef(
+            kind="Role",
+            name=KUBECONFIG_PUBLISHER,
+            api_group="rbac.authorization.k8s.io",
+        ),
+    )
+    secret = k8s.client.V1Secret(
+        metadata=k8s.client.V1ObjectMeta(
+            name=KUBECONFIG_SECRET_NAME,
+            namespace=namespace,
+            labels={KUBECONFIG_SECRET_LABEL: "true"},
+        ),
+    )
+    return service_account, role, role_binding, secret
+
+
 def create_k3s_agent_workload(
     namespace: str,
     node_token: str,
@@ -280,7 +468,7 @@ def create_k3s_agent_workload(
         metadata=k8s.client.V1ObjectMeta(
             name=f"agent-{node_index}",
             namespace=namespace,
-            labels=parameters.nodeLabels,
+            labels={**parameters.nodeLabels, **WORKLOAD_LABELS},
         ),
         spec=spec,
     )
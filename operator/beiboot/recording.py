@@ -0,0 +1,285 @@
+import contextlib
+import functools
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Iterator, Optional
+from urllib.parse import urlencode, urlsplit
+
+import kopf
+
+from beiboot.api import ApiRequest, add_request_hook
+
+logger = logging.getLogger("beiboot.recording")
+
+# the version of the trace format, it is written to the header of each trace file
+TRACE_VERSION = 1
+
+# the fields of a Secret whose values are redacted from a trace
+SECRET_FIELDS = ["data", "stringData"]
+
+
+class Recorder:
+    """
+    It writes the Kubernetes API traffic of the operator to a trace file, one compact JSON object per line (gzip
+    compressed if the file name ends with .gz). The first line is a header ({"k": "meta", "v": <version>, "secrets":
+    <bool>}), followed by these records, each with the offset "t" (in seconds) from the start of the recording:
+
+    - a request: {"k": "r", "m": <method>, "p": <path>, "q": <query>, "s": <status>, "b": <response>, "d": <duration>}
+    - an exec in a Pod: {"k": "x", "p": <path of the Pod>, "c": <container>, "a": <command>, "o": <output>, "d": ...}
+    - a handler call: {"k": "h", "h": <handler>, "b": <object>, "r": <result>, "d": <duration>}
+
+    The values of the data (and stringData) of Secrets in the responses are replaced by empty strings, unless the
+    recorder keeps them (secrets=True). The other responses and the output of the execs are recorded as is, they may
+    contain credentials, too (e.g. the kubeconfig of a cluster). Hence, the file is only readable by the operator.
+    """
+
+    def __init__(self, path: str, secrets: bool = False):
+        self.secrets = secrets
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        self._file = os.fdopen(fd, "wb")
+        if path.endswith(".gz"):
+            self._file = gzip.GzipFile(fileobj=self._file, mode="wb")  # type: ignore
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self.write(
+            {
+                "k": "meta",
+                "v": TRACE_VERSION,
+                "secrets": secrets,
+                "started": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            },
+            start=self._start,
+        )
+
+    def write(self, record: dict, start: float) -> None:
+        """
+        It appends a record to the trace file, this is thread-safe
+
+        :param record: The record
+        :type record: dict
+        :param start: The start of the recorded activity (time.monotonic)
+        :type start: float
+        """
+        record["t"] = round(start - self._start, 4)
+        line = json.dumps(record, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            self._file.write(line.encode("utf-8"))
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+_recorder: Optional[Recorder] = None
+
+
+def setup(path: str, secrets: bool = False) -> bool:
+    """
+    It starts recording the Kubernetes API traffic to the given file (see `Recorder`)
+
+    :param path: The trace file, an empty string disables the recording
+    :type path: str
+    :param secrets: Record the data of Secrets as is, instead of redacting it
+    :type secrets: bool
+    :return: True if the recording is enabled
+    """
+    global _recorder
+    if not path:
+        return False
+    try:
+        _recorder = Recorder(path, secrets=secrets)
+    except OSError as e:
+        logger.warning(f"Recording is disabled, the trace file cannot be written: {e}")
+        return False
+    return True
+
+
+def shutdown() -> None:
+    """
+    It stops the recording and closes the trace file
+    """
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+    _recorder = None
+
+
+def enabled() -> bool:
+    return _recorder is not None
+
+
+def request_path(url: str, query_params=None) -> tuple:
+    """
+    It returns the path and the (encoded) query of a request of the kubernetes client, without the host
+
+    :param url: The url of the request
+    :type url: str
+    :param query_params: The query parameters, a list of tuples
+    :return: The path and the query
+    """
+    parts = urlsplit(url)
+    query = "&".join(filter(None, [parts.query, urlencode(query_params or [])]))
+    return parts.path, query
+
+
+def exec_path(name: str, namespace: str) -> str:
+    return f"/api/v1/namespaces/{namespace}/pods/{name}/exec"
+
+
+def _decode(data: Optional[bytes]):
+    if not data:
+        return None
+    try:
+        return json.loads(data)
+    except ValueError:
+        return data.decode("utf-8", errors="replace")
+
+
+def redact_secrets(obj):
+    """
+    It replaces the values of the data and stringData of a Secret, or of each Secret of a SecretList, by empty
+    strings; the keys are kept. Other objects are returned unchanged.
+
+    :param obj: The (decoded) body of a response
+    :return: The body without the content of Secrets
+    """
+    if not isinstance(obj, dict):
+        return obj
+    if obj.get("kind") == "Secret":
+        secrets = [obj]
+    elif obj.get("kind") == "SecretList":
+        secrets = obj.get("items") or []
+    else:
+        return obj
+    for secret in secrets:
+        for name in SECRET_FIELDS:
+            if isinstance(secret.get(name), dict):
+                secret[name] = {key: "" for key in secret[name]}
+    return obj
+
+
+@contextlib.contextmanager
+def _record_request(request: ApiRequest) -> Iterator[None]:
+    if _recorder is None:
+        yield
+        return
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        # a request without a response (e.g. the connection was refused) is not recorded
+        if _recorder is not None and request.status is not None:
+            path, query = request_path(request.url, request.query_params)
+            body = _decode(request.data)
+            if not _recorder.secrets:
+                body = redact_secrets(body)
+            _recorder.write(
+                {
+                    "k": "r",
+                    "m": request.method,
+                    "p": path,
+                    "q": query,
+                    "s": request.status,
+                    "b": body,
+                    "d": round(time.monotonic() - start, 4),
+                },
+                start=start,
+            )
+
+
+def instrument_kubernetes_client() -> None:
+    """
+    It records every request of the (blocking) kubernetes client (see `beiboot.api.add_request_hook`) and every exec
+    in a Pod, by wrapping kubernetes.stream.stream once
+    """
+    import kubernetes.stream
+
+    add_request_hook(_record_request)
+
+    stream = kubernetes.stream.stream
+    if not getattr(stream, "_beiboot_recorded", False):
+
+        @functools.wraps(stream)
+        def _stream(api_method, name, namespace, *args, **kwargs):
+            if _recorder is None or kwargs.get("_preload_content") is False:
+                return stream(api_method, name, namespace, *args, **kwargs)
+            start = time.monotonic()
+            output = stream(api_method, name, namespace, *args, **kwargs)
+            if _recorder is not None:
+                _recorder.write(
+                    {
+                        "k": "x",
+                        "p": exec_path(name, namespace),
+                        "c": kwargs.get("container", ""),
+                        "a": kwargs.get("command"),
+                        "o": output,
+                        "d": round(time.monotonic() - start, 4),
+                    },
+                    start=start,
+                )
+            return output
+
+        _stream._beiboot_recorded = True  # type: ignore
+        kubernetes.stream.stream = _stream
+
+
+def recorded(func: Callable) -> Callable:
+    """
+    A decorator for kopf handlers of an object, it records the body of the object and the result of each call, such
+    that the calls can be replayed
+    """
+
+    @functools.wraps(func)
+    async def _recorded(*args, **kwargs):
+        if _recorder is None:
+            return await func(*args, **kwargs)
+        start = time.monotonic()
+        body = dict(kwargs.get("body") or {})
+        result = "error"
+        try:
+            value = await func(*args, **kwargs)
+            result = "success"
+            return value
+        except kopf.TemporaryError as e:
+            result = "temporary"
+            raise e
+        except kopf.PermanentError as e:
+            result = "permanent"
+            raise e
+        finally:
+            if _recorder is not None:
+                _recorder.write(
+                    {
+                        "k": "h",
+                        "h": func.__name__,
+                        "b": body,
+                        "r": result,
+                        "d": round(time.monotonic() - start, 4),
+                    },
+                    start=start,
+                )
+
+    return _recorded
+
+
+def read_trace(path: str) -> Iterator[dict]:
+    """
+    It reads the records of a trace file (see `Recorder`)
+
+    :param path: The trace file
+    :type path: str
+    :return: The records, without the header
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:  # type: ignore
+        header = json.loads(f.readline() or "{}")
+        if header.get("k") != "meta" or header.get("v") != TRACE_VERSION:
+            raise ValueError(f"{path} is not a trace file of version {TRACE_VERSION}")
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,209 @@
+import asyncio
+import copy
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import kubernetes as k8s
+
+from beiboot.api import AsyncApi
+from beiboot.configuration import configuration
+
+# the field manager of all objects applied by the operator
+FIELD_MANAGER = "beiboot-operator"
+
+# the apiVersion, kind, resource (plural) and scope of the objects the operator applies, keyed by their model
+RESOURCES: Dict[str, Tuple[str, str, str, bool]] = {
+    "V1ConfigMap": ("v1", "ConfigMap", "configmaps", True),
+    "V1Deployment": ("apps/v1", "Deployment", "deployments", True),
+    "V1Job": ("batch/v1", "Job", "jobs", True),
+    "V1Namespace": ("v1", "Namespace", "namespaces", False),
+    "V1PodDisruptionBudget": (
+        "policy/v1",
+        "PodDisruptionBudget",
+        "poddisruptionbudgets",
+        True,
+    ),
+    "V1Role": ("rbac.authorization.k8s.io/v1", "Role", "roles", True),
+    "V1RoleBinding": (
+        "rbac.authorization.k8s.io/v1",
+        "RoleBinding",
+        "rolebindings",
+        True,
+    ),
+    "V1Secret": ("v1", "Secret", "secrets", True),
+    "V1Service": ("v1", "Service", "services", True),
+    "V1ServiceAccount": ("v1", "ServiceAccount", "serviceaccounts", True),
+    "V1StatefulSet": ("apps/v1", "StatefulSet", "statefulsets", True),
+}
+
+# the resource (plural) and scope of the kinds without a model in python-kubernetes, these are applied as dicts
+CUSTOM_RESOURCES: Dict[Tuple[str, str], Tuple[str, bool]] = {
+    ("snapshot.storage.k8s.io/v1", "VolumeSnapshot"): ("volumesnapshots", True),
+    ("snapshot.storage.k8s.io/v1", "VolumeSnapshotContent"): (
+        "volumesnapshotcontents",
+        False,
+    ),
+}
+
+api_client = AsyncApi(k8s.client.ApiClient())
+
+
+@dataclass
+class ApplyResult:
+    """
+    The result of applying one object: the applied object as returned by the API server, or the error
+    """
+
+    obj: Any
+    applied: Any = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def name(self) -> str:
+        if isinstance(self.obj, dict):
+            return self.obj["metadata"]["name"]
+        return self.obj.metadata.name
+
+
+def apply_path(
+    api_version: str, resource: str, name: str, namespace: Optional[str] = None
+) -> str:
+    """
+    It returns the API path of an object
+
+    :param api_version: The apiVersion of the object, e.g. apps/v1
+    :type api_version: str
+    :param resource: The resource (plural) of the object, e.g. statefulsets
+    :type resource: str
+    :param name: The name of the object
+    :type name: str
+    :param namespace: The namespace of the object, None for cluster-scoped objects
+    :type namespace: str
+    :return: The API path
+    """
+    prefix = "/api/v1" if api_version == "v1" else f"/apis/{api_version}"
+    if namespace:
+        return f"{prefix}/namespaces/{namespace}/{resource}/{name}"
+    return f"{prefix}/{resource}/{name}"
+
+
+def apply_request(obj: Any, namespace: Optional[str] = None) -> Tuple[str, dict, str]:
+    """
+    It returns the response type, the server-side apply body and the API path of a Kubernetes object
+
+    :param obj: The object, either a model (e.g. a k8s.client.V1StatefulSet) or a dict of a custom resource
+    :param namespace: The namespace of the object, defaults to the namespace in its metadata
+    :type namespace: str
+    :return: The response type, the body and the path
+    """
+    if isinstance(obj, dict):
+        key = (obj.get("apiVersion"), obj.get("kind"))
+        if key not in CUSTOM_RESOURCES:
+            raise ValueError(f"Cannot apply objects of kind {key[1]}")
+        response_type = "object"
+        api_version, kind = key  # type: ignore
+        resource, namespaced = CUSTOM_RESOURCES[key]  # type: ignore
+        body = copy.deepcopy(obj)
+    else:
+        response_type = type(obj).__name__
+        if response_type not in RESOURCES:
+            raise ValueError(f"Cannot apply objects of type {response_type}")
+        api_version, kind, resource, namespaced = RESOURCES[response_type]
+        body = api_client.sync.sanitize_for_serialization(obj)
+    body["apiVersion"] = api_version
+    body["kind"] = kind
+    metadata = body.setdefault("metadata", {})
+    if namespaced:
+        namespace = namespace or metadata.get("namespace")
+        if not namespace:
+            raise ValueError(f"{kind} {metadata.get('name')} requires a namespace")
+        metadata["namespace"] = namespace
+    else:
+        namespace = None
+    return (
+        response_type,
+        body,
+        apply_path(api_version, resource, metadata["name"], namespace),
+    )
+
+
+async def apply_object(obj: Any, namespace: Optional[str] = None) -> Any:
+    """
+    It creates or updates an object with server-side apply. The operator takes over all fields it sets, hence
+    applying the same object again is a no-op.
+
+    :param obj: The object, either a model (e.g. a k8s.client.V1StatefulSet) or a dict of a custom resource
+    :param namespace: The namespace of the object, defaults to the namespace in its metadata
+    :type namespace: str
+    :return: The applied object (of the same model, or a dict)
+    """
+    response_type, body, path = apply_request(obj, namespace)
+    return await api_client.call_api(
+        path,
+        "PATCH",
+        query_params=[("fieldManager", FIELD_MANAGER), ("force", "true")],
+        header_params={
+            "Accept": "application/json",
+            "Content-Type": "application/apply-patch+yaml",
+        },
+        # JSON is valid YAML
+        body=json.dumps(body),
+        response_type=response_type,
+        auth_settings=["BearerToken"],
+        _return_http_data_only=True,
+    )
+
+
+async def apply_all(
+    logger, objects: List[Any], namespace: Optional[str] = None
+) -> List[ApplyResult]:
+    """
+    It applies independent objects concurrently (see `apply_object`), at most APPLY_CONCURRENCY at a time. Failures
+    do not stop the other objects from being applied.
+
+    :param logger: a logger object
+    :param objects: The objects to apply
+    :type objects: List[Any]
+    :param namespace: The namespace of the objects, defaults to the namespace in their metadata
+    :type namespace: str
+    :return: The result of each object, in the given order
+    """
+    semaphore = asyncio.Semaphore(configuration.APPLY_CONCURRENCY)
+
+    async def _apply(obj: Any) -> ApplyResult:
+        result = ApplyResult(obj)
+        async with semaphore:
+            logger.debug(f"Applying {type(obj).__name__} {result.name}")
+            try:
+                result.applied = await apply_object(obj, namespace)
+            except (k8s.client.ApiException, ValueError) as e:
+                logger.warning(f"Cannot apply {result.name}: {e}")
+                result.error = e
+        return result
+
+    return list(await asyncio.gather(*[_apply(obj) for obj in objects]))
+
+
+async def apply_objects(
+    logger, objects: List[Any], namespace: Optional[str] = None
+) -> List[Any]:
+    """
+    It applies independent objects concurrently (see `apply_all`) and raises the first failure
+
+    :param logger: a logger object
+    :param objects: The objects to apply
+    :type objects: List[Any]
+    :param namespace: The namespace of the objects, defaults to the namespace in their metadata
+    :type namespace: str
+    :return: The applied objects, in the given order
+    """
+    results = await apply_all(logger, objects, namespace)
+    for result in results:
+        if not result.ok:
+            raise result.error  # type: ignore
+    return [result.applied for result in results]
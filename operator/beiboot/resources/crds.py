@@ -17,6 +17,8 @@ BEIBOOT_PARAMETERS = k8s.client.V1JSONSchemaProps(
         "maxLifetime": k8s.client.V1JSONSchemaProps(type="string"),
         # max time with no client heartbeat before the cluster extincts
         "maxSessionTimeout": k8s.client.V1JSONSchemaProps(type="string"),
+        # hibernate instead of removing the cluster once the session timeout is reached
+        "hibernateOnSessionTimeout": k8s.client.V1JSONSchemaProps(type="boolean"),
         # timeout for this cluster to become ready
         "clusterReadyTimeout": k8s.client.V1JSONSchemaProps(type="integer"),
         # server resources
@@ -4,19 +4,19 @@ from typing import Optional, Dict
 import kopf
 import kubernetes as k8s
 
-app_v1_api = k8s.client.AppsV1Api()
-core_v1_api = k8s.client.CoreV1Api()
-rbac_v1_api = k8s.client.RbacAuthorizationV1Api()
-custom_api = k8s.client.CustomObjectsApi()
-batch_v1_api = k8s.client.BatchV1Api()
-policy_v1_api = k8s.client.PolicyV1Api()
+from beiboot.api import AsyncApi, run_sync
+from beiboot.resources.apply import apply_object, apply_objects
 
+app_v1_api = AsyncApi(k8s.client.AppsV1Api())
+core_v1_api = AsyncApi(k8s.client.CoreV1Api())
+custom_api = AsyncApi(k8s.client.CustomObjectsApi())
 
-def handle_create_statefulset(
+
+async def handle_create_statefulset(
     logger, statefulset: k8s.client.V1StatefulSet, namespace: str
 ) -> None:
     """
-    It creates a statefulset if it doesn't exist, and patches it if it does
+    It applies a statefulset, it is created if it doesn't exist and updated with the current configuration if it does
 
     :param logger: a logger object
     :param statefulset: The statefulset object that we want to create
@@ -24,74 +24,25 @@ def handle_create_statefulset(
     :param namespace: The namespace in which the statefulset will be created
     :type namespace: str
     """
-    try:
-        app_v1_api.create_namespaced_stateful_set(body=statefulset, namespace=namespace)
-    except k8s.client.exceptions.ApiException as e:
-        if e.status == 409:
-            logger.warning(
-                f"Statefulset {statefulset.metadata.name} already available, now patching it with current configuration"
-            )
-            app_v1_api.patch_namespaced_stateful_set(
-                name=statefulset.metadata.name,
-                body=statefulset,
-                namespace=namespace,
-            )
-            logger.info(f"Statefulset {statefulset.metadata.name} patched")
-        else:
-            raise e
-    except ValueError as e:
-        logger.info(str(e))
-        pass
+    await apply_object(statefulset, namespace)
+    logger.info(f"Statefulset {statefulset.metadata.name} applied")
 
 
-def handle_create_deployment(
+async def handle_create_deployment(
     logger, deployment: k8s.client.V1Deployment, namespace: str
 ) -> None:
-    try:
-        app_v1_api.create_namespaced_deployment(body=deployment, namespace=namespace)
-    except k8s.client.exceptions.ApiException as e:
-        if e.status == 409:
-            logger.warning(
-                f"Deployment {deployment.metadata.name} already available, now patching it with current configuration"
-            )
-            app_v1_api.patch_namespaced_deployment(
-                name=deployment.metadata.name,
-                body=deployment,
-                namespace=namespace,
-            )
-            logger.info(f"Deployment {deployment.metadata.name} patched")
-        else:
-            raise e
-    except ValueError as e:
-        logger.info(str(e))
-        pass
+    await apply_object(deployment, namespace)
+    logger.info(f"Deployment {deployment.metadata.name} applied")
 
 
-def handle_create_pod_disruption_budgets(
+async def handle_create_pod_disruption_budgets(
     logger, pdb: k8s.client.V1PodDisruptionBudget, namespace: str
 ) -> None:
-    try:
-        policy_v1_api.create_namespaced_pod_disruption_budget(namespace, body=pdb)
-    except k8s.client.exceptions.ApiException as e:
-        if e.status == 409:
-            logger.warning(
-                f"Pod Disruption Budget {pdb.metadata.name} already available, \
-                  now patching it with current configuration"
-            )
-            app_v1_api.patch_namespaced_deployment(
-                name=pdb.metadata.name,
-                body=pdb,
-                namespace=namespace,
-            )
-            logger.info(f"Pod Disruption Budget {pdb.metadata.name} patched")
-        else:
-            raise e
-    except ValueError as e:
-        logger.info(str(e))
-        pass
+    await apply_object(pdb, namespace)
+    logger.info(f"Pod Disruption Budget {pdb.metadata.name} applied")
 
 
-def handle_delete_statefulset(logger, name: str, namespace: str) -> None:
+async def handle_delete_statefulset(logger, name: str, namespace: str) -> None:
     """
     It deletes a statefulset
 
@@ -102,7 +53,7 @@ def handle_delete_statefulset(logger, name: str, namespace: str) -> None:
     :type namespace: str
     """
     try:
-        app_v1_api.delete_namespaced_stateful_set(name=name, namespace=namespace)
+        await app_v1_api.delete_namespaced_stateful_set(name=name, namespace=namespace)
     except k8s.client.exceptions.ApiException as e:
         if e.status == 404:
             pass
@@ -113,11 +64,11 @@ def handle_delete_statefulset(logger, name: str, namespace: str) -> None:
         pass
 
 
-def handle_create_service(
+async def handle_create_service(
     logger, service: k8s.client.V1Service, namespace: str
 ) -> k8s.client.V1Service:
     """
-    If the service already exists, patch it with the current configuration
+    It applies a service, it is created if it doesn't exist and updated with the current configuration if it does
 
     :param logger: a logger object
     :param service: The service object to create
@@ -126,27 +77,12 @@ def handle_create_service(
     :type namespace: str
     :return: The service object
     """
-    try:
-        service = core_v1_api.create_namespaced_service(
-            body=service, namespace=namespace
-        )
-    except k8s.client.exceptions.ApiException as e:
-        if e.status in [409, 422]:
-            logger.warning(
-                f"Service {service.metadata.name} already available, now patching it with current configuration"
-            )
-            service = core_v1_api.patch_namespaced_service(
-                name=service.metadata.name,
-                body=service,
-                namespace=namespace,
-            )
-            logger.info(f"Service {service.metadata.name} patched")
-        else:
-            raise e
+    service = await apply_object(service, namespace)
+    logger.info(f"Service {service.metadata.name} applied")
     return service
 
 
-def handle_delete_service(logger, name: str, namespace: str) -> None:
+async def handle_delete_service(logger, name: str, namespace: str) -> None:
     """
     It deletes a service in a namespace
 
@@ -157,7 +93,7 @@ def handle_delete_service(logger, name: str, namespace: str) -> None:
     :type namespace: str
     """
     try:
-        core_v1_api.delete_namespaced_service(name=name, namespace=namespace)
+        await core_v1_api.delete_namespaced_service(name=name, namespace=namespace)
     except k8s.client.exceptions.ApiException as e:
         if e.status == 404:
             pass
@@ -165,7 +101,7 @@ def handle_delete_service(logger, name: str, namespace: str) -> None:
             raise e
 
 
-def handle_create_namespace(logger, namespace: str) -> str:
+async def handle_create_namespace(logger, namespace: str) -> str:
     """
     It creates a namespace in Kubernetes
 
@@ -175,19 +111,16 @@ def handle_create_namespace(logger, namespace: str) -> str:
     :return: The namespace that was created.
     """
     try:
-        core_v1_api.create_namespace(
-            body=k8s.client.V1Namespace(
+        await apply_object(
+            k8s.client.V1Namespace(
                 metadata=k8s.client.V1ObjectMeta(name=namespace)
                 # TODO label these namespaces so we can safely remove then in case of uninstall
             )
         )
-        logger.info(f"Created namespace for beiboot: {namespace}")
+        logger.info(f"Applied namespace for beiboot: {namespace}")
     except k8s.client.exceptions.ApiException as e:
-        if e.status == 409:
-            logger.warning(f"Namespace for beiboot {namespace} already exists")
-        else:
-            logger.error(e)
-            raise e
+        logger.error(e)
+        raise e
     return namespace
 
 
@@ -200,81 +133,120 @@ async def handle_delete_namespace(logger, namespace) -> Optional[k8s.client.V1St
     :return: The status of the delete operation.
     """
     try:
-        status = core_v1_api.delete_namespace(namespace)
+        status = await core_v1_api.delete_namespace(namespace)
         logger.info(f"Deleted namespace for beiboot: {namespace}")
         return status
     except k8s.client.exceptions.ApiException:
         return None
 
 
-def handle_create_beiboot_serviceaccount(logger, name: str, namespace: str) -> None:
+def beiboot_serviceaccount_objects(name: str, namespace: str) -> list:
     """
-    It creates a service account, a role, and a role binding to allow the service account to port forward
-    :param logger: a logger object
-    :param name: The name of the service account to create
+    It returns the role, the service account and the role binding that allow a Beiboot service account to port
+    forward
+
+    :param name: The name of the service account
     :type name: str
-    :param namespace: The namespace to create the service account in
+    :param namespace: The namespace of the service account
     :type namespace: str
+    :return: The role, service account and role binding objects
     """
-    try:
-        role = rbac_v1_api.create_namespaced_role(
-            namespace=namespace,
-            body=k8s.client.V1Role(
-                metadata=k8s.client.V1ObjectMeta(
-                    name="beiboot-allow-port-forward", namespace=namespace
-                ),
-                rules=[
-                    k8s.client.V1PolicyRule(
-                        api_groups=[""],
-                        resources=["pods/portforward"],
-                        verbs=["get", "list", "create"],
-                    ),
-                    k8s.client.V1PolicyRule(
-                        api_groups=[""],
-                        resources=["configmaps"],
-                        verbs=["get", "patch"],
-                    ),
-                ],
+    role = k8s.client.V1Role(
+        metadata=k8s.client.V1ObjectMeta(
+            name="beiboot-allow-port-forward", namespace=namespace
+        ),
+        rules=[
+            k8s.client.V1PolicyRule(
+                api_groups=[""],
+                resources=["pods/portforward"],
+                verbs=["get", "list", "create"],
             ),
-        )
-        sa = core_v1_api.create_namespaced_service_account(
-            namespace=namespace,
-            body=k8s.client.V1ServiceAccount(
-                metadata=k8s.client.V1ObjectMeta(name=name, namespace=namespace)
+            k8s.client.V1PolicyRule(
+                api_groups=[""],
+                resources=["configmaps"],
+                verbs=["get", "patch"],
             ),
-        )
-        rbac_v1_api.create_namespaced_role_binding(
-            namespace=namespace,
-            body=k8s.client.V1RoleBinding(
-                metadata=k8s.client.V1ObjectMeta(
-                    name="beiboot-allow-port-forward", namespace=namespace
-                ),
-                subjects=[
-                    k8s.client.V1Subject(kind="ServiceAccount", name=sa.metadata.name)
-                ],
-                role_ref=k8s.client.V1RoleRef(
-                    kind="Role",
-                    name=role.metadata.name,
-                    api_group="rbac.authorization.k8s.io",
-                ),
+            k8s.client.V1PolicyRule(
+                api_groups=["coordination.k8s.io"],
+                resources=["leases"],
+                verbs=["get", "create", "patch", "update"],
             ),
-        )
-        logger.info(f"Created serviceaccount and permissions for beiboot: {name}")
-    except k8s.client.exceptions.ApiException as e:
-        raise e
+        ],
+    )
+    sa = k8s.client.V1ServiceAccount(
+        metadata=k8s.client.V1ObjectMeta(name=name, namespace=namespace)
+    )
+    role_binding = k8s.client.V1RoleBinding(
+        metadata=k8s.client.V1ObjectMeta(
+            name="beiboot-allow-port-forward", namespace=namespace
+        ),
+        subjects=[k8s.client.V1Subject(kind="ServiceAccount", name=name)],
+        role_ref=k8s.client.V1RoleRef(
+            kind="Role",
+            name=role.metadata.name,
+            api_group="rbac.authorization.k8s.io",
+        ),
+    )
+    return [role, sa, role_binding]
+
+
+async def handle_create_beiboot_serviceaccount(
+    logger, name: str, namespace: str
+) -> None:
+    """
+    It applies a service account, a role, and a role binding to allow the service account to port forward
+    :param logger: a logger object
+    :param name: The name of the service account to create
+    :type name: str
+    :param namespace: The namespace to create the service account in
+    :type namespace: str
+    """
+    await apply_objects(
+        logger, beiboot_serviceaccount_objects(name, namespace), namespace
+    )
+    logger.info(f"Created serviceaccount and permissions for beiboot: {name}")
+
+
+async def handle_rebind_beiboot_serviceaccount(
+    logger, old_name: str, new_name: str, namespace: str
+) -> None:
+    """
+    It replaces the service account of a Beiboot cluster with a new one for another Beiboot (see
+    `handle_create_beiboot_serviceaccount`), the previous service account and its token are removed
+
+    :param logger: a logger object
+    :param old_name: The name of the current service account
+    :type old_name: str
+    :param new_name: The name of the new service account
+    :type new_name: str
+    :param namespace: The namespace of the Beiboot cluster
+    :type namespace: str
+    """
+    _, sa, role_binding = beiboot_serviceaccount_objects(new_name, namespace)
+    await apply_objects(logger, [sa, role_binding], namespace)
+    for delete, name in [
+        (core_v1_api.delete_namespaced_secret, f"{old_name}-token"),
+        (core_v1_api.delete_namespaced_service_account, old_name),
+    ]:
+        try:
+            await delete(name=name, namespace=namespace)
+        except k8s.client.exceptions.ApiException as e:
+            if e.status != 404:
+                raise e
+    logger.info(f"Serviceaccount {old_name} replaced with {new_name}")
 
 
 async def get_serviceaccount_data(name: str, namespace: str) -> dict[str, str]:
     token_secret_name = f"{name}-token"
     try:
-        token_secret = core_v1_api.read_namespaced_secret(
+        token_secret = await core_v1_api.read_namespaced_secret(
             name=token_secret_name, namespace=namespace
         )
         data = token_secret.data
     except k8s.client.exceptions.ApiException as e:
         if e.status == 404:
             try:
-                token_secret = core_v1_api.create_namespaced_secret(
+                token_secret = await core_v1_api.create_namespaced_secret(
                     namespace=namespace,
                     body=k8s.client.V1Secret(
                         metadata=k8s.client.V1ObjectMeta(
@@ -350,26 +322,17 @@ def create_volume_snapshot_pre_provisioned_resource(
     }
 
 
-def handle_create_volume_snapshot(logger, body: dict):
+async def handle_create_volume_snapshot(logger, body: dict):
     """
     :param logger: a logger object
     :param body: The dict that describes the K8s resource
     """
-    try:
-        # python-kubernetes doesn't support VolumeSnapshots; if it does support them one day, we can change it here
-        namespace = body.get("metadata", {}).get("namespace")
-        k8s.client.CustomObjectsApi().create_namespaced_custom_object(
-            group="snapshot.storage.k8s.io",
-            version="v1",
-            namespace=f"{namespace}",
-            plural="volumesnapshots",
-            body=body,
-        )
-        logger.info(
-            f"Created VolumeSnapshot {body.get('metadata', {}).get('name')} in namespace {namespace}."
-        )
-    except k8s.client.exceptions.ApiException as e:
-        raise e
+    # python-kubernetes doesn't support VolumeSnapshots; if it does support them one day, we can change it here
+    await apply_object(body)
+    logger.info(
+        f"Applied VolumeSnapshot {body.get('metadata', {}).get('name')} in namespace "
+        f"{body.get('metadata', {}).get('namespace')}."
+    )
 
 
 async def handle_delete_volume_snapshot(
@@ -377,7 +340,7 @@ async def handle_delete_volume_snapshot(
 ) -> Optional[k8s.client.V1Status]:
     try:
         # python-kubernetes doesn't support VolumeSnapshots; if it does support them one day, we can change it here
-        status = k8s.client.CustomObjectsApi().delete_namespaced_custom_object(
+        status = await custom_api.delete_namespaced_custom_object(
             group="snapshot.storage.k8s.io",
             version="v1",
             namespace=f"{namespace}",
@@ -436,25 +399,17 @@ def create_volume_snapshot_content_pre_provisioned_resource(
     }
 
 
-def handle_create_volume_snapshot_content(logger, body: dict):
+async def handle_create_volume_snapshot_content(logger, body: dict):
     """
     :param logger: a logger object
     :param body: The dict that describes the K8s resource
     """
-    try:
-        # python-kubernetes doesn't support VolumeSnapshotContents; if it does support them one day, we can change it
-        # here
-        k8s.client.CustomObjectsApi().create_cluster_custom_object(
-            group="snapshot.storage.k8s.io",
-            version="v1",
-            plural="volumesnapshotcontents",
-            body=body,
-        )
-        logger.info(
-            f"Created VolumeSnapshotContent {body.get('metadata', {}).get('name')}."
-        )
-    except k8s.client.exceptions.ApiException as e:
-        raise e
+    # python-kubernetes doesn't support VolumeSnapshotContents; if it does support them one day, we can change it
+    # here
+    await apply_object(body)
+    logger.info(
+        f"Applied VolumeSnapshotContent {body.get('metadata', {}).get('name')}."
+    )
 
 
 async def handle_delete_volume_snapshot_content(
@@ -463,7 +418,7 @@ async def handle_delete_volume_snapshot_content(
     try:
         # python-kubernetes doesn't support VolumeSnapshotContents; if it does support them one day, we can change it
         # here
-        status = k8s.client.CustomObjectsApi().delete_cluster_custom_object(
+        status = await custom_api.delete_cluster_custom_object(
             group="snapshot.storage.k8s.io",
             version="v1",
             plural="volumesnapshotcontents",
@@ -491,11 +446,15 @@ async def create_volume_snapshots_from_shelf(
     """
     from beiboot.utils import get_volume_snapshot_class_by_name
 
-    volume_snapshot_class = get_volume_snapshot_class_by_name(
-        shelf["volumeSnapshotClass"], api_instance=custom_api
+    volume_snapshot_class = await run_sync(
+        get_volume_snapshot_class_by_name,
+        shelf["volumeSnapshotClass"],
+        api_instance=custom_api.sync,
     )
     driver = volume_snapshot_class["driver"]
     mapping = {}
+    volume_snapshot_contents = []
+    volume_snapshots = []
     for volume_snapshot_content in shelf["volumeSnapshotContents"]:
         node_name = volume_snapshot_content["node"]
         volume_snapshot_content_name = (
@@ -504,27 +463,30 @@ async def create_volume_snapshots_from_shelf(
         volume_snapshot_name = volume_snapshot_content_name
         # we must use deletionPolicy=Retain, otherwise the VolumeSnapshotContent and the snapshotHandle will be deleted
         # when the cluster is deleted, rendering the shelf not usable
-        vsc_resource = create_volume_snapshot_content_pre_provisioned_resource(
-            name=volume_snapshot_content_name,
-            driver=driver,
-            snapshot_handle=volume_snapshot_content["snapshotHandle"],
-            volume_snapshot_ref_name=volume_snapshot_name,
-            volume_snapshot_ref_namespace=cluster_namespace,
-            deletion_policy="Retain",
-            labels={"shelf-uid": shelf["metadata"]["uid"]},
+        volume_snapshot_contents.append(
+            create_volume_snapshot_content_pre_provisioned_resource(
+                name=volume_snapshot_content_name,
+                driver=driver,
+                snapshot_handle=volume_snapshot_content["snapshotHandle"],
+                volume_snapshot_ref_name=volume_snapshot_name,
+                volume_snapshot_ref_namespace=cluster_namespace,
+                deletion_policy="Retain",
+                labels={"shelf-uid": shelf["metadata"]["uid"]},
+            )
         )
-        handle_create_volume_snapshot_content(logger, body=vsc_resource)
-
-        vs_resource = create_volume_snapshot_pre_provisioned_resource(
-            name=volume_snapshot_name,
-            namespace=cluster_namespace,
-            volume_snapshot_content=volume_snapshot_content_name,
-            labels={"shelf-uid": shelf["metadata"]["uid"]},
+        volume_snapshots.append(
+            create_volume_snapshot_pre_provisioned_resource(
+                name=volume_snapshot_name,
+                namespace=cluster_namespace,
+                volume_snapshot_content=volume_snapshot_content_name,
+                labels={"shelf-uid": shelf["metadata"]["uid"]},
+            )
         )
-        handle_create_volume_snapshot(logger, body=vs_resource)
-
         mapping[node_name] = volume_snapshot_name
 
+    # the VolumeSnapshots refer to their VolumeSnapshotContents
+    await apply_objects(logger, volume_snapshot_contents)
+    await apply_objects(logger, volume_snapshots)
     return mapping
 
 
@@ -533,9 +495,7 @@ async def handle_create_job(logger, body: k8s.client.V1Job) -> None:
     :param logger: a logger object
     :param body: The dict that describes the K8s resource
     """
-    try:
-        namespace = body.metadata.namespace
-        batch_v1_api.create_namespaced_job(namespace, body)
-        logger.info(f"Created Job {body.metadata.name} in namespace {namespace}.")
-    except k8s.client.exceptions.ApiException as e:
-        raise e
+    await apply_object(body)
+    logger.info(
+        f"Applied Job {body.metadata.name} in namespace {body.metadata.namespace}."
+    )
@@ -0,0 +1,300 @@
+import asyncio
+import heapq
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from beiboot.utils import parse_timedelta
+
+logger = logging.getLogger("beiboot.scheduler")
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.strip("Z"))
+    except ValueError:
+        return None
+
+
+def nearest_deadline(
+    model: dict,
+    session_timeout: Optional[str],
+    last_heartbeat: Optional[datetime] = None,
+) -> Optional[datetime]:
+    """
+    It returns the nearest point in time at which the Beiboot may have to be terminated: its sunset or the end of
+    the client session timeout (see `BeibootCluster.should_terminate`)
+
+    :param model: The body of the Beiboot object
+    :type model: dict
+    :param session_timeout: The maxSessionTimeout of the Beiboot
+    :type session_timeout: str
+    :param last_heartbeat: The latest client heartbeat, if known
+    :type last_heartbeat: datetime
+    :return: The nearest deadline or None
+    """
+    deadlines = []
+    if sunset := _parse_timestamp(model.get("sunset")):
+        deadlines.append(sunset)
+    if session_timeout:
+        try:
+            td = parse_timedelta(session_timeout)
+        except ValueError:
+            td = None
+        transitions = model.get("stateTransitions") or {}
+        last_contact = (
+            last_heartbeat
+            or _parse_timestamp(model.get("lastClientContact"))
+            or _parse_timestamp(transitions.get("READY"))
+        )
+        if td and last_contact:
+            deadlines.append(last_contact + td)
+    return min(deadlines) if deadlines else None
+
+
+class _DueQueue:
+    """
+    The common loop of the ReconcileScheduler and the DeadlineQueue: a heap of names by due time that sleeps until
+    the earliest one is due and calls the handler for each due name in its own task. A name is due once, scheduling
+    it again replaces the previous due time. With bounded concurrency, a due name waits for a free slot; it keeps its
+    due time until then (see `_waiting`).
+    """
+
+    # the description of the handler in log messages
+    action = "Handling"
+
+    def __init__(self, concurrency: Optional[int] = None):
+        self.concurrency = concurrency
+        self._heap: List[Tuple[Any, int, str]] = []
+        self._due: Dict[str, Any] = {}
+        # the due times of the handler calls that wait for a free slot, by ticket
+        self._waiting: Dict[int, Any] = {}
+        self._counter = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+    def _now(self) -> Any:
+        raise NotImplementedError()
+
+    def _seconds(self, due: Any, now: Any) -> float:
+        return due - now
+
+    def _push(self, name: str, due: Any) -> None:
+        self._due[name] = due
+        self._counter += 1
+        heapq.heappush(self._heap, (due, self._counter, name))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _pop_due(self) -> Tuple[List[Tuple[str, Any]], Optional[float]]:
+        now = self._now()
+        names = []
+        while self._heap:
+            due, _, name = self._heap[0]
+            if self._due.get(name) != due:
+                # removed or rescheduled
+                heapq.heappop(self._heap)
+                continue
+            if due > now:
+                return names, self._seconds(due, now)
+            heapq.heappop(self._heap)
+            del self._due[name]
+            names.append((name, due))
+        return names, None
+
+    async def _run(self, handler: Callable[[str], Awaitable]) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency) if self.concurrency else None
+
+        async def _handle(ticket: int, name: str):
+            try:
+                if semaphore is None:
+                    self._waiting.pop(ticket, None)
+                    await handler(name)
+                else:
+                    async with semaphore:
+                        self._waiting.pop(ticket, None)
+                        await handler(name)
+            except Exception as e:  # noqa
+                logger.error(f"{self.action} of {name} failed: {e}")
+            finally:
+                # cancelled while waiting for a slot
+                self._waiting.pop(ticket, None)
+
+        while True:
+            names, timeout = self._pop_due()
+            for name, due in names:
+                self._counter += 1
+                self._waiting[self._counter] = due
+                task = asyncio.create_task(_handle(self._counter, name))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            self._wakeup.clear()  # type: ignore
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)  # type: ignore
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, handler: Callable[[str], Awaitable]) -> None:
+        """
+        Start the loop, the handler is called with each due name
+
+        :param handler: The coroutine function to call
+        :type handler: Callable[[str], Awaitable]
+        """
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run(handler))
+
+    async def stop(self) -> None:
+        """
+        Stop the loop and cancel the handlers that are still running
+        """
+        tasks = list(self._running)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._running.clear()
+        self._waiting.clear()
+
+
+class ReconcileScheduler(_DueQueue):
+    """
+    A scheduler for the periodic reconciliation of Beiboot objects. The next check of each Beiboot is picked from
+    its state, the time it has been stable and its recent failures with some jitter. Due Beiboots are handed to the
+    handler with bounded concurrency. Deadlines (sunset, session timeout) are handled by the DeadlineQueue.
+    """
+
+    action = "Scheduled reconciliation"
+
+    def __init__(
+        self,
+        interval: float,
+        jitter: float = 0.1,
+        concurrency: int = 10,
+        max_backoff: int = 3,
+    ):
+        super().__init__(concurrency=concurrency)
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self._failures: Dict[str, int] = {}
+
+    def _now(self) -> float:
+        return time.monotonic()
+
+    def next_interval(self, model: dict, now=None) -> float:
+        """
+        It returns the number of seconds until the next check of the given Beiboot
+
+        :param model: The body of the Beiboot object
+        :type model: dict
+        :return: The number of seconds
+        """
+        now = now or datetime.utcnow()
+        state = model.get("state")
+        interval = self.interval
+        if state in ["RUNNING", "PENDING"]:
+            # the cluster is about to become running or ready
+            interval = self.interval / 2
+        elif state == "READY":
+            ready = _parse_timestamp((model.get("stateTransitions") or {}).get("READY"))
+            if ready and now - ready > timedelta(hours=1):
+                interval = self.interval * 4
+            elif ready and now - ready > timedelta(minutes=10):
+                interval = self.interval * 2
+        failures = self._failures.get(model["metadata"]["name"], 0)
+        if failures:
+            interval = self.interval * 2 ** min(failures, self.max_backoff)
+        interval *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(interval, 1)
+
+    def schedule(self, model: dict, reschedule: bool = False) -> None:
+        """
+        Schedule the next check of the given Beiboot. An existing schedule is only moved to an earlier time, unless
+        reschedule is set.
+
+        :param model: The body of the Beiboot object
+        :type model: dict
+        :param reschedule: Replace an existing schedule
+        :type reschedule: bool
+        """
+        name = model["metadata"]["name"]
+        due = time.monotonic() + self.next_interval(model)
+        if not reschedule and name in self._due and self._due[name] <= due:
+            return
+        self._push(name, due)
+
+    def record(self, name: str, success: bool) -> None:
+        if success:
+            self._failures.pop(name, None)
+        else:
+            self._failures[name] = self._failures.get(name, 0) + 1
+
+    def remove(self, name: str) -> None:
+        self._due.pop(name, None)
+        self._failures.pop(name, None)
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        The number of scheduled Beiboots, including the due ones that wait for a free slot
+        """
+        return len(self._due) + len(self._waiting)
+
+    @property
+    def lag(self) -> float:
+        """
+        The number of seconds the most overdue Beiboot is behind its schedule, a due Beiboot is behind until its
+        reconciliation got a free slot
+        """
+        dues = [*self._due.values(), *self._waiting.values()]
+        if not dues:
+            return 0.0
+        return max(time.monotonic() - min(dues), 0.0)
+
+
+class DeadlineQueue(_DueQueue):
+    """
+    A single priority queue of the termination deadlines (sunset, client session timeout) of all Beiboots. The
+    queue sleeps until the earliest deadline has passed and then calls the handler for that Beiboot.
+    """
+
+    action = "Deadline handling"
+
+    def _now(self) -> datetime:
+        return datetime.utcnow()
+
+    def _seconds(self, due: datetime, now: datetime) -> float:
+        return (due - now).total_seconds()
+
+    def set(self, name: str, deadline: Optional[datetime]) -> None:
+        """
+        Set (or replace) the deadline of a Beiboot, None removes it
+
+        :param name: The name of the Beiboot
+        :type name: str
+        :param deadline: The deadline (UTC)
+        :type deadline: datetime
+        """
+        if deadline is None:
+            self.remove(name)
+            return
+        if self._due.get(name) == deadline:
+            return
+        self._push(name, deadline)
+
+    def remove(self, name: str) -> None:
+        self._due.pop(name, None)
+
+    def get(self, name: str) -> Optional[datetime]:
+        return self._due.get(name)
+
+    def __len__(self) -> int:
+        return len(self._due)
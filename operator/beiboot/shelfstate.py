@@ -1,10 +1,11 @@
-import uuid
 from datetime import datetime
 from typing import Optional, Tuple, List
 
 import kubernetes as k8s
 import kopf
 
+from beiboot.api import AsyncApi
+from beiboot.events import create_event, event_publisher
 from beiboot.clusterstate import BeibootCluster
 from beiboot.configuration import ShelfConfiguration, ClusterConfiguration
 from beiboot.resources.utils import (
@@ -15,7 +16,7 @@ from beiboot.resources.utils import (
 )
 from beiboot.utils import StateMachine, AsyncState
 
-objects_api = k8s.client.CustomObjectsApi()
+objects_api = AsyncApi(k8s.client.CustomObjectsApi())
 
 
 class Shelf(StateMachine):
@@ -24,6 +25,8 @@ class Shelf(StateMachine):
     The body of the Shelf CRD is available as self.model
     """
 
+    metrics_kind = "shelf"
+
     requested = AsyncState("Shelf requested", initial=True, value="REQUESTED")
     creating = AsyncState("Shelf creating", value="CREATING")
     preparing = AsyncState(
@@ -65,9 +68,8 @@ class Shelf(StateMachine):
         )
         self._cluster_namespace = cluster_namespace
         self.cluster_parameters: Optional[ClusterConfiguration] = None
-        self.custom_api = k8s.client.CustomObjectsApi()
-        self.core_api = k8s.client.CoreV1Api()
-        self.events_api = k8s.client.EventsV1Api()
+        self.custom_api = AsyncApi(k8s.client.CustomObjectsApi())
+        self.core_api = AsyncApi(k8s.client.CoreV1Api())
 
     def set_persistent_volume_claims(self, persistent_volume_claims: dict):
         self.persistent_volume_claims = persistent_volume_claims
@@ -218,7 +220,7 @@ class Shelf(StateMachine):
         else:
             return None
 
-    def on_enter_state(self, destination, *args, **kwargs):
+    async def on_enter_state(self, destination, *args, **kwargs):
         """
         If the current state value is not the same as the latest state value, write the current state value to the
         Shelf object
@@ -229,11 +231,11 @@ class Shelf(StateMachine):
         if self.get_latest_state():
             state, _ = self.get_latest_state()
             if self.current_state_value != state:
-                self._write_state()
+                await self._write_state()
         else:
-            self._write_state()
+            await self._write_state()
 
-    def on_enter_requested(self) -> None:
+    async def on_enter_requested(self) -> None:
         """
         > The function `on_enter_requested` is called when the state machine enters the `requested` state
         """
@@ -243,7 +245,7 @@ class Shelf(StateMachine):
             f"The shelf request for '{self.name}' has been accepted",
         )
 
-    def on_create(self):
+    async def on_create(self):
         """
         > The function posts an event to the Kubernetes API, and then patches the custom resource with the parameters
         """
@@ -253,7 +255,7 @@ class Shelf(StateMachine):
             self.creating.value, f"The shelf '{self.name}' is now being created"
         )
 
-        self._patch_object(
+        await self._patch_object(
             {
                 "clusterParameters": dataclasses.asdict(self.cluster_parameters),
             }
@@ -281,7 +283,7 @@ class Shelf(StateMachine):
             "volumeSnapshotContents": volume_snapshot_contents,
         }
 
-        self._patch_object(data)
+        await self._patch_object(data)
 
     async def on_pre_shelve(self, cluster: BeibootCluster):
         """
@@ -301,7 +303,9 @@ class Shelf(StateMachine):
                 volume_snapshot_class=self.volume_snapshot_class,
                 pvc_name=pvc_name,
             )
-            handle_create_volume_snapshot(self.logger, body=volume_snapshot_resource)
+            await handle_create_volume_snapshot(
+                self.logger, body=volume_snapshot_resource
+            )
         self.post_event(
             self.creating.value,
             f"Now waiting for the shelf '{self.name}' to enter ready state",
@@ -341,7 +345,7 @@ class Shelf(StateMachine):
 
     def post_event(self, reason: str, message: str, _type: str = "Normal") -> None:
         """
-        It creates an event object and posts it to the Kubernetes API
+        It queues an event object for the Kubernetes API, the event is posted in the background
 
         :param reason: The reason for the event
         :type reason: str
@@ -350,61 +354,55 @@ class Shelf(StateMachine):
         :param _type: The type of event, defaults to Normal
         :type _type: str (optional)
         """
-        # TODO: refactor with clusterstate
-        now = self._get_now()
-        event = k8s.client.EventsV1Event(
-            metadata=k8s.client.V1ObjectMeta(
-                name=f"{self.name}-{uuid.uuid4()}",
-                namespace=self.configuration.NAMESPACE,
-            ),
-            reason=reason.capitalize(),
-            note=message[:1024],  # maximum message length
-            event_time=now,
-            action="Shelf-State",
-            type=_type,
-            reporting_instance="beiboot-operator",
-            reporting_controller="beiboot-operator",
-            regarding=k8s.client.V1ObjectReference(
-                kind="shelf",
+        event_publisher.publish(
+            create_event(
                 name=self.name,
                 namespace=self.configuration.NAMESPACE,
+                kind="shelf",
                 uid=self.model.metadata["uid"],
-            ),
-        )
-        self.events_api.create_namespaced_event(
-            namespace=self.configuration.NAMESPACE, body=event
+                action="Shelf-State",
+                reason=reason,
+                message=message,
+                _type=_type,
+            )
         )
 
-    def _write_state(self):
+    async def _write_state(self):
         # TODO: refactor with clusterstate
         data = {
             "state": self.current_state.value,
             "stateTransitions": {self.current_state.value: self._get_now()},
         }
-        self._patch_object(data)
+        await self._patch_object(data)
 
-    def _patch_object(self, data: dict):
+    async def _send_patch(self, data: dict):
         # TODO: refactor with clusterstate
-        self.custom_api.patch_namespaced_custom_object(
-            namespace=self.configuration.NAMESPACE,
-            name=self.name,
-            body=data,
-            group="beiboots.getdeck.dev",
-            plural="shelves",
-            version="v1",
-        )
+        try:
+            await self.custom_api.patch_namespaced_custom_object(
+                namespace=self.configuration.NAMESPACE,
+                name=self.name,
+                body=data,
+                group="beiboots.getdeck.dev",
+                plural="shelves",
+                version="v1",
+            )
+        except k8s.client.exceptions.ApiException as e:
+            if e.status == 404:
+                # the object has been removed in the meantime
+                return
+            raise e
 
     async def _volume_snapshots_ready(self):
         """
         Check whether VolumeSnapshots/VolumeSnapshotContents are readyToUse and update shelf CRD data if necessary.
         """
-        volume_snapshots = objects_api.list_namespaced_custom_object(
+        volume_snapshots = await objects_api.list_namespaced_custom_object(
             group="snapshot.storage.k8s.io",
             version="v1",
             namespace=self.cluster_namespace,
             plural="volumesnapshots",
         )
-        volume_snapshot_contents = objects_api.list_cluster_custom_object(
+        volume_snapshot_contents = await objects_api.list_cluster_custom_object(
             group="snapshot.storage.k8s.io",
             version="v1",
             plural="volumesnapshotcontents",
@@ -467,7 +465,7 @@ class Shelf(StateMachine):
 
         if data_volume_snapshot_contents != self.model["volumeSnapshotContents"]:
             data = {"volumeSnapshotContents": data_volume_snapshot_contents}
-            self._patch_object(data)
+            await self._patch_object(data)
 
         return all(ready)
 
@@ -511,7 +509,7 @@ class Shelf(StateMachine):
         # delete all VolumeSnapshots and VolumeSnapshotContents with the shelf-uid label
         # this is primarily done to clean up all VolumeSnapshotContents with the same snapshotHandle, as they won't be
         # usable once one of them is deleted
-        volume_snapshots = objects_api.list_namespaced_custom_object(
+        volume_snapshots = await objects_api.list_namespaced_custom_object(
             group="snapshot.storage.k8s.io",
             version="v1",
             namespace=self.cluster_namespace,
@@ -524,7 +522,7 @@ class Shelf(StateMachine):
                 name=volume_snapshot["metadata"]["name"],
                 namespace=self.cluster_namespace,
             )
-        volume_snapshot_contents = objects_api.list_cluster_custom_object(
+        volume_snapshot_contents = await objects_api.list_cluster_custom_object(
             group="snapshot.storage.k8s.io",
             version="v1",
             plural="volumesnapshotcontents",
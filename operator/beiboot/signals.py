@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from typing import Dict
+
+logger = logging.getLogger("beiboot")
+
+# the labels of the workloads (StatefulSets, Deployments) of all Beiboot clusters, the workload watch streams select
+# them on the API server
+WORKLOAD_LABELS = {"beiboot.getdeck.dev/workload": "true"}
+
+
+class WorkloadSignals:
+    """
+    Signals for status changes of the workloads (StatefulSets, Deployments) in the Beiboot namespaces, fed by the
+    workload watch streams of the operator. A waiter is woken up by the next change in its namespace after it
+    started waiting.
+    """
+
+    def __init__(self):
+        self._events: Dict[str, asyncio.Event] = {}
+        self._waiters: Dict[str, int] = {}
+
+    def notify(self, namespace: str) -> None:
+        """
+        Wake up all waiters of the given namespace
+
+        :param namespace: The namespace of the changed workload
+        :type namespace: str
+        """
+        # waiters that start afterwards wait for the next change
+        if event := self._events.pop(namespace, None):
+            event.set()
+
+    async def wait(self, namespace: str, timeout: float) -> bool:
+        """
+        Wait for the next workload change in the given namespace
+
+        :param namespace: The Beiboot namespace
+        :type namespace: str
+        :param timeout: The maximum number of seconds to wait
+        :type timeout: float
+        :return: True if a workload changed, False if the timeout passed
+        """
+        event = self._events.setdefault(namespace, asyncio.Event())
+        self._waiters[namespace] = self._waiters.get(namespace, 0) + 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiters[namespace] -= 1
+            if self._waiters[namespace] == 0:
+                del self._waiters[namespace]
+                if self._events.get(namespace) is event:
+                    del self._events[namespace]
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+
+workload_signals = WorkloadSignals()
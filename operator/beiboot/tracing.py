@@ -0,0 +1,204 @@
+import contextlib
+import functools
+import hashlib
+import logging
+import uuid
+from typing import Callable, Iterator, Optional
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.trace import NonRecordingSpan, SpanContext, SpanKind, TraceFlags
+except ImportError:  # pragma: no cover
+    # tracing is optional, it requires the opentelemetry-sdk package (the "tracing" extra)
+    trace = None  # type: ignore
+
+from beiboot.api import ApiRequest, add_request_hook
+from beiboot.metrics import api_request_labels
+
+logger = logging.getLogger("beiboot.tracing")
+
+# the annotation of the Kubernetes events that holds the W3C trace context of the posting span
+TRACEPARENT_ANNOTATION = "beiboot.getdeck.dev/traceparent"
+
+_provider = None
+_tracer = None
+
+
+def setup(exporter: str, endpoint: Optional[str] = None, path: str = "") -> bool:
+    """
+    It sets up the tracing of the operator, the spans are exported to an OTLP collector (exporter "otlp", requires the
+    opentelemetry-exporter-otlp-proto-http package) or appended to a file as JSON lines (exporter "file")
+
+    :param exporter: The exporter: otlp, file or an empty string to disable tracing
+    :type exporter: str
+    :param endpoint: The OTLP endpoint, defaults to OTEL_EXPORTER_OTLP_TRACES_ENDPOINT or http://localhost:4318
+    :type endpoint: str
+    :param path: The file of the file exporter
+    :type path: str
+    :return: True if tracing is enabled
+    """
+    global _provider, _tracer
+    if not exporter:
+        return False
+    if trace is None:
+        logger.warning("Tracing is disabled, as the opentelemetry-sdk is not installed")
+        return False
+    if exporter == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+                OTLPSpanExporter,
+            )
+        except ImportError:
+            logger.warning(
+                "Tracing is disabled, as the opentelemetry-exporter-otlp-proto-http is not installed"
+            )
+            return False
+        span_exporter = (
+            OTLPSpanExporter(endpoint=endpoint) if endpoint else OTLPSpanExporter()
+        )
+    elif exporter == "file":
+        span_exporter = ConsoleSpanExporter(
+            out=open(path, "a"),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    else:
+        logger.warning(f"Tracing is disabled, the exporter {exporter} is unknown")
+        return False
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": "beiboot-operator"})
+    )
+    _provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    _tracer = _provider.get_tracer("beiboot")
+    return True
+
+
+def shutdown() -> None:
+    """
+    It exports the pending spans and stops tracing
+    """
+    global _provider, _tracer
+    if _provider is not None:
+        _provider.shutdown()
+    _provider, _tracer = None, None
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def lifecycle_ids(uid: str) -> tuple:
+    """
+    It returns the trace id of the lifecycle of an object and the span id of its (virtual) root span, both derived from
+    the uid of the object. Hence all spans of an object belong to one trace, across handler runs and operator restarts.
+
+    :param uid: The uid of the object
+    :type uid: str
+    :return: The trace id and the span id
+    """
+    try:
+        trace_id = uuid.UUID(uid).int
+    except ValueError:
+        trace_id = int(hashlib.sha256(uid.encode()).hexdigest()[:32], 16)
+    span_id = int(hashlib.sha256(f"{uid}/root".encode()).hexdigest()[:16], 16)
+    return trace_id or 1, span_id or 1
+
+
+def _parent_context(uid: Optional[str]):
+    if not uid:
+        return None
+    trace_id, span_id = lifecycle_ids(uid)
+    current = trace.get_current_span().get_span_context()
+    if current.is_valid and current.trace_id == trace_id:
+        # nested in a span of the same lifecycle
+        return None
+    span_context = SpanContext(
+        trace_id=trace_id,
+        span_id=span_id,
+        is_remote=True,
+        trace_flags=TraceFlags(TraceFlags.SAMPLED),
+    )
+    return trace.set_span_in_context(NonRecordingSpan(span_context))
+
+
+@contextlib.contextmanager
+def span(name: str, uid: Optional[str] = None, kind=None, **attributes) -> Iterator:
+    """
+    A context manager for a span, it does nothing if tracing is disabled. With the uid of an object, the span is part
+    of the lifecycle trace of that object (see `lifecycle_ids`), otherwise it is a child of the current span.
+
+    :param name: The name of the span
+    :type name: str
+    :param uid: The uid of the Beiboot (or Shelf) object
+    :type uid: str
+    :return: The span or None
+    """
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(
+        name,
+        context=_parent_context(uid),
+        kind=kind or SpanKind.INTERNAL,
+        attributes={key: str(value) for key, value in attributes.items()},
+    ) as _span:
+        yield _span
+
+
+def traceparent() -> Optional[str]:
+    """
+    It returns the W3C traceparent of the current span, or None
+    """
+    if _tracer is None:
+        return None
+    span_context = trace.get_current_span().get_span_context()
+    if not span_context.is_valid:
+        return None
+    return (
+        f"00-{span_context.trace_id:032x}-{span_context.span_id:016x}-"
+        f"{int(span_context.trace_flags):02x}"
+    )
+
+
+def traced(func: Callable) -> Callable:
+    """
+    A decorator for kopf handlers of an object, the handler runs in a span of the lifecycle trace of the object
+    """
+
+    @functools.wraps(func)
+    async def _traced(*args, **kwargs):
+        uid = None
+        if body := kwargs.get("body"):
+            uid = body.get("metadata", {}).get("uid")
+        with span(func.__name__, uid=uid, object_name=kwargs.get("name", "")):
+            return await func(*args, **kwargs)
+
+    return _traced
+
+
+@contextlib.contextmanager
+def _trace_request(request: ApiRequest) -> Iterator[None]:
+    if _tracer is None:
+        yield
+        return
+    verb, resource = api_request_labels(
+        request.method, request.url, request.headers.get("Content-Type", "")
+    )
+    with span(
+        f"{verb} {resource}", kind=SpanKind.CLIENT, http_method=request.method
+    ) as _span:
+        try:
+            yield
+        finally:
+            if request.status is not None:
+                _span.set_attribute("http_status_code", request.status)
+
+
+def instrument_kubernetes_client() -> None:
+    """
+    It records a span for every request of the (blocking) kubernetes client (see `beiboot.api.add_request_hook`).
+    The spans are children of the span that issued the request (see `beiboot.api.run_sync`).
+    """
+    add_request_hook(_trace_request)
@@ -2,7 +2,7 @@ import inspect
 import logging
 import string
 import random
-from typing import List
+from typing import List, Optional
 from datetime import timedelta
 
 import kubernetes as k8s
@@ -15,7 +15,11 @@ from statemachine.statemachine import (
 )
 
 
+from beiboot.api import AsyncApi, get_executor, run_sync
+from beiboot.cache import node_index
 from beiboot.configuration import ClusterConfiguration, BeibootConfiguration
+from beiboot import tracing
+from beiboot.metrics import observe_state_duration, pod_execs
 
 
 logger = logging.getLogger("beiboot")
@@ -33,7 +37,7 @@ def generate_token(length=10) -> str:
     )
 
 
-def exec_command_pod(
+async def exec_command_pod(
     api_instance: k8s.client.CoreV1Api,
     pod_name: str,
     namespace: str,
@@ -51,46 +55,78 @@ def exec_command_pod(
     :param run_async: run this command async
     :return: the result output as str
     """
-    if run_async:
-        resp = api_instance.connect_get_namespaced_pod_exec(
-            pod_name,
-            namespace,
-            container=container_name,
-            command=command,
-            stderr=False,
-            stdin=False,
-            stdout=False,
-            tty=False,
-            async_req=True,
-        )
-    else:
-        resp = k8s.stream.stream(
-            api_instance.connect_get_namespaced_pod_exec,
-            pod_name,
-            namespace,
-            container=container_name,
-            command=command,
-            stderr=True,
-            stdin=False,
-            stdout=True,
-            tty=False,
-        )
+    # k8s.stream.stream temporarily replaces the request method of the ApiClient, hence every exec needs its own
+    # ApiClient to not interfere with concurrent requests of other handlers
+    api_client = k8s.client.ApiClient(
+        configuration=api_instance.api_client.configuration
+    )
+    _api = k8s.client.CoreV1Api(api_client=api_client)
+    try:
+        with tracing.span(
+            "exec", pod=pod_name, container=container_name, command=command[0]
+        ):
+            if run_async:
+                resp = await run_sync(
+                    _api.connect_get_namespaced_pod_exec,
+                    pod_name,
+                    namespace,
+                    container=container_name,
+                    command=command,
+                    stderr=False,
+                    stdin=False,
+                    stdout=False,
+                    tty=False,
+                    async_req=True,
+                )
+            else:
+                resp = await run_sync(
+                    k8s.stream.stream,
+                    _api.connect_get_namespaced_pod_exec,
+                    pod_name,
+                    namespace,
+                    container=container_name,
+                    command=command,
+                    stderr=True,
+                    stdin=False,
+                    stdout=True,
+                    tty=False,
+                )
+    except Exception as e:
+        pod_execs.labels(result="error").inc()
+        raise e
+    finally:
+        # closing waits for a request that runs in the thread pool of the ApiClient (run_async), not on the event loop
+        get_executor().submit(close_api_client, api_client)
+    pod_execs.labels(result="success").inc()
     if not run_async:
         logger.debug("Response: " + resp)
     return resp
 
 
-def get_external_node_ips(api_instance: k8s.client.CoreV1Api) -> List[str]:
+def close_api_client(api_client: k8s.client.ApiClient) -> None:
+    """
+    It closes the thread pool and the connection pool of an ApiClient
+
+    :param api_client: The ApiClient
+    :type api_client: k8s.client.ApiClient
+    """
+    api_client.close()
+    api_client.rest_client.pool_manager.clear()
+
+
+async def get_external_node_ips(api_instance: AsyncApi) -> List[str]:
     """
     It gets the external IP addresses of all the nodes in the Kubernetes cluster
 
-    :param api_instance: k8s.client.CoreV1Api
-    :type api_instance: k8s.client.CoreV1Api
+    :param api_instance: An AsyncApi of a k8s.client.CoreV1Api
+    :type api_instance: AsyncApi
     :return: A list of IP addresses of the Kubernetes nodes.
     """
+    if node_index.primed:
+        return node_index.external_ips()
     ips = []
     try:
-        nodes = api_instance.list_node()
+        nodes = await api_instance.list_node()
     except Exception as e:  # noqa
         logger.error("Could not read Kubernetes nodes: " + str(e))
         return []
@@ -126,7 +162,8 @@ def get_beiboot_for_namespace(
     configuration: BeibootConfiguration,
 ):
     """
-    It returns the Beiboot object for a given namespace
+    It returns the Beiboot object for a given namespace. The lookup is served from the in-memory Beiboot index; only
+    if the index is not yet primed, the Beiboot objects are listed from the Kubernetes API
 
     :param namespace: the namespace to look for a beiboot in
     :type namespace: str
@@ -141,11 +178,10 @@ def get_beiboot_for_namespace(
         spec
         status
     """
+    from beiboot.cache import AttrDict, beiboot_index
 
-    class AttrDict(dict):
-        def __init__(self, *args, **kwargs):
-            super(AttrDict, self).__init__(*args, **kwargs)
-            self.__dict__ = self
+    if beiboot_index.primed:
+        return beiboot_index.get_by_namespace(namespace)
 
     beiboots = api_instance.list_namespaced_custom_object(
         group="getdeck.dev",
@@ -154,7 +190,7 @@ def get_beiboot_for_namespace(
         plural="beiboots",
     )
     for bbt in beiboots["items"]:
-        if bbt["beibootNamespace"] == namespace:
+        if bbt.get("beibootNamespace") == namespace:
             # need to wrap this for correct later use
             return AttrDict(bbt)
     else:
@@ -184,7 +220,14 @@ def get_beiboot_by_name(
 
 
 def get_label_selector(labels: dict[str, str]) -> str:
-    return ",".join(["{0}={1}".format(*label) for label in list(labels.items())])
+    # the parameters of a Beiboot object turn "true" and "false" into booleans (see ClusterConfiguration._merge), the
+    # label values must be selected the way they have been written, though
+    return ",".join(
+        [
+            f"{key}={str(value).lower() if isinstance(value, bool) else value}"
+            for key, value in labels.items()
+        ]
+    )
 
 
 def parse_timedelta(delta: str, only_positve=True) -> timedelta:
@@ -244,9 +287,87 @@ class AsyncState(State):
         return combined
 
 
+def merge_patch(target: dict, patch: dict) -> dict:
+    """
+    Deep-merge a (JSON merge) patch into another one, values of the patch take precedence
+
+    :param target: The patch to merge into
+    :type target: dict
+    :param patch: The patch to merge
+    :type patch: dict
+    :return: The merged patch
+    """
+    result = dict(target)
+    for key, value in patch.items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = merge_patch(result[key], value)
+        else:
+            result[key] = value
+    return result
+
+
 # It's a state machine that can be used in an asynchronous context
 class AsyncStateMachine(BaseStateMachine):
+    # patches of the object that are issued during a transition are coalesced and sent at the end of the transition
+    _transition_depth: int = 0
+    _pending_patch: Optional[dict] = None
+    # the kind of the object in the state duration metrics (see `beiboot.metrics.state_duration`), e.g. beiboot
+    metrics_kind: Optional[str] = None
+
+    def _observe_state_duration(self, state: str) -> None:
+        if self.metrics_kind is not None:
+            observe_state_duration(
+                self.metrics_kind, state, self.completed_transition(state)  # type: ignore
+            )
+
+    async def _patch_object(self, data: dict):
+        if self._transition_depth:
+            self._pending_patch = merge_patch(self._pending_patch or {}, data)
+        else:
+            await self._send_patch(data)
+
+    async def _send_patch(self, data: dict):
+        raise NotImplementedError
+
+    async def _flush_patch(self):
+        data, self._pending_patch = self._pending_patch, None
+        if data:
+            await self._send_patch(data)
+
+    def _trace_uid(self) -> Optional[str]:
+        try:
+            return self.model["metadata"]["uid"]  # type: ignore
+        except (AttributeError, KeyError, TypeError):
+            return None
+
     async def _activate(self, transition, *args, **kwargs):
+        self._transition_depth += 1
+        try:
+            with tracing.span(
+                f"{self.metrics_kind or 'object'}.{transition.identifier}",
+                uid=self._trace_uid(),
+                source=self.current_state.value,
+            ):
+                result = await self._run_transition(transition, *args, **kwargs)
+        except BaseException:
+            await self._end_transition(failed=True)
+            raise
+        await self._end_transition()
+        return result
+
+    async def _end_transition(self, failed: bool = False) -> None:
+        self._transition_depth -= 1
+        if self._transition_depth:
+            return
+        try:
+            await self._flush_patch()
+        except Exception as e:
+            if not failed:
+                raise e
+            # the error of the transition (e.g. a kopf.TemporaryError) must reach kopf, not the one of the patch
+            logger.error(f"Cannot patch the object after a failed transition: {e}")
+
+    async def _run_transition(self, transition, *args, **kwargs):
         bounded_on_event = getattr(self, "on_{}".format(transition.identifier), None)
         on_event = transition.on_execute
 
@@ -264,19 +385,27 @@ class AsyncStateMachine(BaseStateMachine):
         result, destination = transition._get_destination(result)
 
         bounded_on_exit_state_event = getattr(self, "on_exit_state", None)
-        if callable(bounded_on_exit_state_event):
+        if inspect.iscoroutinefunction(bounded_on_exit_state_event):
+            await bounded_on_exit_state_event(self.current_state)
+        elif callable(bounded_on_exit_state_event):
             bounded_on_exit_state_event(self.current_state)
 
         bounded_on_exit_specific_state_event = getattr(
             self, "on_exit_{}".format(self.current_state.identifier), None
         )
-        if callable(bounded_on_exit_specific_state_event):
+        if inspect.iscoroutinefunction(bounded_on_exit_specific_state_event):
+            await bounded_on_exit_specific_state_event()
+        elif callable(bounded_on_exit_specific_state_event):
             bounded_on_exit_specific_state_event()
 
+        if destination != self.current_state:
+            self._observe_state_duration(self.current_state.value)
         self.current_state = destination
 
         bounded_on_enter_state_event = getattr(self, "on_enter_state", None)
-        if callable(bounded_on_enter_state_event):
+        if inspect.iscoroutinefunction(bounded_on_enter_state_event):
+            await bounded_on_enter_state_event(destination)
+        elif callable(bounded_on_enter_state_event):
             bounded_on_enter_state_event(destination)
 
         bounded_on_enter_specific_state_event = getattr(
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import threading
+from typing import Awaitable, Callable, List, Optional
+
+import kubernetes as k8s
+from kubernetes.watch.watch import iter_resp_lines
+
+logger = logging.getLogger("beiboot")
+
+# the seconds after which the API server ends a watch request, it is started again right away
+WATCH_TIMEOUT = 300
+# the maximum seconds between two attempts to start a failed watch
+MAX_BACKOFF = 30
+
+
+class SelectorWatch:
+    """
+    A watch stream of one kind of objects that is filtered by the API server with a label and/or field selector.
+    The watch streams of kopf filter the objects in the operator (`labels=`, `when=`), i.e. they transfer and
+    decode every object of their kind in the host cluster. Use a SelectorWatch for kinds the operator only needs a
+    few objects of, e.g. the kubeconfig Secrets.
+
+    The stream runs in its own thread with the (blocking) kubernetes client and calls the handler on the event loop
+    with each raw event, one after another, like kopf.on.event does. After an error the stream is started again
+    without a resource version, i.e. it begins with an ADDED event for each matching object; handlers must be
+    idempotent.
+    """
+
+    def __init__(
+        self,
+        list_func: Callable,
+        handler: Callable[..., Awaitable],
+        namespace: Optional[str] = None,
+        label_selector: str = "",
+        field_selector: str = "",
+    ):
+        self.list_func = list_func
+        self.handler = handler
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.field_selector = field_selector
+        self.resource_version: Optional[str] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._response = None
+        self._stopped = threading.Event()
+
+    @property
+    def name(self) -> str:
+        return self.handler.__name__
+
+    def start(self) -> None:
+        """
+        Start the watch stream in its own thread, the handler runs on the current event loop
+        """
+        self._loop = asyncio.get_running_loop()
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"beiboot-watch-{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the watch stream, an event that is being handled is finished
+        """
+        self._stopped.set()
+        if response := self._response:
+            try:
+                response.close()
+            except Exception:  # noqa
+                pass
+
+    def _request(self):
+        kwargs = dict(watch=True, _preload_content=False, timeout_seconds=WATCH_TIMEOUT)
+        if self.label_selector:
+            kwargs["label_selector"] = self.label_selector
+        if self.field_selector:
+            kwargs["field_selector"] = self.field_selector
+        if self.resource_version:
+            kwargs["resource_version"] = self.resource_version
+        if self.namespace is not None:
+            return self.list_func(self.namespace, **kwargs)
+        return self.list_func(**kwargs)
+
+    def _run(self) -> None:
+        backoff = 1
+        while not self._stopped.is_set():
+            try:
+                self._stream()
+                backoff = 1
+            except Exception as e:  # noqa
+                if self._stopped.is_set():
+                    return
+                logger.warning(f"Watch stream of {self.name} failed: {e}")
+                self.resource_version = None
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def _stream(self) -> None:
+        self._response = response = self._request()
+        try:
+            for line in iter_resp_lines(response):
+                if self._stopped.is_set():
+                    return
+                event = json.loads(line)
+                obj = event.get("object") or {}
+                if event["type"] == "ERROR":
+                    if obj.get("code") == 410:
+                        # the resource version is too old, start over
+                        self.resource_version = None
+                        return
+                    raise k8s.client.ApiException(
+                        status=obj.get("code"), reason=obj.get("message")
+                    )
+                self.resource_version = obj.get("metadata", {}).get(
+                    "resourceVersion", self.resource_version
+                )
+                if event["type"] == "BOOKMARK":
+                    continue
+                self._dispatch(event)
+        finally:
+            self._response = None
+            response.close()
+            response.release_conn()
+
+    def _dispatch(self, event: dict) -> None:
+        metadata = event["object"].get("metadata", {})
+        future = asyncio.run_coroutine_threadsafe(
+            self.handler(
+                event=event,
+                name=metadata.get("name"),
+                namespace=metadata.get("namespace"),
+                logger=logger,
+            ),
+            self._loop,  # type: ignore
+        )
+        try:
+            future.result()
+        except Exception as e:  # noqa
+            logger.error(f"Watch handler {self.name} failed: {e}")
+
+
+selector_watches: List[SelectorWatch] = []
+
+
+def on_event(
+    list_func: Callable,
+    namespace: Optional[str] = None,
+    label_selector: str = "",
+    field_selector: str = "",
+) -> Callable:
+    """
+    A decorator like kopf.on.event, for a watch stream that is filtered by the API server (see `SelectorWatch`):
+
+        @on_event(core_api.list_secret_for_all_namespaces, label_selector="app=beiboot")
+        async def handle_secret(event, name, namespace, logger, **kwargs):
+            ...
+
+    :param list_func: The (blocking) list function of the kind, e.g. CoreV1Api().list_secret_for_all_namespaces, or
+        a namespaced one together with namespace
+    :type list_func: Callable
+    :param namespace: The namespace to watch with a namespaced list function
+    :type namespace: str
+    :param label_selector: The label selector of the objects
+    :type label_selector: str
+    :param field_selector: The field selector of the objects
+    :type field_selector: str
+    """
+
+    def decorator(handler: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+        selector_watches.append(
+            SelectorWatch(
+                list_func,
+                handler,
+                namespace=namespace,
+                label_selector=label_selector,
+                field_selector=field_selector,
+            )
+        )
+        return handler
+
+    return decorator
+
+
+def start_watches() -> None:
+    """
+    Start all registered watch streams
+    """
+    for watch in selector_watches:
+        watch.start()
+
+
+def stop_watches() -> None:
+    """
+    Stop all registered watch streams
+    """
+    for watch in selector_watches:
+        watch.stop()
@@ -0,0 +1,72 @@
+import argparse
+import json
+import logging
+import sys
+
+from tests.benchmark.harness import run_benchmark
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m tests.benchmark",
+        description="Benchmark the Beiboot operator against a fake Kubernetes API server",
+    )
+    parser.add_argument(
+        "-n", "--beiboots", type=int, default=20, help="the number of Beiboots"
+    )
+    parser.add_argument(
+        "--shelves",
+        type=int,
+        default=0,
+        help="the number of Beiboots that are shelved before they are deleted",
+    )
+    parser.add_argument(
+        "--ready-delay",
+        type=float,
+        default=0.2,
+        help="the seconds until the workloads of a cluster become ready",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=0,
+        help="the maximum number of concurrent lifecycles (default: all at once)",
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="trace the peak of the Python heap (slows down the operator)",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="PATH",
+        default="",
+        help="record the API traffic of the operator to a trace file (see tests.benchmark.replay)",
+    )
+    parser.add_argument("--json", metavar="PATH", help="write the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="log the operator")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if not args.verbose:
+        # the operator logs a warning for every temporary error, i.e. while clusters are pending
+        logging.getLogger("beiboot").setLevel(logging.ERROR)
+        # more concurrent requests than pooled connections of the kubernetes client are logged for each request
+        logging.getLogger("urllib3.connectionpool").setLevel(logging.ERROR)
+    result = run_benchmark(
+        beiboots=args.beiboots,
+        shelves=args.shelves,
+        ready_delay=args.ready_delay,
+        concurrency=args.concurrency,
+        trace_memory=args.tracemalloc,
+        record=args.record,
+    )
+    print(result.report())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result.to_dict(), f, indent=2)
+    return 1 if result.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
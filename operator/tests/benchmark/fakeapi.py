@@ -0,0 +1,819 @@
+import argparse
+import asyncio
+import base64
+import copy
+import json
+import socket
+import subprocess
+import sys
+import urllib.request
+import uuid
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import yaml  # type: ignore
+from aiohttp import web
+
+# requests with this header are issued by the benchmark driver, they are not counted as requests of the operator
+DRIVER_HEADER = "X-Beiboot-Benchmark"
+# the external IP of the only node of the fake cluster
+NODE_IP = "203.0.113.10"
+# the first node port that is assigned to NodePort services
+NODE_PORT_BASE = 30000
+
+
+def now() -> str:
+    return datetime.utcnow().isoformat(timespec="seconds") + "Z"
+
+
+def merge_patch(target: dict, patch: dict) -> dict:
+    """
+    It applies a JSON merge patch (RFC 7386) to an object, a None value removes the key
+
+    :param target: The object
+    :type target: dict
+    :param patch: The patch
+    :type patch: dict
+    :return: The patched object
+    """
+    result = dict(target)
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        elif isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = merge_patch(result[key], value)
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
+def apply_schema_defaults(schema: dict, value) -> None:
+    """
+    It sets the defaults of an OpenAPI schema (as in the CRDs) on the missing properties of a value, recursively
+    """
+    if isinstance(value, dict):
+        for key, prop in (schema.get("properties") or {}).items():
+            if key not in value:
+                if "default" in prop:
+                    value[key] = copy.deepcopy(prop["default"])
+            else:
+                apply_schema_defaults(prop, value[key])
+    elif isinstance(value, list) and schema.get("items"):
+        for item in value:
+            apply_schema_defaults(schema["items"], item)
+
+
+def parse_label_selector(selector: str) -> List[Tuple[str, Optional[str]]]:
+    requirements: List[Tuple[str, Optional[str]]] = []
+    for requirement in filter(None, (s.strip() for s in selector.split(","))):
+        if "=" in requirement:
+            key, value = requirement.split("=", 1)
+            requirements.append((key.rstrip("="), value))
+        else:
+            requirements.append((requirement, None))
+    return requirements
+
+
+def _label_value(value) -> str:
+    # the operator writes some label values as JSON booleans
+    return json.dumps(value) if isinstance(value, bool) else str(value)
+
+
+def matches_labels(obj: dict, requirements: List[Tuple[str, Optional[str]]]) -> bool:
+    labels = obj.get("metadata", {}).get("labels") or {}
+    for key, value in requirements:
+        if key not in labels or (
+            value is not None and _label_value(labels[key]) != value
+        ):
+            return False
+    return True
+
+
+def matches_fields(obj: dict, requirements: List[Tuple[str, Optional[str]]]) -> bool:
+    # only the fields that every kind supports: metadata.name and metadata.namespace
+    for key, value in requirements:
+        if obj.get("metadata", {}).get(key.split(".", 1)[-1]) != value:
+            return False
+    return True
+
+
+@dataclass(frozen=True)
+class ResourcePath:
+    """
+    A parsed API path, e.g. /apis/apps/v1/namespaces/default/statefulsets/server/scale
+    """
+
+    api: str
+    resource: str
+    namespace: Optional[str] = None
+    name: Optional[str] = None
+    subresource: Optional[str] = None
+
+    @classmethod
+    def parse(cls, path: str) -> Optional["ResourcePath"]:
+        parts = [part for part in path.split("/") if part]
+        if len(parts) >= 2 and parts[0] == "api":
+            api, rest = parts[1], parts[2:]
+        elif len(parts) >= 3 and parts[0] == "apis":
+            api, rest = f"{parts[1]}/{parts[2]}", parts[3:]
+        else:
+            return None
+        if len(rest) >= 3 and rest[0] == "namespaces":
+            # a namespaced resource
+            return cls(api, rest[2], rest[1], *rest[3:5])
+        if 1 <= len(rest) <= 3:
+            # a cluster-scoped resource (or a namespaced resource in all namespaces)
+            return cls(api, rest[0], None, *rest[1:3])
+        return None
+
+    @property
+    def kind(self) -> Tuple[str, str]:
+        return self.api, self.resource
+
+
+@dataclass
+class Watcher:
+    kind: Tuple[str, str]
+    namespace: Optional[str]
+    selector: List[Tuple[str, Optional[str]]]
+    fields: List[Tuple[str, Optional[str]]] = field(default_factory=list)
+    queue: asyncio.Queue = field(default_factory=asyncio.Queue)
+
+    def wants(self, kind: Tuple[str, str], obj: dict) -> bool:
+        if kind != self.kind:
+            return False
+        if self.namespace and obj["metadata"].get("namespace") != self.namespace:
+            return False
+        return matches_labels(obj, self.selector) and matches_fields(obj, self.fields)
+
+
+class ApiError(Exception):
+    def __init__(self, code: int, reason: str, message: str):
+        super().__init__(message)
+        self.code = code
+        self.reason = reason
+        self.message = message
+
+    def status(self) -> dict:
+        return {
+            "kind": "Status",
+            "apiVersion": "v1",
+            "metadata": {},
+            "status": "Failure",
+            "message": self.message,
+            "reason": self.reason,
+            "code": self.code,
+        }
+
+
+class Store:
+    """
+    The in-memory object store of the fake API server. Objects are kept as dicts per (apiVersion, resource) and
+    namespace/name. A minimal set of controllers is emulated right away when an object is written: workloads become
+    ready (optionally after a delay), NodePort services get their node ports, service account tokens are issued and
+    VolumeSnapshots become ready to use.
+    """
+
+    def __init__(self, ready_delay: float = 0.0):
+        self.ready_delay = ready_delay
+        self.objects: Dict[Tuple[str, str], Dict[Tuple[str, str], dict]] = defaultdict(
+            dict
+        )
+        self.watchers: List[Watcher] = []
+        self._resource_version = 0
+        self._node_port = NODE_PORT_BASE
+
+    def _next_resource_version(self) -> str:
+        self._resource_version += 1
+        return str(self._resource_version)
+
+    @property
+    def resource_version(self) -> str:
+        return str(self._resource_version)
+
+    def _notify(self, event_type: str, kind: Tuple[str, str], obj: dict) -> None:
+        watchers = [watcher for watcher in self.watchers if watcher.wants(kind, obj)]
+        if not watchers:
+            return
+        line = (json.dumps({"type": event_type, "object": obj}) + "\n").encode()
+        for watcher in watchers:
+            watcher.queue.put_nowait(line)
+
+    def get(self, kind: Tuple[str, str], namespace: Optional[str], name: str) -> dict:
+        try:
+            return self.objects[kind][(namespace or "", name)]
+        except KeyError:
+            raise ApiError(404, "NotFound", f'{kind[1]} "{name}" not found')
+
+    def list(
+        self, kind: Tuple[str, str], namespace: Optional[str], selector: str = ""
+    ) -> List[dict]:
+        requirements = parse_label_selector(selector)
+        return [
+            obj
+            for (ns, _), obj in self.objects[kind].items()
+            if (not namespace or ns == namespace) and matches_labels(obj, requirements)
+        ]
+
+    def create(
+        self, kind: Tuple[str, str], namespace: Optional[str], body: dict
+    ) -> dict:
+        metadata = body.setdefault("metadata", {})
+        name = metadata.get("name")
+        if not name and metadata.get("generateName"):
+            name = metadata["generateName"] + uuid.uuid4().hex[:5]
+            metadata["name"] = name
+        if not name:
+            raise ApiError(422, "Invalid", "metadata.name is required")
+        if (namespace or "", name) in self.objects[kind]:
+            raise ApiError(409, "AlreadyExists", f'{kind[1]} "{name}" already exists')
+        if namespace:
+            if ("", namespace) not in self.objects[("v1", "namespaces")]:
+                raise ApiError(404, "NotFound", f'namespaces "{namespace}" not found')
+            metadata["namespace"] = namespace
+        metadata.update(
+            uid=str(uuid.uuid4()),
+            creationTimestamp=now(),
+            generation=1,
+            resourceVersion=self._next_resource_version(),
+        )
+        self._apply_defaults(kind, body)
+        self.objects[kind][(namespace or "", name)] = body
+        self._control(kind, body, created=True)
+        self._notify("ADDED", kind, body)
+        return body
+
+    def update(
+        self, kind: Tuple[str, str], namespace: Optional[str], name: str, body: dict
+    ) -> dict:
+        current = self.get(kind, namespace, name)
+        metadata = body.setdefault("metadata", {})
+        for key in ["uid", "creationTimestamp", "generation", "namespace", "name"]:
+            if key in current["metadata"]:
+                metadata[key] = current["metadata"][key]
+        if body.get("spec") != current.get("spec"):
+            metadata["generation"] = current["metadata"].get("generation", 1) + 1
+        metadata["resourceVersion"] = self._next_resource_version()
+        self._apply_defaults(kind, body)
+        self.objects[kind][(namespace or "", name)] = body
+        self._control(kind, body)
+        self._notify("MODIFIED", kind, body)
+        return body
+
+    def patch(
+        self,
+        kind: Tuple[str, str],
+        namespace: Optional[str],
+        name: str,
+        patch: dict,
+        apply: bool = False,
+    ) -> dict:
+        try:
+            current = self.get(kind, namespace, name)
+        except ApiError as e:
+            if not apply:
+                raise e
+            # server-side apply creates missing objects
+            return self.create(kind, namespace, copy.deepcopy(patch))
+        patched = merge_patch(current, patch)
+        return self.update(kind, namespace, name, patched)
+
+    def delete(
+        self, kind: Tuple[str, str], namespace: Optional[str], name: str
+    ) -> dict:
+        obj = self.get(kind, namespace, name)
+        del self.objects[kind][(namespace or "", name)]
+        self._notify("DELETED", kind, obj)
+        if kind == ("v1", "namespaces"):
+            # the namespace and all of its objects are removed at once
+            for other_kind, objects in self.objects.items():
+                for key in [key for key in objects if key[0] == name]:
+                    self._notify("DELETED", other_kind, objects.pop(key))
+        else:
+            # the Pods of a workload are removed with it
+            uid = obj["metadata"]["uid"]
+            pods = self.objects[("v1", "pods")]
+            for key, pod in list(pods.items()):
+                owners = pod["metadata"].get("ownerReferences") or []
+                if any(owner.get("uid") == uid for owner in owners):
+                    self._notify("DELETED", ("v1", "pods"), pods.pop(key))
+        return obj
+
+    def _apply_defaults(self, kind: Tuple[str, str], body: dict) -> None:
+        """
+        It sets the defaults from the schema of the CRD of custom objects, like the API server does on every write
+        """
+        group = kind[0].split("/")[0]
+        crd = self.objects[
+            ("apiextensions.k8s.io/v1", "customresourcedefinitions")
+        ].get(("", f"{kind[1]}.{group}"))
+        if crd is None:
+            return
+        for version in crd["spec"].get("versions", []):
+            apply_schema_defaults(
+                (version.get("schema") or {}).get("openAPIV3Schema") or {}, body
+            )
+
+    def _control(self, kind: Tuple[str, str], obj: dict, created: bool = False) -> None:
+        resource = kind[1]
+        if resource in ["statefulsets", "deployments"]:
+            self._control_workload(kind, obj, created)
+        elif resource == "services":
+            self._control_service(obj)
+        elif resource == "secrets":
+            self._control_secret(obj)
+        elif resource == "namespaces":
+            obj["status"] = {"phase": "Active"}
+        elif resource == "volumesnapshots" and created:
+            self._control_volume_snapshot(obj)
+
+    def _control_workload(self, kind: Tuple[str, str], obj: dict, created: bool):
+        replicas = obj.get("spec", {}).get("replicas", 1)
+        if created:
+            self._create_pods(kind, obj, replicas)
+        if self.ready_delay and created:
+            obj["status"] = {"replicas": 0, "observedGeneration": 1}
+            asyncio.get_running_loop().call_later(
+                self.ready_delay,
+                self._workload_ready,
+                kind,
+                obj["metadata"].get("namespace"),
+                obj["metadata"]["name"],
+            )
+        else:
+            obj["status"] = self._ready_status(obj, replicas)
+
+    @staticmethod
+    def _ready_status(obj: dict, replicas: int) -> dict:
+        return {
+            "replicas": replicas,
+            "readyReplicas": replicas,
+            "updatedReplicas": replicas,
+            "availableReplicas": replicas,
+            "currentReplicas": replicas,
+            "observedGeneration": obj["metadata"]["generation"],
+        }
+
+    def _workload_ready(self, kind: Tuple[str, str], namespace: str, name: str):
+        try:
+            obj = self.get(kind, namespace, name)
+        except ApiError:
+            return
+        obj["status"] = self._ready_status(obj, obj.get("spec", {}).get("replicas", 1))
+        obj["metadata"]["resourceVersion"] = self._next_resource_version()
+        self._notify("MODIFIED", kind, obj)
+
+    def _create_pods(self, kind: Tuple[str, str], owner: dict, replicas: int):
+        namespace = owner["metadata"]["namespace"]
+        template = copy.deepcopy(owner.get("spec", {}).get("template") or {})
+        for index in range(replicas):
+            if kind[1] == "statefulsets":
+                name = f"{owner['metadata']['name']}-{index}"
+            else:
+                name = f"{owner['metadata']['name']}-{uuid.uuid4().hex[:10]}"
+            spec = copy.deepcopy(template.get("spec") or {"containers": []})
+            for claim in owner["spec"].get("volumeClaimTemplates") or []:
+                claim_name = f"{claim['metadata']['name']}-{name}"
+                spec.setdefault("volumes", []).append(
+                    {
+                        "name": claim["metadata"]["name"],
+                        "persistentVolumeClaim": {"claimName": claim_name},
+                    }
+                )
+                if (namespace, claim_name) not in self.objects[
+                    ("v1", "persistentvolumeclaims")
+                ]:
+                    self.create(
+                        ("v1", "persistentvolumeclaims"),
+                        namespace,
+                        {
+                            "metadata": {"name": claim_name},
+                            "spec": copy.deepcopy(claim.get("spec") or {}),
+                            "status": {"phase": "Bound"},
+                        },
+                    )
+            pod = {
+                "apiVersion": "v1",
+                "kind": "Pod",
+                "metadata": {
+                    "name": name,
+                    "labels": dict(template.get("metadata", {}).get("labels") or {}),
+                    "ownerReferences": [
+                        {
+                            "apiVersion": kind[0],
+                            "kind": "StatefulSet"
+                            if kind[1] == "statefulsets"
+                            else "ReplicaSet",
+                            "name": owner["metadata"]["name"],
+                            "uid": owner["metadata"]["uid"],
+                        }
+                    ],
+                },
+                "spec": spec,
+                "status": {"phase": "Running", "podIP": "10.244.0.10"},
+            }
+            self.create(("v1", "pods"), namespace, pod)
+
+    def _control_service(self, obj: dict) -> None:
+        spec = obj.setdefault("spec", {})
+        spec.setdefault("clusterIP", "10.96.0.10")
+        if spec.get("type") in ["NodePort", "LoadBalancer"]:
+            for port in spec.get("ports") or []:
+                if not port.get("nodePort"):
+                    self._node_port += 1
+                    port["nodePort"] = self._node_port
+
+    @staticmethod
+    def _control_secret(obj: dict) -> None:
+        if string_data := obj.pop("stringData", None):
+            data = obj.setdefault("data", {})
+            for key, value in string_data.items():
+                data[key] = base64.b64encode(value.encode()).decode()
+        if obj.get("type") == "kubernetes.io/service-account-token" and not obj.get(
+            "data"
+        ):
+            # the token controller issues the token right away
+            obj["data"] = {
+                key: base64.b64encode(value.encode()).decode()
+                for key, value in {
+                    "token": f"token-{obj['metadata']['uid']}",
+                    "ca.crt": "fake-ca",
+                    "namespace": obj["metadata"]["namespace"],
+                }.items()
+            }
+
+    def _control_volume_snapshot(self, obj: dict) -> None:
+        source = obj.get("spec", {}).get("source") or {}
+        content_name = source.get("volumeSnapshotContentName")
+        if not content_name:
+            # a dynamically provisioned snapshot of a PVC
+            content_name = f"snapcontent-{obj['metadata']['uid']}"
+            self.create(
+                ("snapshot.storage.k8s.io/v1", "volumesnapshotcontents"),
+                None,
+                {
+                    "apiVersion": "snapshot.storage.k8s.io/v1",
+                    "kind": "VolumeSnapshotContent",
+                    "metadata": {"name": content_name},
+                    "spec": {
+                        "deletionPolicy": "Retain",
+                        "driver": "fake.csi.getdeck.dev",
+                        "volumeSnapshotRef": {
+                            "name": obj["metadata"]["name"],
+                            "namespace": obj["metadata"]["namespace"],
+                        },
+                    },
+                    "status": {
+                        "readyToUse": True,
+                        "snapshotHandle": f"fake/{obj['metadata']['uid']}",
+                    },
+                },
+            )
+        obj["status"] = {
+            "boundVolumeSnapshotContentName": content_name,
+            "readyToUse": True,
+        }
+
+    def seed(self) -> None:
+        """
+        It creates the objects of an empty cluster: the default and getdeck namespaces and one node
+        """
+        for namespace in ["default", "kube-system", "getdeck"]:
+            self.create(("v1", "namespaces"), None, {"metadata": {"name": namespace}})
+        self.create(
+            ("v1", "nodes"),
+            None,
+            {
+                "metadata": {"name": "fake-node"},
+                "status": {
+                    "addresses": [
+                        {"type": "InternalIP", "address": "10.0.0.10"},
+                        {"type": "ExternalIP", "address": NODE_IP},
+                    ],
+                    "conditions": [{"type": "Ready", "status": "True"}],
+                },
+            },
+        )
+
+
+def _request_labels(method: str, path: ResourcePath, watch: bool, apply: bool):
+    if path.subresource == "exec":
+        return "exec", "pods"
+    if method == "GET":
+        verb = "watch" if watch else ("get" if path.name else "list")
+    else:
+        verb = {
+            "POST": "create",
+            "PUT": "update",
+            "PATCH": "apply" if apply else "patch",
+            "DELETE": "delete",
+        }.get(method, method.lower())
+    resource = path.resource
+    if path.subresource:
+        resource = f"{resource}/{path.subresource}"
+    return verb, resource
+
+
+class FakeApiServer:
+    """
+    A stand-in for the Kubernetes API server that serves all (core, apps, events, custom and CRD) resources from an
+    in-memory `Store`, including watch streams and a stub for the exec into Pods. It counts the requests by verb and
+    resource, the counters are served at /benchmark/stats (and reset with a POST to /benchmark/reset).
+    """
+
+    def __init__(
+        self,
+        ready_delay: float = 0.0,
+        exec_handler: Optional[Callable[[str, str, List[str]], str]] = None,
+    ):
+        self.store = Store(ready_delay)
+        self.exec_handler = exec_handler or (lambda namespace, pod, command: "")
+        self.requests: Counter = Counter()
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024**2)
+        app.router.add_get("/benchmark/stats", self._stats)
+        app.router.add_post("/benchmark/reset", self._reset)
+        app.router.add_route("*", "/{tail:.*}", self._handle)
+        return app
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "requests": {
+                    f"{verb} {resource}": count
+                    for (verb, resource), count in self.requests.items()
+                },
+                "objects": sum(len(objects) for objects in self.store.objects.values()),
+            }
+        )
+
+    async def _reset(self, request: web.Request) -> web.Response:
+        self.requests.clear()
+        return web.json_response({})
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        path = ResourcePath.parse(request.path)
+        if path is None:
+            return web.json_response(
+                ApiError(
+                    404, "NotFound", "the server could not find the resource"
+                ).status(),
+                status=404,
+            )
+        watch = request.query.get("watch") in ["true", "1"]
+        content_type = request.headers.get("Content-Type", "")
+        apply = "apply-patch" in content_type
+        if DRIVER_HEADER not in request.headers:
+            self.requests[_request_labels(request.method, path, watch, apply)] += 1
+        try:
+            if path.subresource == "exec":
+                return await self._exec(request, path)
+            if watch:
+                return await self._watch(request, path)
+            return web.json_response(await self._serve(request, path, apply))
+        except ApiError as e:
+            return web.json_response(e.status(), status=e.code)
+
+    async def _read_body(self, request: web.Request):
+        raw = await request.read()
+        if not raw:
+            return {}
+        try:
+            return json.loads(raw)
+        except ValueError:
+            # server-side apply bodies may be YAML
+            return yaml.safe_load(raw)
+
+    async def _serve(self, request: web.Request, path: ResourcePath, apply: bool):
+        store = self.store
+        if path.subresource and path.subresource not in ["status", "scale"]:
+            raise ApiError(404, "NotFound", f"{path.subresource} is not supported")
+        if request.method == "GET":
+            if path.name:
+                obj = store.get(path.kind, path.namespace, path.name)
+                if path.subresource == "scale":
+                    return self._scale(obj)
+                return obj
+            return {
+                "apiVersion": path.api,
+                "kind": "List",
+                "metadata": {"resourceVersion": store.resource_version},
+                "items": [
+                    obj
+                    for obj in store.list(
+                        path.kind,
+                        path.namespace,
+                        request.query.get("labelSelector", ""),
+                    )
+                    if matches_fields(
+                        obj,
+                        parse_label_selector(request.query.get("fieldSelector", "")),
+                    )
+                ],
+            }
+        body = await self._read_body(request)
+        if request.method == "POST" and not path.name:
+            return store.create(path.kind, path.namespace, body)
+        if not path.name:
+            raise ApiError(405, "MethodNotAllowed", "collections cannot be modified")
+        if path.subresource == "scale":
+            # the scale subresource only changes the replicas of the workload
+            body = {"spec": {"replicas": body.get("spec", {}).get("replicas")}}
+        if request.method == "PUT":
+            return store.update(path.kind, path.namespace, path.name, body)
+        if request.method == "PATCH":
+            if isinstance(body, list):
+                raise ApiError(
+                    415, "UnsupportedMediaType", "JSON patches are not supported"
+                )
+            return store.patch(path.kind, path.namespace, path.name, body, apply=apply)
+        if request.method == "DELETE":
+            obj = store.delete(path.kind, path.namespace, path.name)
+            return {
+                "kind": "Status",
+                "apiVersion": "v1",
+                "metadata": {},
+                "status": "Success",
+                "details": {
+                    "name": path.name,
+                    "kind": path.resource,
+                    "uid": obj["metadata"]["uid"],
+                },
+            }
+        raise ApiError(405, "MethodNotAllowed", f"{request.method} is not supported")
+
+    @staticmethod
+    def _scale(obj: dict) -> dict:
+        replicas = obj.get("spec", {}).get("replicas", 1)
+        return {
+            "apiVersion": "autoscaling/v1",
+            "kind": "Scale",
+            "metadata": {
+                "name": obj["metadata"]["name"],
+                "namespace": obj["metadata"].get("namespace"),
+            },
+            "spec": {"replicas": replicas},
+            "status": {"replicas": obj.get("status", {}).get("replicas", 0)},
+        }
+
+    async def _watch(self, request: web.Request, path: ResourcePath):
+        watcher = Watcher(
+            path.kind,
+            path.namespace,
+            parse_label_selector(request.query.get("labelSelector", "")),
+            # field selectors have the same syntax
+            parse_label_selector(request.query.get("fieldSelector", "")),
+        )
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        if not request.query.get("resourceVersion"):
+            # the watch starts with the current state of all objects
+            for obj in self.store.list(path.kind, path.namespace):
+                if watcher.wants(path.kind, obj):
+                    await response.write(
+                        (json.dumps({"type": "ADDED", "object": obj}) + "\n").encode()
+                    )
+        self.store.watchers.append(watcher)
+        timeout = float(request.query.get("timeoutSeconds", 0)) or None
+        try:
+            while True:
+                line = await asyncio.wait_for(watcher.queue.get(), timeout=timeout)
+                await response.write(line)
+        except (asyncio.TimeoutError, ConnectionResetError):
+            pass
+        finally:
+            self.store.watchers.remove(watcher)
+        return response
+
+    async def _exec(self, request: web.Request, path: ResourcePath):
+        self.store.get(("v1", "pods"), path.namespace, path.name)  # type: ignore
+        command = request.query.getall("command", [])
+        ws = web.WebSocketResponse(protocols=("v4.channel.k8s.io",))
+        await ws.prepare(request)
+        output = self.exec_handler(path.namespace, path.name, command)  # type: ignore
+        if output:
+            await ws.send_bytes(b"\x01" + output.encode("utf-8"))
+        await ws.send_bytes(
+            b"\x03" + json.dumps({"metadata": {}, "status": "Success"}).encode()
+        )
+        await ws.close()
+        return ws
+
+
+async def serve(
+    port: int = 0, ready_delay: float = 0.0, announce=print, watch_stdin: bool = False
+) -> None:
+    """
+    It runs the fake API server on localhost until it is cancelled (or stdin is closed)
+
+    :param port: The port, 0 picks a free one
+    :type port: int
+    :param ready_delay: The seconds until a new workload becomes ready
+    :type ready_delay: float
+    :param announce: It is called with the port once the server is listening
+    :param watch_stdin: Stop once stdin is closed, i.e. when the parent process is gone
+    :type watch_stdin: bool
+    """
+    server = FakeApiServer(ready_delay=ready_delay)
+    server.store.seed()
+    runner = web.AppRunner(server.app(), access_log=None)
+    await runner.setup()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", port))
+    site = web.SockSite(runner, sock)
+    await site.start()
+    announce(sock.getsockname()[1])
+    stopped = asyncio.Event()
+    if watch_stdin:
+        asyncio.get_running_loop().add_reader(sys.stdin.fileno(), stopped.set)
+    try:
+        await stopped.wait()
+    finally:
+        await runner.cleanup()
+
+
+class FakeApiProcess:
+    """
+    It runs the fake API server in a separate process, hence it does not compete with the operator for the GIL and
+    does not count towards the memory of the operator
+
+        with FakeApiProcess(ready_delay=0.2) as api:
+            kubernetes_configuration.host = api.url
+    """
+
+    def __init__(self, ready_delay: float = 0.0):
+        self.ready_delay = ready_delay
+        self.url = ""
+        self._process: Optional[subprocess.Popen] = None
+
+    def start(self) -> "FakeApiProcess":
+        self._process = subprocess.Popen(
+            [
+                sys.executable,
+                __file__,
+                "--ready-delay",
+                str(self.ready_delay),
+                "--watch-stdin",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        port = self._process.stdout.readline().strip()  # type: ignore
+        if not port.isdigit():
+            self.stop()
+            raise RuntimeError("The fake API server did not start")
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    def stop(self) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait(timeout=10)
+            self._process = None
+
+    def _call(self, method: str, path: str) -> dict:
+        request = urllib.request.Request(
+            self.url + path, method=method, headers={DRIVER_HEADER: "true"}
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return json.loads(response.read())
+
+    def stats(self) -> dict:
+        return self._call("GET", "/benchmark/stats")
+
+    def reset(self) -> None:
+        self._call("POST", "/benchmark/reset")
+
+    def __enter__(self) -> "FakeApiProcess":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="A fake Kubernetes API server")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--ready-delay", type=float, default=0.0)
+    parser.add_argument("--watch-stdin", action="store_true")
+    args = parser.parse_args()
+    try:
+        asyncio.run(
+            serve(
+                args.port,
+                args.ready_delay,
+                announce=lambda port: print(port, flush=True),
+                watch_stdin=args.watch_stdin,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
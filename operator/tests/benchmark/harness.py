@@ -0,0 +1,524 @@
+import asyncio
+import json
+import logging
+import math
+import resource
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+import kopf
+
+from tests.benchmark.fakeapi import DRIVER_HEADER, FakeApiProcess
+
+logger = logging.getLogger("beiboot.benchmark")
+
+NAMESPACE = "getdeck"
+BEIBOOTS_PATH = f"/apis/getdeck.dev/v1/namespaces/{NAMESPACE}/beiboots"
+SHELVES_PATH = f"/apis/beiboots.getdeck.dev/v1/namespaces/{NAMESPACE}/shelves"
+# kopf retries a handler after the delay of its TemporaryError, the benchmark waits at most this long
+MAX_RETRY_DELAY = 2.0
+# the maximum seconds for the lifecycle of one Beiboot
+LIFECYCLE_TIMEOUT = 300.0
+
+
+def beiboot_body(name: str) -> dict:
+    return {
+        "apiVersion": "getdeck.dev/v1",
+        "kind": "beiboot",
+        "metadata": {"name": name, "namespace": NAMESPACE},
+        "provider": "k3s",
+        "parameters": {"ports": ["8080:80"], "nodes": 1},
+    }
+
+
+def shelf_body(name: str, cluster_name: str) -> dict:
+    return {
+        "apiVersion": "beiboots.getdeck.dev/v1",
+        "kind": "shelf",
+        "metadata": {"name": name, "namespace": NAMESPACE},
+        "clusterName": cluster_name,
+        "volumeSnapshotClass": "fake-snapclass",
+    }
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    It returns the q-th percentile (nearest rank) of the values, or 0 if there are none
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def _max_rss() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # in bytes on macOS, in kilobytes elsewhere
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+@dataclass
+class BenchmarkResult:
+    beiboots: int
+    shelves: int
+    duration: float = 0.0
+    ready_times: List[float] = field(default_factory=list)
+    shelf_ready_times: List[float] = field(default_factory=list)
+    failures: List[str] = field(default_factory=list)
+    # the requests of the operator during the lifecycles, by "<verb> <resource>"
+    api_requests: Dict[str, int] = field(default_factory=dict)
+    peak_rss: int = 0
+    rss_growth: int = 0
+    heap_peak: Optional[int] = None
+    max_loop_lag: float = 0.0
+
+    @property
+    def completed(self) -> int:
+        return self.beiboots - len(self.failures)
+
+    @property
+    def throughput(self) -> float:
+        """
+        The completed Beiboot lifecycles per second
+        """
+        return self.completed / self.duration if self.duration else 0.0
+
+    @property
+    def api_calls(self) -> int:
+        return sum(self.api_requests.values())
+
+    @property
+    def api_calls_per_beiboot(self) -> float:
+        return self.api_calls / self.beiboots if self.beiboots else 0.0
+
+    @staticmethod
+    def _percentiles(values: List[float]) -> Dict[str, float]:
+        return {
+            "p50": percentile(values, 50),
+            "p90": percentile(values, 90),
+            "p99": percentile(values, 99),
+            "max": max(values, default=0.0),
+        }
+
+    @property
+    def time_to_ready(self) -> Dict[str, float]:
+        return self._percentiles(self.ready_times)
+
+    @property
+    def shelf_time_to_ready(self) -> Dict[str, float]:
+        return self._percentiles(self.shelf_ready_times)
+
+    def to_dict(self) -> dict:
+        result = asdict(self)
+        result.update(
+            throughput=self.throughput,
+            api_calls=self.api_calls,
+            api_calls_per_beiboot=self.api_calls_per_beiboot,
+            time_to_ready=self.time_to_ready,
+            shelf_time_to_ready=self.shelf_time_to_ready,
+        )
+        return result
+
+    def report(self) -> str:
+        def _line(label: str, value: str) -> str:
+            return f"{label:<24}{value}"
+
+        def _percentile_line(values: Dict[str, float]) -> str:
+            return " | ".join(f"{key} {value:.2f}s" for key, value in values.items())
+
+        mib = 1024**2
+        memory = (
+            f"peak RSS {self.peak_rss / mib:.1f} MiB (+{self.rss_growth / mib:.1f} MiB)"
+        )
+        if self.heap_peak is not None:
+            memory += f", Python heap peak {self.heap_peak / mib:.1f} MiB"
+        lines = [
+            _line(
+                "Beiboots:",
+                f"{self.beiboots} (with shelf: {self.shelves}, failed: {len(self.failures)})",
+            ),
+            _line("Duration:", f"{self.duration:.2f}s"),
+            _line("Throughput:", f"{self.throughput:.2f} Beiboots/s"),
+            _line("Time to READY:", _percentile_line(self.time_to_ready)),
+        ]
+        if self.shelves:
+            lines.append(
+                _line(
+                    "Shelf time to READY:", _percentile_line(self.shelf_time_to_ready)
+                )
+            )
+        lines += [
+            _line(
+                "API calls per Beiboot:",
+                f"{self.api_calls_per_beiboot:.1f} ({self.api_calls} in total)",
+            ),
+        ]
+        for request, count in sorted(
+            self.api_requests.items(), key=lambda item: (-item[1], item[0])
+        ):
+            lines.append(_line("", f"{count / self.beiboots:6.2f}  {request}"))
+        lines += [
+            _line("Memory:", memory),
+            _line("Event loop lag:", f"max {self.max_loop_lag:.3f}s"),
+        ]
+        for failure in self.failures:
+            lines.append(_line("Failed:", failure))
+        return "\n".join(lines)
+
+
+class Benchmark:
+    """
+    It drives Beiboots (and Shelves) through their lifecycles with the handlers of the operator, the way kopf would:
+    the create handler is retried after temporary errors until the Beiboot is READY, then the delete handler runs. The
+    watch streams of the operator (e.g. for the Beiboot index and the workload wakeups) are fed from the fake API
+    server, the clusters are provided by `StubCluster`.
+    """
+
+    def __init__(
+        self,
+        api: FakeApiProcess,
+        beiboots: int,
+        shelves: int = 0,
+        concurrency: int = 0,
+        trace_memory: bool = False,
+        record: str = "",
+    ):
+        self.api = api
+        self.result = BenchmarkResult(beiboots=beiboots, shelves=min(shelves, beiboots))
+        self.concurrency = concurrency or beiboots
+        self.trace_memory = trace_memory
+        self.record = record
+        self._ready_at: Dict[str, float] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def _request(self, method: str, path: str, body: Optional[dict] = None):
+        async with self._session.request(  # type: ignore
+            method, self.api.url + path, json=body, headers={DRIVER_HEADER: "true"}
+        ) as response:
+            data = await response.json()
+            if response.status == 404:
+                return None
+            if response.status >= 400:
+                raise RuntimeError(f"{method} {path}: {data.get('message')}")
+            return data
+
+    async def _watch(
+        self,
+        path: str,
+        dispatch: Callable[[dict], Awaitable],
+        started: asyncio.Event,
+        label_selector: str = "",
+        field_selector: str = "",
+    ) -> None:
+        params = {"watch": "true"}
+        if label_selector:
+            params["labelSelector"] = label_selector
+        if field_selector:
+            params["fieldSelector"] = field_selector
+        async with self._session.get(  # type: ignore
+            self.api.url + path,
+            params=params,
+            headers={DRIVER_HEADER: "true"},
+            timeout=aiohttp.ClientTimeout(total=None),
+        ) as response:
+            started.set()
+            async for line in response.content:
+                event = json.loads(line)
+                try:
+                    await dispatch(event)
+                except Exception as e:  # noqa
+                    logger.error(f"Watch handler for {path} failed: {e}")
+
+    async def _start_watches(self) -> None:
+        from beiboot.comps.client_timeout import CONFIGMAP_NAME
+        from beiboot.comps.ghostunnel import GHOSTUNNEL_LABELS
+        from beiboot.handler.beiboots import index_beiboot, index_client_heartbeats
+        from beiboot.handler.clusters import (
+            handle_tunnel_pod_events,
+            handle_tunnel_service_events,
+            handle_workload_status,
+            index_node,
+        )
+        from beiboot.signals import WORKLOAD_LABELS
+        from beiboot.utils import get_label_selector
+
+        def _meta(event: dict) -> dict:
+            return event["object"]["metadata"]
+
+        def _record_ready(event: dict) -> None:
+            if event["object"].get("state") == "READY":
+                self._ready_at.setdefault(
+                    f"{event['object']['kind']}/{_meta(event)['name']}",
+                    time.monotonic(),
+                )
+
+        async def _beiboot(event: dict) -> None:
+            _record_ready(event)
+            await index_beiboot(event=event, namespace=_meta(event)["namespace"])
+
+        async def _shelf(event: dict) -> None:
+            _record_ready(event)
+
+        async def _workload(event: dict) -> None:
+            await handle_workload_status(namespace=_meta(event)["namespace"])
+
+        async def _tunnel_service(event: dict) -> None:
+            await handle_tunnel_service_events(
+                event=event,
+                name=_meta(event)["name"],
+                namespace=_meta(event)["namespace"],
+            )
+
+        async def _tunnel_pod(event: dict) -> None:
+            await handle_tunnel_pod_events(
+                event=event, namespace=_meta(event)["namespace"]
+            )
+
+        async def _node(event: dict) -> None:
+            await index_node(event=event)
+
+        async def _configmap(event: dict) -> None:
+            await index_client_heartbeats(
+                event=event, namespace=_meta(event)["namespace"], logger=logger
+            )
+
+        watches = [
+            ("/apis/getdeck.dev/v1/beiboots", _beiboot, "", ""),
+            ("/apis/beiboots.getdeck.dev/v1/shelves", _shelf, "", ""),
+            (
+                "/apis/apps/v1/statefulsets",
+                _workload,
+                get_label_selector(WORKLOAD_LABELS),
+                "",
+            ),
+            (
+                "/apis/apps/v1/deployments",
+                _workload,
+                get_label_selector(WORKLOAD_LABELS),
+                "",
+            ),
+            (
+                "/api/v1/services",
+                _tunnel_service,
+                get_label_selector(GHOSTUNNEL_LABELS),
+                "",
+            ),
+            ("/api/v1/pods", _tunnel_pod, get_label_selector(GHOSTUNNEL_LABELS), ""),
+            ("/api/v1/nodes", _node, "", ""),
+            ("/api/v1/configmaps", _configmap, "", f"metadata.name={CONFIGMAP_NAME}"),
+        ]
+        events = []
+        for path, dispatch, label_selector, field_selector in watches:
+            started = asyncio.Event()
+            events.append(started)
+            self._tasks.append(
+                asyncio.create_task(
+                    self._watch(path, dispatch, started, label_selector, field_selector)
+                )
+            )
+        await asyncio.gather(*[started.wait() for started in events])
+
+    async def _startup(self) -> None:
+        from beiboot import metrics as bbt_metrics
+        from beiboot import recording as bbt_recording
+        from beiboot.handler.beiboots import prime_beiboot_index, start_key_pool
+        from beiboot.handler.clusters import prime_node_index
+        from beiboot.handler.components import check_beiboot_components
+        from beiboot.provider.factory import ProviderType, cluster_factory
+        from tests.benchmark.stub import StubBuilder
+
+        cluster_factory.register_builder(ProviderType.K3S, StubBuilder())
+        if bbt_recording.setup(self.record):
+            bbt_recording.instrument_kubernetes_client()
+        bbt_metrics.instrument_kubernetes_client()
+        await check_beiboot_components(logger=logger)
+        prime_beiboot_index(logger=logger)
+        prime_node_index(logger=logger)
+        await start_key_pool(logger=logger)
+        await self._start_watches()
+
+    async def _shutdown(self) -> None:
+        from beiboot import recording as bbt_recording
+        from beiboot.comps.pki import key_pool
+        from beiboot.events import event_publisher
+        from beiboot.handler.clusters import reconcile_debouncer
+
+        # the events are posted in the background, they are part of the lifecycles
+        await event_publisher.stop()
+        await reconcile_debouncer.cancel()
+        await key_pool.stop()
+        bbt_recording.shutdown()
+
+    async def _run_handler(
+        self,
+        handler: Callable,
+        path: str,
+        name: str,
+        done: Callable[[Optional[dict]], bool],
+    ) -> None:
+        """
+        It runs a kopf handler for an object until the object is done, the handler is retried after temporary errors
+        """
+        while True:
+            body = await self._request("GET", f"{path}/{name}")
+            if done(body):
+                return
+            try:
+                await handler(
+                    body=kopf.Body(body), logger=logger, name=name, namespace=NAMESPACE
+                )
+            except kopf.TemporaryError as e:
+                logger.debug(f"Retrying {handler.__name__} for {name}: {e}")
+                await asyncio.sleep(min(e.delay or 0, MAX_RETRY_DELAY))
+                continue
+            body = await self._request("GET", f"{path}/{name}")
+            if not done(body):
+                state = body.get("state") if body else "deleted"
+                raise RuntimeError(f"{handler.__name__} left {name} in state {state}")
+            return
+
+    async def _lifecycle(self, index: int, semaphore: asyncio.Semaphore) -> None:
+        from beiboot.handler.beiboots import beiboot_created, beiboot_deleted
+        from beiboot.handler.shelves import shelf_created, shelf_deleted
+
+        def _ready(body: Optional[dict]) -> bool:
+            return body is not None and body.get("state") == "READY"
+
+        name = f"bench-{index:04d}"
+        async with semaphore:
+            try:
+                created = time.monotonic()
+                await self._request("POST", BEIBOOTS_PATH, beiboot_body(name))
+                await self._run_handler(beiboot_created, BEIBOOTS_PATH, name, _ready)
+                self.result.ready_times.append(
+                    self._ready_at.get(f"beiboot/{name}", time.monotonic()) - created
+                )
+                if index < self.result.shelves:
+                    shelf_name = f"{name}-shelf"
+                    created = time.monotonic()
+                    await self._request(
+                        "POST", SHELVES_PATH, shelf_body(shelf_name, name)
+                    )
+                    await self._run_handler(
+                        shelf_created, SHELVES_PATH, shelf_name, _ready
+                    )
+                    self.result.shelf_ready_times.append(
+                        self._ready_at.get(f"shelf/{shelf_name}", time.monotonic())
+                        - created
+                    )
+                    await self._delete(shelf_deleted, SHELVES_PATH, shelf_name)
+                await self._delete(beiboot_deleted, BEIBOOTS_PATH, name)
+            except Exception as e:  # noqa
+                self.result.failures.append(f"{name}: {e!r}")
+
+    async def _delete(self, handler: Callable, path: str, name: str) -> None:
+        """
+        It runs the delete handler of an object and removes the object afterwards, like kopf removes its finalizer
+        """
+        while (body := await self._request("GET", f"{path}/{name}")) is not None:
+            try:
+                await handler(
+                    body=kopf.Body(body), logger=logger, name=name, namespace=NAMESPACE
+                )
+            except kopf.TemporaryError as e:
+                logger.debug(f"Retrying {handler.__name__} for {name}: {e}")
+                await asyncio.sleep(min(e.delay or 0, MAX_RETRY_DELAY))
+                continue
+            await self._request("DELETE", f"{path}/{name}")
+            return
+
+    async def _monitor_loop_lag(self, interval: float = 0.05) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            self.result.max_loop_lag = max(
+                self.result.max_loop_lag, time.monotonic() - start - interval
+            )
+
+    async def run(self) -> BenchmarkResult:
+        self._session = aiohttp.ClientSession()
+        try:
+            await self._startup()
+            self.api.reset()
+            rss = _max_rss()
+            if self.trace_memory:
+                tracemalloc.start()
+            monitor = asyncio.create_task(self._monitor_loop_lag())
+            semaphore = asyncio.Semaphore(self.concurrency)
+            start = time.monotonic()
+            await asyncio.gather(
+                *[
+                    asyncio.wait_for(
+                        self._lifecycle(index, semaphore), LIFECYCLE_TIMEOUT
+                    )
+                    for index in range(self.result.beiboots)
+                ],
+                return_exceptions=True,
+            )
+            self.result.duration = time.monotonic() - start
+            monitor.cancel()
+            await self._shutdown()
+            if self.trace_memory:
+                self.result.heap_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            self.result.peak_rss = _max_rss()
+            self.result.rss_growth = self.result.peak_rss - rss
+            self.result.api_requests = self.api.stats()["requests"]
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self._session.close()
+        return self.result
+
+
+def configure_kubernetes(url: str) -> None:
+    """
+    It points the kubernetes client to the given API server, this must happen before the operator is imported, as its
+    modules create their API instances on import
+    """
+    import kubernetes as k8s
+
+    if any(module.startswith("beiboot") for module in sys.modules):
+        raise RuntimeError("The operator has already been imported")
+    configuration = k8s.client.Configuration()
+    configuration.host = url
+    k8s.client.Configuration.set_default(configuration)
+
+
+def run_benchmark(
+    beiboots: int = 10,
+    shelves: int = 0,
+    ready_delay: float = 0.2,
+    concurrency: int = 0,
+    trace_memory: bool = False,
+    record: str = "",
+) -> BenchmarkResult:
+    """
+    It runs the lifecycles of the given number of Beiboots against a fake API server and returns the results
+
+    :param beiboots: The number of Beiboots
+    :type beiboots: int
+    :param shelves: The number of Beiboots that are shelved before they are deleted
+    :type shelves: int
+    :param ready_delay: The seconds until the workloads of a cluster become ready
+    :type ready_delay: float
+    :param concurrency: The maximum number of concurrent lifecycles, 0 runs all at once
+    :type concurrency: int
+    :param trace_memory: Trace the peak of the Python heap (slows down the operator)
+    :type trace_memory: bool
+    :param record: Record the API traffic of the operator to this trace file (see `tests.benchmark.replay`)
+    :type record: str
+    :return: The results
+    """
+    with FakeApiProcess(ready_delay=ready_delay) as api:
+        configure_kubernetes(api.url)
+        benchmark = Benchmark(
+            api, beiboots, shelves, concurrency, trace_memory, record=str(record)
+        )
+        return asyncio.run(benchmark.run())
@@ -0,0 +1,391 @@
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import logging
+import sys
+import time
+from collections import Counter, defaultdict, deque
+from dataclasses import asdict, dataclass, field
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+import kopf
+
+from tests.benchmark.harness import configure_kubernetes
+
+logger = logging.getLogger("beiboot.replay")
+
+# the operator is never connected to this host, all requests are served from the trace
+REPLAY_HOST = "http://127.0.0.1:9"
+# the handlers that are replayed, by name
+HANDLERS = {
+    "beiboot_created": "beiboot.handler.beiboots",
+    "beiboot_deleted": "beiboot.handler.beiboots",
+    "shelf_created": "beiboot.handler.shelves",
+    "shelf_deleted": "beiboot.handler.shelves",
+}
+
+
+class _Response:
+    """
+    The part of a urllib3 response that the kubernetes client uses
+    """
+
+    def __init__(self, status: int, data):
+        self.status = status
+        self.reason = "OK" if status < 400 else "Replayed"
+        if data is None:
+            self.data = b""
+        elif isinstance(data, str):
+            self.data = data.encode("utf-8")
+        else:
+            self.data = json.dumps(data).encode("utf-8")
+
+    def getheaders(self) -> dict:
+        return {"content-type": "application/json"}
+
+    def getheader(self, name: str, default=None):
+        return self.getheaders().get(name.lower(), default)
+
+
+def _not_found(path: str) -> dict:
+    return {
+        "kind": "Status",
+        "apiVersion": "v1",
+        "status": "Failure",
+        "reason": "NotFound",
+        "message": f"{path} is not part of the trace",
+        "code": 404,
+    }
+
+
+@dataclass
+class HandlerCall:
+    handler: str
+    name: str
+    recorded_result: str
+    recorded_duration: float
+    result: str = ""
+    duration: float = 0.0
+
+
+@dataclass
+class ReplayResult:
+    calls: List[HandlerCall] = field(default_factory=list)
+    duration: float = 0.0
+    # the requests of the operator that were served from the trace, and the ones missing in it, by "<verb> <resource>"
+    served: Dict[str, int] = field(default_factory=dict)
+    missed: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def mismatches(self) -> List[HandlerCall]:
+        """
+        The handler calls with another result than in the recording
+        """
+        return [call for call in self.calls if call.result != call.recorded_result]
+
+    @property
+    def recorded_duration(self) -> float:
+        return sum(call.recorded_duration for call in self.calls)
+
+    def to_dict(self) -> dict:
+        result = asdict(self)
+        result.update(
+            mismatches=len(self.mismatches), recorded_duration=self.recorded_duration
+        )
+        return result
+
+    def report(self) -> str:
+        def _line(label: str, value: str) -> str:
+            return f"{label:<24}{value}"
+
+        lines = [
+            _line(
+                "Handler calls:",
+                f"{len(self.calls)} (other result than recorded: {len(self.mismatches)})",
+            ),
+            _line(
+                "Duration:",
+                f"{self.duration:.2f}s (recorded: {self.recorded_duration:.2f}s)",
+            ),
+        ]
+        by_handler: Dict[str, List[HandlerCall]] = defaultdict(list)
+        for call in self.calls:
+            by_handler[call.handler].append(call)
+        for handler, calls in sorted(by_handler.items()):
+            lines.append(
+                _line(
+                    "",
+                    f"{len(calls):4d}  {handler}: {sum(c.duration for c in calls):.2f}s "
+                    f"(recorded: {sum(c.recorded_duration for c in calls):.2f}s)",
+                )
+            )
+        lines.append(_line("API calls served:", str(sum(self.served.values()))))
+        for request, count in sorted(self.served.items(), key=lambda i: (-i[1], i[0])):
+            lines.append(_line("", f"{count:6d}  {request}"))
+        if self.missed:
+            lines.append(_line("API calls missed:", str(sum(self.missed.values()))))
+            for request, count in sorted(
+                self.missed.items(), key=lambda i: (-i[1], i[0])
+            ):
+                lines.append(_line("", f"{count:6d}  {request}"))
+        for call in self.mismatches:
+            lines.append(
+                _line(
+                    "Other result:",
+                    f"{call.handler} {call.name}: {call.result} (recorded: {call.recorded_result})",
+                )
+            )
+        return "\n".join(lines)
+
+
+class Replayer:
+    """
+    It replays the handler calls of a trace (see `beiboot.recording`) and serves the Kubernetes API requests and Pod
+    execs of the operator with the recorded responses, without a cluster. The responses of a request (method, path and
+    query) are served in the recorded order, the last one is repeated once they are used up. Requests that are not
+    part of the trace are answered with a 404 (reads) or the request body (writes).
+
+    The watch events of the workloads (which wake up pending clusters) are not part of the trace, hence pending
+    clusters are checked every PENDING_POLL_INTERVAL seconds for at most PENDING_WAIT seconds while replaying.
+    Traces of the benchmark (tests.benchmark --record) need the clusters of `StubCluster` (stub=True).
+    """
+
+    PENDING_POLL_INTERVAL = 0.05
+    PENDING_WAIT = 1.0
+
+    def __init__(self, path: str, latency: bool = False, stub: bool = False):
+        self.latency = latency
+        self.stub = stub
+        self.calls: List[dict] = []
+        self._responses: Dict[Tuple[str, str, str], Deque[dict]] = defaultdict(deque)
+        self._outputs: Dict[Tuple[str, str, str], Deque[dict]] = defaultdict(deque)
+        from beiboot.recording import read_trace
+
+        for record in read_trace(path):
+            if record["k"] == "r":
+                self._responses[(record["m"], record["p"], record["q"])].append(record)
+            elif record["k"] == "x":
+                key = (record["p"], record["c"], json.dumps(record["a"]))
+                self._outputs[key].append(record)
+            elif record["k"] == "h" and record["h"] in HANDLERS:
+                self.calls.append(record)
+        self.served: Counter = Counter()
+        self.missed: Counter = Counter()
+
+    @staticmethod
+    def _next(queue: Deque[dict]) -> dict:
+        return queue.popleft() if len(queue) > 1 else queue[0]
+
+    def _serve(self, method: str, url: str, query_params, headers, body) -> _Response:
+        from beiboot.metrics import api_request_labels
+        from beiboot.recording import request_path
+
+        path, query = request_path(url, query_params)
+        label = " ".join(
+            api_request_labels(method, url, (headers or {}).get("Content-Type", ""))
+        )
+        queue = self._responses.get((method, path, query))
+        if not queue:
+            self.missed[label] += 1
+            if method == "GET":
+                return _Response(404, _not_found(path))
+            return _Response(201 if method == "POST" else 200, body)
+        record = self._next(queue)
+        self.served[label] += 1
+        if self.latency:
+            time.sleep(record["d"])
+        return _Response(record["s"], record["b"])
+
+    def _exec(self, name: str, namespace: str, container: str, command) -> str:
+        from beiboot.recording import exec_path
+
+        key = (exec_path(name, namespace), container, json.dumps(command))
+        queue = self._outputs.get(key)
+        if not queue:
+            self.missed["exec pods"] += 1
+            return ""
+        record = self._next(queue)
+        self.served["exec pods"] += 1
+        if self.latency:
+            time.sleep(record["d"])
+        return record["o"]
+
+    @contextlib.contextmanager
+    def installed(self) -> Iterator[None]:
+        """
+        A context manager that serves all requests of the kubernetes client (and all execs) from the trace
+        """
+        import kubernetes.stream
+        from kubernetes.client.rest import ApiException, RESTClientObject, RESTResponse
+
+        from beiboot.configuration import configuration
+
+        def _request(
+            client,
+            method,
+            url,
+            query_params=None,
+            headers=None,
+            body=None,
+            post_params=None,
+            _preload_content=True,
+            _request_timeout=None,
+        ):
+            response = self._serve(method, url, query_params, headers, body)
+            if not _preload_content:
+                return response
+            response = RESTResponse(response)
+            if not 200 <= response.status <= 299:
+                raise ApiException(http_resp=response)
+            return response
+
+        def _stream(api_method, name, namespace, *args, **kwargs):
+            return self._exec(
+                name, namespace, kwargs.get("container", ""), kwargs.get("command")
+            )
+
+        request, stream = RESTClientObject.request, kubernetes.stream.stream
+        pending = configuration.PENDING_POLL_INTERVAL, configuration.PENDING_WAIT
+        RESTClientObject.request = functools.wraps(request)(_request)
+        kubernetes.stream.stream = _stream
+        configuration.PENDING_POLL_INTERVAL = self.PENDING_POLL_INTERVAL
+        configuration.PENDING_WAIT = self.PENDING_WAIT
+        try:
+            yield
+        finally:
+            RESTClientObject.request, kubernetes.stream.stream = request, stream
+            configuration.PENDING_POLL_INTERVAL, configuration.PENDING_WAIT = pending
+
+    async def _call(self, record: dict, result: ReplayResult, delay: float) -> None:
+        import importlib
+
+        await asyncio.sleep(delay)
+        handler = getattr(importlib.import_module(HANDLERS[record["h"]]), record["h"])
+        body = record["b"]
+        metadata = body.get("metadata", {})
+        call = HandlerCall(
+            handler=record["h"],
+            name=metadata.get("name", ""),
+            recorded_result=record["r"],
+            recorded_duration=record["d"],
+        )
+        start = time.monotonic()
+        try:
+            await handler(
+                body=kopf.Body(body),
+                logger=logger,
+                name=call.name,
+                namespace=metadata.get("namespace"),
+            )
+            call.result = "success"
+        except kopf.TemporaryError:
+            call.result = "temporary"
+        except kopf.PermanentError:
+            call.result = "permanent"
+        except Exception as e:  # noqa
+            logger.debug(f"{call.handler} for {call.name} failed: {e!r}")
+            call.result = "error"
+        call.duration = time.monotonic() - start
+        result.calls.append(call)
+
+    async def replay(self, speed: float = 0.0) -> ReplayResult:
+        """
+        It replays the handler calls of the trace
+
+        :param speed: Start the calls at their recorded offsets, divided by speed (e.g. 10 replays ten times as fast),
+            0 replays them one after another
+        :type speed: float
+        :return: The results
+        """
+        from beiboot.events import event_publisher
+
+        if self.stub:
+            from beiboot.provider.factory import ProviderType, cluster_factory
+            from tests.benchmark.stub import StubBuilder
+
+            cluster_factory.register_builder(ProviderType.K3S, StubBuilder())
+        result = ReplayResult()
+        with self.installed():
+            start = time.monotonic()
+            if speed:
+                first = self.calls[0]["t"] if self.calls else 0.0
+                await asyncio.gather(
+                    *[
+                        self._call(call, result, (call["t"] - first) / speed)
+                        for call in self.calls
+                    ]
+                )
+            else:
+                for call in self.calls:
+                    await self._call(call, result, 0)
+            result.duration = time.monotonic() - start
+            await event_publisher.stop()
+        result.served, result.missed = dict(self.served), dict(self.missed)
+        return result
+
+
+def run_replay(
+    path: str, speed: float = 0.0, latency: bool = False, stub: bool = False
+) -> ReplayResult:
+    """
+    It replays a trace file of the operator (BEIBOOT_RECORD_FILE) offline and returns the results
+
+    :param path: The trace file
+    :type path: str
+    :param speed: Start the handler calls at their recorded offsets divided by speed, 0 runs them one after another
+    :type speed: float
+    :param latency: Delay the responses by their recorded duration
+    :type latency: bool
+    :param stub: Provide the clusters with `StubCluster`, for traces of the benchmark
+    :type stub: bool
+    :return: The results
+    """
+    if not any(module.startswith("beiboot") for module in sys.modules):
+        configure_kubernetes(REPLAY_HOST)
+    replayer = Replayer(path, latency=latency, stub=stub)
+    return asyncio.run(replayer.replay(speed))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m tests.benchmark.replay",
+        description="Replay a recorded trace of the Beiboot operator without a cluster",
+    )
+    parser.add_argument("trace", help="the trace file (BEIBOOT_RECORD_FILE)")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0.0,
+        help="start the handler calls at their recorded offsets divided by SPEED (default: one after another)",
+    )
+    parser.add_argument(
+        "--latency",
+        action="store_true",
+        help="delay the responses by their recorded duration",
+    )
+    parser.add_argument(
+        "--stub",
+        action="store_true",
+        help="provide the clusters with the stub of the benchmark (for traces of tests.benchmark --record)",
+    )
+    parser.add_argument("--json", metavar="PATH", help="write the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="log the operator")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if not args.verbose:
+        logging.getLogger("beiboot").setLevel(logging.CRITICAL)
+    result = run_replay(
+        args.trace, speed=args.speed, latency=args.latency, stub=args.stub
+    )
+    print(result.report())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result.to_dict(), f, indent=2)
+    return 1 if result.mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+from typing import Dict, List, Optional
+
+import kubernetes as k8s
+
+from beiboot.api import AsyncApi
+from beiboot.configuration import BeibootConfiguration, ClusterConfiguration
+from beiboot.provider.abstract import AbstractClusterProvider
+from beiboot.resources.apply import apply_objects
+from beiboot.resources.utils import handle_delete_statefulset
+from beiboot.signals import WORKLOAD_LABELS
+from beiboot.utils import exec_command_pod, get_label_selector
+
+core_api = AsyncApi(k8s.client.CoreV1Api())
+app_api = AsyncApi(k8s.client.AppsV1Api())
+
+KUBECONFIG = """apiVersion: v1
+kind: Config
+clusters:
+- cluster:
+    server: https://127.0.0.1:6443
+  name: default
+contexts:
+- context:
+    cluster: default
+    user: default
+  name: default
+current-context: default
+users:
+- name: default
+  user:
+    token: {name}
+"""
+
+
+class StubCluster(AbstractClusterProvider):
+    """
+    A cluster provider for the benchmark, it runs one server StatefulSet (that the fake API server makes ready) with
+    a data volume, but nothing inside it: the kubeconfig is static and the cluster is ready once the StatefulSet is
+    """
+
+    provider_type = "stub"
+    server_name = "server"
+
+    def __init__(
+        self,
+        configuration: BeibootConfiguration,
+        cluster_parameter: ClusterConfiguration,
+        name: str,
+        namespace: str,
+        ports: Optional[List[str]],
+        logger,
+        shelf_name: str = "",
+    ):
+        super().__init__(name, namespace, ports, shelf_name)
+        self.configuration = configuration
+        self.parameters = cluster_parameter
+        self.logger = logger
+
+    def _server_workload(self) -> k8s.client.V1StatefulSet:
+        labels = self.parameters.serverLabels
+        return k8s.client.V1StatefulSet(
+            metadata=k8s.client.V1ObjectMeta(
+                name=self.server_name,
+                namespace=self.namespace,
+                labels={**labels, **WORKLOAD_LABELS},
+            ),
+            spec=k8s.client.V1StatefulSetSpec(
+                replicas=1,
+                service_name=self.server_name,
+                selector=k8s.client.V1LabelSelector(match_labels=labels),
+                template=k8s.client.V1PodTemplateSpec(
+                    metadata=k8s.client.V1ObjectMeta(labels=labels),
+                    spec=k8s.client.V1PodSpec(
+                        containers=[
+                            k8s.client.V1Container(
+                                name=self.server_name, image="busybox"
+                            )
+                        ]
+                    ),
+                ),
+                volume_claim_templates=[
+                    k8s.client.V1PersistentVolumeClaim(
+                        metadata=k8s.client.V1ObjectMeta(name="data"),
+                        spec=k8s.client.V1PersistentVolumeClaimSpec(
+                            access_modes=["ReadWriteOnce"],
+                            resources=k8s.client.V1ResourceRequirements(
+                                requests={
+                                    "storage": self.parameters.serverStorageRequests
+                                }
+                            ),
+                        ),
+                    )
+                ],
+            ),
+        )
+
+    async def get_kubeconfig(self) -> str:
+        return KUBECONFIG.format(name=self.name)
+
+    async def prepare_restore_from_shelf(self) -> bool:
+        return True
+
+    async def create_new(self) -> bool:
+        await apply_objects(self.logger, [self._server_workload()], self.namespace)
+        return True
+
+    async def restore_from_shelf(self) -> bool:
+        return await self.create_new()
+
+    async def delete(self) -> bool:
+        await handle_delete_statefulset(self.logger, self.server_name, self.namespace)
+        return True
+
+    async def exists(self) -> bool:
+        stss = await app_api.list_namespaced_stateful_set(
+            self.namespace,
+            label_selector=get_label_selector(self.parameters.serverLabels),
+        )
+        return bool(stss.items)
+
+    async def running(self) -> bool:
+        stss = await app_api.list_namespaced_stateful_set(
+            self.namespace,
+            label_selector=get_label_selector(self.parameters.serverLabels),
+        )
+        if not stss.items:
+            return False
+        return all(
+            sts.status.available_replicas == sts.spec.replicas
+            and sts.status.observed_generation >= sts.metadata.generation
+            for sts in stss.items
+        )
+
+    async def ready(self) -> bool:
+        return await self.running()
+
+    async def _scale(self, replicas: int) -> None:
+        await app_api.patch_namespaced_stateful_set_scale(
+            name=self.server_name,
+            namespace=self.namespace,
+            body={"spec": {"replicas": replicas}},
+        )
+
+    async def hibernate(self) -> bool:
+        await self._scale(0)
+        return True
+
+    async def resume(self) -> bool:
+        await self._scale(1)
+        return True
+
+    def api_version(self) -> str:
+        return "stub"
+
+    def get_ports(self) -> List[str]:
+        ports = list(self.ports or [])
+        if "6443:6443" not in ports:
+            ports.append("6443:6443")
+        return ports
+
+    async def get_pvc_mapping(self) -> Dict:
+        pods = await core_api.list_namespaced_pod(
+            self.namespace,
+            label_selector=get_label_selector(self.parameters.serverLabels),
+        )
+        pvc_mapping = {}
+        for pod in pods.items:
+            for volume in pod.spec.volumes or []:
+                if volume.persistent_volume_claim:
+                    pvc_mapping[
+                        pod.metadata.owner_references[0].name
+                    ] = volume.persistent_volume_claim.claim_name
+        return pvc_mapping
+
+    async def on_shelf_request(self) -> bool:
+        # flush the data of the server, like the K3s provider does before the snapshots are taken
+        await exec_command_pod(
+            core_api,
+            f"{self.server_name}-0",
+            self.namespace,
+            self.server_name,
+            ["sync"],
+        )
+        return True
+
+
+class StubBuilder:
+    def __call__(
+        self,
+        configuration: BeibootConfiguration,
+        cluster_parameter: ClusterConfiguration,
+        name: str,
+        namespace: str,
+        ports: Optional[List[str]],
+        logger,
+        shelf_name: str = "",
+        **_ignored,
+    ) -> StubCluster:
+        return StubCluster(
+            configuration, cluster_parameter, name, namespace, ports, logger, shelf_name
+        )
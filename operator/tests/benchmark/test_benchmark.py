@@ -0,0 +1,70 @@
+from time import sleep
+
+# the API requests of one Beiboot lifecycle (with 2 of 5 Beiboots shelved, ~50 as of writing); the benchmark fails if
+# a change of the operator makes it (much) chattier
+API_CALLS_PER_BEIBOOT = 75
+
+
+def test_fake_api():
+    import kubernetes as k8s
+    from kubernetes.stream import stream
+
+    from tests.benchmark.fakeapi import FakeApiProcess
+
+    with FakeApiProcess(ready_delay=0.2) as api:
+        configuration = k8s.client.Configuration()
+        configuration.host = api.url
+        core_api = k8s.client.CoreV1Api(k8s.client.ApiClient(configuration))
+        app_api = k8s.client.AppsV1Api(k8s.client.ApiClient(configuration))
+
+        app_api.create_namespaced_stateful_set(
+            "default",
+            {
+                "metadata": {"name": "server"},
+                "spec": {
+                    "replicas": 1,
+                    "serviceName": "server",
+                    "selector": {"matchLabels": {"app": "server"}},
+                    "template": {
+                        "metadata": {"labels": {"app": "server"}},
+                        "spec": {"containers": [{"name": "server", "image": "x"}]},
+                    },
+                },
+            },
+        )
+        sts = app_api.read_namespaced_stateful_set("server", "default")
+        assert not sts.status.ready_replicas
+        sleep(0.5)
+        sts = app_api.read_namespaced_stateful_set("server", "default")
+        assert sts.status.ready_replicas == 1
+
+        pods = core_api.list_namespaced_pod("default", label_selector="app=server")
+        assert [pod.metadata.name for pod in pods.items] == ["server-0"]
+        output = stream(
+            core_api.connect_get_namespaced_pod_exec,
+            "server-0",
+            "default",
+            container="server",
+            command=["sync"],
+            stderr=True,
+            stdin=False,
+            stdout=True,
+            tty=False,
+        )
+        assert output == ""
+
+        app_api.delete_namespaced_stateful_set("server", "default")
+        assert not core_api.list_namespaced_pod("default").items
+        assert api.stats()["requests"]["create statefulsets"] == 1
+
+
+def test_beiboot_lifecycles():
+    from tests.benchmark.harness import run_benchmark
+
+    result = run_benchmark(beiboots=5, shelves=2, ready_delay=0.1)
+    print(result.report())
+
+    assert result.failures == []
+    assert len(result.ready_times) == 5
+    assert len(result.shelf_ready_times) == 2
+    assert result.api_calls_per_beiboot <= API_CALLS_PER_BEIBOOT
@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+
+OPERATOR_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+
+def _run(*args: str) -> None:
+    # the operator (and the stub provider) create their API instances on import, hence each run needs a fresh
+    # interpreter: the benchmark is configured for its fake API server, the replay for none
+    subprocess.run(
+        [sys.executable, "-m", *args], cwd=OPERATOR_DIR, check=True, timeout=300
+    )
+
+
+def test_record_and_replay(tmp_path):
+    trace = str(tmp_path / "trace.jsonl.gz")
+    _run(
+        "tests.benchmark",
+        "-n",
+        "2",
+        "--shelves",
+        "1",
+        "--ready-delay",
+        "0.1",
+        "--record",
+        trace,
+    )
+    # the trace may contain credentials, e.g. the output of the execs
+    assert os.stat(trace).st_mode & 0o777 == 0o600
+
+    output = tmp_path / "replay.json"
+    _run("tests.benchmark.replay", trace, "--stub", "--json", str(output))
+    replay = json.loads(output.read_text())
+    handlers = {call["handler"] for call in replay["calls"]}
+    assert handlers == {
+        "beiboot_created",
+        "beiboot_deleted",
+        "shelf_created",
+        "shelf_deleted",
+    }
+    assert replay["mismatches"] == 0
+    assert replay["served"]["exec pods"] == 1
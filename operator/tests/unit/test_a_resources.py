@@ -51,47 +51,166 @@ def test_beiboot_configmap():
     assert configmap.metadata.name == "beiboot-config"
 
 
+def test_ghostunnel_workload():
+    from beiboot.comps.ghostunnel import (
+        GHOSTUNNEL_PROBE_PORT,
+        create_ghostunnel_workload,
+    )
+    from beiboot.configuration import BeibootConfiguration
+
+    workload = create_ghostunnel_workload(
+        [("0.0.0.0:6443", "kubeapi:6443"), ("0.0.0.0:8080", "port-8080:8080")],
+        "getdeck-bbt-test",
+        BeibootConfiguration(),
+    )
+    # all ports are tunneled by one container
+    containers = workload.spec.template.spec.containers
+    assert len(containers) == 1
+    assert [port.container_port for port in containers[0].ports] == [6443, 8080]
+    script = containers[0].command[-1]
+    assert "--listen 0.0.0.0:6443 --target kubeapi:6443" in script
+    assert "--listen 0.0.0.0:8080 --target port-8080:8080" in script
+    probe = containers[0].readiness_probe._exec.command[-1]
+    assert f"localhost:{GHOSTUNNEL_PROBE_PORT}/" in probe
+    assert f"localhost:{GHOSTUNNEL_PROBE_PORT + 1}/" in probe
+
+
+def test_apply_request():
+    from beiboot.resources.apply import apply_request
+    from beiboot.resources.utils import (
+        create_volume_snapshot_content_pre_provisioned_resource,
+    )
+
+    response_type, body, path = apply_request(demo_statefulset(), "getdeck-bbt-test")
+    assert response_type == "V1StatefulSet"
+    assert body["apiVersion"] == "apps/v1"
+    assert body["kind"] == "StatefulSet"
+    assert body["metadata"]["namespace"] == "getdeck-bbt-test"
+    assert path == "/apis/apps/v1/namespaces/getdeck-bbt-test/statefulsets/web"
+    _, body, path = apply_request(demo_service(), "getdeck-bbt-test")
+    assert body["kind"] == "Service"
+    assert path == "/api/v1/namespaces/getdeck-bbt-test/services/web"
+
+    # cluster-scoped custom resources are applied as dicts
+    vsc = create_volume_snapshot_content_pre_provisioned_resource(
+        "snapshot", "driver", "handle", "snapshot", "getdeck-bbt-test"
+    )
+    response_type, body, path = apply_request(vsc)
+    assert response_type == "object"
+    assert path == "/apis/snapshot.storage.k8s.io/v1/volumesnapshotcontents/snapshot"
+    assert "namespace" not in body["metadata"]
+
+    with pytest.raises(ValueError):
+        apply_request(object(), "getdeck-bbt-test")
+    with pytest.raises(ValueError):
+        # a namespaced object without a namespace
+        apply_request(demo_statefulset())
+
+
+@pytest.mark.asyncio
+async def test_apply_objects(monkeypatch):
+    import asyncio
+    import json
+
+    import beiboot.resources.apply as apply
+    from beiboot.configuration import configuration
+
+    class FakeApiClient:
+        def __init__(self, sync):
+            self.sync = sync
+            self.requests = []
+            self.active = 0
+            self.max_active = 0
+
+        async def call_api(self, path, method, **kwargs):
+            import kubernetes
+
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            await asyncio.sleep(0.01)
+            self.active -= 1
+            self.requests.append((path, method, kwargs))
+            name = json.loads(kwargs["body"])["metadata"]["name"]
+            if name == "port-443":
+                raise kubernetes.client.ApiException(status=422)
+            return name
+
+    fake = FakeApiClient(apply.api_client.sync)
+    monkeypatch.setattr(apply, "api_client", fake)
+    monkeypatch.setattr(configuration, "APPLY_CONCURRENCY", 2)
+    services = ports_to_services(
+        ports=["8080:80", "8443:443", "9090:90"],
+        namespace="getdeck-bbt-test",
+        cluster_config=ClusterConfiguration(),
+    )
+    results = await apply.apply_all(
+        logging.getLogger(), [demo_statefulset()] + services, "getdeck-bbt-test"
+    )
+    assert [r.applied for r in results] == ["web", "port-80", None, "port-90"]
+    assert [r.ok for r in results] == [True, True, False, True]
+    assert results[2].error.status == 422
+    assert fake.max_active == 2
+    # a failure is raised once all objects have been applied
+    with pytest.raises(Exception):
+        await apply.apply_objects(logging.getLogger(), services, "getdeck-bbt-test")
+    assert len(fake.requests) == 7
+    path, method, kwargs = fake.requests[0]
+    assert method == "PATCH"
+    assert kwargs["header_params"]["Content-Type"] == "application/apply-patch+yaml"
+    assert ("fieldManager", apply.FIELD_MANAGER) in kwargs["query_params"]
+
+
 class TestResources:
-    def test_create_statefulset(self, minikube):
+    @pytest.mark.asyncio
+    async def test_create_statefulset(self, minikube):
         from beiboot.resources.utils import handle_create_statefulset
 
         sts = demo_statefulset()
-        handle_create_statefulset(logging.getLogger(), sts, "default")
-        handle_create_statefulset(logging.getLogger(), sts, "default")
+        await handle_create_statefulset(logging.getLogger(), sts, "default")
+        await handle_create_statefulset(logging.getLogger(), sts, "default")
 
-    def test_delete_statefulset(self, minikube):
+    @pytest.mark.asyncio
+    async def test_delete_statefulset(self, minikube):
         from beiboot.resources.utils import handle_delete_statefulset
 
         sts = demo_statefulset()
-        handle_delete_statefulset(logging.getLogger(), sts.metadata.name, "default")
-        handle_delete_statefulset(logging.getLogger(), sts.metadata.name, "default")
+        await handle_delete_statefulset(
+            logging.getLogger(), sts.metadata.name, "default"
+        )
+        await handle_delete_statefulset(
+            logging.getLogger(), sts.metadata.name, "default"
+        )
 
-    def test_create_deployment(self, minikube):
+    @pytest.mark.asyncio
+    async def test_create_deployment(self, minikube):
         from beiboot.resources.utils import handle_create_deployment
 
         deploy = demo_deployment()
-        handle_create_deployment(logging.getLogger(), deploy, "default")
-        handle_create_deployment(logging.getLogger(), deploy, "default")
+        await handle_create_deployment(logging.getLogger(), deploy, "default")
+        await handle_create_deployment(logging.getLogger(), deploy, "default")
 
-    def test_create_namespace(self, minikube):
+    @pytest.mark.asyncio
+    async def test_create_namespace(self, minikube):
         from beiboot.resources.utils import handle_create_namespace
 
-        handle_create_namespace(logging.getLogger(), "my-namespace")
-        handle_create_namespace(logging.getLogger(), "my-namespace")
+        await handle_create_namespace(logging.getLogger(), "my-namespace")
+        await handle_create_namespace(logging.getLogger(), "my-namespace")
 
-    def test_create_service(self, minikube):
+    @pytest.mark.asyncio
+    async def test_create_service(self, minikube):
         from beiboot.resources.utils import handle_create_service
 
         svc = demo_service()
-        handle_create_service(logging.getLogger(), svc, "default")
-        handle_create_service(logging.getLogger(), svc, "default")
+        await handle_create_service(logging.getLogger(), svc, "default")
+        await handle_create_service(logging.getLogger(), svc, "default")
 
-    def test_delete_service(self, minikube):
+    @pytest.mark.asyncio
+    async def test_delete_service(self, minikube):
         from beiboot.resources.utils import handle_delete_service
 
         svc = demo_service()
-        handle_delete_service(logging.getLogger(), svc.metadata.name, "default")
-        handle_delete_service(logging.getLogger(), svc.metadata.name, "default")
+        await handle_delete_service(logging.getLogger(), svc.metadata.name, "default")
+        await handle_delete_service(logging.getLogger(), svc.metadata.name, "default")
 
     @pytest.mark.asyncio
     async def test_delete_namespace(self, minikube):
@@ -102,18 +221,19 @@ class TestResources:
 
     @pytest.mark.asyncio
     async def test_service_account(self, minikube):
-        import kubernetes
         import kopf
         from beiboot.resources.utils import (
             handle_create_beiboot_serviceaccount,
             get_serviceaccount_data,
         )
 
-        handle_create_beiboot_serviceaccount(logging.getLogger(), "beiboot", "default")
-        with pytest.raises(kubernetes.client.exceptions.ApiException):
-            handle_create_beiboot_serviceaccount(
-                logging.getLogger(), "beiboot", "default"
-            )
+        await handle_create_beiboot_serviceaccount(
+            logging.getLogger(), "beiboot", "default"
+        )
+        # the service account is applied, hence creating it again is a no-op
+        await handle_create_beiboot_serviceaccount(
+            logging.getLogger(), "beiboot", "default"
+        )
         with pytest.raises(kopf.TemporaryError):
             await get_serviceaccount_data("beiboot", "default")
         sleep(2)
@@ -0,0 +1,66 @@
+import contextlib
+import json
+
+import pytest
+
+
+class FakeResponse:
+    def __init__(self, status, data):
+        self.status = status
+        self.data = data
+
+
+def test_request_hooks(monkeypatch, tmp_path):
+    from kubernetes.client.rest import ApiException, RESTClientObject
+
+    from beiboot import metrics, recording
+    from beiboot.api import add_request_hook
+
+    def request(self, method, url, query_params=None, headers=None, **kwargs):
+        if url.endswith("/missing"):
+            raise ApiException(status=404, reason="Not Found")
+        return FakeResponse(200, json.dumps({"kind": "PodList"}).encode("utf-8"))
+
+    monkeypatch.setattr(RESTClientObject, "request", request)
+
+    seen = []
+
+    @contextlib.contextmanager
+    def log_request(api_request):
+        seen.append((api_request.method, api_request.status))
+        try:
+            yield
+        finally:
+            seen.append((api_request.method, api_request.status))
+
+    add_request_hook(log_request)
+    add_request_hook(log_request)
+    metrics.instrument_kubernetes_client()
+    recording.instrument_kubernetes_client()
+    recording.instrument_kubernetes_client()
+    # the request method is wrapped once for all hooks
+    assert RESTClientObject.request.__wrapped__ is request
+
+    path = str(tmp_path / "trace.jsonl")
+    assert recording.setup(path)
+    url = "https://10.0.0.1:443/api/v1/namespaces/ns/pods"
+    try:
+        response = RESTClientObject.request(None, "GET", url, [("limit", 10)])
+        with pytest.raises(ApiException):
+            RESTClientObject.request(None, "GET", f"{url}/missing")
+    finally:
+        recording.shutdown()
+
+    assert response.status == 200
+    assert seen == [("GET", None), ("GET", 200), ("GET", None), ("GET", 404)]
+    sample = metrics.REGISTRY.get_sample_value
+    labels = dict(verb="list", resource="pods", code="200")
+    assert sample("beiboot_kubernetes_api_requests_total", labels) == 1
+    labels = dict(verb="get", resource="pods", code="404")
+    assert sample("beiboot_kubernetes_api_requests_total", labels) == 1
+
+    records = [r for r in recording.read_trace(path) if r["k"] == "r"]
+    assert [(r["p"], r["q"], r["s"], r["b"]) for r in records] == [
+        ("/api/v1/namespaces/ns/pods", "limit=10", 200, {"kind": "PodList"}),
+        ("/api/v1/namespaces/ns/pods/missing", "", 404, None),
+    ]
@@ -0,0 +1,59 @@
+def _beiboot(name: str, namespace: str, state: str = "READY") -> dict:
+    return {
+        "metadata": {"name": name, "uid": f"uid-{name}"},
+        "beibootNamespace": namespace,
+        "state": state,
+    }
+
+
+def test_beiboot_index():
+    from beiboot.cache import BeibootIndex
+
+    index = BeibootIndex()
+    assert index.primed is False
+    index.prime([_beiboot("a", "getdeck-bbt-a"), _beiboot("b", "getdeck-bbt-b")])
+    assert index.primed is True
+    assert len(index) == 2
+    assert index.has_namespace("getdeck-bbt-a")
+    assert not index.has_namespace("getdeck-bbt-c")
+    bbt = index.get_by_namespace("getdeck-bbt-b")
+    assert bbt["metadata"]["name"] == "b"
+    # the returned objects allow attribute access like kopf bodies
+    assert bbt.metadata["uid"] == "uid-b"
+    # the returned objects are copies
+    bbt["state"] = "ERROR"
+    assert index.get_by_name("b")["state"] == "READY"
+
+    index.upsert(_beiboot("b", "getdeck-bbt-b", state="ERROR"))
+    assert [bbt["metadata"]["name"] for bbt in index.get_by_state("READY")] == ["a"]
+    assert [bbt["metadata"]["name"] for bbt in index.get_by_state("ERROR")] == ["b"]
+    assert index.count_by_state() == {"READY": 1, "ERROR": 1}
+
+    index.remove(_beiboot("a", "getdeck-bbt-a"))
+    assert index.get_by_name("a") is None
+    assert index.get_by_namespace("getdeck-bbt-a") is None
+    assert index.namespaces() == {"getdeck-bbt-b"}
+
+
+def test_node_index():
+    from beiboot.cache import NodeIndex
+
+    def node(name, *ips):
+        return {
+            "metadata": {"name": name},
+            "status": {
+                "addresses": [{"type": "InternalIP", "address": "10.0.0.1"}]
+                + [{"type": "ExternalIP", "address": ip} for ip in ips]
+            },
+        }
+
+    index = NodeIndex()
+    assert index.primed is False
+    index.prime([node("b", "1.2.3.5"), node("a", "1.2.3.4")])
+    assert index.primed is True
+    assert index.external_ips() == ["1.2.3.4", "1.2.3.5"]
+    index.upsert(node("c"))
+    index.upsert(node("a", "1.2.3.6"))
+    assert index.external_ips() == ["1.2.3.6", "1.2.3.5"]
+    index.remove(node("b"))
+    assert index.external_ips() == ["1.2.3.6"]
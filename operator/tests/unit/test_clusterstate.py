@@ -0,0 +1,378 @@
+import asyncio
+import dataclasses
+import logging
+from datetime import datetime, timedelta
+
+import pytest
+
+
+class FakeCustomApi:
+    def __init__(self):
+        self.patched = []
+
+    async def patch_namespaced_custom_object(self, namespace, name, body, **kwargs):
+        self.patched.append(body)
+
+
+class FakeProvider:
+    def __init__(self, running=True, calls=None):
+        self._running = running
+        self.calls = calls if calls is not None else []
+
+    async def get_kubeconfig(self):
+        return "apiVersion: v1\nkind: Config\n"
+
+    async def running(self):
+        return self._running
+
+    def get_ports(self):
+        return ["6443:6443"]
+
+    async def hibernate(self):
+        self.calls.append("provider.hibernate")
+        return True
+
+    async def resume(self):
+        self.calls.append("provider.resume")
+        return True
+
+
+def _cluster(state, parameters=None, **model):
+    import kubernetes as k8s
+
+    from beiboot.cache import AttrDict
+    from beiboot.clusterstate import BeibootCluster
+    from beiboot.configuration import configuration
+
+    configuration.set_cluster_config(k8s.client.V1ConfigMap(data={}))
+    parameters = configuration.refresh_k8s_config(
+        {"gefyra": {"enabled": False}, **(parameters or {})}
+    )
+    cluster = BeibootCluster(
+        configuration,
+        parameters,
+        model=AttrDict(
+            metadata={"name": "test", "uid": "uid-1"},
+            provider="k3s",
+            state=state,
+            **model,
+        ),
+        logger=logging.getLogger("test"),
+    )
+    cluster.custom_api = FakeCustomApi()
+    cluster._provider = FakeProvider()
+    cluster.events = []
+    cluster.post_event = lambda reason, message, _type="Normal": cluster.events.append(
+        reason
+    )
+    return cluster
+
+
+@pytest.mark.asyncio
+async def test_bind(monkeypatch):
+    from beiboot import clusterstate
+    from beiboot.configuration import ClusterConfiguration
+
+    rebound = []
+
+    async def rebind(logger, standby, name, namespace):
+        rebound.append((standby, name, namespace))
+
+    monkeypatch.setattr(clusterstate, "handle_rebind_beiboot_serviceaccount", rebind)
+    cluster = _cluster("REQUESTED", {"maxLifetime": "2h"})
+    standby = {
+        "metadata": {"name": "standby-1"},
+        "beibootNamespace": "getdeck-bbt-standby-1",
+        "parameters": {
+            **dataclasses.asdict(ClusterConfiguration()),
+            "gefyra": {"enabled": False},
+        },
+    }
+
+    # the standby is handed to on_bind, but not to on_enter_running
+    await cluster.bind(standby)
+
+    assert cluster.is_running
+    assert cluster.namespace == "getdeck-bbt-standby-1"
+    assert cluster.parameters.maxLifetime == "2h"
+    assert rebound == [("standby-1", "test", "getdeck-bbt-standby-1")]
+    handover, transition = cluster.custom_api.patched
+    assert handover["beibootNamespace"] == "getdeck-bbt-standby-1"
+    assert "sunset" in handover
+    # the state and the kubeconfig are written with one patch
+    assert transition["state"] == "RUNNING"
+    assert transition["kubeconfig"]["source"]
+    assert cluster.events == ["RUNNING"]
+
+
+@pytest.mark.asyncio
+async def test_operate(monkeypatch):
+    from beiboot.comps import ghostunnel
+    from beiboot.signals import workload_signals
+
+    async def ghostunnel_ready(namespace):
+        return True
+
+    monkeypatch.setattr(ghostunnel, "ghostunnel_ready", ghostunnel_ready)
+    cluster = _cluster(
+        "PENDING", {"maxLifetime": "1h"}, beibootNamespace="getdeck-bbt-test"
+    )
+    cluster._provider = FakeProvider(running=False)
+    tunnel_data = []
+
+    async def write_tunnel_data():
+        tunnel_data.append(cluster.namespace)
+
+    cluster._write_tunnel_data = write_tunnel_data
+
+    async def start_provider():
+        await asyncio.sleep(0.1)
+        cluster._provider._running = True
+        workload_signals.notify("getdeck-bbt-test")
+
+    # the pending cluster becomes running while the transition waits for it
+    task = asyncio.create_task(start_provider())
+    await asyncio.wait_for(cluster.operate(wait=5), timeout=2)
+    await task
+
+    assert cluster.is_running
+    assert tunnel_data == ["getdeck-bbt-test"]
+    (patch,) = cluster.custom_api.patched
+    assert patch["state"] == "RUNNING"
+    assert patch["sunset"]
+    assert patch["kubeconfig"]["source"]
+
+
+def _timestamp(dt: datetime) -> str:
+    return dt.isoformat(timespec="microseconds") + "Z"
+
+
+@pytest.mark.asyncio
+async def test_hibernate_and_resume(monkeypatch):
+    from beiboot.comps import ghostunnel
+
+    calls = []
+
+    async def hibernate_ghostunnel(namespace):
+        calls.append("ghostunnel.hibernate")
+
+    async def resume_ghostunnel(namespace):
+        calls.append("ghostunnel.resume")
+
+    monkeypatch.setattr(ghostunnel, "hibernate_ghostunnel", hibernate_ghostunnel)
+    monkeypatch.setattr(ghostunnel, "resume_ghostunnel", resume_ghostunnel)
+    cluster = _cluster("READY", beibootNamespace="getdeck-bbt-test")
+    cluster._provider = FakeProvider(calls=calls)
+
+    await cluster.hibernate()
+    assert cluster.is_hibernated
+    await cluster.resume()
+    assert cluster.is_pending
+
+    # the tunnel is stopped before and started after the cluster
+    assert calls == [
+        "ghostunnel.hibernate",
+        "provider.hibernate",
+        "provider.resume",
+        "ghostunnel.resume",
+    ]
+    assert [patch["state"] for patch in cluster.custom_api.patched] == [
+        "HIBERNATED",
+        "PENDING",
+    ]
+    assert cluster.events == ["HIBERNATED", "PENDING"]
+
+
+@pytest.mark.asyncio
+async def test_should_hibernate(monkeypatch):
+    from beiboot import clusterstate
+
+    heartbeats = {}
+
+    async def get_latest_client_heartbeat(namespace):
+        return heartbeats.get(namespace)
+
+    monkeypatch.setattr(
+        clusterstate, "get_latest_client_heartbeat", get_latest_client_heartbeat
+    )
+    now = datetime.utcnow()
+    parameters = {"maxSessionTimeout": "1m", "hibernateOnSessionTimeout": True}
+    transitions = {"READY": _timestamp(now - timedelta(minutes=2))}
+
+    def cluster(state):
+        return _cluster(
+            state,
+            parameters,
+            beibootNamespace="getdeck-bbt-test",
+            stateTransitions=transitions,
+        )
+
+    # no client connected within the session timeout since the cluster became ready
+    assert await cluster("READY").should_hibernate
+    assert not await cluster("READY").should_terminate
+    # only a ready or running cluster is hibernated
+    assert not await cluster("PENDING").should_hibernate
+    assert not await cluster("HIBERNATED").should_hibernate
+
+    heartbeats["getdeck-bbt-test"] = now - timedelta(seconds=10)
+    assert not await cluster("READY").should_hibernate
+    heartbeats["getdeck-bbt-test"] = now - timedelta(minutes=2)
+    assert await cluster("RUNNING").should_hibernate
+
+    # without hibernateOnSessionTimeout the cluster is terminated instead
+    parameters["hibernateOnSessionTimeout"] = False
+    assert not await cluster("READY").should_hibernate
+    assert await cluster("READY").should_terminate
+
+
+class FakeAppsApi:
+    def __init__(self, deployment=None):
+        self.deployment = deployment
+        self.scaled = []
+        self.replaced = []
+
+    async def patch_namespaced_deployment_scale(self, name, namespace, body):
+        self.scaled.append((name, body["spec"]["replicas"]))
+
+    async def read_namespaced_deployment(self, name, namespace):
+        return self.deployment
+
+    async def replace_namespaced_deployment(self, name, namespace, body):
+        self.replaced.append(body)
+
+
+class FakeCoreApi:
+    def __init__(self, secret=None):
+        self.secret = secret
+
+    async def read_namespaced_secret(self, name, namespace):
+        import kubernetes as k8s
+
+        if self.secret is None:
+            raise k8s.client.ApiException(status=404)
+        return self.secret
+
+
+@pytest.mark.asyncio
+async def test_hibernate_and_resume_ghostunnel(monkeypatch):
+    import base64
+
+    import kubernetes as k8s
+
+    from beiboot.comps import ghostunnel
+
+    pki = k8s.client.V1Secret(
+        data={"client.crt": base64.b64encode(b"crt").decode("utf-8")}
+    )
+    deployment = k8s.client.V1Deployment(
+        spec=k8s.client.V1DeploymentSpec(
+            replicas=0,
+            selector=k8s.client.V1LabelSelector(),
+            template=k8s.client.V1PodTemplateSpec(
+                spec=k8s.client.V1PodSpec(
+                    containers=[],
+                    init_containers=[k8s.client.V1Container(name="pki")],
+                    volumes=[k8s.client.V1Volume(name="pki-data")],
+                )
+            ),
+        )
+    )
+    app_api = FakeAppsApi(deployment)
+    monkeypatch.setattr(ghostunnel, "app_api", app_api)
+    monkeypatch.setattr(ghostunnel, "core_api", FakeCoreApi(pki))
+
+    await ghostunnel.hibernate_ghostunnel("getdeck-bbt-test")
+    assert app_api.scaled == [(ghostunnel.GHOSTUNNEL_NAME, 0)]
+
+    # the tunnel is resumed with its backed up PKI instead of generating a new one
+    await ghostunnel.resume_ghostunnel("getdeck-bbt-test")
+    (resumed,) = app_api.replaced
+    assert resumed.spec.replicas == 1
+    pod_spec = resumed.spec.template.spec
+    assert pod_spec.init_containers is None
+    assert [v.secret.secret_name for v in pod_spec.volumes] == [
+        ghostunnel.GHOSTUNNEL_PKI_SECRET
+    ]
+
+    # without a backup the tunnel generates a new PKI
+    monkeypatch.setattr(ghostunnel, "core_api", FakeCoreApi())
+    app_api.replaced.clear()
+    deployment.spec.template.spec.init_containers = [k8s.client.V1Container(name="pki")]
+    await ghostunnel.resume_ghostunnel("getdeck-bbt-test")
+    (resumed,) = app_api.replaced
+    assert resumed.spec.replicas == 1
+    assert resumed.spec.template.spec.init_containers
+
+
+@pytest.mark.asyncio
+async def test_client_heartbeat_resumes(monkeypatch):
+    import kubernetes as k8s
+
+    from beiboot.cache import AttrDict, client_leases
+    from beiboot.clusterstate import BeibootCluster
+    from beiboot.configuration import configuration
+    from beiboot.handler import beiboots
+
+    resumed = []
+
+    async def resume(self, *args, **kwargs):
+        resumed.append(self.name)
+
+    monkeypatch.setattr(BeibootCluster, "resume", resume)
+    configuration.set_cluster_config(k8s.client.V1ConfigMap(data={}))
+    now = datetime.utcnow()
+    body = AttrDict(
+        metadata={"name": "test", "uid": "uid-1"},
+        provider="k3s",
+        state="HIBERNATED",
+        beibootNamespace="getdeck-bbt-test",
+        parameters={"maxSessionTimeout": "1m", "hibernateOnSessionTimeout": True},
+        stateTransitions={"HIBERNATED": _timestamp(now - timedelta(minutes=1))},
+    )
+
+    # a heartbeat from before the hibernation does not resume the cluster
+    client_leases.set("getdeck-bbt-test", {"a": now - timedelta(minutes=2)})
+    await beiboots.handle_client_heartbeat(body, logging.getLogger("test"))
+    assert resumed == []
+
+    client_leases.set("getdeck-bbt-test", {"a": now})
+    await beiboots.handle_client_heartbeat(body, logging.getLogger("test"))
+    assert resumed == ["test"]
+    # a hibernated cluster has no session timeout deadline
+    assert beiboots.deadline_queue.get("test") is None
+
+    client_leases.remove("getdeck-bbt-test")
+
+
+@pytest.mark.asyncio
+async def test_deadline_of_pending_cluster():
+    import kubernetes as k8s
+
+    from beiboot.cache import beiboot_index
+    from beiboot.configuration import configuration
+    from beiboot.handler import beiboots
+
+    configuration.set_cluster_config(k8s.client.V1ConfigMap(data={}))
+    now = datetime.utcnow()
+    body = {
+        "metadata": {"name": "test", "uid": "uid-1"},
+        "provider": "k3s",
+        "state": "PENDING",
+        "beibootNamespace": "getdeck-bbt-test",
+        "parameters": {"maxSessionTimeout": "1m", "hibernateOnSessionTimeout": True},
+        "stateTransitions": {"READY": _timestamp(now - timedelta(minutes=5))},
+    }
+    beiboot_index.upsert(body)
+
+    # the session timeout has passed, but a pending cluster is not hibernated: the deadline is not set again
+    # (which would call the handler right away, over and over), but with the next change of the Beiboot
+    await beiboots.handle_beiboot_deadline("test")
+    assert beiboots.deadline_queue.get("test") is None
+
+    # a deadline that has moved in the meantime is set again
+    beiboot_index.upsert({**body, "lastClientContact": _timestamp(now)})
+    await beiboots.handle_beiboot_deadline("test")
+    assert beiboots.deadline_queue.get("test") > datetime.utcnow()
+
+    beiboot_index.remove(body)
+    beiboots.deadline_queue.remove("test")
@@ -128,6 +128,7 @@ def test_encode_configuration():
             "ports": "null",
             "maxLifetime": "null",
             "maxSessionTimeout": "null",
+            "hibernateOnSessionTimeout": "false",
         },
         data,
     )
@@ -162,3 +163,24 @@ def test_decode_configuration():
     assert config.gefyra.get("enabled") is False
     assert config.tunnel.get("enabled") is True
     assert config.tunnel.get("endpoint") == "192.168.49.2"
+
+
+def test_cached_configuration():
+    from beiboot.configuration import BeibootConfiguration
+
+    configuration = BeibootConfiguration()
+    configuration.set_cluster_config(
+        kubernetes.client.V1ConfigMap(data={"nodes": "2", "maxLifetime": "2h"})
+    )
+    config = configuration.refresh_k8s_config({"nodes": 3})
+    assert config.nodes == 3
+    assert config.maxLifetime == "2h"
+    # overrides must not leak into the cached configuration
+    config.gefyra["enabled"] = False
+    config = configuration.refresh_k8s_config()
+    assert config.nodes == 2
+    assert config.gefyra.get("enabled") is True
+
+    configuration.set_cluster_config(kubernetes.client.V1ConfigMap(data={"nodes": "4"}))
+    assert configuration.refresh_k8s_config().nodes == 4
+    assert configuration.refresh_k8s_config().maxLifetime is None
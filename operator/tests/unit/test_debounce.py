@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_debouncer():
+    from beiboot.debounce import Debouncer
+
+    runs = []
+
+    async def reconcile(name):
+        runs.append(name)
+        await asyncio.sleep(0.1)
+
+    debouncer = Debouncer(window=0.05)
+    for i in range(10):
+        debouncer.trigger("ns-a", lambda i=i: reconcile(f"a-{i}"))
+    debouncer.trigger("ns-b", lambda: reconcile("b"))
+    assert debouncer.pending("ns-a")
+    await asyncio.sleep(0.2)
+    # all triggers within the window are merged into one run with the latest function
+    assert sorted(runs) == ["a-9", "b"]
+
+    # a trigger during a run schedules exactly one more run
+    debouncer.trigger("ns-a", lambda: reconcile("a-10"))
+    await asyncio.sleep(0.1)
+    debouncer.trigger("ns-a", lambda: reconcile("a-11"))
+    debouncer.trigger("ns-a", lambda: reconcile("a-12"))
+    await asyncio.sleep(0.3)
+    assert runs[2:] == ["a-10", "a-12"]
+    assert not debouncer.pending("ns-a")
+    await debouncer.cancel()
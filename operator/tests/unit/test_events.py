@@ -0,0 +1,124 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+
+class FakeEventsApi:
+    def __init__(self):
+        self.created = []
+        self.patched = []
+
+    async def create_namespaced_event(self, namespace, body):
+        self.created.append(body)
+
+    async def patch_namespaced_event(self, name, namespace, body):
+        self.patched.append((name, body))
+
+
+@pytest.mark.asyncio
+async def test_event_publisher():
+    from beiboot.events import EventPublisher, create_event
+
+    def event(reason, uid="uid-1"):
+        return create_event(
+            name="test",
+            namespace="getdeck",
+            kind="beiboot",
+            uid=uid,
+            action="Beiboot-State",
+            reason=reason,
+            message=f"{reason} happened",
+        )
+
+    publisher = EventPublisher(burst=3, refill=timedelta(hours=1))
+    api = FakeEventsApi()
+    publisher._events_api = api
+
+    # repeated events are collapsed into a series of the first event
+    publisher.publish(event("backoff"))
+    publisher.publish(event("backoff"))
+    publisher.publish(event("backoff"))
+    publisher.publish(event("ready"))
+    # another object has its own rate limit
+    publisher.publish(event("ready", uid="uid-2"))
+    await publisher.stop()
+
+    # uid-1's "ready" event exceeded the rate limit, it is sent when the publisher stops
+    assert [(e.regarding.uid, e.reason) for e in api.created] == [
+        ("uid-1", "Backoff"),
+        ("uid-2", "Ready"),
+        ("uid-1", "Ready"),
+    ]
+    assert [body["series"]["count"] for _, body in api.patched] == [2, 3]
+    assert api.patched[0][0] == api.created[0].metadata.name
+
+
+@pytest.mark.asyncio
+async def test_event_publisher_deferred():
+    from beiboot.events import EventPublisher, create_event
+
+    def event(reason):
+        return create_event(
+            name="test",
+            namespace="getdeck",
+            kind="beiboot",
+            uid="uid-1",
+            action="Beiboot-State",
+            reason=reason,
+            message=f"{reason} happened",
+        )
+
+    publisher = EventPublisher(burst=1, refill=timedelta(milliseconds=100))
+    api = FakeEventsApi()
+    publisher._events_api = api
+
+    publisher.publish(event("backoff"))
+    publisher.publish(event("backoff"))
+    publisher.publish(event("backoff"))
+    publisher.publish(event("ready"))
+    await asyncio.sleep(0.5)
+    assert publisher._deferred == {}
+
+    # the rate limited events are sent with the next tokens of the object
+    assert [e.reason for e in api.created] == ["Backoff", "Ready"]
+    assert [body["series"]["count"] for _, body in api.patched] == [3]
+    await publisher.stop()
+
+
+@pytest.mark.asyncio
+async def test_event_publisher_failed_create():
+    from kubernetes.client import ApiException
+
+    from beiboot.events import EventPublisher, create_event
+
+    class FailingEventsApi(FakeEventsApi):
+        failures = 1
+
+        async def create_namespaced_event(self, namespace, body):
+            if self.failures:
+                self.failures -= 1
+                raise ApiException(status=429, reason="Too Many Requests")
+            await super().create_namespaced_event(namespace, body)
+
+    publisher = EventPublisher(burst=10, refill=timedelta(hours=1))
+    api = FailingEventsApi()
+    publisher._events_api = api
+
+    for _ in range(3):
+        publisher.publish(
+            create_event(
+                name="test",
+                namespace="getdeck",
+                kind="beiboot",
+                uid="uid-1",
+                action="Beiboot-State",
+                reason="backoff",
+                message="backoff happened",
+            )
+        )
+    await publisher.stop()
+
+    # the event is created with the next repeat, instead of patching an event that does not exist
+    assert [(e.reason, e.series.count) for e in api.created] == [("Backoff", 2)]
+    assert [body["series"]["count"] for _, body in api.patched] == [3]
@@ -0,0 +1,84 @@
+import pytest
+
+
+def test_callback_gauge():
+    from prometheus_client import CollectorRegistry, generate_latest
+
+    from beiboot.metrics import CallbackGauge
+
+    registry = CollectorRegistry()
+    states = CallbackGauge("test_beiboots", "Beiboots", ["state"], registry=registry)
+    depth = CallbackGauge("test_depth", "Depth", registry=registry)
+    failing = CallbackGauge("test_failing", "Failing", registry=registry)
+    states.set_function(lambda: {("READY",): 2, ("PENDING",): 1})
+    depth.set_function(lambda: 3)
+    failing.set_function(lambda: 1 / 0)
+
+    text = generate_latest(registry).decode("utf-8")
+    assert "# TYPE test_beiboots gauge" in text
+    assert 'test_beiboots{state="PENDING"} 1.0' in text
+    assert 'test_beiboots{state="READY"} 2.0' in text
+    assert "test_depth 3.0" in text
+    # a failing function does not fail the scrape
+    assert "# TYPE test_failing gauge" in text
+    assert registry.get_sample_value("test_failing") is None
+
+
+def test_api_request_labels():
+    from beiboot.metrics import api_request_labels
+
+    host = "https://10.0.0.1:443"
+    assert api_request_labels("GET", f"{host}/api/v1/namespaces/ns/pods") == (
+        "list",
+        "pods",
+    )
+    assert api_request_labels("GET", f"{host}/api/v1/namespaces/ns") == (
+        "get",
+        "namespaces",
+    )
+    assert api_request_labels(
+        "PATCH",
+        f"{host}/apis/apps/v1/namespaces/ns/statefulsets/server?force=true",
+        "application/apply-patch+yaml",
+    ) == ("apply", "statefulsets")
+    assert api_request_labels(
+        "PATCH", f"{host}/apis/apps/v1/namespaces/ns/deployments/tunnel/scale"
+    ) == ("patch", "deployments/scale")
+    assert api_request_labels("DELETE", f"{host}/api/v1/namespaces/ns") == (
+        "delete",
+        "namespaces",
+    )
+    assert api_request_labels("GET", f"{host}/version") == ("get", "other")
+
+
+@pytest.mark.asyncio
+async def test_timed_handler():
+    from beiboot.metrics import REGISTRY, timed
+
+    @timed
+    async def test_handler(body, **kwargs):
+        if body.get("fail"):
+            raise RuntimeError("failed")
+        return body
+
+    assert await test_handler(body={}, logger=None) == {}
+    with pytest.raises(RuntimeError):
+        await test_handler(body={"fail": True})
+    for result in ["success", "error"]:
+        assert (
+            REGISTRY.get_sample_value(
+                "beiboot_handler_duration_seconds_count",
+                {"handler": "test_handler", "result": result},
+            )
+            == 1
+        )
+
+
+def test_handler_modules():
+    import types
+
+    import beiboot.handler
+
+    # the star imports of the handler package must not shadow its modules, e.g. with the `beiboots` gauge
+    for name in ["beiboots", "clusters", "metrics", "shelves"]:
+        assert isinstance(getattr(beiboot.handler, name), types.ModuleType)
@@ -0,0 +1,55 @@
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_tunnel_pki(monkeypatch):
+    from asn1crypto import pem, x509
+    from oscrypto import asymmetric
+
+    import beiboot.comps.pki as pki
+
+    key_pool = pki.KeyPool(size=3, bit_size=1024)
+    monkeypatch.setattr(pki, "key_pool", key_pool)
+
+    files = await pki.create_tunnel_pki(
+        "getdeck-bbt-test", ["10.0.0.1", "tunnel.example.com"]
+    )
+    # the key pool is refilled in the background
+    await key_pool._task
+    assert len(key_pool) == 3
+    await key_pool.stop()
+
+    assert set(files) == {
+        "getdeck-bbt-test.crt",
+        "server.crt",
+        "server.key",
+        "client.crt",
+        "client.key",
+    }
+
+    def certificate(filename):
+        _, _, der = pem.unarmor(files[filename].encode("utf-8"))
+        return x509.Certificate.load(der)
+
+    ca = certificate("getdeck-bbt-test.crt")
+    server = certificate("server.crt")
+    client = certificate("client.crt")
+    assert ca.ca and ca.subject.native["common_name"] == "getdeck-bbt-test"
+    assert server.subject.native["common_name"] == pki.SERVER_CN
+    assert server.valid_ips == ["10.0.0.1"]
+    assert server.valid_domains == ["tunnel.example.com"]
+    assert server.extended_key_usage_value.native == ["server_auth"]
+    assert client.subject.native["common_name"] == pki.CLIENT_CN
+    assert client.extended_key_usage_value.native == ["client_auth"]
+
+    # both certificates are signed by the CA
+    ca_public_key = asymmetric.load_public_key(ca.public_key)
+    for cert in [server, client]:
+        assert cert.issuer == ca.subject
+        asymmetric.rsa_pkcs1v15_verify(
+            ca_public_key, cert.signature, cert["tbs_certificate"].dump(), "sha256"
+        )
+
+    # the private keys belong to the certificates
+    client_key = asymmetric.load_private_key(files["client.key"].encode("utf-8"))
+    assert client_key.public_key.asn1.dump() == client.public_key.dump()
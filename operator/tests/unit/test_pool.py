@@ -0,0 +1,146 @@
+import dataclasses
+
+import pytest
+
+
+class FakeCustomApi:
+    def __init__(self, conflicts=()):
+        self.conflicts = set(conflicts)
+        self.patched = []
+        self.created = []
+
+    async def create_namespaced_custom_object(self, namespace, body, **kwargs):
+        self.created.append(body)
+
+    async def patch_namespaced_custom_object(self, namespace, name, body, **kwargs):
+        import kubernetes as k8s
+
+        if name in self.conflicts:
+            raise k8s.client.exceptions.ApiException(status=409)
+        self.patched.append((name, body))
+
+
+def _standby(name, parameters, state="READY", labels=None):
+    return {
+        "metadata": {
+            "name": name,
+            "resourceVersion": "1",
+            "labels": {"beiboot.getdeck.dev/standby": "abc", **(labels or {})},
+        },
+        "state": state,
+        "beibootNamespace": f"getdeck-bbt-{name}",
+        "parameters": parameters,
+    }
+
+
+def test_parse_pool_config():
+    from beiboot.pool import parse_pool_config
+
+    assert parse_pool_config(None) == []
+    assert parse_pool_config("not json") == []
+    specs = parse_pool_config(
+        '[{"size": 2, "parameters": {"nodes": 1}}, {"size": 0}, {"size": "x"}]'
+    )
+    assert len(specs) == 1
+    assert specs[0].size == 2
+    assert (
+        specs[0].key
+        == parse_pool_config('[{"size": 1, "parameters": {"nodes": 1}}]')[0].key
+    )
+
+
+@pytest.mark.asyncio
+async def test_warm_pool_claim():
+    from beiboot import pool
+    from beiboot.cache import BeibootIndex
+    from beiboot.configuration import ClusterConfiguration, configuration
+
+    requested = ClusterConfiguration()
+    requested.maxLifetime = "2h"
+    stored = dataclasses.asdict(ClusterConfiguration())
+    # the stored parameters of a booted standby include the API port
+    stored["ports"] = ["6443:6443"]
+    other = {**stored, "nodes": 3}
+
+    index = BeibootIndex()
+    index.prime(
+        [
+            _standby("a", stored),
+            _standby("b", stored),
+            _standby("c", other),
+            _standby("d", stored, state="PENDING"),
+            _standby("e", stored, labels={"beiboot.getdeck.dev/bound-to": "x"}),
+        ]
+    )
+    original_index = pool.beiboot_index
+    pool.beiboot_index = index
+    try:
+        warm_pool = pool.WarmPool(configuration)
+        assert [
+            body["metadata"]["name"] for body in warm_pool.candidates(requested)
+        ] == ["a", "b"]
+
+        # a standby that has been claimed in the meantime is skipped
+        api = FakeCustomApi(conflicts=["a"])
+        warm_pool.custom_api = api
+        standby = await warm_pool.claim("mycluster", requested)
+        assert standby["metadata"]["name"] == "b"
+        name, body = api.patched[0]
+        assert name == "b"
+        assert body["metadata"]["labels"] == {
+            "beiboot.getdeck.dev/bound-to": "mycluster"
+        }
+        assert body["metadata"]["resourceVersion"] == "1"
+        assert body["beibootNamespace"] is None
+
+        warm_pool.custom_api = FakeCustomApi(conflicts=["a", "b"])
+        assert await warm_pool.claim("mycluster", requested) is None
+    finally:
+        pool.beiboot_index = original_index
+
+
+@pytest.mark.asyncio
+async def test_warm_pool_refill():
+    from beiboot import pool
+    from beiboot.cache import BeibootIndex
+    from beiboot.configuration import configuration
+
+    index = BeibootIndex()
+    index.prime([])
+    original_index = pool.beiboot_index
+    pool.beiboot_index = index
+    try:
+        warm_pool = pool.WarmPool(configuration)
+        warm_pool.specs = [pool.PoolSpec(size=2, parameters={})]
+        key = warm_pool.specs[0].key
+        api = FakeCustomApi()
+        warm_pool.custom_api = api
+
+        await warm_pool.refill()
+        # the standbys of the previous refill are not yet in the index, they are not requested again
+        await warm_pool.refill()
+        assert len(api.created) == 2
+        assert {
+            body["metadata"]["labels"][pool.STANDBY_LABEL] for body in api.created
+        } == {key}
+
+        standbys = [
+            {
+                **body,
+                "metadata": {**body["metadata"], "resourceVersion": "1"},
+                "state": "PENDING",
+            }
+            for body in api.created
+        ]
+        index.upsert(standbys[0])
+        await warm_pool.refill()
+        assert len(api.created) == 2
+
+        # a standby that is gone from the index is replaced
+        index.upsert(standbys[1])
+        await warm_pool.refill()
+        index.remove(standbys[0])
+        await warm_pool.refill()
+        assert len(api.created) == 3
+    finally:
+        pool.beiboot_index = original_index
@@ -4,10 +4,16 @@ import kopf
 import pytest
 
 
-def test_k3s_image_tag():
+def test_k3s_image_tag(monkeypatch):
     from beiboot.configuration import ClusterConfiguration, BeibootConfiguration
+    from beiboot.provider import k3s
     from beiboot.provider.k3s import K3s
+    from beiboot.provider.k3s.tags import build_tag_resolver
 
+    # the tags are resolved from the catalog fixture only, without contacting the registry
+    monkeypatch.setenv("BEIBOOT_K3S_TAG_CATALOG", "tests/fixtures/k3s-tags.txt")
+    monkeypatch.setenv("BEIBOOT_K3S_TAG_CATALOG_ONLY", "true")
+    monkeypatch.setattr(k3s, "tag_resolver", build_tag_resolver(BeibootConfiguration()))
     parameters = ClusterConfiguration()
 
     for v in ["v1.24.8", "v1.25.4", "V1.23.13", "1.24.6"]:
@@ -34,3 +40,286 @@ def test_k3s_image_tag():
         )
         with pytest.raises(kopf.PermanentError):
             provider.k3s_image_tag
+
+
+def test_k3s_builder_memoization():
+    from beiboot.configuration import ClusterConfiguration, BeibootConfiguration
+    from beiboot.provider.k3s import K3sBuilder
+
+    builder = K3sBuilder()
+    configuration = BeibootConfiguration()
+
+    def build(parameters, uid="1234"):
+        return builder(
+            configuration,
+            parameters,
+            "test",
+            "test_ns",
+            ["8080:80"],
+            logging.getLogger(),
+            uid=uid,
+        )
+
+    provider = build(ClusterConfiguration())
+    assert build(ClusterConfiguration()) is provider
+    # other Beiboot objects get their own instance
+    assert build(ClusterConfiguration(), uid="5678") is not provider
+    # changed parameters invalidate the instance
+    parameters = ClusterConfiguration()
+    parameters.nodes = 3
+    changed = build(parameters)
+    assert changed is not provider
+    assert changed.parameters.nodes == 3
+    assert build(parameters) is changed
+
+    builder.evict("1234")
+    assert build(parameters) is not changed
+
+
+@pytest.mark.asyncio
+async def test_k3s_builder_handler_logger():
+    import asyncio
+
+    from beiboot.configuration import ClusterConfiguration, BeibootConfiguration
+    from beiboot.provider.k3s import K3sBuilder
+
+    builder = K3sBuilder()
+    configuration = BeibootConfiguration()
+    loggers = {}
+
+    async def handler(logger_name):
+        logger = logging.getLogger(logger_name)
+        provider = builder(
+            configuration,
+            ClusterConfiguration(),
+            "test",
+            "test_ns",
+            None,
+            logger,
+            uid="1234",
+        )
+        await asyncio.sleep(0)
+        loggers[logger_name] = provider.logger
+        return provider
+
+    # concurrent handlers of one Beiboot share the instance, but not their loggers
+    first, second = await asyncio.gather(handler("first"), handler("second"))
+    assert first is second
+    assert loggers == {
+        "first": logging.getLogger("first"),
+        "second": logging.getLogger("second"),
+    }
+
+
+@pytest.mark.asyncio
+async def test_k3s_load_shelf(monkeypatch):
+    from beiboot.configuration import ClusterConfiguration, BeibootConfiguration
+    import beiboot.provider.k3s as k3s
+
+    requests = []
+
+    class FakeCustomApi:
+        async def get_namespaced_custom_object(self, **kwargs):
+            requests.append(kwargs)
+            return {"clusterParameters": {"nodes": 3}}
+
+    monkeypatch.setattr(k3s, "custom_api", FakeCustomApi())
+    provider = k3s.K3s(
+        BeibootConfiguration(),
+        ClusterConfiguration(),
+        "test",
+        "test_ns",
+        None,
+        logging.getLogger(),
+        shelf_name="myshelf",
+    )
+    # the Shelf is not read in the constructor
+    assert provider.shelf is None
+    assert requests == []
+    assert await provider.prepare_restore_from_shelf()
+    assert await provider.load_shelf() == {"clusterParameters": {"nodes": 3}}
+    assert provider.parameters.nodes == 3
+    assert len(requests) == 1
+    assert requests[0]["name"] == "myshelf"
+
+
+def test_inner_cluster_clients():
+    import base64
+
+    import yaml
+
+    from beiboot.cache import BeibootIndex
+    from beiboot.provider.k3s import client
+
+    def kubeconfig(token):
+        return yaml.dump(
+            {
+                "apiVersion": "v1",
+                "kind": "Config",
+                "clusters": [
+                    {
+                        "name": "default",
+                        "cluster": {
+                            "server": "https://127.0.0.1:6443",
+                            "insecure-skip-tls-verify": True,
+                        },
+                    }
+                ],
+                "users": [{"name": "default", "user": {"token": token}}],
+                "contexts": [
+                    {
+                        "name": "default",
+                        "context": {"cluster": "default", "user": "default"},
+                    }
+                ],
+                "current-context": "default",
+            }
+        )
+
+    def beiboot(token=None):
+        body = {"metadata": {"name": "test"}, "beibootNamespace": "getdeck-bbt-test"}
+        if token:
+            body["kubeconfig"] = {
+                "source": base64.b64encode(kubeconfig(token).encode()).decode()
+            }
+        return body
+
+    index = BeibootIndex()
+    clients = client.InnerClusterClients()
+    original_index = client.beiboot_index
+    client.beiboot_index = index
+    try:
+        # no kubeconfig stored yet
+        index.upsert(beiboot())
+        assert clients.get("getdeck-bbt-test") is None
+
+        index.upsert(beiboot("token-1"))
+        api = clients.get("getdeck-bbt-test")
+        assert api is not None
+        assert (
+            api.api_client.configuration.host
+            == "https://kubeapi.getdeck-bbt-test.svc:6443"
+        )
+        assert clients.get("getdeck-bbt-test") is api
+
+        # a changed kubeconfig creates a new client
+        index.upsert(beiboot("token-2"))
+        assert clients.get("getdeck-bbt-test") is not api
+
+        clients.mark_unreachable("getdeck-bbt-test")
+        assert clients.get("getdeck-bbt-test") is None
+        clients.evict("getdeck-bbt-test")
+        assert clients.get("getdeck-bbt-test") is not None
+    finally:
+        client.beiboot_index = original_index
+
+
+def test_k3s_server_publishes_kubeconfig():
+    from beiboot.configuration import ClusterConfiguration
+    from beiboot.provider.k3s import K3s
+    from beiboot.provider.k3s.utils import (
+        create_k3s_server_workload,
+        create_k3s_kubeconfig_publisher,
+        KUBECONFIG_PUBLISHER,
+        KUBECONFIG_PUBLISHER_TOKEN_VOLUME,
+        KUBECONFIG_PUBLISH_INTERVAL,
+        KUBECONFIG_SECRET_LABEL,
+        KUBECONFIG_SECRET_NAME,
+    )
+
+    sts = create_k3s_server_workload(
+        "getdeck-bbt-test",
+        "token",
+        K3s.k3s_image,
+        K3s.k3s_default_image_tag,
+        K3s.k3s_image_pullpolicy,
+        K3s.kubeconfig_from_location,
+        K3s.api_server_container_name,
+        ClusterConfiguration(),
+    )
+    pod_spec = sts.spec.template.spec
+    assert pod_spec.service_account_name == KUBECONFIG_PUBLISHER
+    # only the publisher gets the token of the service account
+    assert pod_spec.automount_service_account_token is False
+    apiserver, publisher = pod_spec.containers
+    assert [mount.name for mount in apiserver.volume_mounts].count(
+        KUBECONFIG_PUBLISHER_TOKEN_VOLUME
+    ) == 0
+    assert (
+        publisher.volume_mounts[1].name == KUBECONFIG_PUBLISHER_TOKEN_VOLUME
+        and publisher.volume_mounts[1].mount_path
+        == "/var/run/secrets/kubernetes.io/serviceaccount"
+    )
+    assert "--tls-san=kubeapi.getdeck-bbt-test.svc" in apiserver.args[0]
+    # both containers share the directory of the kubeconfig
+    assert (
+        apiserver.volume_mounts[1].mount_path
+        == publisher.volume_mounts[0].mount_path
+        == "/getdeck/kubeconfig"
+    )
+    assert KUBECONFIG_SECRET_NAME in publisher.args[0]
+    # the kubeconfig is only published again once it changed
+    assert f"sleep {KUBECONFIG_PUBLISH_INTERVAL}" in publisher.args[0]
+
+    _, role, role_binding, secret = create_k3s_kubeconfig_publisher("getdeck-bbt-test")
+    # the publisher cannot create (or read) any other Secret
+    assert [(rule.resource_names, rule.verbs) for rule in role.rules] == [
+        ([KUBECONFIG_SECRET_NAME], ["get", "patch"])
+    ]
+    assert role_binding.subjects[0].name == KUBECONFIG_PUBLISHER
+    assert secret.metadata.name == KUBECONFIG_SECRET_NAME
+    assert secret.metadata.labels == {KUBECONFIG_SECRET_LABEL: "true"}
+
+
+def test_k3s_tag_resolver(tmp_path):
+    from datetime import timedelta
+
+    from beiboot.provider.k3s.tags import K3sTagResolver
+
+    catalog = tmp_path / "tags"
+    catalog.write_text("# known tags\nv1.24.8-k3s1\nv1.25.4-k3s1\n")
+    resolver = K3sTagResolver(
+        catalog_file=str(catalog), negative_ttl=timedelta(minutes=1)
+    )
+    lookups = []
+
+    def lookup(tag):
+        lookups.append(tag)
+        return tag == "v1.23.13-k3s1"
+
+    resolver._lookup = lookup
+
+    assert resolver.resolve("v1.24.8") == "v1.24.8-k3s1"
+    assert resolver.resolve("1.25.4") == "v1.25.4-k3s1"
+    # malformed versions never reach the registry
+    assert resolver.resolve("k1.24.8") is None
+    assert resolver.resolve("v1.a.13") is None
+    assert lookups == []
+
+    resolver.set_configmap_catalog('["v1.26.0-k3s1"]')
+    assert resolver.resolve("V1.26.0") == "v1.26.0-k3s1"
+    assert lookups == []
+
+    # registry results are cached, positive and negative
+    for _ in range(3):
+        assert resolver.resolve("V1.23.13") == "v1.23.13-k3s1"
+        assert resolver.resolve("2.25.4") is None
+    assert lookups == ["v1.23.13-k3s1", "v2.25.4-k3s1"]
+
+
+def test_k3s_tag_resolver_authoritative():
+    from beiboot.provider.k3s.tags import K3sTagResolver
+
+    resolver = K3sTagResolver(authoritative=True)
+    resolver.set_configmap_catalog("v1.24.8-k3s1")
+
+    def lookup(tag):
+        raise AssertionError(f"The registry was contacted for {tag}")
+
+    resolver._lookup = lookup
+
+    assert resolver.resolve("1.24.8") == "v1.24.8-k3s1"
+    assert resolver.resolve("k1.24.8") is None
+    # a tag outside the catalog is rejected without a registry lookup
+    with pytest.raises(kopf.PermanentError):
+        resolver.resolve("1.25.4")
@@ -0,0 +1,94 @@
+import json
+import os
+
+import kopf
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_recorded_handler(tmp_path):
+    from beiboot import recording
+
+    @recording.recorded
+    async def beiboot_created(body, **kwargs):
+        if body["state"] == "PENDING":
+            raise kopf.TemporaryError("pending", delay=1)
+
+    path = str(tmp_path / "trace.jsonl.gz")
+    assert recording.setup(path)
+    try:
+        await beiboot_created(body={"state": "READY"}, name="test")
+        with pytest.raises(kopf.TemporaryError):
+            await beiboot_created(body={"state": "PENDING"}, name="test")
+    finally:
+        recording.shutdown()
+    assert not recording.enabled()
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    records = list(recording.read_trace(path))
+    assert [(r["k"], r["h"], r["b"], r["r"]) for r in records] == [
+        ("h", "beiboot_created", {"state": "READY"}, "success"),
+        ("h", "beiboot_created", {"state": "PENDING"}, "temporary"),
+    ]
+    assert records[0]["t"] <= records[1]["t"]
+
+
+def test_request_path():
+    from beiboot.recording import request_path
+
+    assert request_path(
+        "https://127.0.0.1:6443/api/v1/namespaces/getdeck/pods",
+        [("labelSelector", "app=server")],
+    ) == ("/api/v1/namespaces/getdeck/pods", "labelSelector=app%3Dserver")
+    assert request_path("http://localhost/apis?watch=1") == ("/apis", "watch=1")
+
+
+def test_redact_secrets():
+    from beiboot.recording import redact_secrets
+
+    secret = {
+        "kind": "Secret",
+        "metadata": {"name": "kubeconfig"},
+        "data": {"kubeconfig": "YXBpVmVyc2lvbjogdjE="},
+        "stringData": {"token": "secret"},
+    }
+    assert redact_secrets(secret) == {
+        "kind": "Secret",
+        "metadata": {"name": "kubeconfig"},
+        "data": {"kubeconfig": ""},
+        "stringData": {"token": ""},
+    }
+    secrets = {"kind": "SecretList", "items": [{"data": {"ca.crt": "Y2E="}}]}
+    assert redact_secrets(secrets) == {
+        "kind": "SecretList",
+        "items": [{"data": {"ca.crt": ""}}],
+    }
+    config_map = {"kind": "ConfigMap", "data": {"key": "value"}}
+    assert redact_secrets(config_map) == {"kind": "ConfigMap", "data": {"key": "value"}}
+    assert redact_secrets("not found") == "not found"
+
+
+@pytest.mark.parametrize("secrets", [False, True])
+def test_recorded_secrets(monkeypatch, tmp_path, secrets):
+    from kubernetes.client.rest import RESTClientObject
+
+    from beiboot import recording
+
+    class FakeResponse:
+        status = 200
+        data = json.dumps({"kind": "Secret", "data": {"token": "dG9rZW4="}}).encode()
+
+    monkeypatch.setattr(
+        RESTClientObject, "request", lambda self, *args, **kwargs: FakeResponse()
+    )
+    recording.instrument_kubernetes_client()
+
+    path = str(tmp_path / "trace.jsonl")
+    assert recording.setup(path, secrets=secrets)
+    try:
+        RESTClientObject.request(None, "GET", "/api/v1/namespaces/ns/secrets/token")
+    finally:
+        recording.shutdown()
+
+    (record,) = recording.read_trace(path)
+    assert record["b"]["data"] == {"token": "dG9rZW4=" if secrets else ""}
@@ -0,0 +1,170 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def _timestamp(dt: datetime) -> str:
+    return dt.isoformat(timespec="microseconds") + "Z"
+
+
+def _beiboot(name="test", state="READY", ready_since=timedelta(seconds=0), **kwargs):
+    now = datetime.utcnow()
+    return {
+        "metadata": {"name": name},
+        "state": state,
+        "stateTransitions": {"READY": _timestamp(now - ready_since)},
+        **kwargs,
+    }
+
+
+def test_next_interval():
+    from beiboot.scheduler import ReconcileScheduler
+
+    scheduler = ReconcileScheduler(interval=60, jitter=0)
+    assert scheduler.next_interval(_beiboot(state="RUNNING")) == 30
+    assert scheduler.next_interval(_beiboot(state="PENDING")) == 30
+    assert scheduler.next_interval(_beiboot()) == 60
+    assert scheduler.next_interval(_beiboot(ready_since=timedelta(minutes=20))) == 120
+    assert scheduler.next_interval(_beiboot(ready_since=timedelta(hours=2))) == 240
+
+    # deadlines are left to the deadline queue
+    sunset = _timestamp(datetime.utcnow() + timedelta(seconds=10))
+    assert scheduler.next_interval(_beiboot(sunset=sunset)) == 60
+
+    # failures back off
+    scheduler.record("test", success=False)
+    scheduler.record("test", success=False)
+    assert scheduler.next_interval(_beiboot()) == 240
+    scheduler.record("test", success=True)
+    assert scheduler.next_interval(_beiboot()) == 60
+
+    jittered = ReconcileScheduler(interval=60, jitter=0.1)
+    intervals = {jittered.next_interval(_beiboot()) for _ in range(10)}
+    assert all(54 <= i <= 66 for i in intervals)
+    assert len(intervals) > 1
+
+
+@pytest.mark.asyncio
+async def test_scheduler_queue():
+    from beiboot.scheduler import ReconcileScheduler
+
+    scheduler = ReconcileScheduler(interval=1, jitter=0)
+    handled = []
+
+    async def handler(name):
+        handled.append(name)
+
+    scheduler.schedule(_beiboot("a"))
+    scheduler.schedule(_beiboot("b", state="ERROR"))
+    scheduler.schedule(_beiboot("c"))
+    # an existing schedule is not postponed
+    scheduler.schedule(_beiboot("a", ready_since=timedelta(hours=2)))
+    scheduler.remove("c")
+    assert scheduler.queue_depth == 2
+    assert scheduler.lag == 0
+
+    scheduler.start(handler)
+    await asyncio.sleep(1.2)
+    assert sorted(handled) == ["a", "b"]
+    assert scheduler.queue_depth == 0
+    await scheduler.stop()
+
+
+def test_nearest_deadline():
+    from beiboot.scheduler import nearest_deadline
+
+    now = datetime.utcnow()
+    sunset = now + timedelta(hours=1)
+    assert nearest_deadline(_beiboot(), None) is None
+    assert nearest_deadline(_beiboot(sunset=_timestamp(sunset)), None) == sunset
+    # the session timeout is counted from the last client contact, or from READY
+    contact = now - timedelta(seconds=50)
+    model = _beiboot(sunset=_timestamp(sunset), lastClientContact=_timestamp(contact))
+    assert nearest_deadline(model, "1m") == contact + timedelta(minutes=1)
+    ready = nearest_deadline(_beiboot(), "1m")
+    assert now < ready <= datetime.utcnow() + timedelta(minutes=1)
+    # a known heartbeat takes precedence
+    heartbeat = now + timedelta(seconds=30)
+    assert nearest_deadline(model, "1m", heartbeat) == heartbeat + timedelta(minutes=1)
+
+
+@pytest.mark.asyncio
+async def test_deadline_queue():
+    from beiboot.scheduler import DeadlineQueue
+
+    queue = DeadlineQueue()
+    handled = []
+
+    async def handler(name):
+        handled.append(name)
+
+    now = datetime.utcnow()
+    queue.start(handler)
+    queue.set("a", now + timedelta(seconds=0.2))
+    queue.set("b", now + timedelta(seconds=0.1))
+    queue.set("c", now + timedelta(seconds=0.1))
+    queue.remove("c")
+    # a moved deadline replaces the previous one
+    queue.set("d", now + timedelta(seconds=0.1))
+    queue.set("d", now + timedelta(hours=1))
+    await asyncio.sleep(0.05)
+    assert handled == []
+    await asyncio.sleep(0.3)
+    assert handled == ["b", "a"]
+    assert len(queue) == 1
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_cancels_handlers():
+    from beiboot.scheduler import DeadlineQueue
+
+    queue = DeadlineQueue()
+    started = asyncio.Event()
+    cancelled = []
+
+    async def handler(name):
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+
+    queue.start(handler)
+    queue.set("a", datetime.utcnow())
+    await asyncio.wait_for(started.wait(), timeout=1)
+    await queue.stop()
+    # the handler that was still running is cancelled and awaited
+    assert cancelled == ["a"]
+    assert not queue._running
+
+
+@pytest.mark.asyncio
+async def test_scheduler_saturated():
+    from beiboot.scheduler import ReconcileScheduler
+
+    scheduler = ReconcileScheduler(interval=1, jitter=0, concurrency=1)
+    release = asyncio.Event()
+    handled = []
+
+    async def handler(name):
+        handled.append(name)
+        await release.wait()
+
+    scheduler.schedule(_beiboot("a"))
+    scheduler.schedule(_beiboot("b"))
+    scheduler.start(handler)
+    await asyncio.sleep(1.3)
+    # one reconciliation is blocked, the other one waits for the free slot: it is still queued and falls behind
+    assert len(handled) == 1
+    assert scheduler.queue_depth == 1
+    assert scheduler.lag >= 0.2
+
+    release.set()
+    await asyncio.sleep(0.05)
+    assert sorted(handled) == ["a", "b"]
+    assert scheduler.queue_depth == 0
+    assert scheduler.lag == 0
+    await scheduler.stop()
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_workload_signals():
+    from beiboot.signals import WorkloadSignals
+
+    signals = WorkloadSignals()
+    # a change before the wait does not wake up the waiter
+    signals.notify("ns-a")
+    assert await signals.wait("ns-a", timeout=0.05) is False
+    assert len(signals) == 0
+
+    waiters = asyncio.gather(
+        signals.wait("ns-a", timeout=1),
+        signals.wait("ns-a", timeout=1),
+        signals.wait("ns-b", timeout=0.1),
+    )
+    await asyncio.sleep(0.01)
+    signals.notify("ns-a")
+    assert await waiters == [True, True, False]
+    assert len(signals) == 0
+
+
+@pytest.mark.asyncio
+async def test_kubeconfig_wakes_waiter(monkeypatch):
+    import base64
+    import logging
+
+    from beiboot.cache import kubeconfigs
+    from beiboot.handler import clusters
+    from beiboot.signals import workload_signals
+
+    def get_beiboot(*args, **kwargs):
+        raise AssertionError("the kubeconfig watch must not operate the cluster")
+
+    monkeypatch.setattr(clusters, "get_beiboot_for_namespace", get_beiboot)
+    event = {
+        "type": "ADDED",
+        "object": {
+            "metadata": {"name": "beiboot-kubeconfig", "namespace": "ns-a"},
+            "data": {"kubeconfig": base64.b64encode(b"apiVersion: v1").decode()},
+        },
+    }
+    waiter = asyncio.ensure_future(workload_signals.wait("ns-a", timeout=1))
+    await asyncio.sleep(0.01)
+    await clusters.handle_cluster_kubeconfig(
+        event=event, namespace="ns-a", logger=logging.getLogger("test")
+    )
+    # the waiting handler of the pending cluster is woken up to move it on
+    assert await waiter is True
+    assert kubeconfigs.get("ns-a") == "apiVersion: v1"
+    kubeconfigs.remove("ns-a")
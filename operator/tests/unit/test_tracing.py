@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_lifecycle_trace(tmp_path):
+    pytest.importorskip("opentelemetry.sdk")
+    from beiboot import tracing
+    from beiboot.api import run_sync
+    from beiboot.events import create_event
+
+    uid = "0b6c4a2e-55a1-4e3c-9a3f-6c2f8a1d7e10"
+    path = tmp_path / "traces.jsonl"
+    assert tracing.setup("file", path=str(path))
+    try:
+        with tracing.span("beiboot.prepare", uid=uid):
+            # blocking calls run in the span of the caller
+            traceparent = await run_sync(tracing.traceparent)
+            event = create_event(
+                "test", "getdeck", "beiboot", uid, "Beiboot-State", "ready", "ready"
+            )
+            with tracing.span("exec", uid=uid):
+                pass
+        with tracing.span("beiboot.create", uid=uid):
+            pass
+    finally:
+        tracing.shutdown()
+    assert tracing.traceparent() is None
+
+    spans = {
+        span["name"]: span for span in map(json.loads, path.read_text().splitlines())
+    }
+    trace_id = f"0x{tracing.lifecycle_ids(uid)[0]:032x}"
+    # all spans of the Beiboot belong to one trace, across separate handler runs
+    assert {span["context"]["trace_id"] for span in spans.values()} == {trace_id}
+    assert spans["exec"]["parent_id"] == spans["beiboot.prepare"]["context"]["span_id"]
+    root_id = f"0x{tracing.lifecycle_ids(uid)[1]:016x}"
+    assert spans["beiboot.prepare"]["parent_id"] == root_id
+    assert spans["beiboot.create"]["parent_id"] == root_id
+    assert traceparent.split("-")[1] == trace_id[2:]
+    assert event.metadata.annotations[tracing.TRACEPARENT_ANNOTATION] == traceparent
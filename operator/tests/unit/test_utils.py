@@ -1,4 +1,5 @@
 import logging
+from datetime import datetime
 from pathlib import Path
 from time import sleep
 
@@ -68,6 +69,18 @@ def test_parse_timedelta():
     assert parse_timedelta("-30min", only_positve=False) == timedelta(minutes=-30)
 
 
+def test_get_label_selector():
+    from beiboot.utils import get_label_selector
+
+    assert get_label_selector({"app": "beiboot"}) == "app=beiboot"
+    # the merged parameters of a Beiboot object carry booleans
+    parameters = ClusterConfiguration()
+    parameters.update({"serverLabels": {"beiboot.getdeck.dev/is-server": "true"}})
+    assert get_label_selector(parameters.serverLabels) == (
+        "app=beiboot,beiboot.getdeck.dev/is-node=true,beiboot.getdeck.dev/is-server=true"
+    )
+
+
 def test_validator_ports():
     from beiboot.handler import validate_ports
 
@@ -194,3 +207,142 @@ def test_validator_session_timeout():
 #             logger=logging.getLogger(),
 #             operation="CREATE",
 #         )
+
+
+def test_merge_patch():
+    from beiboot.utils import merge_patch
+
+    assert merge_patch(
+        {"state": "CREATING", "stateTransitions": {"CREATING": "1"}, "ports": ["a"]},
+        {"state": "PENDING", "stateTransitions": {"PENDING": "2"}, "ports": ["b"]},
+    ) == {
+        "state": "PENDING",
+        "stateTransitions": {"CREATING": "1", "PENDING": "2"},
+        "ports": ["b"],
+    }
+
+
+@pytest.mark.asyncio
+async def test_patch_coalescing():
+    from beiboot.utils import StateMachine, AsyncState
+
+    class Machine(StateMachine):
+        first = AsyncState("First", initial=True, value="FIRST")
+        second = AsyncState("Second", value="SECOND")
+
+        proceed = first.to(second)
+
+        def __init__(self):
+            super(Machine, self).__init__()
+            self.sent = []
+
+        async def _send_patch(self, data: dict):
+            self.sent.append(data)
+
+        async def on_proceed(self):
+            await self._patch_object({"ports": ["8080:80"], "a": {"b": 1}})
+            await self._patch_object({"a": {"c": 2}})
+
+        async def on_enter_second(self):
+            await self._patch_object({"state": self.current_state.value})
+
+    machine = Machine()
+    await machine._patch_object({"outside": True})
+    assert machine.sent == [{"outside": True}]
+    await machine.proceed()
+    assert machine.sent[1:] == [
+        {"ports": ["8080:80"], "a": {"b": 1, "c": 2}, "state": "SECOND"}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_patch_coalescing_errors():
+    import kubernetes as k8s
+
+    from beiboot.utils import StateMachine, AsyncState
+
+    class Machine(StateMachine):
+        first = AsyncState("First", initial=True, value="FIRST")
+        second = AsyncState("Second", value="SECOND")
+
+        proceed = first.to(second)
+
+        def __init__(self, fail: bool):
+            super(Machine, self).__init__()
+            self.fail = fail
+
+        async def _send_patch(self, data: dict):
+            raise k8s.client.ApiException(status=500)
+
+        async def on_proceed(self):
+            await self._patch_object({"ports": ["8080:80"]})
+            if self.fail:
+                raise kopf.TemporaryError("not yet", delay=1)
+
+    # the error of the transition is not replaced by the one of the patch
+    with pytest.raises(kopf.TemporaryError):
+        await Machine(fail=True).proceed()
+    machine = Machine(fail=False)
+    with pytest.raises(k8s.client.ApiException):
+        await machine.proceed()
+    assert machine._transition_depth == 0
+
+
+def test_parse_latest_heartbeat():
+    from beiboot.comps.client_timeout import parse_latest_heartbeat
+
+    assert parse_latest_heartbeat(None) is None
+    assert parse_latest_heartbeat({}) is None
+    assert parse_latest_heartbeat(
+        {"a": "2022-10-01T10:00:00", "b": "2022-10-01T12:00:00"}
+    ) == datetime(2022, 10, 1, 12)
+
+
+def test_cached_client_heartbeat():
+    from beiboot.cache import client_heartbeats, client_leases, forget_namespace
+    from beiboot.comps.client_timeout import (
+        cached_client_heartbeat,
+        parse_lease_renew_time,
+    )
+
+    assert parse_lease_renew_time({"spec": {}}) is None
+    renew_time = parse_lease_renew_time(
+        {"spec": {"renewTime": "2022-10-01T12:30:00.000000Z"}}
+    )
+    assert renew_time == datetime(2022, 10, 1, 12, 30)
+
+    assert cached_client_heartbeat("getdeck-bbt-test") is None
+    client_heartbeats.set("getdeck-bbt-test", datetime(2022, 10, 1, 12))
+    client_leases.set("getdeck-bbt-test", {"beiboot-client-a": renew_time})
+    assert cached_client_heartbeat("getdeck-bbt-test") == renew_time
+    forget_namespace("getdeck-bbt-test")
+    assert cached_client_heartbeat("getdeck-bbt-test") is None
+
+
+@pytest.mark.asyncio
+async def test_exec_command_pod(monkeypatch):
+    import threading
+
+    import kubernetes as k8s
+
+    from beiboot import utils
+
+    calls = []
+    closed = threading.Event()
+
+    def stream(api_method, name, namespace, **kwargs):
+        calls.append((name, namespace, kwargs["container"], kwargs["command"]))
+        return "done"
+
+    def close_api_client(api_client):
+        closed.set()
+
+    monkeypatch.setattr(k8s.stream, "stream", stream)
+    monkeypatch.setattr(utils, "close_api_client", close_api_client)
+    output = await utils.exec_command_pod(
+        k8s.client.CoreV1Api(), "server-0", "getdeck-bbt-test", "server", ["sync"]
+    )
+    assert output == "done"
+    assert calls == [("server-0", "getdeck-bbt-test", "server", ["sync"])]
+    # the ApiClient of the exec is closed afterwards
+    assert closed.wait(timeout=5)
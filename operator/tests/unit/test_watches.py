@@ -0,0 +1,129 @@
+import asyncio
+import json
+
+import pytest
+
+
+class FakeResponse:
+    def __init__(self, events):
+        self.lines = [json.dumps(event).encode("utf-8") + b"\n" for event in events]
+
+    def stream(self, amt=None, decode_content=False):
+        yield from self.lines
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+def _secret(name, resource_version):
+    return {
+        "metadata": {
+            "name": name,
+            "namespace": "getdeck-bbt-test",
+            "resourceVersion": resource_version,
+        }
+    }
+
+
+@pytest.mark.asyncio
+async def test_selector_watch():
+    from beiboot.watches import SelectorWatch
+
+    requests = []
+    responses = [
+        FakeResponse(
+            [
+                {"type": "ADDED", "object": _secret("a", "1")},
+                {"type": "MODIFIED", "object": _secret("a", "2")},
+            ]
+        ),
+        # the resource version expired
+        FakeResponse([{"type": "ERROR", "object": {"code": 410}}]),
+        FakeResponse([{"type": "DELETED", "object": _secret("a", "3")}]),
+    ]
+
+    def list_secret_for_all_namespaces(**kwargs):
+        requests.append(kwargs)
+        if not responses:
+            watch.stop()
+            return FakeResponse([])
+        return responses.pop(0)
+
+    handled = []
+    done = asyncio.Event()
+
+    async def handle_secret(event, name, namespace, logger, **kwargs):
+        handled.append((event["type"], name, namespace))
+        if event["type"] == "DELETED":
+            done.set()
+
+    watch = SelectorWatch(
+        list_secret_for_all_namespaces,
+        handle_secret,
+        label_selector="beiboot.getdeck.dev/kubeconfig=true",
+    )
+    watch.start()
+    await asyncio.wait_for(done.wait(), timeout=5)
+    watch.stop()
+
+    assert handled == [
+        ("ADDED", "a", "getdeck-bbt-test"),
+        ("MODIFIED", "a", "getdeck-bbt-test"),
+        ("DELETED", "a", "getdeck-bbt-test"),
+    ]
+    # the objects are filtered by the API server
+    assert all(
+        request["label_selector"] == "beiboot.getdeck.dev/kubeconfig=true"
+        and request["watch"]
+        for request in requests
+    )
+    # the stream continues from the last resource version, unless it expired
+    assert "resource_version" not in requests[0]
+    assert requests[1]["resource_version"] == "2"
+    assert "resource_version" not in requests[2]
+
+
+def test_filtered_handlers():
+    import beiboot.handler  # noqa
+    from beiboot.watches import selector_watches
+
+    selectors = {
+        (watch.name, watch.list_func.__name__): watch.label_selector
+        or watch.field_selector
+        for watch in selector_watches
+    }
+    assert (
+        selectors[("handle_cluster_kubeconfig", "list_secret_for_all_namespaces")]
+        == "beiboot.getdeck.dev/kubeconfig=true"
+    )
+    assert (
+        selectors[("handle_tunnel_service_events", "list_service_for_all_namespaces")]
+        == "beiboot.dev=tunnel"
+    )
+    assert (
+        selectors[("handle_tunnel_pod_events", "list_pod_for_all_namespaces")]
+        == "beiboot.dev=tunnel"
+    )
+    assert (
+        selectors[("index_client_heartbeats", "list_config_map_for_all_namespaces")]
+        == "metadata.name=beiboot-clients"
+    )
+    assert (
+        selectors[("index_client_leases", "list_lease_for_all_namespaces")]
+        == "beiboot.getdeck.dev/client-heartbeat=true"
+    )
+    assert (
+        selectors[("beiboot_configmap_changed", "list_namespaced_config_map")]
+        == "metadata.name=beiboot-config"
+    )
+    for list_func in [
+        "list_stateful_set_for_all_namespaces",
+        "list_deployment_for_all_namespaces",
+    ]:
+        assert (
+            selectors[("handle_workload_status", list_func)]
+            == "beiboot.getdeck.dev/workload=true"
+        )